@@ -0,0 +1,69 @@
+"""
+Measure PIB step 1 executive biography latency against worker count, with the Bing search and the two
+completions per executive replaced by sleeps.
+
+Run from api/Python:
+    python -m Benchmarks.biographyBenchmark --executives 16 --searchLatency 0.8 --llmLatency 1.5
+    python -m Benchmarks.biographyBenchmark --workers 1 4 8 16 --failureRate 0.1
+
+Each worker count runs on a cold biography cache; a final run with the widest pool repeats the request on the
+warm cache, as a second PIB run in the same week would.
+"""
+import argparse
+import random
+import threading
+import time
+from datetime import date
+from Utilities.biographyPool import BiographyCache, generateBiographies
+
+def sampleExecutives(count):
+    titles = ["Chief Executive Officer", "Chief Financial Officer", "Chief Operating Officer", "General Counsel",
+              "Senior Vice President", "Chief Technology Officer", "Chief Marketing Officer", "Director"]
+    return [{"name": f"Executive {i}", "title": titles[i % len(titles)]} for i in range(count)]
+
+def stubBiography(args, seed):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def biography(executive):
+        with lock:
+            jitter = [rng.uniform(0.8, 1.2) for _ in range(3)]
+            fail = rng.random() < args.failureRate
+        # Rephrase the query, search Bing, then summarize the results
+        time.sleep(args.llmLatency * jitter[0])
+        time.sleep(args.searchLatency * jitter[1])
+        if fail:
+            raise RuntimeError("stub Bing search failed")
+        time.sleep(args.llmLatency * jitter[2])
+        return f"{executive['name']} is the {executive['title']}."
+    return biography
+
+def runMode(name, executives, biography, workers, cache):
+    start = time.perf_counter()
+    biographies, failed = generateBiographies(executives, "STUB", date(2023, 6, 1), biography, workers=workers, cache=cache)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} {workers:3d} workers  {elapsed:8.2f}s  {len(biographies):3d} biographies  {len(failed):3d} failed")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--executives", type=int, default=16)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--searchLatency", type=float, default=0.8, help="Stub Bing search latency in seconds")
+    parser.add_argument("--llmLatency", type=float, default=1.5, help="Stub latency of each completion in seconds")
+    parser.add_argument("--failureRate", type=float, default=0.0, help="Fraction of Bing searches that fail")
+    args = parser.parse_args()
+
+    executives = sampleExecutives(args.executives)
+    serial = None
+    for workers in args.workers:
+        elapsed = runMode("cold", executives, stubBiography(args, seed=workers), workers, BiographyCache())
+        serial = serial or elapsed
+        print(f"{'':<10} speedup over {args.workers[0]} worker(s): {serial / elapsed:5.1f}x")
+
+    cache = BiographyCache()
+    runMode("cold", executives, stubBiography(args, seed=0), max(args.workers), cache)
+    runMode("warm", executives, stubBiography(args, seed=0), max(args.workers), cache)
+
+if __name__ == "__main__":
+    main()
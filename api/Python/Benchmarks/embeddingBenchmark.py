@@ -0,0 +1,44 @@
+"""
+Compare serial (one request per chunk) and batched embedding throughput against a local stub OpenAI server.
+
+Run from api/Python:
+    python -m Benchmarks.embeddingBenchmark --chunks 500 --latency 0.05
+"""
+import argparse
+import time
+from Benchmarks.stubServer import startStubServer
+from Utilities.embeddingEngine import EmbeddingEngine
+
+def sampleChunks(count, words=250):
+    return [" ".join(f"word{(i * 31 + j) % 997}" for j in range(words)) for i in range(count)]
+
+def runMode(name, engine, chunks, server):
+    requestsBefore = server.requests
+    start = time.perf_counter()
+    vectors = engine.embed(chunks)
+    elapsed = time.perf_counter() - start
+    assert len(vectors) == len(chunks)
+    print(f"{name:<10} {len(chunks) / elapsed:10.1f} chunks/sec  {server.requests - requestsBefore:6d} requests  {elapsed:8.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fixed stub latency per request in seconds")
+    parser.add_argument("--perItemLatency", type=float, default=0.001, help="Stub latency per input in seconds")
+    parser.add_argument("--maxInFlight", type=int, default=4)
+    args = parser.parse_args()
+
+    server = startStubServer(latency=args.latency, perItemLatency=args.perItemLatency)
+    chunks = sampleChunks(args.chunks)
+    try:
+        serial = EmbeddingEngine("azureopenai", "stub", apiBase=server.url, apiVersion="2023-05-15",
+                                 deployment="embedding", maxBatchSize=1, maxInFlight=1)
+        batched = EmbeddingEngine("azureopenai", "stub", apiBase=server.url, apiVersion="2023-05-15",
+                                  deployment="embedding", maxInFlight=args.maxInFlight)
+        runMode("serial", serial, chunks, server)
+        runMode("batched", batched, chunks, server)
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
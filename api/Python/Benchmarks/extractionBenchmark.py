@@ -0,0 +1,116 @@
+"""
+Measure 10-K item extraction throughput with the BeautifulSoup and lxml paths, in one process and in a process pool.
+
+Run from api/Python:
+    python -m Benchmarks.extractionBenchmark --folder /path/to/raw/10k/files
+    python -m Benchmarks.extractionBenchmark --filings 40 --processes 4
+
+--folder takes raw filings as the EDGAR crawler saves them (.htm, .html or .txt); without it a fixture set of
+synthetic HTML and text 10-Ks is generated. Reports filings/sec and filings/sec per core for each mode, and how
+many items the lxml path extracted differently from the BeautifulSoup path.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import pandas as pd
+from Utilities.edgarItems import extractFilings
+
+ITEMS = ['1', '1A', '1B', '2', '3', '4', '5', '6', '7', '7A', '8', '9', '9A', '9B', '10', '11', '12', '13', '14', '15']
+WORDS = ("revenue operations risk market customers products services capital liquidity results financial "
+         "period fiscal company subsidiaries competition regulation management employees facilities").split()
+
+def paragraph(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def sampleHtmlFiling(rng, paragraphs):
+    parts = ["<html><body><div>UNITED STATES SECURITIES AND EXCHANGE COMMISSION</div><div>FORM 10-K</div>",
+             "<div>TABLE OF CONTENTS</div><table>"]
+    parts += [f"<tr><td>Item&#160;{item}.</td><td>{rng.choice(WORDS).title()}</td><td>{page}</td></tr>"
+              for page, item in enumerate(ITEMS, start=3)]
+    parts.append("</table>")
+    for page, item in enumerate(ITEMS, start=3):
+        parts.append(f"<div><span style='font-weight:bold'>ITEM {item}.&#160;&#160;{rng.choice(WORDS).upper()}</span></div>")
+        for p in range(paragraphs):
+            parts.append(f"<p>{paragraph(rng, 60)} See Item {rng.choice(ITEMS)} for more.</p>")
+            if p % 4 == 3:
+                rows = "".join(f"<tr style='background-color:#cceeff'><td>{rng.choice(WORDS)}</td>"
+                               f"<td>{rng.randint(100, 99999):,}</td><td>{rng.randint(100, 99999):,}</td></tr>"
+                               for _ in range(12))
+                parts.append(f"<table>{rows}</table>")
+        parts.append(f"<div>{page}</div><hr/>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+def sampleTextFiling(rng, paragraphs):
+    lines = ["<DOCUMENT>", "<TYPE>10-K", "<TEXT>", "TABLE OF CONTENTS"]
+    lines += [f"Item {item}.    {rng.choice(WORDS).title()}    {page}" for page, item in enumerate(ITEMS, start=3)]
+    for page, item in enumerate(ITEMS, start=3):
+        lines += ["", f"ITEM {item}.  {rng.choice(WORDS).upper()}", ""]
+        for _ in range(paragraphs):
+            lines += [paragraph(rng, 60), ""]
+        lines += ["", f"  -{page}-", ""]
+    lines += ["</TEXT>", "</DOCUMENT>"]
+    return "\n".join(lines)
+
+def writeFixtures(folder, filings, paragraphs, seed=7):
+    rng = random.Random(seed)
+    for i in range(filings):
+        if i % 4 == 3:
+            filename = f"{1000 + i}_10K_2022_{i}.txt"
+            content = sampleTextFiling(rng, paragraphs)
+        else:
+            filename = f"{1000 + i}_10K_2022_{i}.htm"
+            content = sampleHtmlFiling(rng, paragraphs)
+        with open(os.path.join(folder, filename), "w") as f:
+            f.write(content)
+
+def filingSeries(folder):
+    series = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.split(".")[-1] not in ("htm", "html", "txt"):
+            continue
+        cik = filename.split("_")[0]
+        series.append(pd.Series({"CIK": cik, "Company": cik, "Type": "10-K", "Date": None, "Period of Report": None,
+                                 "SIC": None, "State of Inc": None, "State location": None, "Fiscal Year End": None,
+                                 "html_index": None, "htm_file_link": None, "complete_text_file_link": None,
+                                 "filename": filename}))
+    return series
+
+def runMode(name, series, folder, args, processes, parser):
+    start = time.perf_counter()
+    results = extractFilings(series, args.removeTables, ITEMS, folder, processes=processes, html_parser=parser)
+    elapsed = time.perf_counter() - start
+    rate = len(series) / elapsed
+    print(f"{name:<14} {processes:3d} proc  {rate:8.2f} filings/s  {rate / processes:8.2f} filings/s/core  "
+          f"{sum(r is not None for r in results)} extracted")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--folder", help="Folder of raw 10-K filings; synthetic fixtures are generated when omitted")
+    parser.add_argument("--filings", type=int, default=24)
+    parser.add_argument("--paragraphs", type=int, default=40, help="Paragraphs per item in the synthetic filings")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--removeTables", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as fixtures:
+        folder = args.folder
+        if folder is None:
+            folder = fixtures
+            writeFixtures(folder, args.filings, args.paragraphs)
+        series = filingSeries(folder)
+        print(f"{len(series)} filings, {sum(os.path.getsize(os.path.join(folder, s['filename'])) for s in series) / 1e6:.1f} MB")
+
+        baseline = runMode("bs4", series, folder, args, 1, "bs4")
+        fast = runMode("lxml", series, folder, args, 1, "lxml")
+        runMode("lxml pool", series, folder, args, args.processes, "lxml")
+
+    differing = sum(1 for a, b in zip(baseline, fast) for item in ITEMS
+                    if (a or {}).get(f"item_{item}") != (b or {}).get(f"item_{item}"))
+    print(f"items differing between bs4 and lxml: {differing} of {len(series) * len(ITEMS)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compare the previous per-module history windowing with the shared MessageBuilder on long chat histories.
+
+Run from api/Python:
+    python -m Benchmarks.historyBenchmark --turns 200 --requests 50
+
+Each request replays the conversation so far, as the chat functions do, so later requests see the same
+turns again and the memoized token counts apply. tiktoken needs its encoding files: either network access to
+download them, or TIKTOKEN_CACHE_DIR pointing at a directory that already holds them.
+"""
+import argparse
+import time
+import tiktoken
+from Utilities.modelHelper import getOaiChatModel, numTokenFromText
+from Utilities.messageBuilder import getMessagesFromHistory
+
+def legacyTokens(message, model):
+    encoding = tiktoken.encoding_for_model(getOaiChatModel(model))
+    return 2 + sum(len(encoding.encode(value)) for value in message.values())
+
+def legacyMessagesFromHistory(systemPrompt, modelId, history, userConv, fewShots=[], maxTokens=4096):
+    # The implementation ChatGpt, PibChat, OpenChatGpt and ChatGptStream each carried before
+    messages = [{'role': 'system', 'content': systemPrompt}]
+    tokenLength = legacyTokens(messages[-1], modelId)
+    for shot in fewShots:
+        messages.insert(1, {'role': shot.get('role'), 'content': shot.get('content')})
+    appendIndex = len(fewShots) + 1
+    messages.insert(appendIndex, {'role': "user", 'content': userConv})
+    for h in reversed(history[:-1]):
+        if h.get("bot"):
+            messages.insert(appendIndex, {'role': "assistant", 'content': h.get('bot')})
+        messages.insert(appendIndex, {'role': "user", 'content': h.get('user')})
+        tokenLength += legacyTokens(messages[appendIndex], modelId)
+        if tokenLength > maxTokens:
+            break
+    return messages
+
+def sampleHistory(turns, words):
+    return [{"user": " ".join(f"question{t}-{(t * 7 + j) % 211}" for j in range(words // 4)),
+             "bot": " ".join(f"answer{t}-{(t * 13 + j) % 307}" for j in range(words))} for t in range(turns)]
+
+def runMode(name, build, history, args):
+    start = time.perf_counter()
+    for request in range(args.requests):
+        # The conversation grows by one turn per request, ending at the full history
+        conversation = history[:len(history) - args.requests + request + 1]
+        messages = build("You are a helpful assistant.", args.model, conversation, conversation[-1]["user"], [], args.maxTokens)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} {elapsed / args.requests * 1000:10.2f} ms/request  {len(messages):5d} messages in the last window")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--words", type=int, default=120, help="Words per assistant answer")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--maxTokens", type=int, default=100000)
+    parser.add_argument("--model", default="gpt-35-turbo-16k")
+    args = parser.parse_args()
+
+    history = sampleHistory(args.turns, args.words)
+    legacy = runMode("legacy", legacyMessagesFromHistory, history, args)
+    shared = runMode("shared", getMessagesFromHistory, history, args)
+    print(f"speedup  {legacy / shared:10.1f}x  token count cache {numTokenFromText.cache_info()}")
+
+if __name__ == "__main__":
+    main()
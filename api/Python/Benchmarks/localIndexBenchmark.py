@@ -0,0 +1,81 @@
+"""
+Measure build time, query latency and recall of the local memory-mapped vector index on synthetic embeddings.
+
+Run from api/Python:
+    python -m Benchmarks.localIndexBenchmark --rows 2000 20000 --dimensions 1536 --queries 500
+
+Vectors are drawn around a few hundred random topics so that, like real chunk embeddings, they have neighbours
+worth finding. "exact" scans every row, "clustered" probes the nearest clusters only; recall is the fraction of
+the exact top k that the clustered search also returns. The run then deletes a tenth of the rows and adds them
+back, timing both.
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from Utilities.localIndex import LocalIndex, CLUSTER_PROBES
+
+def syntheticVectors(rows, dimensions, topics, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dimensions)).astype(np.float32)
+    return centers[rng.integers(0, topics, rows)] + 0.6 * rng.standard_normal((rows, dimensions)).astype(np.float32)
+
+def timeQueries(index, queries, k, probes):
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([record["id"] for record, _ in index.search(query, k, probes=probes)])
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return results, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+def runRows(rows, args):
+    vectors = syntheticVectors(rows, args.dimensions, args.topics, seed=rows)
+    queries = syntheticVectors(args.queries, args.dimensions, args.topics, seed=rows)
+    ids = [f"chunk-{i}" for i in range(rows)]
+    records = [{"content": f"chunk {i}", "metadata": {"source": f"file-{i // 50}"}} for i in range(rows)]
+    with tempfile.TemporaryDirectory() as root:
+        index = LocalIndex(root)
+        start = time.perf_counter()
+        for i in range(0, rows, args.batch):
+            index.add(ids[i:i + args.batch], vectors[i:i + args.batch], records[i:i + args.batch])
+        build = time.perf_counter() - start
+        print(f"{rows:7d} rows  build {build:7.2f}s  {index.stats()}")
+
+        exact, p50, p99 = timeQueries(index, queries, args.k, probes=1 << 30)
+        print(f"{'':7} exact      p50 {p50:7.3f}ms  p99 {p99:7.3f}ms")
+        if index.stats()["lists"]:
+            clustered, p50, p99 = timeQueries(index, queries, args.k, probes=args.probes)
+            recall = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(exact, clustered)])
+            print(f"{'':7} clustered  p50 {p50:7.3f}ms  p99 {p99:7.3f}ms  recall@{args.k} {recall:.3f}  probes {args.probes}")
+
+        # A fresh handle on the same files, as another worker process would open them
+        start = time.perf_counter()
+        LocalIndex(root).search(queries[0], args.k)
+        print(f"{'':7} cold open and first query {1000 * (time.perf_counter() - start):7.1f}ms")
+
+        removed = ids[::10]
+        start = time.perf_counter()
+        index.delete(removed)
+        deleted = time.perf_counter() - start
+        start = time.perf_counter()
+        index.add(removed, vectors[::10], records[::10])
+        added = time.perf_counter() - start
+        print(f"{'':7} delete {len(removed)} rows {1000 * deleted:7.1f}ms  add them back {1000 * added:7.1f}ms  {index.stats()}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--batch", type=int, default=500, help="Rows per add, as storeIndex batches them")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--probes", type=int, default=CLUSTER_PROBES)
+    args = parser.parse_args()
+    for rows in args.rows:
+        runRows(rows, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Compare the index types on one fixed corpus. For each backend it reports:
+- ingest throughput through DocGenerator.storeIndex;
+- query latency through the retrieval path;
+- recall@k against an exact NumPy search;
+- memory footprint.
+
+Run from api/Python:
+    python -m Benchmarks.retrievalBenchmark --chunks 2000 --queries 200 --k 5
+    python -m Benchmarks.retrievalBenchmark --backends local redis milvus --dimensions 1536
+
+OpenAI embeddings come from the local stub server. They group the chunks around --topics topics, so the exact
+neighbours of a query are meaningful. The embedding cache is disabled so every backend pays the same embedding
+cost; the "embedding" row is that cost alone and is included in every backend's latency.
+
+Backends that need a service run only when the service answers, and are otherwise reported as skipped:
+- redis on RedisAddress/RedisPort, localhost:6379 by default (a redis-stack container);
+- pinecone with PineconeKey, PineconeEnv and VsIndexName;
+- cogsearch and cogsearchvs with SearchService and SearchKey;
+- milvus on localhost:19530, as started by milvus-standalone-docker-compose.yml. storeIndex writes to the
+  default LangChainCollection, which the benchmark drops before and after its run.
+chroma is listed, but storeIndex does not write to it in this tree.
+Every other backend ingests into a fresh namespace that is removed afterwards.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+import numpy as np
+from Benchmarks.stubServer import startStubServer
+
+BACKENDS = ["local", "redis", "pinecone", "cogsearch", "cogsearchvs", "milvus", "chroma"]
+MILVUS_ADDRESS = ("127.0.0.1", 19530)
+# Spread of a chunk's embedding around its topic's center, relative to the center
+TOPIC_NOISE = 0.8
+
+def seedOf(text):
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+def topicalVector(text, dimensions):
+    """Stub embedding: the center of the text's topic, named by its first word, plus noise seeded by the text."""
+    center = np.random.default_rng(seedOf(text.split(" ", 1)[0])).standard_normal(dimensions)
+    noise = np.random.default_rng(seedOf(text)).standard_normal(dimensions)
+    return (center + TOPIC_NOISE * noise).tolist()
+
+def sampleCorpus(chunks, topics, words=120, seed=0):
+    rng = random.Random(seed)
+    return [f"topic{rng.randrange(topics)} chunk{i} " + " ".join(f"word{rng.randrange(5000)}" for _ in range(words))
+            for i in range(chunks)]
+
+def sampleQueries(count, topics, seed=1):
+    rng = random.Random(seed)
+    return [f"topic{rng.randrange(topics)} question{i} " + " ".join(f"word{rng.randrange(5000)}" for _ in range(12))
+            for i in range(count)]
+
+def exactNeighbours(corpus, queries, k, dimensions):
+    def unit(texts):
+        vectors = np.array([topicalVector(text, dimensions) for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = unit(queries) @ unit(corpus).T
+    return [set(row) for row in np.argsort(-scores, axis=1)[:, :k]]
+
+def rssMb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+def directoryMb(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 2 ** 20
+
+def unavailable(indexType):
+    """Why indexType cannot be benchmarked here, or None when it can."""
+    if indexType == "local":
+        return None
+    if indexType == "chroma":
+        return "storeIndex does not write chroma documents in this tree"
+    if indexType == "redis":
+        try:
+            from Utilities.redisIndex import getRedisConnection
+            getRedisConnection().ping()
+        except Exception as e:
+            return f"Redis did not answer: {e}"
+    elif indexType == "pinecone":
+        if not all(os.environ.get(name) for name in ("PineconeKey", "PineconeEnv", "VsIndexName")):
+            return "PineconeKey, PineconeEnv and VsIndexName are not all set"
+    elif indexType in ("cogsearch", "cogsearchvs"):
+        if not (os.environ.get("SearchService") and os.environ.get("SearchKey")):
+            return "SearchService and SearchKey are not set"
+    elif indexType == "milvus":
+        try:
+            import pymilvus
+            socket.create_connection(MILVUS_ADDRESS, timeout=1).close()
+        except Exception as e:
+            return f"Milvus is not reachable on {MILVUS_ADDRESS[0]}:{MILVUS_ADDRESS[1]}: {e}"
+    return None
+
+def storeMb(indexType, nameSpace):
+    """Memory or disk the backend holds for the namespace, where it can be measured from the client."""
+    if indexType == "local":
+        from Utilities.localIndex import localIndexRoot
+        return directoryMb(os.path.join(localIndexRoot(), nameSpace))
+    if indexType == "redis":
+        from Utilities.redisIndex import getRedisConnection
+        return getRedisConnection().info("memory")["used_memory"] / 2 ** 20
+    return None
+
+def settle(indexType, nameSpace, count, timeout=60):
+    """Wait for eventually consistent backends to make every ingested chunk searchable."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if indexType == "pinecone":
+            import pinecone
+            from Utilities.envVars import VsIndexName
+            namespaces = pinecone.Index(VsIndexName).describe_index_stats()["namespaces"]
+            visible = namespaces.get(nameSpace, {}).get("vector_count", 0)
+        elif indexType in ("cogsearch", "cogsearchvs"):
+            from Utilities.clientRegistry import getSearchClient
+            from Utilities.envVars import SearchService, SearchKey
+            visible = getSearchClient(SearchService, SearchKey, nameSpace).get_document_count()
+        else:
+            return
+        if visible >= count:
+            return
+        time.sleep(1)
+    logging.warning(f"Only {visible} of {count} chunks are searchable in {indexType}:{nameSpace} after {timeout}s")
+
+def searcher(indexType, nameSpace, k, embeddings):
+    if indexType == "milvus":
+        from langchain.vectorstores import Milvus
+        host, port = MILVUS_ADDRESS
+        vectorDb = Milvus(embedding_function=embeddings, connection_args={"host": host, "port": str(port)})
+        return lambda question: vectorDb.similarity_search(question, k=k)
+    from Utilities.retrieval import searchTarget
+    target = {"indexType": indexType, "indexNs": nameSpace}
+    return lambda question: searchTarget(target, question, k, "azureopenai", embeddings)
+
+def cleanup(indexType, nameSpace):
+    try:
+        if indexType == "local":
+            from Utilities.localIndex import deleteLocalIndex
+            deleteLocalIndex(nameSpace)
+        elif indexType == "redis":
+            from langchain.vectorstores.redis import Redis
+            import DocGenerator
+            Redis.drop_index(index_name=nameSpace, delete_documents=True, redis_url=DocGenerator.redisUrl)
+        elif indexType == "pinecone":
+            import pinecone
+            from Utilities.envVars import VsIndexName
+            pinecone.Index(VsIndexName).delete(delete_all=True, namespace=nameSpace)
+        elif indexType in ("cogsearch", "cogsearchvs"):
+            from Utilities.cogSearch import deleteSearchIndex
+            deleteSearchIndex(nameSpace)
+        elif indexType == "milvus":
+            from pymilvus import connections, utility
+            connections.connect(host=MILVUS_ADDRESS[0], port=str(MILVUS_ADDRESS[1]))
+            if utility.has_collection("LangChainCollection"):
+                utility.drop_collection("LangChainCollection")
+    except Exception as e:
+        logging.warning(f"Cleaning up {indexType}:{nameSpace} failed: {e}")
+
+def percentiles(latencies):
+    return np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+
+def runBackend(indexType, corpus, queries, truth, args, embeddings):
+    from langchain.docstore.document import Document
+    from DocGenerator import storeIndex
+    nameSpace = "bench" + uuid.uuid4().hex[:12]
+    if indexType == "milvus":
+        cleanup(indexType, nameSpace)
+    docs = [Document(page_content=text, metadata={"source": "benchmark.txt"}) for text in corpus]
+    rssBefore = rssMb()
+    storeBefore = storeMb(indexType, nameSpace) if indexType == "redis" else 0.0
+    try:
+        start = time.perf_counter()
+        storeIndex(indexType, docs, "benchmark.txt", nameSpace, "azureopenai")
+        ingest = time.perf_counter() - start
+        settle(indexType, nameSpace, len(corpus))
+
+        search = searcher(indexType, nameSpace, args.k, embeddings)
+        position = {text: i for i, text in enumerate(corpus)}
+        latencies, recalls = [], []
+        for question, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found = search(question)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(expected & {position.get(doc.page_content) for doc in found}) / args.k)
+        stored = storeMb(indexType, nameSpace)
+        p50, p95, p99 = percentiles(latencies)
+        storeText = f"{stored - storeBefore:9.1f}" if stored is not None else f"{'-':>9}"
+        print(f"{indexType:<12} {len(corpus) / ingest:9.1f} {p50:8.2f} {p95:8.2f} {p99:8.2f} {np.mean(recalls):7.3f} "
+              f"{rssMb() - rssBefore:9.1f} {storeText}")
+    finally:
+        cleanup(indexType, nameSpace)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--topics", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub embedding latency per request in seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    server = startStubServer(latency=args.latency, perItemLatency=0.0, dimensions=args.dimensions, vectorize=topicalVector)
+    # The settings are read when the function modules are imported, so they are pointed at the stub first
+    os.environ.update({"OpenAiEndPoint": server.url, "OpenAiKey": "stub", "OpenAiVersion": "2023-05-15",
+                       "OpenAiEmbedding": "embedding", "EmbeddingCacheMb": "0"})
+    for name, value in (("OpenAiChat", "stub"), ("OpenAiDocStorName", "stub"), ("OpenAiDocStorKey", "stub"),
+                        ("OpenAiDocContainer", "stub"), ("RedisAddress", "localhost"), ("RedisPort", "6379"),
+                        ("RedisPassword", "")):
+        os.environ.setdefault(name, value)
+    from langchain.embeddings.openai import OpenAIEmbeddings
+    from Utilities.embeddingEngine import getEmbeddingEngine
+    embeddings = OpenAIEmbeddings(deployment="embedding", openai_api_key="stub", openai_api_type="azure",
+                                  openai_api_base=server.url, openai_api_version="2023-05-15")
+
+    corpus = sampleCorpus(args.chunks, args.topics)
+    queries = sampleQueries(args.queries, args.topics)
+    truth = exactNeighbours(corpus, queries, args.k, args.dimensions)
+    print(f"{args.chunks} chunks, {args.queries} queries, k={args.k}, {args.dimensions} dimensions")
+    print(f"{'backend':<12} {'docs/sec':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'recall':>7} {'client MB':>9} {'store MB':>9}")
+    try:
+        engine = getEmbeddingEngine("azureopenai", server.url, "stub", "2023-05-15", "", "embedding")
+        latencies = []
+        for question in queries:
+            start = time.perf_counter()
+            engine.embed([question])
+            latencies.append(time.perf_counter() - start)
+        p50, p95, p99 = percentiles(latencies)
+        print(f"{'embedding':<12} {'':>9} {p50:8.2f} {p95:8.2f} {p99:8.2f}")
+        for indexType in args.backends:
+            reason = unavailable(indexType)
+            if reason:
+                print(f"{indexType:<12} skipped: {reason}")
+                continue
+            runBackend(indexType, corpus, queries, truth, args, embeddings)
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Measure Cognitive Search upload throughput at different concurrency levels against a local stub service.
+
+Run from api/Python:
+    python -m Benchmarks.searchUploadBenchmark --documents 5000 --latency 0.2 --failureRate 0.01
+
+Small vectors keep the run latency-bound; with 1536 dimensions the client serialization and the stub
+share one interpreter and the numbers mostly measure JSON encoding.
+"""
+import argparse
+import time
+from Benchmarks.stubServer import startStubServer, fakeVector
+from Utilities.searchUploader import uploadDocuments, closeClients
+
+def sampleDocuments(count, dimensions):
+    return [{"id": f"doc-{i}", "content": " ".join(f"word{(i * 31 + j) % 997}" for j in range(250)),
+             "contentVector": fakeVector(i, dimensions), "sourcefile": "benchmark.pdf"} for i in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--dimensions", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fixed stub latency per request in seconds")
+    parser.add_argument("--perItemLatency", type=float, default=0.0005, help="Stub latency per document in seconds")
+    parser.add_argument("--failureRate", type=float, default=0.01, help="Share of documents the stub rejects with 503")
+    parser.add_argument("--batchDocs", type=int, default=250, help="Maximum documents per indexing request")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    server = startStubServer(latency=args.latency, perItemLatency=args.perItemLatency, failureRate=args.failureRate)
+    documents = sampleDocuments(args.documents, args.dimensions)
+    try:
+        for concurrency in args.concurrency:
+            requestsBefore = server.requests
+            start = time.perf_counter()
+            succeeded, failed = uploadDocuments(server.url, "stub", "benchmark", documents,
+                                                 maxBatchDocs=args.batchDocs, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            print(f"concurrency {concurrency:<3} {succeeded / elapsed:10.1f} docs/sec  {server.requests - requestsBefore:5d} requests  "
+                  f"{failed:4d} failed  {elapsed:8.2f}s")
+    finally:
+        closeClients()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
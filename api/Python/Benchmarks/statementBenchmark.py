@@ -0,0 +1,91 @@
+"""
+Compare computing financial ratios for an index of companies from per-symbol FMP responses against the local
+columnar statement store, with FMP replaced by synthetic statements and a fixed latency per call.
+
+Run from api/Python, after pip install -r Benchmarks/requirements.txt:
+    python -m Benchmarks.statementBenchmark --symbols 500 --latency 0.2
+
+The "api" mode fetches every statement of every symbol and computes the ratios row by row from the lists of dicts,
+as the PIB steps do today. "store cold" fills the Parquet partitions through the same stub, and "store warm"
+answers from the partitions already on disk.
+"""
+import argparse
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import Benchmarks.statementStore as statementStore
+from Benchmarks.statementStore import StatementStore, financialRatios
+
+def stubStatements(statement, latency, years):
+    def fetch(apikey, symbol, period="annual", limit=40):
+        time.sleep(latency)
+        rng = random.Random(f"{statement}{symbol}{period}")
+        revenue = rng.uniform(1e8, 1e11)
+        records = []
+        for year in range(2023, 2023 - min(limit, years), -1):
+            revenue /= rng.uniform(0.9, 1.3)
+            records.append({
+                "date": f"{year}-12-31", "symbol": symbol, "reportedCurrency": "USD", "cik": "0000000000",
+                "fillingDate": f"{year + 1}-02-15", "calendarYear": str(year), "period": "FY",
+                "revenue": revenue, "grossProfit": revenue * rng.uniform(0.2, 0.6),
+                "operatingIncome": revenue * rng.uniform(-0.1, 0.3), "netIncome": revenue * rng.uniform(-0.1, 0.2),
+                "eps": rng.uniform(-2, 10), "totalAssets": revenue * rng.uniform(1, 3),
+                "totalStockholdersEquity": revenue * rng.uniform(0.2, 1.5), "totalDebt": revenue * rng.uniform(0, 1),
+                "cashAndCashEquivalents": revenue * rng.uniform(0, 0.3), "totalCurrentAssets": revenue * rng.uniform(0.2, 0.8),
+                "totalCurrentLiabilities": revenue * rng.uniform(0.1, 0.6), "operatingCashFlow": revenue * rng.uniform(0, 0.3),
+                "capitalExpenditure": -revenue * rng.uniform(0, 0.1), "freeCashFlow": revenue * rng.uniform(-0.05, 0.25),
+                "link": None, "finalLink": None,
+            })
+        return records
+    return fetch
+
+def apiRatios(symbols, workers):
+    def one(symbol):
+        income = statementStore.STATEMENTS["income"](apikey="stub", symbol=symbol)
+        balance = {r["date"]: r for r in statementStore.STATEMENTS["balance"](apikey="stub", symbol=symbol)}
+        cashflow = {r["date"]: r for r in statementStore.STATEMENTS["cashflow"](apikey="stub", symbol=symbol)}
+        rows = []
+        for i, r in enumerate(income):
+            b, c = balance.get(r["date"]), cashflow.get(r["date"])
+            if b is None or c is None:
+                continue
+            previous = income[i + 1] if i + 1 < len(income) else None
+            rows.append({
+                "symbol": symbol, "date": r["date"],
+                "grossMargin": r["grossProfit"] / r["revenue"], "netMargin": r["netIncome"] / r["revenue"],
+                "returnOnEquity": r["netIncome"] / b["totalStockholdersEquity"],
+                "freeCashFlowMargin": c["freeCashFlow"] / r["revenue"],
+                "revenueGrowth": r["revenue"] / abs(previous["revenue"]) - 1 if previous else None,
+            })
+        return rows
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [row for rows in executor.map(one, symbols) for row in rows]
+
+def runMode(name, func, symbols):
+    start = time.perf_counter()
+    rows = func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {len(symbols):5d} symbols  {elapsed:8.2f}s  {len(rows):7d} ratio rows")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub FMP latency per call in seconds")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    for statement in ("income", "balance", "cashflow"):
+        statementStore.STATEMENTS[statement] = stubStatements(statement, args.latency, args.years)
+    symbols = [f"S{i:04d}" for i in range(args.symbols)]
+
+    with tempfile.TemporaryDirectory() as root:
+        store = StatementStore("stub", root=root, workers=args.workers)
+        runMode("api", lambda: apiRatios(symbols, args.workers), symbols)
+        runMode("store cold", lambda: financialRatios(store, symbols), symbols)
+        runMode("store warm", lambda: financialRatios(store, symbols), symbols)
+        runMode("store since", lambda: financialRatios(store, symbols, since="2021-01-01"), symbols)
+
+if __name__ == "__main__":
+    main()
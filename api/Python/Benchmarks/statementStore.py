@@ -0,0 +1,191 @@
+"""
+Local columnar store of FMP financial statements: one Parquet file per statement, period and symbol, laid out
+as hive partitions so a query over many symbols only opens the files and columns it needs.
+Only the statement benchmark uses it so far, so it lives with the benchmarks, and pyarrow is listed in
+Benchmarks/requirements.txt, until a function reads statements from it.
+"""
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from Utilities.fmp import income_statement, balance_sheet_statement, cash_flow_statement, key_metrics, financial_ratios, \
+    enterprise_values, financial_growth
+
+# Statements are refreshed after this many seconds, matching the FMP client's statement TTL
+STATEMENT_TTL = 7 * 24 * 60 * 60
+STATEMENT_LIMIT = 40
+# Fetches for missing partitions run concurrently; the FMP client still applies its own rate limit
+FETCH_WORKERS = 8
+
+STATEMENTS = {
+    "income": income_statement,
+    "balance": balance_sheet_statement,
+    "cashflow": cash_flow_statement,
+    "metrics": key_metrics,
+    "ratios": financial_ratios,
+    "enterprise": enterprise_values,
+    "growth": financial_growth,
+}
+# Every other column is stored as float64, so the files of every symbol share one schema
+STRING_COLUMNS = ["date", "symbol", "reportedCurrency", "cik", "fillingDate", "acceptedDate", "calendarYear", "period",
+                  "link", "finalLink"]
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def statementTable(records):
+    """An Arrow table of the FMP records with the string columns kept and everything else made numeric."""
+    names = list(dict.fromkeys(name for record in records for name in record))
+    columns = {}
+    for name in names:
+        # symbol and period are partition keys, encoded in the path rather than in the file
+        if name in ("symbol", "period"):
+            continue
+        values = [record.get(name) for record in records]
+        if name in STRING_COLUMNS:
+            columns[name] = pa.array([None if v is None else str(v) for v in values], type=pa.string())
+        else:
+            columns[name] = pa.array([_number(v) for v in values], type=pa.float64())
+    return pa.table(columns)
+
+class StatementStore:
+    """
+      Statements under root/<statement>/period=<period>/symbol=<symbol>/part.parquet. A partition is fetched from FMP
+      the first time it is read and again once it is older than ttl; reads filter on the partition keys and the
+      statement date before any data is loaded. A fetch that finds no data leaves an empty marker file in the
+      partition instead, whose modification time holds off the next fetch for the same ttl.
+      """
+
+    def __init__(self, apikey, root=None, ttl=STATEMENT_TTL, limit=STATEMENT_LIMIT, workers=FETCH_WORKERS):
+        self.apikey = apikey
+        self.root = root or os.environ.get("STATEMENT_STORE_PATH") or os.path.join(tempfile.gettempdir(), "fmpstatements")
+        self.ttl = ttl
+        self.limit = limit
+        self.workers = workers
+
+    def partitionPath(self, statement, period, symbol):
+        return os.path.join(self.root, statement, f"period={period}", f"symbol={symbol}", "part.parquet")
+
+    def emptyPath(self, statement, period, symbol):
+        return os.path.join(os.path.dirname(self.partitionPath(statement, period, symbol)), "empty")
+
+    def stale(self, statement, period, symbol):
+        fetched = [os.path.getmtime(path) for path in (self.partitionPath(statement, period, symbol),
+                                                         self.emptyPath(statement, period, symbol)) if os.path.isfile(path)]
+        return not fetched or time.time() - max(fetched) > self.ttl
+
+    def fetch(self, statement, period, symbol):
+        """Download one partition and write it atomically; returns False when FMP had no data for it."""
+        records = STATEMENTS[statement](apikey=self.apikey, symbol=symbol, period=period, limit=self.limit)
+        path = self.partitionPath(statement, period, symbol)
+        emptyPath = self.emptyPath(statement, period, symbol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not isinstance(records, list) or len(records) == 0:
+            logging.info(f"No {statement} {period} statements for {symbol}")
+            # Recorded so the symbol is not fetched again on every load until the ttl runs out
+            with open(emptyPath, "w") as f:
+                f.write(str(time.time()))
+            return False
+        tempPath = path + ".tmp"
+        pq.write_table(statementTable(records), tempPath)
+        os.replace(tempPath, path)
+        if os.path.isfile(emptyPath):
+            os.remove(emptyPath)
+        return True
+
+    def refresh(self, statement, symbols, period="annual", force=False):
+        """Fetch the partitions of symbols that are missing or stale. Returns the symbols that were fetched."""
+        pending = [symbol for symbol in symbols if force or self.stale(statement, period, symbol)]
+        if not pending:
+            return []
+        fetched = []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(pending))), thread_name_prefix="statements") as executor:
+            for symbol, ok in zip(pending, executor.map(lambda s: self._fetchQuietly(statement, period, s), pending)):
+                if ok:
+                    fetched.append(symbol)
+        logging.info(f"Fetched {len(fetched)} of {len(pending)} stale {statement} {period} partitions")
+        return fetched
+
+    def _fetchQuietly(self, statement, period, symbol):
+        try:
+            return self.fetch(statement, period, symbol)
+        except Exception as e:
+            logging.error(f"Fetching {statement} {period} statements for {symbol} failed: {e}")
+            return False
+
+    def load(self, statement, symbols, period="annual", columns=None, since=None, refresh=True):
+        """
+        The statements of symbols as one DataFrame sorted by symbol and date, newest last. columns limits the
+        columns read from disk (symbol, period and date are always included) and since drops statements dated
+        before it, both pushed down to the Parquet scan.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        if refresh:
+            self.refresh(statement, symbols, period)
+        # Opening only the requested partitions skips listing, and filtering, every other symbol in the store
+        paths = [path for path in (self.partitionPath(statement, period, symbol) for symbol in symbols) if os.path.isfile(path)]
+        if not paths:
+            return pd.DataFrame(columns=["symbol", "period", "date"] + list(columns or []))
+        dataset = ds.dataset(paths, format="parquet", partitioning="hive", partition_base_dir=os.path.join(self.root, statement))
+        predicate = None
+        if since is not None:
+            predicate = ds.field("date") >= str(since)
+        if columns is not None:
+            columns = list(dict.fromkeys(["symbol", "period", "date"] + [c for c in columns if c in dataset.schema.names]))
+        df = dataset.to_table(columns=columns, filter=predicate).to_pandas()
+        return df.sort_values(["symbol", "date"], kind="stable").reset_index(drop=True)
+
+    def records(self, statement, symbol, period="annual", limit=None):
+        """One symbol's statements as FMP returns them: a list of dicts, newest first, with None for missing values."""
+        df = self.load(statement, [symbol], period).iloc[::-1]
+        if limit is not None:
+            df = df.head(limit)
+        df = df.astype(object).where(df.notna(), None)
+        return df.to_dict("records")
+
+def financialRatios(store, symbols, period="annual", since=None):
+    """
+    Margins, returns, leverage and growth for every statement date of every symbol, computed column-wise over the
+    joined income, balance sheet and cash flow statements instead of one symbol at a time.
+    """
+    income = store.load("income", symbols, period, since=since,
+                        columns=["revenue", "grossProfit", "operatingIncome", "netIncome", "eps"])
+    balance = store.load("balance", symbols, period, since=since,
+                         columns=["totalAssets", "totalStockholdersEquity", "totalDebt", "cashAndCashEquivalents",
+                                  "totalCurrentAssets", "totalCurrentLiabilities"])
+    cashflow = store.load("cashflow", symbols, period, since=since,
+                          columns=["operatingCashFlow", "capitalExpenditure", "freeCashFlow"])
+    df = income.merge(balance, on=["symbol", "period", "date"], how="inner").merge(cashflow, on=["symbol", "period", "date"], how="inner")
+
+    def ratio(numerator, denominator):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = df[numerator].to_numpy(dtype="float64") / df[denominator].to_numpy(dtype="float64")
+        return np.where(np.isfinite(values), values, np.nan)
+
+    ratios = df[["symbol", "period", "date"]].copy()
+    ratios["grossMargin"] = ratio("grossProfit", "revenue")
+    ratios["operatingMargin"] = ratio("operatingIncome", "revenue")
+    ratios["netMargin"] = ratio("netIncome", "revenue")
+    ratios["freeCashFlowMargin"] = ratio("freeCashFlow", "revenue")
+    ratios["returnOnAssets"] = ratio("netIncome", "totalAssets")
+    ratios["returnOnEquity"] = ratio("netIncome", "totalStockholdersEquity")
+    ratios["debtToEquity"] = ratio("totalDebt", "totalStockholdersEquity")
+    ratios["currentRatio"] = ratio("totalCurrentAssets", "totalCurrentLiabilities")
+    # Rows are sorted by symbol then date, so growth is the change from the previous row of the same symbol
+    sameSymbol = df["symbol"].to_numpy()[1:] == df["symbol"].to_numpy()[:-1]
+    for column, name in (("revenue", "revenueGrowth"), ("netIncome", "netIncomeGrowth"), ("eps", "epsGrowth")):
+        values = df[column].to_numpy(dtype="float64")
+        growth = np.full(len(values), np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth[1:] = np.where(sameSymbol, values[1:] / np.abs(values[:-1]) - np.sign(values[:-1]), np.nan)
+        ratios[name] = np.where(np.isfinite(growth), growth, np.nan)
+    return ratios
@@ -0,0 +1,95 @@
+"""Local stand-in for the OpenAI and Cognitive Search REST endpoints used by the benchmarks."""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, each response waits out the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _readJson(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _writeJson(self, body, status=200):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        body = self._readJson()
+        with server.statsLock:
+            server.requests += 1
+        if self.path.split("?")[0].endswith("/embeddings"):
+            inputs = body.get("input")
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            time.sleep(server.latency + server.perItemLatency * len(inputs))
+            data = [{"object": "embedding", "index": i, "embedding": server.vectorize(inputText(text), server.dimensions)}
+                    for i, text in enumerate(inputs)]
+            self._writeJson({"object": "list", "data": data, "model": "text-embedding-ada-002",
+                             "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+        elif self.path.split("?")[0].endswith("/docs/search.index"):
+            actions = body.get("value", [])
+            time.sleep(server.latency + server.perItemLatency * len(actions))
+            results = []
+            for action in actions:
+                # Documents fail transiently at failureRate, the way a throttled service reports them
+                failed = server.random.random() < server.failureRate
+                results.append({"key": str(action.get("id")), "status": not failed,
+                                "errorMessage": "Service unavailable" if failed else None,
+                                "statusCode": 503 if failed else 201})
+                with server.statsLock:
+                    if failed:
+                        server.documentsFailed += 1
+                    else:
+                        server.documentsIndexed += 1
+            status = 207 if any(not r["status"] for r in results) else 200
+            self._writeJson({"value": results}, status=status)
+        else:
+            self._writeJson({"error": {"message": "Not found"}}, status=404)
+
+def inputText(value):
+    """The text of an embedding input; LangChain sends token ids, which must embed like the text they encode."""
+    if isinstance(value, list):
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base").decode(value)
+    return value
+
+def fakeVector(text, dimensions):
+    """Deterministic pseudo-embedding so repeated texts map to the same vector."""
+    seed = int(hashlib.md5(str(text).encode("utf-8")).hexdigest()[:8], 16)
+    rnd = random.Random(seed)
+    return [rnd.uniform(-1, 1) for _ in range(dimensions)]
+
+def startStubServer(latency=0.05, perItemLatency=0.001, dimensions=1536, failureRate=0.0, vectorize=fakeVector):
+    """
+    Start the stub server on a free local port and return it; call server.shutdown() when done.
+    vectorize(text, dimensions) computes the embedding returned for each input.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.perItemLatency = perItemLatency
+    server.dimensions = dimensions
+    server.failureRate = failureRate
+    server.vectorize = vectorize
+    server.random = random.Random(0)
+    server.requests = 0
+    server.documentsIndexed = 0
+    server.documentsFailed = 0
+    server.statsLock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -12,6 +12,9 @@ from langchain.chains.qa_with_sources import load_qa_with_sources_chain
 from langchain.docstore.document import Document
 from Utilities.redisIndex import performRedisSearch
 from Utilities.cogSearch import performCogSearch
+from Utilities.retrieval import getRetrievalTargets, retrieveDocuments, searchTarget, queryEmbedding, FusionRetriever
+from Utilities.rerank import rerankDocuments, RerankRetriever, RERANK_CANDIDATES
+from Utilities.contextPacker import packForChain, PackingRetriever
 from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
 from langchain.chains import RetrievalQAWithSourcesChain
 from langchain.prompts import PromptTemplate
@@ -19,13 +22,14 @@ from Utilities.envVars import *
 from langchain.agents import create_csv_agent
 from Utilities.azureBlob import getLocalBlob, getFullPath
 from azure.cosmos import CosmosClient, PartitionKey
+from Utilities.clientRegistry import getCosmosContainer, withClient
 from langchain.callbacks import get_openai_callback
 from langchain.chains.question_answering import load_qa_chain
 from langchain.output_parsers import RegexParser
 from langchain.chains import RetrievalQA
 from typing import Any, Sequence
-from Utilities.modelHelper import numTokenFromMessages, getTokenLimit
-from Utilities.messageBuilder import MessageBuilder
+from Utilities.modelHelper import getTokenLimit
+from Utilities.messageBuilder import getMessagesFromHistory
 
 def main(req: func.HttpRequest, context: func.Context) -> func.HttpResponse:
     logging.info(f'{context.function_name} HTTP trigger function processed a request.')
@@ -75,32 +79,6 @@ def ComposeResponse(jsonData, indexNs, indexType):
             results["values"].append(outputRecord)
     return json.dumps(results, ensure_ascii=False)
 
-def getMessagesFromHistory(systemPrompt: str, modelId: str, history: Sequence[dict[str, str]], 
-                           userConv: str, fewShots = [], maxTokens: int = 4096):
-        #messageBuilder = MessageBuilder(systemPrompt, modelId)
-        messages = []
-        messages.append({'role': 'system', 'content': systemPrompt})
-        tokenLength = numTokenFromMessages(messages[-1], modelId)
-
-        # Add examples to show the chat what responses we want. It will try to mimic any responses and make sure they match the rules laid out in the system message.
-        for shot in fewShots:
-            messages.insert(1, {'role': shot.get('role'), 'content': shot.get('content')})
-
-        userContent = userConv
-        appendIndex = len(fewShots) + 1
-
-        messages.insert(appendIndex, {'role': "user", 'content': userContent})
-
-        for h in reversed(history[:-1]):
-            if h.get("bot"):
-                messages.insert(appendIndex, {'role': "assistant", 'content': h.get('bot')})
-            messages.insert(appendIndex, {'role': "user", 'content': h.get('user')})
-            tokenLength += numTokenFromMessages(messages[appendIndex], modelId)
-            if tokenLength > maxTokens:
-                break
-
-        return messages
-
 def getChatHistory(history, includeLastTurn=True, maxTokens=1000) -> str:
     historyText = ""
     for h in reversed(history if includeLastTurn else history[:-1]):
@@ -109,7 +87,7 @@ def getChatHistory(history, includeLastTurn=True, maxTokens=1000) -> str:
             break
     return historyText
 
-def insertMessage(sessionId, type, role, totalTokens, tokens, response, cosmosContainer):
+def insertMessage(sessionId, type, role, totalTokens, tokens, response):
     aiMessage = {
         "id": str(uuid.uuid4()), 
         "type": type, 
@@ -119,11 +97,15 @@ def insertMessage(sessionId, type, role, totalTokens, tokens, response, cosmosCo
         "timestamp": datetime.datetime.utcnow().isoformat(), 
         "content": response
     }
-    cosmosContainer.create_item(body=aiMessage)
+    # Upserted, as the id is fixed above and a retry after a timeout may find the first write already stored
+    withClient(getCosmosContainer, (CosmosEndpoint, CosmosKey, CosmosDatabase, CosmosContainer), lambda container: container.upsert_item(body=aiMessage))
 
 def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
     embeddingModelType = overrides.get('embeddingModelType') or 'azureopenai'
     topK = overrides.get("top") or 5
+    # overrides["rerank"] retrieves rerankCandidates chunks and keeps the topK most relevant, least redundant of them
+    rerank = overrides.get("rerank") or False
+    searchK = (overrides.get("rerankCandidates") or RERANK_CANDIDATES) if rerank else topK
     temperature = overrides.get("temperature") or 0.3
     tokenLength = overrides.get('tokenLength') or 500
     firstSession = overrides.get('firstSession') or False
@@ -131,16 +113,10 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
     promptTemplate = overrides.get('promptTemplate') or ''
     deploymentType = overrides.get('deploymentType') or 'gpt35'
     overrideChain = overrides.get("chainType") or 'stuff'
+    # Extra indexes in overrides["indexes"] are searched concurrently and fused with this one
+    targets = getRetrievalTargets(indexType, indexNs, overrides)
 
     logging.info("Search for Top " + str(topK))
-    try:
-        cosmosClient = CosmosClient(url=CosmosEndpoint, credential=CosmosKey)
-        cosmosDb = cosmosClient.create_database_if_not_exists(id=CosmosDatabase)
-        cosmosKey = PartitionKey(path="/sessionId")
-        cosmosContainer = cosmosDb.create_container_if_not_exists(id=CosmosContainer, partition_key=cosmosKey, offer_throughput=400)
-    except Exception as e:
-        logging.info("Error connecting to CosmosDB: " + str(e))
-
     lastQuestion = history[-1]["user"]
     totalTokens = 0
 
@@ -149,7 +125,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
         if firstSession:
             sessionInfo = overrides.get('session') or ''
             session = json.loads(sessionInfo)
-            cosmosContainer.upsert_item(session)
+            withClient(getCosmosContainer, (CosmosEndpoint, CosmosKey, CosmosDatabase, CosmosContainer), lambda container: container.upsert_item(session))
             logging.info(session)
     except Exception as e:
         logging.info("Error inserting session into CosmosDB: " + str(e))
@@ -175,6 +151,8 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
             gptModel = "gpt-3.5-turbo-16k"
 
     tokenLimit = getTokenLimit(gptModel)
+    # The search query is a few keywords; the history builder counts the prompt itself
+    queryTokens = 32
     # STEP 1: Generate an optimized keyword search query based on the chat history and the last question
     messages = getMessagesFromHistory(
             systemTemplate,
@@ -182,7 +160,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
             history,
             'Generate search query for: ' + lastQuestion,
             [],
-            tokenLimit - len('Generate search query for: ' + lastQuestion) - tokenLength
+            tokenLimit - queryTokens
             )
     
     if (embeddingModelType == 'azureopenai'):
@@ -208,7 +186,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                 model=gptModel,
                 messages=messages, 
                 temperature=0.0, 
-                max_tokens=32, 
+                max_tokens=queryTokens, 
                 n=1)
             
         elif deploymentType == "gpt3516k":
@@ -225,7 +203,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                 model=gptModel,
                 messages=messages, 
                 temperature=0.0, 
-                max_tokens=32, 
+                max_tokens=queryTokens, 
                 n=1)
         logging.info("LLM Setup done")
     elif embeddingModelType == "openai":
@@ -242,7 +220,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                 model=gptModel,
                 messages=messages, 
                 temperature=0.0, 
-                max_tokens=32, 
+                max_tokens=queryTokens, 
                 n=1)
     # Example usage of ChatLiteLLM
     # elif embeddingModelType == "claude":
@@ -273,7 +251,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
         if (q == ''):
             q = lastQuestion
 
-        insertMessage(sessionId, "Message", "User", 0, 0, lastQuestion, cosmosContainer)
+        insertMessage(sessionId, "Message", "User", 0, 0, lastQuestion)
 
     except Exception as e:
         q = lastQuestion
@@ -491,8 +469,15 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
 
         logging.info("Final Prompt created")
         if indexType == 'pinecone':
-            vectorDb = Pinecone.from_existing_index(index_name=VsIndexName, embedding=embeddings, namespace=indexNs)
-            docRetriever = vectorDb.as_retriever(search_kwargs={"namespace": indexNs, "k": topK})
+            if len(targets) > 1 or rerank:
+                docRetriever = FusionRetriever(targets=targets, k=searchK, embeddingModelType=embeddingModelType, embeddings=embeddings,
+                                               withVectors=rerank)
+            else:
+                vectorDb = Pinecone.from_existing_index(index_name=VsIndexName, embedding=embeddings, namespace=indexNs)
+                docRetriever = vectorDb.as_retriever(search_kwargs={"namespace": indexNs, "k": searchK})
+            if rerank:
+                docRetriever = RerankRetriever(retriever=docRetriever, k=topK, embeddingModelType=embeddingModelType)
+            docRetriever = PackingRetriever(retriever=docRetriever, chainType=overrideChain, prompt=qaPrompt, modelId=gptModel, maxTokens=tokenLength)
             logging.info("Pinecone Setup done for indexName : " + indexNs)
             with get_openai_callback() as cb:
                 chain = RetrievalQAWithSourcesChain(combine_documents_chain=qaChain, retriever=docRetriever, 
@@ -535,20 +520,30 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                         "sources": sources.replace("SOURCES:", '').replace("SOURCES", "").replace("Sources:", '').replace('- ', ''), 
                         "nextQuestions": nextQuestions.replace('Next Questions:', '').replace('- ', ''), "error": ""}
                 try:
-                    insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response, cosmosContainer)
+                    insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response)
                 except Exception as e:
                     logging.info("Error inserting message: " + str(e))
 
                 return response
-        elif indexType == "redis":
+        elif indexType == "redis" or indexType == "local":
             try:
-                returnField = ["metadata", "content", "vector_score"]
-                vectorField = "content_vector"
-                results = performRedisSearch(q, indexNs, topK, returnField, vectorField, embeddingModelType)
-                docs = [
-                        Document(page_content=result.content, metadata=json.loads(result.metadata))
-                        for result in results.docs
-                ]
+                # Embedded once, for the search and the reranking
+                queryVector = queryEmbedding(q, embeddingModelType) if rerank else None
+                if len(targets) > 1:
+                    docs = retrieveDocuments(targets, q, searchK, embeddingModelType, embeddings, queryVector=queryVector, withVectors=rerank)
+                elif indexType == "local" or rerank:
+                    docs = searchTarget(targets[0], q, searchK, embeddingModelType, embeddings, queryVector, rerank)
+                else:
+                    returnField = ["metadata", "content", "vector_score"]
+                    vectorField = "content_vector"
+                    results = performRedisSearch(q, indexNs, searchK, returnField, vectorField, embeddingModelType)
+                    docs = [
+                            Document(page_content=result.content, metadata=json.loads(result.metadata))
+                            for result in results.docs
+                    ]
+                if rerank:
+                    docs = rerankDocuments(q, docs, topK, embeddingModelType, queryVector=queryVector)
+                docs = packForChain(docs, overrideChain, qaPrompt, q, gptModel, tokenLength)
                 rawDocs = []
                 for doc in docs:
                     rawDocs.append(doc.page_content)
@@ -578,7 +573,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                         "sources": sources.replace("SOURCES:", '').replace("SOURCES", "").replace("Sources:", '').replace('- ', ''), 
                         "nextQuestions": nextQuestions.replace('Next Questions:', '').replace('- ', ''), "error": ""}
                     try:
-                        insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response, cosmosContainer)
+                        insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response)
                     except Exception as e:
                         logging.info("Error inserting message: " + str(e))
 
@@ -587,15 +582,24 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                 return {"data_points": "", "answer": "Working on fixing Redis Implementation - Error : " + str(e), "thoughts": "",
                         "sources": '', "nextQuestions": '', "error": str(e)}
         elif indexType == "cogsearch" or indexType == "cogsearchvs":
-            r = performCogSearch(indexType, embeddingModelType, q, indexNs, topK)
-            if r == None:
-                    docs = [Document(page_content="No results found")]
-            else :
-                docs = [
-                    Document(page_content=doc['content'], metadata={"id": doc['id'], "source": doc['sourcefile']})
-                    for doc in r
-                    ]
+            queryVector = queryEmbedding(q, embeddingModelType) if rerank else None
+            if len(targets) > 1:
+                docs = retrieveDocuments(targets, q, searchK, embeddingModelType, embeddings, queryVector=queryVector, withVectors=rerank) or [Document(page_content="No results found")]
+            elif rerank:
+                docs = searchTarget(targets[0], q, searchK, embeddingModelType, embeddings, queryVector, True) or [Document(page_content="No results found")]
+            else:
+                r = performCogSearch(indexType, embeddingModelType, q, indexNs, searchK)
+                if r == None:
+                        docs = [Document(page_content="No results found")]
+                else :
+                    docs = [
+                        Document(page_content=doc['content'], metadata={"id": doc['id'], "source": doc['sourcefile']})
+                        for doc in r
+                        ]
             
+            if rerank:
+                docs = rerankDocuments(q, docs, topK, embeddingModelType, queryVector=queryVector)
+            docs = packForChain(docs, overrideChain, qaPrompt, q, gptModel, tokenLength)
             rawDocs = []
             for doc in docs:
                 rawDocs.append(doc.page_content)
@@ -625,7 +629,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                     "sources": sources.replace("SOURCES:", '').replace("SOURCES", "").replace("Sources:", '').replace('- ', ''), 
                     "nextQuestions": nextQuestions.replace('Next Questions:', '').replace('- ', ''), "error": ""}
                 try:
-                    insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response, cosmosContainer)
+                    insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response)
                 except Exception as e:
                     logging.info("Error inserting message: " + str(e))
 
@@ -640,7 +644,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                                 "thoughts": '',
                                     "sources": sources, "nextQuestions": '', "error": ""}
                     try:
-                        insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response, cosmosContainer)
+                        insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response)
                     except Exception as e:
                         logging.info("Error inserting message: " + str(e))
                         
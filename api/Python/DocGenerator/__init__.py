@@ -24,9 +24,13 @@ from langchain.document_loaders import UnstructuredWordDocumentLoader
 from langchain.chains.summarize import load_summarize_chain
 from langchain.prompts import PromptTemplate
 from langchain.chains.qa_with_sources import load_qa_with_sources_chain
-from Utilities.azureBlob import upsertMetadata, getBlob, getFullPath, copyBlob, copyS3Blob
+from Utilities.azureBlob import upsertMetadata, getBlob, getFullPath, copyBlob, copyS3Blob, downloadBlobToFile
 from Utilities.cogSearch import createSearchIndex, indexSections
+from Utilities.embeddingEngine import getEmbeddingEngine
+from Utilities.localIndex import getLocalIndex
 from Utilities.formrecognizer import analyze_layout, chunk_paragraphs
+from Utilities.pipeline import PipelineStage, runPipeline
+from Utilities.streamSplitter import streamDocuments, splitMarkdownStream, iterLines, spoolDocuments, readSpool, batched, keepHead
 from langchain.document_loaders import AzureBlobStorageFileLoader
 from langchain.document_loaders import AzureBlobStorageContainerLoader
 from azure.storage.blob import BlobClient
@@ -44,7 +48,15 @@ from langchain.text_splitter import MarkdownHeaderTextSplitter
 import glob
 import zipfile
 from pathlib import Path
+from itertools import islice
 
+# Concurrency of the ingestion pipeline stages for multi-file and container loads
+IngestFetchWorkers = 4
+IngestParseWorkers = max(1, min(4, os.cpu_count() or 1))
+IngestIndexWorkers = 2
+IngestParseTimeout = 900
+# Chunks handed to a vector store per call when indexing a streamed document
+StoreBatchSize = 500
 
 try:
     redisUrl = "redis://default:" + RedisPassword + "@" + RedisAddress + ":" + RedisPort
@@ -152,31 +164,34 @@ def summarizeGenerateQa(docs, embeddingModelType, deploymentType):
     #qa = qa.decode('utf8')
     return qa, summary
 
+def downloadBlob(blobConnectionString, blobContainer, blobName):
+    downloadPath = os.path.join(tempfile.gettempdir(), blobName)
+    os.makedirs(os.path.dirname(downloadPath), exist_ok=True)
+    downloadBlobToFile(blobConnectionString, blobContainer, blobName, downloadPath)
+    logging.info("File created " + downloadPath)
+    return downloadPath
+
+def loadDocuments(downloadPath, fileName, source=None):
+    if (fileName.endswith(".pdf")):
+        loader = PDFMinerLoader(downloadPath)
+    elif (fileName.endswith(".docx") or fileName.endswith(".doc")):
+        loader = UnstructuredWordDocumentLoader(downloadPath)
+    elif (fileName.endswith(".txt")):
+        loader = UnstructuredFileLoader(downloadPath)
+    else:
+        raise ValueError("File type of " + fileName + " is not supported")
+    rawDocs = loader.load()
+    if source:
+        for doc in rawDocs:
+            doc.metadata['source'] = source
+    return rawDocs
+
 def blobLoad(blobConnectionString, blobContainer, blobName):
     logging.info("Blob Load started")
     try:
-        readBytes  = getBlob(blobConnectionString, blobContainer, blobName)
-        downloadPath = os.path.join(tempfile.gettempdir(), blobName)
-        os.makedirs(os.path.dirname(tempfile.gettempdir()), exist_ok=True)
-        try:
-            with open(downloadPath, "wb") as file:
-                file.write(readBytes)
-        except Exception as e:
-            logging.error(e)
-
-        logging.info("File created " + downloadPath)
-        if (blobName.endswith(".pdf")):
-            loader = PDFMinerLoader(downloadPath)
-        elif (blobName.endswith(".docx") or blobName.endswith(".doc")):
-            loader = UnstructuredWordDocumentLoader(downloadPath)
-
-        #loader = UnstructuredFileLoader(downloadPath)
-        rawDocs = loader.load()
-
+        downloadPath = downloadBlob(blobConnectionString, blobContainer, blobName)
         fullPath = getFullPath(blobConnectionString, blobContainer, blobName)
-        for doc in rawDocs:
-            doc.metadata['source'] = fullPath
-        return rawDocs
+        return loadDocuments(downloadPath, blobName, fullPath)
     except Exception as e:
         logging.error("Error in blobLoad: %s", e)
         return None
@@ -195,6 +210,62 @@ def s3Load(bucket, key, s3Client):
         logging.error("Error in s3Load: %s", e)
         return None, None
 
+def parseDocument(job):
+    # Runs on the pipeline process pool, so it only takes and returns picklable values; the chunks
+    # are spooled to disk as they are split instead of being sent back as one list
+    if job['csv']:
+        return job
+    if job['textSplitterType'] == "formrecognizer":
+        with open(job['downloadPath'], "rb") as file:
+            readBytes = file.read()
+        docs = analyze_layout(readBytes, job['fullPath'], FormRecognizerEndPoint, FormRecognizerKey, job['chunkSize'])
+    else:
+        docs = streamDocuments(job['downloadPath'], job['fileName'], job['textSplitterType'], job['chunkSize'],
+                               job['chunkOverlap'], job['source'])
+    job['spoolPath'] = job['downloadPath'] + ".chunks"
+    job['chunks'] = spoolDocuments(docs, job['spoolPath'])
+    logging.info("Docs " + str(job['chunks']) + " for " + job['fileName'])
+    return job
+
+def spooledDocuments(job):
+    # A lazy reader over the chunks for indexing, and the first few chunks for summarization and QA
+    head = list(islice(readSpool(job['spoolPath']), 5))
+    return readSpool(job['spoolPath']), head
+
+def removeJobFiles(job):
+    for path in (job.get('downloadPath'), job.get('spoolPath')):
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            logging.info("Could not remove " + path + " : " + str(e))
+
+def ingestStages(fetchFile, indexFile, indexType):
+    # Redis creates its index on the first write without a lock, so its uploads stay serial
+    indexWorkers = 1 if indexType == "redis" else IngestIndexWorkers
+    return [PipelineStage("fetch", fetchFile, workers=IngestFetchWorkers),
+            PipelineStage("parse", parseDocument, workers=IngestParseWorkers, useProcesses=True, timeout=IngestParseTimeout),
+            PipelineStage("index", indexFile, workers=indexWorkers)]
+
+def completeIngestion(results, pipelineMetrics, metrics, onFailure=None):
+    if metrics is not None:
+        metrics.update(pipelineMetrics)
+    errors = []
+    for item in results:
+        if item.error is None:
+            continue
+        if isinstance(item.value, dict):
+            removeJobFiles(item.value)
+        errors.append(item.key + " (" + item.failedStage + "): " + str(item.error))
+        if onFailure is not None:
+            try:
+                onFailure(item.key)
+            except Exception as e:
+                logging.error("Error recording failure for " + item.key + " : " + str(e))
+    if errors:
+        return "; ".join(errors)
+    return "Success"
+
 def storeIndex(indexType, docs, fileName, nameSpace, embeddingModelType):
     logging.info("Storing index")
     try:
@@ -217,20 +288,35 @@ def storeIndex(indexType, docs, fileName, nameSpace, embeddingModelType):
             return
 
         logging.info("Store the index in " + indexType + " and name : " + nameSpace)
+        # docs may be a lazy stream of chunks, so the vector stores are fed one bounded batch at a time
         if indexType == 'pinecone':
-            Pinecone.from_documents(docs, embeddings, index_name=VsIndexName, namespace=nameSpace)
+            for batch in batched(docs, StoreBatchSize):
+                Pinecone.from_documents(batch, embeddings, index_name=VsIndexName, namespace=nameSpace)
         elif indexType == "redis":
-            Redis.from_documents(docs, embeddings, redis_url=redisUrl, index_name=nameSpace)
+            for batch in batched(docs, StoreBatchSize):
+                Redis.from_documents(batch, embeddings, redis_url=redisUrl, index_name=nameSpace)
         elif indexType == "cogsearch" or indexType == "cogsearchvs":
             createSearchIndex(indexType, nameSpace)
             indexSections(indexType, embeddingModelType, fileName, nameSpace, docs)
+        elif indexType == "local":
+            index = getLocalIndex(nameSpace)
+            # Chunks from an earlier upload of the same file are dropped once the new ones are searchable
+            previous = index.idsWhere("file", fileName)
+            engine = getEmbeddingEngine(embeddingModelType, OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding)
+            for batch in batched(docs, StoreBatchSize):
+                vectors = engine.embed([doc.page_content for doc in batch])
+                index.add([uuid.uuid4().hex for _ in batch], vectors,
+                          [{"content": doc.page_content, "metadata": {**doc.metadata, "file": fileName}} for doc in batch])
+            index.delete(previous)
+            logging.info(f"Local index {nameSpace}: {index.stats()}")
         elif indexType == "chroma":
             logging.info("Chroma Client: " + str(docs))
             #Chroma.from_documents(docs, embeddings, collection_name=nameSpace, client=chromaClient, embedding_function=embeddings)
         elif indexType == 'milvus':
             milvus = Milvus(connection_args={"host": "127.0.0.1", "port": "19530"},
                             collection_name=VsIndexName, text_field="text", embedding_function=embeddings)
-            Milvus.from_documents(docs,embeddings)
+            for batch in batched(docs, StoreBatchSize):
+                Milvus.from_documents(batch,embeddings)
     except Exception as e:
         logging.error("Exception during storeIndex" + str(e))
         pass
@@ -238,7 +324,8 @@ def storeIndex(indexType, docs, fileName, nameSpace, embeddingModelType):
 def Embed(indexType, loadType, multiple, indexName,  value,  blobConnectionString,
                                 blobContainer, blobPrefix, blobName, s3Bucket, s3Key, s3AccessKey,
                                 s3SecretKey, s3Prefix, existingIndex, existingIndexNs,
-                                embeddingModelType, textSplitterType, chunkSize, chunkOverlap, promptType, deploymentType):
+                                embeddingModelType, textSplitterType, chunkSize, chunkOverlap, promptType, deploymentType,
+                                metrics=None):
     logging.info("Embedding Data")
     try:
         uResultNs = uuid.uuid4()
@@ -261,105 +348,64 @@ def Embed(indexType, loadType, multiple, indexName,  value,  blobConnectionStrin
                 filesData = list(map(lambda x: {'filename': x['filename']}, filesData))
 
                 logging.info(f"Found {len(filesData)} files to embed")
-                for file in filesData:
-                    logging.info(f"Adding {file['filename']} to Process")
-                    fileName = file['filename']
-                    # Check the file extension
-                    if fileName.endswith('.txt'):
-                        logging.info("Embedding text file")
-                        readBytes  = getBlob(OpenAiDocConnStr, OpenAiDocContainer, fileName)
-                        fileContent = readBytes.decode('utf-8')
-                        downloadPath = os.path.join(tempfile.gettempdir(), fileName)
-                        os.makedirs(os.path.dirname(tempfile.gettempdir()), exist_ok=True)
-                        try:
-                            with open(downloadPath, "wb") as file:
-                                file.write(bytes(fileContent, 'utf-8'))
-                        except Exception as e:
-                            errorMessage = str(e)
-                            logging.error(e)
-
-                        logging.info("File created")
-                        if textSplitterType == "recursive":
-                            loader = UnstructuredFileLoader(downloadPath)
-                            rawDocs = loader.load()
-                            textSplitter = RecursiveCharacterTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                            docs = textSplitter.split_documents(rawDocs)
-                        elif textSplitterType == "tiktoken":
-                            loader = UnstructuredFileLoader(downloadPath)
-                            rawDocs = loader.load()
-                            textSplitter = TokenTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                            docs = textSplitter.split_documents(rawDocs)
-                        elif textSplitterType == "nltk":
-                            loader = UnstructuredFileLoader(downloadPath)
-                            rawDocs = loader.load()
-                            textSplitter = NLTKTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                            docs = textSplitter.split_documents(rawDocs)
-                        elif textSplitterType == "formrecognizer":
-                            fullPath = getFullPath(OpenAiDocConnStr, OpenAiDocContainer, fileName)
-                            docs = analyze_layout(readBytes, fullPath, FormRecognizerEndPoint, FormRecognizerKey, chunkSize)
-                        logging.info("Docs " + str(len(docs)))
-                        storeIndex(indexType, docs, fileName, indexGuId, embeddingModelType)
-                    elif fileName.endswith('.csv'):
+                if indexType == "cogsearch" or indexType == "cogsearchvs":
+                    # Create the index once so the concurrent uploads don't race to create it
+                    createSearchIndex(indexType, indexGuId)
+
+                def fetchFile(fileName):
+                    logging.info(f"Adding {fileName} to Process")
+                    job = {'fileName': fileName, 'csv': fileName.endswith('.csv'), 'textSplitterType': textSplitterType,
+                           'chunkSize': chunkSize, 'chunkOverlap': chunkOverlap}
+                    if not job['csv']:
+                        job['downloadPath'] = downloadBlob(OpenAiDocConnStr, OpenAiDocContainer, fileName)
+                        job['fullPath'] = getFullPath(OpenAiDocConnStr, OpenAiDocContainer, fileName)
+                        job['source'] = None if fileName.endswith('.txt') else job['fullPath']
+                    return job
+
+                def indexFile(job):
+                    fileName = job['fileName']
+                    if job['csv']:
                         # for CSV, all we want to do is set the metadata
                         # so that we can use the appropriate CSV/Pandas/Spark agent for QA and Chat
                         # and/or the Smart Agent
-                        logging.info("Processing CSV File")
-                    else:
-                        try:
-                            logging.info("Embedding Non-text file")
-                            docs = []
-                            if textSplitterType == "recursive":
-                                rawDocs = blobLoad(OpenAiDocConnStr, OpenAiDocContainer, fileName)
-                                textSplitter = RecursiveCharacterTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                                docs = textSplitter.split_documents(rawDocs)
-                            elif textSplitterType == "tiktoken":
-                                rawDocs = blobLoad(OpenAiDocConnStr, OpenAiDocContainer, fileName)
-                                textSplitter = TokenTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                                docs = textSplitter.split_documents(rawDocs)
-                            elif textSplitterType == "nltk":
-                                rawDocs = blobLoad(OpenAiDocConnStr, OpenAiDocContainer, fileName)
-                                textSplitter = NLTKTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                                docs = textSplitter.split_documents(rawDocs)
-                            elif textSplitterType == "formrecognizer":
-                                readBytes  = getBlob(OpenAiDocConnStr, OpenAiDocContainer, fileName)
-                                fullPath = getFullPath(OpenAiDocConnStr, OpenAiDocContainer, fileName)
-                                docs = analyze_layout(readBytes, fullPath, FormRecognizerEndPoint, FormRecognizerKey, chunkSize)
-                            logging.info("Docs " + str(len(docs)))
-                            storeIndex(indexType, docs, fileName, indexGuId, embeddingModelType)
-                        except Exception as e:
-                            logging.info(e)
-                            upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, fileName, {'embedded': 'false', 'indexType': indexType,
-                                                                                            "textSplitterType": textSplitterType, 
-                                    "chunkSize": chunkSize, "chunkOverlap": chunkOverlap, "promptType": promptType, "singleFile": singleFile})
-                            errorMessage = str(e)
-                            return errorMessage
-                    if not(fileName.endswith('.csv')):
-                        logging.info("Perform Summarization and QA")
-                        qa, summary = summarizeGenerateQa(docs, embeddingModelType, deploymentType)
-                        logging.info("Upsert metadata")
-                        metadata = {'embedded': 'true', 'namespace': indexGuId, 'indexType': indexType, 
-                                    "indexName": indexName.replace("-", "_"),
-                                    "textSplitterType": textSplitterType, 
-                                    "chunkSize": chunkSize, "chunkOverlap": chunkOverlap,
-                                    "promptType": promptType,
-                                    "singleFile": singleFile}
-                        logging.info(str(metadata))
-                        upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, fileName, metadata)
-                        try:
-                            metadata = {'summary': summary.replace("-", "_"), 'qa': qa.replace("-", "_")}
-                            upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, fileName, metadata)
-                        except:
-                            pass
-                    elif fileName.endswith('.csv'):
                         logging.info("Upsert metadata")
                         metadata = {'embedded': 'true', 'namespace': indexGuId, 'indexType': "csv", "indexName": indexName.replace("-", "_"),
                                     'summary': 'No Summary', 'qa': 'No QA',
                                     "textSplitterType": textSplitterType, 
                                     "chunkSize": chunkSize, "chunkOverlap": chunkOverlap, "promptType": promptType, "singleFile": singleFile}
                         upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, fileName, metadata)
-                    logging.info("Sleeping")
-                    time.sleep(5)
-                return "Success"
+                        return fileName
+                    docs, headDocs = spooledDocuments(job)
+                    try:
+                        storeIndex(indexType, docs, fileName, indexGuId, embeddingModelType)
+                    finally:
+                        removeJobFiles(job)
+                    logging.info("Perform Summarization and QA")
+                    qa, summary = summarizeGenerateQa(headDocs, embeddingModelType, deploymentType)
+                    logging.info("Upsert metadata")
+                    metadata = {'embedded': 'true', 'namespace': indexGuId, 'indexType': indexType, 
+                                "indexName": indexName.replace("-", "_"),
+                                "textSplitterType": textSplitterType, 
+                                "chunkSize": chunkSize, "chunkOverlap": chunkOverlap,
+                                "promptType": promptType,
+                                "singleFile": singleFile}
+                    logging.info(str(metadata))
+                    upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, fileName, metadata)
+                    try:
+                        metadata = {'summary': summary.replace("-", "_"), 'qa': qa.replace("-", "_")}
+                        upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, fileName, metadata)
+                    except:
+                        pass
+                    return fileName
+
+                def fileFailed(fileName):
+                    upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, fileName, {'embedded': 'false', 'indexType': indexType,
+                                                                                    "textSplitterType": textSplitterType, 
+                                    "chunkSize": chunkSize, "chunkOverlap": chunkOverlap, "promptType": promptType, "singleFile": singleFile})
+
+                results, pipelineMetrics = runPipeline(((file['filename'], file['filename']) for file in filesData),
+                                                       ingestStages(fetchFile, indexFile, indexType))
+                return completeIngestion(results, pipelineMetrics, metrics, fileFailed)
             except Exception as e:
                 logging.error("Error in processing file : " + str(e))
                 upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, indexName + ".txt", {'embedded': 'false', 'indexType': indexType,
@@ -379,15 +425,7 @@ def Embed(indexType, loadType, multiple, indexName,  value,  blobConnectionStrin
                     fileName = file['filename']
                     if fileName.endswith('.zip'):
                         # Download Zip File
-                        readBytes  = getBlob(OpenAiDocConnStr, OpenAiDocContainer, fileName)
-                        downloadPath = os.path.join(tempfile.gettempdir(), fileName)
-                        os.makedirs(os.path.dirname(tempfile.gettempdir()), exist_ok=True)
-                        try:
-                            with open(downloadPath, "wb") as file:
-                                file.write(readBytes)
-                        except Exception as e:
-                            errorMessage = str(e)
-                            logging.error(e)
+                        downloadPath = downloadBlob(OpenAiDocConnStr, OpenAiDocContainer, fileName)
 
                         # Unzip the file
                         zipDownloadPath = os.path.join(tempfile.gettempdir(), "Data\\Markdown\\" + Path(fileName).stem)
@@ -399,22 +437,12 @@ def Embed(indexType, loadType, multiple, indexName,  value,  blobConnectionStrin
                             print(e)
                         markdownFiles = glob.glob(os.path.join(zipDownloadPath + "\\**", "*.md"), recursive=True)
 
-                        rawDocs = []
+                        headDocs = []
                         for file in markdownFiles:
                             try:
-                                with open(file, 'r', encoding="utf8") as f:
-                                        doc = f.read()
-
-                                headerSplit = [
-                                ("#", "Title"),
-                                ("##", "SubTitle"),
-                                ]
-                                markDownSplitter = MarkdownHeaderTextSplitter(headers_to_split_on=headerSplit)
-                                docs = markDownSplitter.split_text(doc)
-                                for doc in docs:
-                                    doc.metadata['source'] = Path(file).stem
-                                rawDocs = rawDocs + docs
-                                storeIndex(indexType, docs, Path(file).stem, indexGuId, embeddingModelType)
+                                # Sections are split while the file is read and go straight to the index
+                                docs = splitMarkdownStream(iterLines(file), {'source': Path(file).stem})
+                                storeIndex(indexType, keepHead(docs, headDocs), Path(file).stem, indexGuId, embeddingModelType)
                             except Exception as e:
                                 logging.info("Skipping file " + file + " as it is not a valid markdown file" + str(e))
                                 continue
@@ -424,7 +452,7 @@ def Embed(indexType, loadType, multiple, indexName,  value,  blobConnectionStrin
                         #     doc.metadata['source'] = fullPath
 
                         logging.info("Perform Summarization and QA")
-                        qa, summary = summarizeGenerateQa(rawDocs, embeddingModelType, deploymentType)
+                        qa, summary = summarizeGenerateQa(headDocs, embeddingModelType, deploymentType)
                         logging.info("Upsert metadata")
                         metadata = {'embedded': 'true', 'namespace': indexGuId, 'indexType': indexType, 
                                     "indexName": indexName.replace("-", "_"),
@@ -493,93 +521,53 @@ def Embed(indexType, loadType, multiple, indexName,  value,  blobConnectionStrin
                                                                                           "promptType": promptType, "singleFile": singleFile})
                 errorMessage = str(e)
                 return errorMessage
-        elif (loadType == "adlscontainer"):
+        elif (loadType == "adlscontainer" or loadType == "adlsfile"):
             try:
-                logging.info("Embedding Azure Blob Container")
-                container = ContainerClient.from_connection_string(
-                    conn_str=blobConnectionString, container_name=blobContainer
-                )
-                frDocs = []
-                blobList = container.list_blobs(name_starts_with=blobPrefix)
-                for blob in blobList:
-                    logging.info("Process Blob : " + blob.name)
-                    if textSplitterType == "recursive":
-                        blobDocs = blobLoad(blobConnectionString, blobContainer, blob.name)
-                        copyBlob(blobConnectionString, blobContainer,  blob.name, OpenAiDocConnStr, OpenAiDocContainer)
-                        textSplitter = RecursiveCharacterTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                    elif textSplitterType == "tiktoken":
-                        blobDocs = blobLoad(blobConnectionString, blobContainer, blob.name)
-                        copyBlob(blobConnectionString, blobContainer,  blob.name, OpenAiDocConnStr, OpenAiDocContainer)
-                        textSplitter = TokenTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                    elif textSplitterType == "nltk":
-                        blobDocs = blobLoad(blobConnectionString, blobContainer, blob.name)
-                        copyBlob(blobConnectionString, blobContainer,  blob.name, OpenAiDocConnStr, OpenAiDocContainer)
-                        textSplitter = NLTKTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                    elif textSplitterType == "formrecognizer":
-                        readBytes  = getBlob(blobConnectionString, blobContainer, blob.name)
-                        copyBlob(blobConnectionString, blobContainer,  blob.name, OpenAiDocConnStr, OpenAiDocContainer)
-                        fullPath = getFullPath(blobConnectionString, blobContainer, blob.name)
-                        docs = analyze_layout(readBytes, fullPath, FormRecognizerEndPoint, FormRecognizerKey, chunkSize)
-                        frDocs.extend(docs)
-                    docs = []
-                    if textSplitterType != "formrecognizer":
-                        docs = textSplitter.split_documents(blobDocs)
-                    else:
-                        docs = frDocs
-                    storeIndex(indexType, docs,  blob.name, indexGuId, embeddingModelType)
+                if loadType == "adlsfile":
+                    logging.info("Embedding Azure Blob File")
+                    blobNames = [blobName]
+                else:
+                    logging.info("Embedding Azure Blob Container")
+                    container = ContainerClient.from_connection_string(
+                        conn_str=blobConnectionString, container_name=blobContainer
+                    )
+                    blobNames = (blob.name for blob in container.list_blobs(name_starts_with=blobPrefix))
+                if indexType == "cogsearch" or indexType == "cogsearchvs":
+                    createSearchIndex(indexType, indexGuId)
+
+                def fetchBlob(blobName):
+                    logging.info("Process Blob : " + blobName)
+                    downloadPath = downloadBlob(blobConnectionString, blobContainer, blobName)
+                    copyBlob(blobConnectionString, blobContainer,  blobName, OpenAiDocConnStr, OpenAiDocContainer)
+                    fullPath = getFullPath(blobConnectionString, blobContainer, blobName)
+                    return {'fileName': blobName, 'csv': False, 'textSplitterType': textSplitterType,
+                            'chunkSize': chunkSize, 'chunkOverlap': chunkOverlap,
+                            'downloadPath': downloadPath, 'fullPath': fullPath, 'source': fullPath}
+
+                def indexBlob(job):
+                    blobName = job['fileName']
+                    docs, headDocs = spooledDocuments(job)
+                    try:
+                        storeIndex(indexType, docs,  blobName, indexGuId, embeddingModelType)
+                    finally:
+                        removeJobFiles(job)
 
                     logging.info("Perform Summarization and QA")
-                    qa, summary = summarizeGenerateQa(docs, embeddingModelType, deploymentType)
+                    qa, summary = summarizeGenerateQa(headDocs, embeddingModelType, deploymentType)
                     logging.info("Upsert metadata")
-                    upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, blob.name, {'embedded': 'true', 'namespace': indexGuId, 'indexType': indexType, 
+                    upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, blobName, {'embedded': 'true', 'namespace': indexGuId, 'indexType': indexType, 
                                                                                      "indexName": indexName,
                                                                                      "textSplitterType": textSplitterType, 
                                                                                      "chunkSize": chunkSize, "chunkOverlap": chunkOverlap,
                                                                                      "promptType": promptType, "singleFile": singleFile})
-                    upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, blob.name, {'summary': summary, 'qa': qa})
-                return "Success"
-            except Exception as e:
-                logging.error("Error in processing ADLS Container : "  + str(e))
-                #upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, indexName + ".txt", {'embedded': 'false', 'indexType': indexType})
-                errorMessage = str(e)
-                return errorMessage
-        elif (loadType == "adlsfile"):
-            try:
-                logging.info("Embedding Azure Blob File")
-                docs = []
-                if textSplitterType == "recursive":
-                    rawDocs = blobLoad(blobConnectionString, blobContainer, blobName)
-                    copyBlob(blobConnectionString, blobContainer, blobName, OpenAiDocConnStr, OpenAiDocContainer)
-                    textSplitter = RecursiveCharacterTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                    docs = textSplitter.split_documents(rawDocs)
-                elif textSplitterType == "tiktoken":
-                    rawDocs = blobLoad(blobConnectionString, blobContainer, blobName)
-                    copyBlob(blobConnectionString, blobContainer,  blobName, OpenAiDocConnStr, OpenAiDocContainer)
-                    textSplitter = TokenTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                    docs = textSplitter.split_documents(rawDocs)
-                elif textSplitterType == "nltk":
-                    rawDocs = blobLoad(blobConnectionString, blobContainer, blobName)
-                    copyBlob(blobConnectionString, blobContainer, blobName, OpenAiDocConnStr, OpenAiDocContainer)
-                    textSplitter = NLTKTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
-                    docs = textSplitter.split_documents(rawDocs)
-                elif textSplitterType == "formrecognizer":
-                    readBytes  = getBlob(blobConnectionString, blobContainer,blobName)
-                    copyBlob(blobConnectionString, blobContainer,  blobName, OpenAiDocConnStr, OpenAiDocContainer)
-                    fullPath = getFullPath(blobConnectionString, blobContainer, blobName)
-                    docs = analyze_layout(readBytes, fullPath, FormRecognizerEndPoint, FormRecognizerKey, chunkSize)
-                storeIndex(indexType, docs, blobName, indexGuId, embeddingModelType)
-                logging.info("Perform Summarization and QA")
-                qa, summary = summarizeGenerateQa(docs, embeddingModelType, deploymentType)
-                logging.info("Upsert metadata")
-                upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, blobName, {'embedded': 'true', 'namespace': indexGuId, 
-                                                                                'indexType': indexType, "indexName": indexName,
-                                                                                "textSplitterType": textSplitterType, 
-                                                                                "chunkSize": chunkSize, "chunkOverlap": chunkOverlap,
-                                                                                "promptType": promptType, "singleFile": singleFile})
-                upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, blobName, {'summary': summary, 'qa': qa})
-                return "Success"
+                    upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, blobName, {'summary': summary, 'qa': qa})
+                    return blobName
+
+                results, pipelineMetrics = runPipeline(((name, name) for name in blobNames),
+                                                       ingestStages(fetchBlob, indexBlob, indexType))
+                return completeIngestion(results, pipelineMetrics, metrics)
             except Exception as e:
-                logging.error("Error in processing ADLS File : "  + str(e))
+                logging.error("Error in processing ADLS " + loadType + " : "  + str(e))
                 #upsertMetadata(OpenAiDocConnStr, OpenAiDocContainer, indexName + ".txt", {'embedded': 'false', 'indexType': indexType})
                 errorMessage = str(e)
                 return errorMessage
@@ -733,15 +721,17 @@ def TransformValue(indexType, loadType,  multiple, indexName, existingIndex, exi
         s3SecretKey = data['s3SecretKey']
         s3Prefix = data['s3Prefix']
 
+        metrics = {}
         summaryResponse = Embed(indexType, loadType,  multiple, indexName, value, blobConnectionString,
                                 blobContainer, blobPrefix, blobName, s3Bucket, s3Key, s3AccessKey,
                                 s3SecretKey, s3Prefix, existingIndex, existingIndexNs, embeddingModelType,
-                                textSplitter, chunkSize, chunkOverlap, promptType, deploymentType)
+                                textSplitter, chunkSize, chunkOverlap, promptType, deploymentType, metrics)
+        responseData = {"error": summaryResponse}
+        if metrics:
+            responseData["metrics"] = metrics
         return ({
             "recordId": recordId,
-            "data": {
-                "error": summaryResponse
-                    }
+            "data": responseData
             })
 
     except:
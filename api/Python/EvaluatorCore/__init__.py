@@ -7,6 +7,7 @@ from Utilities.envVars import *
 import json
 import pandas as pd
 from collections import namedtuple
+import itertools
 from Utilities.azureBlob import getBlob, getFullPath
 
 def EvaluatorCore(context: df.DurableOrchestrationContext):
@@ -35,7 +36,6 @@ def EvaluatorCore(context: df.DurableOrchestrationContext):
         model = "GPT3.5"
         #chunkSizes = ['500', '1000', '1500', '2000']
         #overlaps = ['0', '50', '100', '150']
-        result = []
 
         SplitDocs = namedtuple('SplitDoc', ['splitMethods', 'chunkSizes', 'overlaps', 
                                            'model', 'embeddingModelType', 'fileName' ])
@@ -57,18 +57,26 @@ def EvaluatorCore(context: df.DurableOrchestrationContext):
         #logging.info("Evaluator Qa Data: " + str(evaluatorQaData))
 
         RunDocs = namedtuple('RunDoc', ['evalatorQaData', 'totalQuestions', 'promptStyle', 'documentId', 
-                                        'splitMethods', 'chunkSizes', 'overlaps',
+                                        'splitMethod', 'chunkSize', 'overlap', 'runId',
                                         'retrieverType', 'reEvaluate', 'topK', 'model', 'fileName',
                                         'embeddingModelType', 'temperature', 'tokenLength'])
-        runDocs = RunDocs(evalatorQaData=evaluatorQaData, totalQuestions=totalQuestions, promptStyle=promptStyle,
-                            documentId=documentId, splitMethods=splitMethods, chunkSizes=chunkSizes, overlaps=overlaps,
-                            retrieverType=retrieverType, reEvaluate=reEvaluate, topK=topK, model=model, fileName=fileName,
-                            embeddingModelType=embeddingModelType, temperature=temperature, tokenLength=tokenLength)
-        logging.info("Evaluator Run Doc Activity")
-        evaluatedResult = yield context.call_activity('EvaluatorRunDoc', runDocs)
+        # new_uuid is replay safe; it is only used when the document has not been evaluated before
+        runId = str(context.new_uuid())
+        # One activity per configuration, so each one stays well inside the function timeout and a replay
+        # reuses the results of the activities that already completed
+        retryOptions = df.RetryOptions(first_retry_interval_in_milliseconds=30000, max_number_of_attempts=3)
+        runTasks = []
+        for splitMethod, chunkSize, overlap in itertools.product(splitMethods, chunkSizes, overlaps):
+            runDocs = RunDocs(evalatorQaData=evaluatorQaData, totalQuestions=totalQuestions, promptStyle=promptStyle,
+                                documentId=documentId, splitMethod=splitMethod, chunkSize=chunkSize, overlap=overlap, runId=runId,
+                                retrieverType=retrieverType, reEvaluate=reEvaluate, topK=topK, model=model, fileName=fileName,
+                                embeddingModelType=embeddingModelType, temperature=temperature, tokenLength=tokenLength)
+            runTasks.append(context.call_activity_with_retry('EvaluatorRunDoc', retryOptions, runDocs))
+        logging.info(f"Evaluator Run Doc Activity for {len(runTasks)} configurations")
+        result = yield context.task_all(runTasks)
         context.set_custom_status = "Completed Evaluator Run Doc Activity"
 
-        return [result]
+        return result
     except ValueError:
         return func.HttpResponse(
              "Invalid body",
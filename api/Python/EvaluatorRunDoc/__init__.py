@@ -5,6 +5,7 @@ import azure.durable_functions as df
 from Utilities.envVars import *
 # Import required libraries
 from Utilities.cogSearchVsRetriever import CognitiveSearchVsRetriever
+from Utilities.rerank import RerankRetriever, RERANK_CANDIDATES
 from langchain.chains import RetrievalQA
 from langchain import PromptTemplate
 from langchain.text_splitter import RecursiveCharacterTextSplitter
@@ -26,13 +27,18 @@ from Utilities.evaluator import createEvaluatorResultIndex, searchEvaluatorRunId
 from json import JSONDecodeError
 import random
 import itertools
+from concurrent.futures import ThreadPoolExecutor
 import openai
 from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
 from langchain.evaluation.qa import QAEvalChain
-from Utilities.evaluator import searchEvaluatorRunIndex, createEvaluatorRunIndex, getEvaluatorResult
+from Utilities.evaluator import searchEvaluatorRunIndex, createEvaluatorRunIndex, getEvaluatorResult, chunkConfiguration
+
+# Questions are answered, and graded in batches, this many at a time
+EVALUATION_WORKERS = 8
+GRADING_BATCH = 8
 
 RunDocs = namedtuple('RunDoc', ['evalatorQaData', 'totalQuestions', 'promptStyle', 'documentId', 
-                                        'splitMethods', 'chunkSizes', 'overlaps',
+                                        'splitMethod', 'chunkSize', 'overlap', 'runId',
                                         'retrieverType', 'reEvaluate', 'topK', 'model', 'fileName',
                                         'embeddingModelType', 'temperature', 'tokenLength'])
 
@@ -223,67 +229,79 @@ def blobLoad(blobConnectionString, blobContainer, blobName):
         doc.metadata['source'] = fullPath
     return rawDocs
 
-def runEvaluator(llm, evaluatorQaData, totalQuestions, chain, retriever, promptStyle, 
+def predictQuestion(chain, example):
+    # Only the chain call is timed; the documents it retrieved come back with the answer
+    startTime = time.time()
+    try:
+        output = chain({"query": example["question"]}, return_only_outputs=True)
+    except Exception as e:
+        logging.error(f"Error in prediction for {example['question']}: {e}")
+        return None
+    latency = time.time() - startTime
+
+    # Extract text from retrieved docs
+    retrievedDocText = ""
+    for i, doc in enumerate(output.get("source_documents", [])):
+        retrievedDocText += "Doc %s: " % str(i+1) + \
+            doc.page_content + " "
+    return {"result": output["result"], "retrieved": retrievedDocText, "latency": latency}
+
+def gradeInBatches(executor, grade, examples, predictions):
+    # Each batch is one QAEvalChain.apply over several examples, and the batches are graded concurrently
+    batches = [(examples[i:i + GRADING_BATCH], predictions[i:i + GRADING_BATCH]) for i in range(0, len(examples), GRADING_BATCH)]
+    return [graded for batch in executor.map(lambda b: grade(*b), batches) for graded in batch]
+
+def gradeScore(graded):
+    # QAEvalChain.apply returns the grade under its output key, "results" in current langchain and "text" before
+    text = graded.get("results", graded.get("text", ""))
+    return {'score': 1 if "Incorrect" not in text else 0, 'justification': text}
+
+def runEvaluator(llm, evaluatorQaData, totalQuestions, chain, promptStyle, 
                  promptStyleFast, promptStyleBias, promptStyleGrading, promptStyleDefault,
                  gradeDocsPromptFast, gradeDocsPromptDefault) -> list:
-    d = pd.DataFrame(columns=['question', 'answer', 'predictedAnswer', 'answerScore', 'retrievalScore', 'latency'])
-    for i in range(int(totalQuestions)):
-        predictions = []
-        retrievedDocs = []
-        gtDataSet = []
-        latency = []
-        currentDataSet = evaluatorQaData[i]
-    
-        try:
-            startTime = time.time()
-            predictions.append(chain({"query": currentDataSet["question"]}, return_only_outputs=True))
-            gtDataSet.append(currentDataSet)
-            endTime = time.time()
-            elapsedTime = endTime - startTime
-            latency.append(elapsedTime)
-        except:
-            predictions.append({'result': 'Error in prediction'})
-            print("Error in prediction")
-
-        # Extract text from retrieved docs
-        retrievedDocText = ""
-        docs = retriever.get_relevant_documents(currentDataSet["question"])
-        for i, doc in enumerate(docs):
-            retrievedDocText += "Doc %s: " % str(i+1) + \
-                doc.page_content + " "
-
-        # Log
-        retrieved = {"question": currentDataSet["question"],
-                    "answer": currentDataSet["answer"], "result": retrievedDocText}
-        retrievedDocs.append(retrieved)
+    questions = evaluatorQaData[:int(totalQuestions)]
+    with ThreadPoolExecutor(max_workers=EVALUATION_WORKERS, thread_name_prefix="evaluator") as executor:
+        outputs = list(executor.map(lambda example: predictQuestion(chain, example), questions))
+
+        # Questions whose prediction failed are left out of the results
+        gtDataSet = [example for example, output in zip(questions, outputs) if output is not None]
+        predictions = [{"result": output["result"]} for output in outputs if output is not None]
+        retrievedDocs = [{"question": example["question"], "answer": example["answer"], "result": output["retrieved"]}
+                         for example, output in zip(questions, outputs) if output is not None]
+        latency = [output["latency"] for output in outputs if output is not None]
 
         # Grade
-        gradedAnswer = gradeModelAnswer(llm, gtDataSet, predictions, promptStyle, promptStyleFast, promptStyleBias, promptStyleGrading, promptStyleDefault)
-        gradedRetrieval = gradeModelRetrieval(llm, gtDataSet, retrievedDocs, promptStyle, gradeDocsPromptFast, gradeDocsPromptDefault)
-
-        # Assemble output
-        # Summary statistics
-        dfOutput = {'question': currentDataSet['question'], 'answer': currentDataSet['answer'],
-                    'predictedAnswer': predictions[0]['result'], 'answerScore': [{'score': 1 if "Incorrect" not in text else 0,
-                                'justification': text} for text in [g['text'] for g in gradedAnswer]], 
-                                'retrievalScore': [{'score': 1 if "Incorrect" not in text else 0,
-                                'justification': text} for text in [g['text'] for g in gradedRetrieval]],
-                    'latency': latency}
-        
-        #yield dfOutput
-
-        # Add to dataframe
-        d = pd.concat([d, pd.DataFrame(dfOutput)], axis=0)
-
-    d_dict = d.to_dict('records')
-    return d_dict
-
-def main(runDocs: RunDocs) -> str:
-    evaluatorQaData,totalQuestions,promptStyle,documentId,splitMethods,chunkSizes,overlaps,retrieverType,reEvaluate,topK,model,fileName, embeddingModelType, temperature, tokenLength = runDocs
-
-    evaluatorDataIndexName = "evaluatordata"
+        gradedAnswers = gradeInBatches(executor, lambda examples, batch: gradeModelAnswer(llm, examples, batch, promptStyle,
+                                        promptStyleFast, promptStyleBias, promptStyleGrading, promptStyleDefault), gtDataSet, predictions)
+        gradedRetrievals = gradeInBatches(executor, lambda examples, batch: gradeModelRetrieval(llm, examples, batch, promptStyle,
+                                        gradeDocsPromptFast, gradeDocsPromptDefault), gtDataSet, retrievedDocs)
+
+    # Assemble output
+    results = []
+    for example, prediction, gradedAnswer, gradedRetrieval, elapsedTime in zip(gtDataSet, predictions, gradedAnswers, gradedRetrievals, latency):
+        results.append({'question': example['question'], 'answer': example['answer'],
+                    'predictedAnswer': prediction['result'],
+                    'answerScore': gradeScore(gradedAnswer), 'retrievalScore': gradeScore(gradedRetrieval),
+                    'latency': elapsedTime})
+    logging.info(f"Evaluated {len(results)} of {len(questions)} questions")
+    return results
+
+def main(runDocs: RunDocs) -> dict:
+    # Evaluates a single (splitMethod, chunkSize, overlap) configuration; EvaluatorCore runs one of these per configuration
+    evaluatorQaData,totalQuestions,promptStyle,documentId,splitMethod,chunkSize,overlap,runId,retrieverType,reEvaluate,topK,model,fileName, embeddingModelType, temperature, tokenLength = runDocs
+
+    evaluatorChunkIndexName = "evaluatorchunks"
     evaluatorRunIndexName = "evaluatorrun"
     evaluatorRunResultIndexName = "evaluatorrunresult"
+    configuration = {"splitMethod": splitMethod, "chunkSize": chunkSize, "overlap": overlap}
+
+    # Results already checkpointed in the result index by an earlier run are not evaluated again
+    createEvaluatorResultIndex(SearchService, SearchKey, evaluatorRunResultIndexName)
+    r = searchEvaluatorRunIndex(SearchService, SearchKey, evaluatorRunResultIndexName, documentId, retrieverType, 
+                            promptStyle, splitMethod, chunkSize, overlap)
+    if r.get_count() > 0 and not reEvaluate:
+        logging.info(f"Skipping evaluated configuration {configuration} for {documentId}")
+        return dict(configuration, status="Skipped", questions=r.get_count())
 
     qaChainPrompt, promptStyleFast, promptStyleBias, promptStyleGrading, promptStyleDefault, gradeDocsPromptFast, gradeDocsPromptDefault = getPrompts()
 
@@ -314,71 +332,64 @@ def main(runDocs: RunDocs) -> str:
             model_name="gpt-3.5-turbo",
             max_tokens=tokenLength)
 
-    # Select retriever
-    createEvaluatorResultIndex(SearchService, SearchKey, evaluatorRunResultIndexName)
-    # Check if we already have runId for this document
+    # Keep the runId of earlier evaluations of this document; the orchestrator's one is used for a new document
     r = searchEvaluatorRunIdIndex(SearchService, SearchKey, evaluatorRunResultIndexName, documentId)
-    if r.get_count() == 0:
-        runId = str(uuid.uuid4())
-    else:
-        for run in r:
-            runId = run['runId']
-            break
-    for splitMethod in splitMethods:
-        for chunkSize in chunkSizes:
-            for overlap in overlaps:
-                # Verify if we have created the Run ID
-                r = searchEvaluatorRunIndex(SearchService, SearchKey, evaluatorRunResultIndexName, documentId, retrieverType, 
-                                        promptStyle, splitMethod, chunkSize, overlap)
-                if r.get_count() == 0 or reEvaluate:
-                    # Create the Run ID
-                    print("Processing: ", documentId, retrieverType, promptStyle, splitMethod, chunkSize, overlap)
-                    runIdData = []
-                    subRunId = str(uuid.uuid4())
-                
-                    retriever = CognitiveSearchVsRetriever(contentKey="contentVector",
-                                serviceName=SearchService,
-                                apiKey=SearchKey,
-                                indexName=evaluatorDataIndexName,
-                                topK=topK,
-                                splitMethod = splitMethod,
-                                model = model,
-                                chunkSize = chunkSize,
-                                overlap = overlap,
-                                openAiEndPoint = OpenAiEndPoint,
-                                openAiKey = OpenAiKey,
-                                openAiVersion = OpenAiVersion,
-                                openAiApiKey = OpenAiApiKey,
-                                documentId = documentId,
-                                openAiEmbedding=OpenAiEmbedding,
-                                returnFields=["id", "content", "sourceFile", "splitMethod", "chunkSize", "overlap", "model", "modelType", "documentId"]
-                                )
-                    vectorStoreChain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever, 
-                                                    chain_type_kwargs={"prompt": qaChainPrompt})
-                    runEvaluations = runEvaluator(llm, evaluatorQaData, totalQuestions, vectorStoreChain, retriever, promptStyle, 
-                                                  promptStyleFast, promptStyleBias, promptStyleGrading, promptStyleDefault,
-                                                    gradeDocsPromptFast, gradeDocsPromptDefault)
-                    #yield runEvaluations
-                    
-                    runEvaluationData = []
-                    for runEvaluation in runEvaluations:
-                            runEvaluationData.append({
-                                "id": str(uuid.uuid4()),
-                                "runId": runId,
-                                "subRunId": subRunId,
-                                "documentId": documentId,
-                                "retrieverType": retrieverType,
-                                "promptStyle": promptStyle,
-                                "splitMethod": splitMethod,
-                                "chunkSize": chunkSize,
-                                "overlap": overlap,
-                                "question": runEvaluation['question'],
-                                "answer": runEvaluation['answer'],
-                                "predictedAnswer": runEvaluation['predictedAnswer'],
-                                "answerScore": json.dumps(runEvaluation['answerScore']),
-                                "retrievalScore": json.dumps(runEvaluation['retrievalScore']),
-                                "latency": str(runEvaluation['latency']),
-                            })
-                    indexDocs(SearchService, SearchKey, evaluatorRunResultIndexName, runEvaluationData)
+    for run in r:
+        runId = run['runId']
+        break
+
+    print("Processing: ", documentId, retrieverType, promptStyle, splitMethod, chunkSize, overlap)
+    subRunId = str(uuid.uuid4())
+
+    # The "Rerank" retriever type grades the same chunks after reranking a wider candidate set down to topK
+    rerank = retrieverType == "Rerank"
+    retriever = CognitiveSearchVsRetriever(contentKey="contentVector",
+                serviceName=SearchService,
+                apiKey=SearchKey,
+                indexName=evaluatorChunkIndexName,
+                topK=RERANK_CANDIDATES if rerank else topK,
+                splitMethod = splitMethod,
+                model = model,
+                chunkSize = chunkSize,
+                overlap = overlap,
+                openAiEndPoint = OpenAiEndPoint,
+                openAiKey = OpenAiKey,
+                openAiVersion = OpenAiVersion,
+                openAiApiKey = OpenAiApiKey,
+                documentId = documentId,
+                configuration = chunkConfiguration(splitMethod, model, chunkSize, overlap),
+                openAiEmbedding=OpenAiEmbedding,
+                # With rerank, the stored chunk vectors come back too, so the candidates are not embedded again
+                returnFields=["id", "content", "sourceFile", "configurations", "modelType", "documentId"] + (["contentVector"] if rerank else [])
+                )
+    if rerank:
+        retriever = RerankRetriever(retriever=retriever, k=topK, embeddingModelType=embeddingModelType)
+    vectorStoreChain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever, 
+                                    chain_type_kwargs={"prompt": qaChainPrompt}, return_source_documents=True)
+    runEvaluations = runEvaluator(llm, evaluatorQaData, totalQuestions, vectorStoreChain, promptStyle, 
+                                  promptStyleFast, promptStyleBias, promptStyleGrading, promptStyleDefault,
+                                    gradeDocsPromptFast, gradeDocsPromptDefault)
+    
+    runEvaluationData = []
+    for runEvaluation in runEvaluations:
+            runEvaluationData.append({
+                "id": str(uuid.uuid4()),
+                "runId": runId,
+                "subRunId": subRunId,
+                "documentId": documentId,
+                "retrieverType": retrieverType,
+                "promptStyle": promptStyle,
+                "splitMethod": splitMethod,
+                "chunkSize": chunkSize,
+                "overlap": overlap,
+                "question": runEvaluation['question'],
+                "answer": runEvaluation['answer'],
+                "predictedAnswer": runEvaluation['predictedAnswer'],
+                "answerScore": json.dumps(runEvaluation['answerScore']),
+                "retrievalScore": json.dumps(runEvaluation['retrievalScore']),
+                "latency": str(runEvaluation['latency']),
+            })
+    # Checkpoint this configuration as soon as it is graded
+    indexDocs(SearchService, SearchKey, evaluatorRunResultIndexName, runEvaluationData)
                     
-    return "Success"
\ No newline at end of file
+    return dict(configuration, status="Evaluated", questions=len(runEvaluationData), subRunId=subRunId)
@@ -10,6 +10,7 @@ from langchain import PromptTemplate
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from Utilities.evaluator import createEvaluatorDataSearchIndex, indexEvaluatorDataSections, indexDocs
 from Utilities.evaluator import searchEvaluatorDocumentIndexedData, createEvaluatorDocumentSearchIndex
+from Utilities.evaluator import createEvaluatorChunkSearchIndex, indexEvaluatorChunkGrid, chunkConfiguration
 from langchain.chains import QAGenerationChain
 import json
 import time
@@ -50,7 +51,7 @@ def main(splitDocs: SplitDocs) -> str:
     logging.info("Split Document for Evaluation")
     splitMethods, chunkSizes, overlaps, model, embeddingModelType, fileName = splitDocs
     evaluatorDocumentIndex = "evaluatordocument"
-    evaluatorDataIndexName = "evaluatordata"
+    evaluatorChunkIndexName = "evaluatorchunks"
 
     # Process our fileName
     # TODO : Add support for other file types
@@ -80,26 +81,24 @@ def main(splitDocs: SplitDocs) -> str:
             })
         indexDocs(SearchService, SearchKey, evaluatorDocumentIndex, evaluatorDocument)
 
-    logging.info("Create Evaluator Data Search Index")
-    createEvaluatorDataSearchIndex(SearchService, SearchKey, evaluatorDataIndexName)
+    logging.info("Create Evaluator Chunk Search Index")
+    createEvaluatorChunkSearchIndex(SearchService, SearchKey, evaluatorChunkIndexName)
+    # Splitting is local and cheap, so every configuration is split on every run; only chunks (or configuration
+    # references) missing from the chunk index cost an embedding or an upload
+    docsByConfiguration = {}
     for splitMethod in splitMethods:
         for chunkSize in chunkSizes:
             for overlap in overlaps:
-                # Check if we already have data inserted into our index
-                logging.info("Search for Document Indexed Data")
-                dataResponse = searchEvaluatorDocumentIndexedData(SearchService, SearchKey, evaluatorDataIndexName, documentId, 
-                                                    splitMethod, chunkSize, overlap)
-                if dataResponse.get_count() == 0:
-                    logging.info("Processing Split Method: " + splitMethod + " Chunk Size: " + chunkSize + " Overlap: " + overlap)
-                    # Split the document into chunks of 500 characters & 0 overlap
-                    if splitMethod == "RecursiveCharacterTextSplitter":
-                        logging.info("Create Splitter")
-                        splitter = RecursiveCharacterTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(overlap))
-                        logging.info("Split Document")
-                        docs = splitter.split_documents(rawDocs)
+                logging.info("Processing Split Method: " + splitMethod + " Chunk Size: " + chunkSize + " Overlap: " + overlap)
+                if splitMethod == "RecursiveCharacterTextSplitter":
+                    splitter = RecursiveCharacterTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(overlap))
+                    docsByConfiguration[chunkConfiguration(splitMethod, model, chunkSize, overlap)] = splitter.split_documents(rawDocs)
+                else:
+                    logging.info("Unsupported Split Method: " + splitMethod)
 
-                    logging.info("Index Document Data")
-                    indexEvaluatorDataSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, 
-                                SearchKey, embeddingModelType, OpenAiEmbedding, fileName, evaluatorDataIndexName, docs, 
-                                splitMethod, chunkSize, overlap, model, embeddingModelType, documentId)
+    logging.info("Index Document Chunks")
+    stats = indexEvaluatorChunkGrid(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey,
+                                    embeddingModelType, OpenAiEmbedding, fileName, evaluatorChunkIndexName, docsByConfiguration,
+                                    embeddingModelType, documentId)
+    logging.info(f"Indexed document chunks: {stats}")
     return documentId
\ No newline at end of file
@@ -26,6 +26,7 @@ from langchain.chains.qa_with_sources import load_qa_with_sources_chain
 #from langchain.vectorstores import Weaviate
 from Utilities.azureBlob import upsertMetadata, getBlob, getAllBlobs, getSasToken, getFullPath
 from Utilities.cogSearch import createSearchIndex, createSections, indexSections, deleteSearchIndex
+from Utilities.localIndex import deleteLocalIndex
 from langchain.document_loaders import AzureBlobStorageFileLoader
 from langchain.document_loaders import AzureBlobStorageContainerLoader
 from azure.storage.blob import BlobClient
@@ -100,6 +101,8 @@ def IndexManagement(indexType, indexName, blobName, indexNs, operation, record):
                 Redis.drop_index(index_name=indexNs, delete_documents=True, redis_url=redisUrl)
             elif indexType == "cogsearch" or indexType == "cogsearchvs":
                 deleteSearchIndex(indexNs)
+            elif indexType == "local":
+                deleteLocalIndex(indexNs)
             blobList = getAllBlobs(OpenAiDocConnStr, OpenAiDocContainer)
             for blob in blobList:
                 try:
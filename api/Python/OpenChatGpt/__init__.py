@@ -7,7 +7,9 @@ import os
 import pinecone
 from Utilities.envVars import *
 from azure.cosmos import CosmosClient, PartitionKey
-from Utilities.modelHelper import numTokenFromMessages, getTokenLimit
+from Utilities.clientRegistry import getCosmosContainer, withClient
+from Utilities.modelHelper import getTokenLimit
+from Utilities.messageBuilder import getMessagesFromHistory
 from typing import Any, Sequence
 from langchain.utilities import BingSearchAPIWrapper
 from langchain.agents import AgentType, initialize_agent, Tool
@@ -139,33 +141,7 @@ def ComposeResponse(jsonData, indexNs, indexType):
             results["values"].append(outputRecord)
     return json.dumps(results, ensure_ascii=False)
 
-def getMessagesFromHistory(systemPrompt: str, modelId: str, history: Sequence[dict[str, str]], 
-                           userConv: str, fewShots = [], maxTokens: int = 4096):
-        #messageBuilder = MessageBuilder(systemPrompt, modelId)
-        messages = []
-        messages.append({'role': 'system', 'content': systemPrompt})
-        tokenLength = numTokenFromMessages(messages[-1], modelId)
-
-        # Add examples to show the chat what responses we want. It will try to mimic any responses and make sure they match the rules laid out in the system message.
-        for shot in fewShots:
-            messages.insert(1, {'role': shot.get('role'), 'content': shot.get('content')})
-
-        userContent = userConv
-        appendIndex = len(fewShots) + 1
-
-        messages.insert(appendIndex, {'role': "user", 'content': userContent})
-
-        for h in reversed(history[:-1]):
-            if h.get("bot"):
-                messages.insert(appendIndex, {'role': "assistant", 'content': h.get('bot')})
-            messages.insert(appendIndex, {'role': "user", 'content': h.get('user')})
-            tokenLength += numTokenFromMessages(messages[appendIndex], modelId)
-            if tokenLength > maxTokens:
-                break
-        
-        return messages
-
-def insertMessage(sessionId, type, role, totalTokens, tokens, response, cosmosContainer):
+def insertMessage(sessionId, type, role, totalTokens, tokens, response):
     aiMessage = {
         "id": str(uuid.uuid4()), 
         "type": type, 
@@ -175,7 +151,8 @@ def insertMessage(sessionId, type, role, totalTokens, tokens, response, cosmosCo
         "timestamp": datetime.datetime.utcnow().isoformat(), 
         "content": response
     }
-    cosmosContainer.create_item(body=aiMessage)
+    # Upserted, as the id is fixed above and a retry after a timeout may find the first write already stored
+    withClient(getCosmosContainer, (CosmosEndpoint, CosmosKey, CosmosDatabase, CosmosContainer), lambda container: container.upsert_item(body=aiMessage))
 
 def checkFunctionArgs(function, args):
     sig = inspect.signature(function)
@@ -498,14 +475,6 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                 openai_api_key=OpenAiApiKey,
                 max_tokens=tokenLength)
         
-    try:
-        cosmosClient = CosmosClient(url=CosmosEndpoint, credential=CosmosKey)
-        cosmosDb = cosmosClient.create_database_if_not_exists(id=CosmosDatabase)
-        cosmosKey = PartitionKey(path="/sessionId")
-        cosmosContainer = cosmosDb.create_container_if_not_exists(id=CosmosContainer, partition_key=cosmosKey, offer_throughput=400)
-    except Exception as e:
-        logging.info("Error connecting to CosmosDB: " + str(e))
-
     lastQuestion = history[-1]["user"]
 
     # If we are getting the new session, let's insert the data into CosmosDB
@@ -513,7 +482,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
         if firstSession:
             sessionInfo = overrides.get('session') or ''
             session = json.loads(sessionInfo)
-            cosmosContainer.upsert_item(session)
+            withClient(getCosmosContainer, (CosmosEndpoint, CosmosKey, CosmosDatabase, CosmosContainer), lambda container: container.upsert_item(session))
             logging.info(session)
     except Exception as e:
         logging.info("Error inserting session into CosmosDB: " + str(e))
@@ -525,11 +494,11 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
             history,
             lastQuestion,
             [],
-            tokenLimit - len(lastQuestion) - tokenLength,
+            tokenLimit - tokenLength,
             )
 
     if (functionCall):
-        insertMessage(sessionId, "Message", "User", 0, 0, lastQuestion, cosmosContainer)
+        insertMessage(sessionId, "Message", "User", 0, 0, lastQuestion)
 
         functions = [
             {
@@ -644,7 +613,7 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
             answer = asstResponse
 
         logging.info(answer)
-        insertMessage(sessionId, "Message", "Assistant", 0, 0, answer, cosmosContainer)
+        insertMessage(sessionId, "Message", "Assistant", 0, 0, answer)
         response = {"data_points": '', "answer": answer, 
                     "thoughts": '', 
                     "sources": '', 
@@ -688,9 +657,9 @@ def GetRrrAnswer(history, approach, overrides, indexNs, indexType):
                 top_p=float(1.0))
             
     try:
-        insertMessage(sessionId, "Message", "User", 0, 0, lastQuestion, cosmosContainer)
+        insertMessage(sessionId, "Message", "User", 0, 0, lastQuestion)
         answer = completion.choices[0].message.content
-        insertMessage(sessionId, "Message", "Assistant", 0, 0, answer, cosmosContainer)
+        insertMessage(sessionId, "Message", "Assistant", 0, 0, answer)
         response = {"data_points": '', "answer": answer, 
             "thoughts": '', 
             "sources": '', 
@@ -14,7 +14,8 @@ from pytz import timezone
 from dateutil.relativedelta import relativedelta
 from datetime import timedelta
 from Utilities.pibCopilot import indexDocs, createPressReleaseIndex, findEarningCalls, mergeDocs, createPibIndex, findPibData, performEarningCallCogSearch
-from Utilities.pibCopilot import deletePibData, findEarningCallsBySymbol
+from Utilities.pibCopilot import deletePibData, findEarningCallsBySymbol, findEarningCallQuarters, PibStepCache, pibInputHash
+from Utilities.biographyPool import generateBiographies
 from Utilities.pibCopilot import indexEarningCallSections, createEarningCallVectorIndex, createEarningCallIndex, performCogSearch, createSecFilingIndex, findSecFiling
 from Utilities.pibCopilot import findLatestSecFilings, indexSecFilingsSections, createSecFilingsVectorIndex
 import typing
@@ -22,6 +23,7 @@ from Utilities.fmp import *
 from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
 import logging, json, os
 import uuid
+from functools import partial
 import azure.functions as func
 import time
 from Utilities.cogSearchRetriever import CognitiveSearchRetriever
@@ -31,240 +33,126 @@ from Utilities.azureBlob import upsertMetadata, getBlob, getFullPath, copyBlob,
 import tempfile
 from langchain.document_loaders import PDFMinerLoader
 
-def processStep1(pibIndexName, cik, step, symbol, temperature, llm, today):
-    s1Data = []
-    r = findPibData(SearchService, SearchKey, pibIndexName, cik, step, returnFields=['id', 'symbol', 'cik', 'step', 'description', 'insertedDate',
-                                                                    'pibData'])
+def executiveBiography(llm, symbol, executive):
+    #### With the company profile and key executives, we can ask Bing Search to get the biography of the Key executive and 
+    # ask OpenAI to summarize it - Public Data
+    name = executive['name']
+    title = executive['title']
+    query = f"Give me brief biography of {name} who is {title} at {symbol}. Biography should be restricted to {symbol} and summarize it as 2 paragraphs."
+    qaPromptTemplate = """
+        Rephrase the following question asked by user to perform intelligent internet search
+        {query}
+        """
     
-    logging.info(f"Found {r.get_count()} records for {symbol} in {pibIndexName}")
-    if r.get_count() == 0:
-        step1Profile = []
-        profile = companyProfile(apikey=FmpKey, symbol=symbol)
+    qaPrompt = PromptTemplate(input_variables=["query"],template=qaPromptTemplate)
+    chain = LLMChain(llm=llm, prompt=qaPrompt)
+    q = chain.run(query=query)
+    bingSearch = BingSearchAPIWrapper(k=20)
+    results = bingSearch.run(query=q)
+    logging.info(f"Generate Summary for {q}")
+    chain = load_summarize_chain(llm, chain_type="stuff")
+    docs = [Document(page_content=results)]
+    return chain.run(docs)
+
+def processStep1(pibIndexName, cik, step, symbol, temperature, llm, today):
+    cache = PibStepCache(SearchService, SearchKey, pibIndexName, symbol, cik, step, today)
+
+    profile = companyProfile(apikey=FmpKey, symbol=symbol)
+    def formatProfile():
         df = pd.DataFrame.from_dict(pd.json_normalize(profile))
         df.fillna("",inplace=True)
-        sData = {
-                'id' : str(uuid.uuid4()),
-                'symbol': symbol,
-                'cik': cik,
-                'step': step,
-                'description': 'Company Profile',
-                'insertedDate': today.strftime("%Y-%m-%d"),
-                'pibData' : str(df[['symbol', 'mktCap', 'companyName', 'currency', 'cik', 'isin', 'exchange', 'industry', 'sector', 'address', 'city', 'state', 'zip', 'website', 'description']].to_dict('records'))
-        }
-        step1Profile.append(sData)
-        s1Data.append(sData)
-        # Insert data into pibIndex
-        mergeDocs(SearchService, SearchKey, pibIndexName, step1Profile)
-
-        # Get the list of all executives and generate biography for each of them
-        executives = keyExecutives(apikey=FmpKey, symbol=symbol)
-        df = pd.DataFrame.from_dict(pd.json_normalize(executives),orient='columns')
-        df = df.drop_duplicates(subset='name', keep="first")
-
-        step1Biography = []
-        step1Executives = []
-        #### With the company profile and key executives, we can ask Bing Search to get the biography of the all Key executives and 
-        # ask OpenAI to summarize it - Public Data
-        for executive in executives:
-            name = executive['name']
-            title = executive['title']
-            query = f"Give me brief biography of {name} who is {title} at {symbol}. Biography should be restricted to {symbol} and summarize it as 2 paragraphs."
-            qaPromptTemplate = """
-                Rephrase the following question asked by user to perform intelligent internet search
-                {query}
-                """
-            
-            qaPrompt = PromptTemplate(input_variables=["query"],template=qaPromptTemplate)
-            chain = LLMChain(llm=llm, prompt=qaPrompt)
-            q = chain.run(query=query)
-            bingSearch = BingSearchAPIWrapper(k=20)
-            results = bingSearch.run(query=q)
-            logging.info(f"Generate Summary for {q}")
-            chain = load_summarize_chain(llm, chain_type="stuff")
-            docs = [Document(page_content=results)]
-            summary = chain.run(docs)
-            step1Executives.append({
-                "name": name,
-                "title": title,
-                "biography": summary
-            })
-
-        sData = {
-                'id' : str(uuid.uuid4()),
-                'symbol': symbol,
-                'cik': cik,
-                'step': step,
-                'description': 'Biography of Key Executives',
-                'insertedDate': today.strftime("%Y-%m-%d"),
-                'pibData' : str(step1Executives)
-        }
-        step1Biography.append(sData)
-        s1Data.append(sData)
-        mergeDocs(SearchService, SearchKey, pibIndexName, step1Biography)
-    elif r.get_count() == 1:
-        for s in r:
-            logging.info(f"Found Company Profile for {symbol}")
-            if s['description'] == 'Company Profile':
-                s1Data.append(
-                    {
-                        'id' : s['id'],
-                        'symbol': s['symbol'],
-                        'cik': s['cik'],
-                        'step': s['step'],
-                        'description': s['description'],
-                        'insertedDate': s['insertedDate'],
-                        'pibData' : s['pibData']
-                    })
-                
-                # Get the list of all executives and generate biography for each of them
-                executives = keyExecutives(apikey=FmpKey, symbol=symbol)
-                df = pd.DataFrame.from_dict(pd.json_normalize(executives),orient='columns')
-                df = df.drop_duplicates(subset='name', keep="first")
-
-                step1Biography = []
-                step1Executives = []
-                #### With the company profile and key executives, we can ask Bing Search to get the biography of the all Key executives and 
-                # ask OpenAI to summarize it - Public Data
-                for executive in executives:
-                    name = executive['name']
-                    title = executive['title']
-                    query = f"Give me brief biography of {name} who is {title} at {symbol}. Biography should be restricted to {symbol} and summarize it as 2 paragraphs."
-                    qaPromptTemplate = """
-                        Rephrase the following question asked by user to perform intelligent internet search
-                        {query}
-                        """
-                    qaPrompt = PromptTemplate(input_variables=["query"],template=qaPromptTemplate)
-                    chain = LLMChain(llm=llm, prompt=qaPrompt)
-                    q = chain.run(query=query)
-                    bingSearch = BingSearchAPIWrapper(k=25)
-                    results = bingSearch.run(query=q)
-                    logging.info(f"Generate Summary for {q}")
-                    chain = load_summarize_chain(llm, chain_type="stuff")
-                    docs = [Document(page_content=results)]
-                    summary = chain.run(docs)
-                    step1Executives.append({
-                        "name": name,
-                        "title": title,
-                        "biography": summary
-                    })
-
-                sData = {
-                        'id' : str(uuid.uuid4()),
-                        'symbol': symbol,
-                        'cik': cik,
-                        'step': step,
-                        'description': 'Biography of Key Executives',
-                        'insertedDate': today.strftime("%Y-%m-%d"),
-                        'pibData' : str(step1Executives)
-                }
-                step1Biography.append(sData)
-                s1Data.append(sData)
-                mergeDocs(SearchService, SearchKey, pibIndexName, step1Biography)
-            elif s['description'] == 'Biography of Key Executives':
-                logging.info(f"Found Biography of Key Executives for {symbol}")
-                s1Data.append(
-                    {
-                        'id' : s['id'],
-                        'symbol': s['symbol'],
-                        'cik': s['cik'],
-                        'step': s['step'],
-                        'description': s['description'],
-                        'insertedDate': s['insertedDate'],
-                        'pibData' : s['pibData']
-                    })
-                
-                step1Profile = []
-                profile = companyProfile(apikey=FmpKey, symbol=symbol)
-                df = pd.DataFrame.from_dict(pd.json_normalize(profile))
-                sData = {
-                        'id' : str(uuid.uuid4()),
-                        'symbol': symbol,
-                        'cik': cik,
-                        'step': step,
-                        'description': 'Company Profile',
-                        'insertedDate': today.strftime("%Y-%m-%d"),
-                        'pibData' : str(df[['symbol', 'mktCap', 'companyName', 'currency', 'cik', 'isin', 'exchange', 'industry', 'sector', 'address', 'city', 'state', 'zip', 'website', 'description']].to_dict('records'))
-                }
-                step1Profile.append(sData)
-                s1Data.append(sData)
-                # Insert data into pibIndex
-                mergeDocs(SearchService, SearchKey, pibIndexName, step1Profile)
-    else:
-        for s in r:
-            s1Data.append(
-                {
-                    'id' : s['id'],
-                    'symbol': s['symbol'],
-                    'cik': s['cik'],
-                    'step': s['step'],
-                    'description': s['description'],
-                    'insertedDate': s['insertedDate'],
-                    'pibData' : s['pibData']
-                })
-    
+        return str(df[['symbol', 'mktCap', 'companyName', 'currency', 'cik', 'isin', 'exchange', 'industry', 'sector', 'address', 'city', 'state', 'zip', 'website', 'description']].to_dict('records'))
+
+    # Biographies cost a Bing search and two completions per executive, so they are only redone when the executives change
+    executives = keyExecutives(apikey=FmpKey, symbol=symbol)
+
+    s1Data = [cache.section('Company Profile', profile, formatProfile)]
+    biographyRows = cache.storedWhenMissing(executives, 'Biography of Key Executives')
+    if biographyRows is None:
+        executives = executives or []
+        inputHash = pibInputHash([(executive['name'], executive['title']) for executive in executives])
+        biographyRows = cache.fresh(inputHash, 'Biography of Key Executives')
+    if biographyRows is None:
+        biographies, failed = generateBiographies(executives, symbol, today, partial(executiveBiography, llm, symbol))
+        # A section missing some executives, or generated without any, is stored without its hash, so the next
+        # run retries it (the executives already done come from the biography cache)
+        rowHash = None if failed or not executives else inputHash
+        biographyRows = cache.save([cache.newRow('Biography of Key Executives', rowHash, str(biographies))])
+    s1Data.append(biographyRows[0])
     return s1Data
 
-def getEarningCalls(totalYears, historicalYear, symbol, today):
+def earningCallRecord(transcript):
+    symbol = transcript['symbol']
+    quarter = transcript['quarter']
+    year = transcript['year']
+    return {
+        "id": f"{symbol}-{year}-{quarter}",
+        "symbol": symbol,
+        "quarter": str(quarter),
+        "year": str(year),
+        "callDate": transcript['date'],
+        "content": transcript['content'],
+        #"inserteddate": datetime.now(central).strftime("%Y-%m-%d"),
+    }
+
+def getEarningCalls(totalYears, historicalYear, symbol, today, earningCallDates=None):
     # Call the paid data (FMP) API
     # Get the earning call transcripts for the last 3 years and merge documents into the index.
-    i = 0
-    earningsData = []
+    # The stored quarters come from one index query, only the missing ones are fetched (one batch call per year)
+    # and all of them are uploaded together. Returns the latest earning call.
     earningIndexName = 'earningcalls'
     try:
         # Create the index if it does not exist
         createEarningCallIndex(SearchService, SearchKey, earningIndexName)
         # Get the list of all earning calls available
-        earningCallDates = earningCallsAvailableDates(apikey=FmpKey, symbol=symbol)
-        if len(earningCallDates) > 0:
-            quarter = earningCallDates[0][0]
-            year = earningCallDates[0][1]
-            r = findEarningCalls(SearchService, SearchKey, earningIndexName, symbol, str(quarter), str(year), returnFields=['id', 'symbol', 
-                                'quarter', 'year', 'callDate', 'content'])
-            if r.get_count() == 0:
-                insertEarningCall = []
-                earningTranscript = earningCallTranscript(apikey=FmpKey, symbol=symbol, year=str(year), quarter=quarter)
-                for transcript in earningTranscript:
-                    symbol = transcript['symbol']
-                    quarter = transcript['quarter']
-                    year = transcript['year']
-                    callDate = transcript['date']
-                    content = transcript['content']
-                    id = f"{symbol}-{year}-{quarter}"
-                    earningRecord = {
-                        "id": id,
-                        "symbol": symbol,
-                        "quarter": str(quarter),
-                        "year": str(year),
-                        "callDate": callDate,
-                        "content": content,
-                        #"inserteddate": datetime.now(central).strftime("%Y-%m-%d"),
-                    }
-                    earningsData.append(earningRecord)
-                    insertEarningCall.append(earningRecord)
-                    mergeDocs(SearchService, SearchKey, earningIndexName, insertEarningCall)
-            else:
-                logging.info(f"Found {r.get_count()} records for {symbol} for {quarter} {str(year)}")
-                for s in r:
-                    record = {
-                            'id' : s['id'],
-                            'symbol': s['symbol'],
-                            'quarter': s['quarter'],
-                            'year': s['year'],
-                            'callDate': s['callDate'],
-                            'content': s['content']
-                        }
-                    earningsData.append(record)
-        else:
+        if earningCallDates is None:
+            earningCallDates = earningCallsAvailableDates(apikey=FmpKey, symbol=symbol)
+        if len(earningCallDates) == 0:
             logging.info(f"No earning calls found for {symbol}")
-            return earningsData
-                
-        logging.info(f"Total records found for {symbol} : {len(earningsData)}")
-
-        return earningsData[-1]
+            return []
+
+        latestQuarter = (str(earningCallDates[0][1]), str(earningCallDates[0][0]))
+        fromYear = min(historicalYear, int(latestQuarter[0]))
+        stored = findEarningCallQuarters(SearchService, SearchKey, earningIndexName, symbol, fromYear) or []
+        storedQuarters = set((s['year'], s['quarter']) for s in stored)
+        missing = set((str(year), str(quarter)) for quarter, year, *_ in earningCallDates if int(year) >= fromYear)
+        missing -= storedQuarters
+        logging.info(f"Found {len(storedQuarters)} stored earning calls for {symbol} since {fromYear}, {len(missing)} to fetch")
+
+        insertEarningCall = []
+        for year in sorted(set(year for year, _ in missing), reverse=True):
+            transcripts = batch_earning_call_transcript(apikey=FmpKey, symbol=symbol, year=int(year))
+            if not transcripts:
+                # The batch endpoint is not available on every FMP plan
+                transcripts = []
+                for quarter in sorted(q for y, q in missing if y == year):
+                    transcripts.extend(earningCallTranscript(apikey=FmpKey, symbol=symbol, year=year, quarter=quarter) or [])
+            for transcript in transcripts:
+                if (str(transcript['year']), str(transcript['quarter'])) in missing:
+                    insertEarningCall.append(earningCallRecord(transcript))
+        if len(insertEarningCall) > 0:
+            mergeDocs(SearchService, SearchKey, earningIndexName, insertEarningCall)
+
+        for record in insertEarningCall:
+            if (record['year'], record['quarter']) == latestQuarter:
+                return record
+        r = findEarningCalls(SearchService, SearchKey, earningIndexName, symbol, latestQuarter[1], latestQuarter[0], returnFields=['id', 'symbol', 
+                            'quarter', 'year', 'callDate', 'content'])
+        for s in r:
+            return {
+                    'id' : s['id'],
+                    'symbol': s['symbol'],
+                    'quarter': s['quarter'],
+                    'year': s['year'],
+                    'callDate': s['callDate'],
+                    'content': s['content']
+                }
+        logging.info(f"No transcript found for {symbol} for {latestQuarter[1]} {latestQuarter[0]}")
+        return []
     except Exception as e:
         logging.error(f"Error occured while processing {symbol} : {e}")
 
-def getPressReleases(today, symbol):
+def getPressReleases(today, symbol, pr=None):
     # For now we are calling API to get data, but otherwise we need to ensure the data is not persisted in our 
     # index repository before calling again, if it is persisted then we need to delete it first
     counter = 0
@@ -273,7 +161,8 @@ def getPressReleases(today, symbol):
     # Create the index if it does not exist
     createPressReleaseIndex(SearchService, SearchKey, pressReleaseIndexName)
     print(f"Processing ticker : {symbol}")
-    pr = pressReleases(apikey=FmpKey, symbol=symbol, limit=25)
+    if pr is None:
+        pr = pressReleases(apikey=FmpKey, symbol=symbol, limit=25)
     for pressRelease in pr:
         symbol = pressRelease['symbol']
         releaseDate = pressRelease['date']
@@ -362,181 +251,165 @@ def findAnswer(chainType, topK, symbol, quarter, year, question, indexName, embe
 
     return outputAnswer
 
+def getLatestEarningCall(symbol):
+    # The latest transcript already stored in the earning calls index
+    content = ''
+    latestCallDate = ''
+    r = findEarningCallsBySymbol(SearchService, SearchKey, "earningcalls", symbol, returnFields=['id', 'content', 'callDate'])
+    if r.get_count() > 0:
+        logging.info("Total earning calls found: " + str(r.get_count()))
+        existingEarningCalls = []
+        for s in r:
+            existingEarningCalls.append({"callDate": s['callDate'], "content": s['content']})
+        df = pd.DataFrame(existingEarningCalls)
+        df['callDate'] = pd.to_datetime(df['callDate'])
+        df = df.sort_values(by='callDate', ascending=False)
+        latestCallDate = df.iloc[0]['callDate']
+        content = df.iloc[0]['content']
+    return content, latestCallDate
+
 def processStep2(pibIndexName, cik, step, symbol, llm, today, embeddingModelType, totalYears, 
                  historicalYear):
-    r = findPibData(SearchService, SearchKey, pibIndexName, cik, step, returnFields=['id', 'symbol', 'cik', 'step', 'description', 'insertedDate',
-                                                                   'pibData'])
+    cache = PibStepCache(SearchService, SearchKey, pibIndexName, symbol, cik, step, today)
     content = ''
     latestCallDate = ''
-    s2Data = []
-    if r.get_count() == 0:
-
-        #Let's just use the latest earnings call transcript to create the documents that we want to use it 
-        #for generative AI tasks
-        try:
-            latestEarningsData = getEarningCalls(totalYears, historicalYear, symbol, today)
-            content = latestEarningsData['content']
-            latestCallDate = latestEarningsData['callDate']
-            year = latestEarningsData['year']
-            quarter = latestEarningsData['quarter']
-            splitter = RecursiveCharacterTextSplitter(chunk_size=8000, chunk_overlap=1000)
-            rawDocs = splitter.create_documents([content])
-            docs = splitter.split_documents(rawDocs)
-            logging.info("Number of documents chunks generated from Call transcript : " + str(len(docs)))
-        except Exception as e:
-            logging.info("Error in splitting the earning call transcript : ", e)
-            return s2Data, content, latestCallDate
 
-        # Store the last index of the earning call transcript in vector Index
-        earningVectorIndexName = 'latestearningcalls'
-        createEarningCallVectorIndex(SearchService, SearchKey, earningVectorIndexName)
-        # Check if we already have the data store, if not then create it
-        indexEarningCallSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey,
-                                embeddingModelType, OpenAiEmbedding, earningVectorIndexName, docs,
-                                latestCallDate, latestEarningsData['symbol'], latestEarningsData['year'],
-                                latestEarningsData['quarter'])
+    # The Q&A and summary only change when a new earning call transcript is available
+    earningCallDates = earningCallsAvailableDates(apikey=FmpKey, symbol=symbol)
+    inputHash = pibInputHash((earningCallDates or [])[:1])
+    s2Data = cache.storedWhenMissing(earningCallDates, 'Earning Call Q&A', 'Earning Call Summary') or \
+        cache.fresh(inputHash, 'Earning Call Q&A', 'Earning Call Summary')
+    if s2Data is not None:
+        content, latestCallDate = getLatestEarningCall(symbol)
+        return s2Data, content, latestCallDate
 
+    s2Data = []
+    #Let's just use the latest earnings call transcript to create the documents that we want to use it 
+    #for generative AI tasks
+    try:
+        latestEarningsData = getEarningCalls(totalYears, historicalYear, symbol, today, earningCallDates)
+        content = latestEarningsData['content']
+        latestCallDate = latestEarningsData['callDate']
+        year = latestEarningsData['year']
+        quarter = latestEarningsData['quarter']
+        splitter = RecursiveCharacterTextSplitter(chunk_size=8000, chunk_overlap=1000)
+        rawDocs = splitter.create_documents([content])
+        docs = splitter.split_documents(rawDocs)
+        logging.info("Number of documents chunks generated from Call transcript : " + str(len(docs)))
+    except Exception as e:
+        logging.info("Error in splitting the earning call transcript : ", e)
+        return s2Data, content, latestCallDate
 
-        logging.info("Completed latest earning call transcript indexing")
-        earningCallQa = []
-        
-        commonQuestions = [
-            "What are some of the current and looming threats to the business?",
-            "What is the debt level or debt ratio of the company right now?",
-            "How do you feel about the upcoming product launches or new products?",
-            "How are you managing or investing in your human capital?",
-            "How do you track the trends in your industry?",
-            "Are there major slowdowns in the production of goods?",
-            "How will you maintain or surpass this performance in the next few quarters?",
-            "What will your market look like in five years as a result of using your product or service?",
-            "How are you going to address the risks that will affect the long-term growth of the company?",
-            "How is the performance this quarter going to affect the long-term goals of the company?"
-        ]
+    # Store the last index of the earning call transcript in vector Index
+    earningVectorIndexName = 'latestearningcalls'
+    createEarningCallVectorIndex(SearchService, SearchKey, earningVectorIndexName)
+    # Check if we already have the data store, if not then create it
+    indexEarningCallSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey,
+                            embeddingModelType, OpenAiEmbedding, earningVectorIndexName, docs,
+                            latestCallDate, latestEarningsData['symbol'], latestEarningsData['year'],
+                            latestEarningsData['quarter'])
 
-        for question in commonQuestions:
-            answer = findAnswer('stuff', 3, symbol, str(quarter), str(year), question, earningVectorIndexName, embeddingModelType, llm)
-            if "I don't know" not in answer:
-                earningCallQa.append({"question": question, "answer": answer})
-        
-        logging.info("Completed latest earning call transcript Common QA")
-
-        commonQuestions = [
-                "Provide key information about revenue for the quarter",
-                "Provide key information about profits and losses (P&L) for the quarter",
-                "Provide key information about industry trends for the quarter",
-                "Provide key information about business trends discussed on the call",
-                "Provide key information about risk discussed on the call",
-                "Provide key information about AI discussed on the call",
-                "Provide any information about mergers and acquisitions (M&A) discussed on the call.",
-                "Provide key information about guidance discussed on the call"
-            ]
 
-        for question in commonQuestions:
-            answer = findAnswer('stuff', 3, symbol, str(quarter), str(year), question, earningVectorIndexName, embeddingModelType, llm)
-            if "I don't know" not in answer:
-                earningCallQa.append({"question": question, "answer": answer})
+    logging.info("Completed latest earning call transcript indexing")
+    earningCallQa = []
+    
+    commonQuestions = [
+        "What are some of the current and looming threats to the business?",
+        "What is the debt level or debt ratio of the company right now?",
+        "How do you feel about the upcoming product launches or new products?",
+        "How are you managing or investing in your human capital?",
+        "How do you track the trends in your industry?",
+        "Are there major slowdowns in the production of goods?",
+        "How will you maintain or surpass this performance in the next few quarters?",
+        "What will your market look like in five years as a result of using your product or service?",
+        "How are you going to address the risks that will affect the long-term growth of the company?",
+        "How is the performance this quarter going to affect the long-term goals of the company?"
+    ]
+
+    for question in commonQuestions:
+        answer = findAnswer('stuff', 3, symbol, str(quarter), str(year), question, earningVectorIndexName, embeddingModelType, llm)
+        if "I don't know" not in answer:
+            earningCallQa.append({"question": question, "answer": answer})
+    
+    logging.info("Completed latest earning call transcript Common QA")
+
+    commonQuestions = [
+            "Provide key information about revenue for the quarter",
+            "Provide key information about profits and losses (P&L) for the quarter",
+            "Provide key information about industry trends for the quarter",
+            "Provide key information about business trends discussed on the call",
+            "Provide key information about risk discussed on the call",
+            "Provide key information about AI discussed on the call",
+            "Provide any information about mergers and acquisitions (M&A) discussed on the call.",
+            "Provide key information about guidance discussed on the call"
+        ]
 
-        logging.info("Completed latest earning call transcript Specific QA")
+    for question in commonQuestions:
+        answer = findAnswer('stuff', 3, symbol, str(quarter), str(year), question, earningVectorIndexName, embeddingModelType, llm)
+        if "I don't know" not in answer:
+            earningCallQa.append({"question": question, "answer": answer})
 
-        promptTemplate = """You are an AI assistant tasked with summarizing financial information from earning call transcript. 
-            Your summary should accurately capture the key information in the document while avoiding the omission of any domain-specific words. 
-            Please generate a concise and comprehensive summary between 5-7 paragraphs on each of the following numbered topics.  Your response should include the topic as part of the summary.
-            1. Financial Results: Please provide a summary of the financial results.
-            2. Business Highlights: Please provide a summary of the business highlights.
-            3. Future Outlook: Please provide a summary of the future outlook.
-            4. Business Risks: Please provide a summary of the business risks.
-            5. Management Positive Sentiment: Please provide a summary of the what management is confident about.
-            6. Management Negative Sentiment: Please provide a summary of the what management is concerned about.
-            Please remember to use clear language and maintain the integrity of the original information without missing any important details:
-            {text}
-            """
-        customPrompt = PromptTemplate(template=promptTemplate, input_variables=["text"])
-        chainType = "map_reduce"
-        summaryChain = load_summarize_chain(llm, chain_type=chainType, return_intermediate_steps=False, 
-                                    combine_prompt=customPrompt)
-        summaryOutput = summaryChain({"input_documents": docs}, return_only_outputs=True)
-        output = summaryOutput['output_text']
-        logging.info("Completed latest earning call transcript summarization")
-
-        formattedOutput = output.splitlines()
-        while("" in formattedOutput):
-            formattedOutput.remove("")
-        for summary in formattedOutput:
-            splitSummary = summary.split(":")
-            try:
-                question = splitSummary[0]
-                answer = splitSummary[1]
-                earningCallQa.append({"question": question, "answer": answer})
-            except:
-                continue
-
-        s2Data.append({
-                    'id' : str(uuid.uuid4()),
-                    'symbol': symbol,
-                    'cik': cik,
-                    'step': step,
-                    'description': 'Earning Call Q&A',
-                    'insertedDate': today.strftime("%Y-%m-%d"),
-                    'pibData' : str(earningCallQa)
-        })
+    logging.info("Completed latest earning call transcript Specific QA")
 
-        promptTemplate = """You are an AI assistant tasked with summarizing financial information from earning call transcript. 
+    promptTemplate = """You are an AI assistant tasked with summarizing financial information from earning call transcript. 
         Your summary should accurately capture the key information in the document while avoiding the omission of any domain-specific words. 
-        Please generate a concise and comprehensive summary between 5-7 paragraphs and maintain the continuity.  
-        Ensure your summary includes the key information from the transcript like future outlook, business risk, 
-        management concerns.
+        Please generate a concise and comprehensive summary between 5-7 paragraphs on each of the following numbered topics.  Your response should include the topic as part of the summary.
+        1. Financial Results: Please provide a summary of the financial results.
+        2. Business Highlights: Please provide a summary of the business highlights.
+        3. Future Outlook: Please provide a summary of the future outlook.
+        4. Business Risks: Please provide a summary of the business risks.
+        5. Management Positive Sentiment: Please provide a summary of the what management is confident about.
+        6. Management Negative Sentiment: Please provide a summary of the what management is concerned about.
+        Please remember to use clear language and maintain the integrity of the original information without missing any important details:
         {text}
-            """
-        customPrompt = PromptTemplate(template=promptTemplate, input_variables=["text"])
-        logging.info("Starting latest earning call transcript summarization - Stuff or MapReduce")
+        """
+    customPrompt = PromptTemplate(template=promptTemplate, input_variables=["text"])
+    chainType = "map_reduce"
+    summaryChain = load_summarize_chain(llm, chain_type=chainType, return_intermediate_steps=False, 
+                                combine_prompt=customPrompt)
+    summaryOutput = summaryChain({"input_documents": docs}, return_only_outputs=True)
+    output = summaryOutput['output_text']
+    logging.info("Completed latest earning call transcript summarization")
+
+    formattedOutput = output.splitlines()
+    while("" in formattedOutput):
+        formattedOutput.remove("")
+    for summary in formattedOutput:
+        splitSummary = summary.split(":")
         try:
-            chainType = "stuff"
-            summaryChain = load_summarize_chain(llm, chain_type=chainType, prompt=customPrompt)
-            summaryOutput = summaryChain({"input_documents": docs}, return_only_outputs=True)
-            output = summaryOutput['output_text']
-            logging.info("Completed latest earning call transcript summarization - Stuff")
+            question = splitSummary[0]
+            answer = splitSummary[1]
+            earningCallQa.append({"question": question, "answer": answer})
         except:
-            chainType = "map_reduce"
-            summaryChain = load_summarize_chain(llm, chain_type=chainType, combine_prompt=customPrompt)
-            summaryOutput = summaryChain({"input_documents": docs}, return_only_outputs=True)
-            output = summaryOutput['output_text']
-            logging.info("Completed latest earning call transcript summarization - MapReduce")
-        
-        s2Data.append({
-                    'id' : str(uuid.uuid4()),
-                    'symbol': symbol,
-                    'cik': cik,
-                    'step': step,
-                    'description': 'Earning Call Summary',
-                    'insertedDate': today.strftime("%Y-%m-%d"),
-                    'pibData' : str([{"summary": output}])
-        })
+            continue
 
-        mergeDocs(SearchService, SearchKey, pibIndexName, s2Data)
-    else:
-        logging.info('Found existing data')
-        for s in r:
-            s2Data.append(
-                {
-                    'id' : s['id'],
-                    'symbol': s['symbol'],
-                    'cik': s['cik'],
-                    'step': s['step'],
-                    'description': s['description'],
-                    'insertedDate': s['insertedDate'],
-                    'pibData' : s['pibData']
-                })
-        r = findEarningCallsBySymbol(SearchService, SearchKey, "earningcalls", symbol, returnFields=['id', 'content', 'callDate'])
-        if r.get_count() > 0:
-            logging.info("Total earning calls found: " + str(r.get_count()))
-            existingEarningCalls = []
-            for s in r:
-                existingEarningCalls.append({"callDate": s['callDate'], "content": s['content']})
-            df = pd.DataFrame(existingEarningCalls)
-            df['callDate'] = pd.to_datetime(df['callDate'])
-            df = df.sort_values(by='callDate', ascending=False)
-            latestCallDate = df.iloc[0]['callDate']
-            content = df.iloc[0]['content']
+    s2Data.append(cache.newRow('Earning Call Q&A', inputHash, str(earningCallQa)))
+
+    promptTemplate = """You are an AI assistant tasked with summarizing financial information from earning call transcript. 
+    Your summary should accurately capture the key information in the document while avoiding the omission of any domain-specific words. 
+    Please generate a concise and comprehensive summary between 5-7 paragraphs and maintain the continuity.  
+    Ensure your summary includes the key information from the transcript like future outlook, business risk, 
+    management concerns.
+    {text}
+        """
+    customPrompt = PromptTemplate(template=promptTemplate, input_variables=["text"])
+    logging.info("Starting latest earning call transcript summarization - Stuff or MapReduce")
+    try:
+        chainType = "stuff"
+        summaryChain = load_summarize_chain(llm, chain_type=chainType, prompt=customPrompt)
+        summaryOutput = summaryChain({"input_documents": docs}, return_only_outputs=True)
+        output = summaryOutput['output_text']
+        logging.info("Completed latest earning call transcript summarization - Stuff")
+    except:
+        chainType = "map_reduce"
+        summaryChain = load_summarize_chain(llm, chain_type=chainType, combine_prompt=customPrompt)
+        summaryOutput = summaryChain({"input_documents": docs}, return_only_outputs=True)
+        output = summaryOutput['output_text']
+        logging.info("Completed latest earning call transcript summarization - MapReduce")
+    
+    s2Data.append(cache.newRow('Earning Call Summary', inputHash, str([{"summary": output}])))
+
+    s2Data = cache.save(s2Data)
 
     return s2Data, content, latestCallDate
 
@@ -557,70 +430,57 @@ def summarizePressReleases(llm, docs):
     outputAnswer = summary['output_text']
     return outputAnswer
 
+def summarizeLatestPressReleases(llm, pressReleasesList):
+    """The summaries of the latest press releases, and whether any of them failed."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=50)
+    # We will process only last 25 press releases
+    rawPressReleasesDoc = [Document(page_content=t['content']) for t in pressReleasesList[:25]]
+    pressReleasesDocs = splitter.split_documents(rawPressReleasesDoc)
+    logging.info("Number of documents chunks generated from Press releases : " + str(len(pressReleasesDocs)))
+
+
+    pressReleasesPib = []
+    failed = False
+    last25PressReleases = pressReleasesList[:25]
+    last25PressReleasesDocs = pressReleasesDocs[:25]
+    i = 0
+    for pDocs in last25PressReleasesDocs:
+        try:
+            logging.info("Processing Press Release: " + str(i))
+            outputAnswer = summarizePressReleases(llm, [pDocs])
+            jsonStep = json.loads(outputAnswer)
+            pressReleasesPib.append({
+                    "releaseDate": last25PressReleases[i]['releaseDate'],
+                    "title": last25PressReleases[i]['title'],
+                    "summary": jsonStep['summary'],
+                    "sentiment": jsonStep['sentiment'],
+                    "sentimentScore": jsonStep['sentiment score']
+            })
+            i = i + 1
+        except Exception as e:
+            logging.info("Error processing Press Release: " + str(i) + " : " + str(e))
+            failed = True
+            i = i + 1
+            continue
+    return pressReleasesPib, failed
+
 def processStep3(symbol, cik, step, llm, pibIndexName, today):
     # With the data indexed, let's summarize the information
-    s3Data = []
-    r = findPibData(SearchService, SearchKey, pibIndexName, cik, step, returnFields=['id', 'symbol', 'cik', 'step', 'description', 'insertedDate',
-                                                                   'pibData'])
-    if r.get_count() == 0:
-        logging.info('No existing data found')
-        pressReleasesList = getPressReleases(today, symbol)
-
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=50)
-        # We will process only last 25 press releases
-        rawPressReleasesDoc = [Document(page_content=t['content']) for t in pressReleasesList[:25]]
-        pressReleasesDocs = splitter.split_documents(rawPressReleasesDoc)
-        logging.info("Number of documents chunks generated from Press releases : " + str(len(pressReleasesDocs)))
-
-
-        pressReleasesPib = []
-        last25PressReleases = pressReleasesList[:25]
-        last25PressReleasesDocs = pressReleasesDocs[:25]
-        i = 0
-        for pDocs in last25PressReleasesDocs:
-            try:
-                logging.info("Processing Press Release: " + str(i))
-                outputAnswer = summarizePressReleases(llm, [pDocs])
-                jsonStep = json.loads(outputAnswer)
-                pressReleasesPib.append({
-                        "releaseDate": last25PressReleases[i]['releaseDate'],
-                        "title": last25PressReleases[i]['title'],
-                        "summary": jsonStep['summary'],
-                        "sentiment": jsonStep['sentiment'],
-                        "sentimentScore": jsonStep['sentiment score']
-                })
-                i = i + 1
-            except:
-                logging.info("Error processing Press Release: " + str(i))
-                i = i + 1
-                continue
-
-        # We are deleting the data as the Press-releases could be dynamic and we want the latest data
-        # deletePibData(SearchService, SearchKey, pibIndexName, cik, step, returnFields=['id', 'symbol', 'cik', 'step', 'description', 'insertedDate',
-        #                                                                'pibData'])
-        s3Data.append({
-                        'id' : str(uuid.uuid4()),
-                        'symbol': symbol,
-                        'cik': cik,
-                        'step': step,
-                        'description': 'Press Releases',
-                        'insertedDate': today.strftime("%Y-%m-%d"),
-                        'pibData' : str(pressReleasesPib)
-                })
-        mergeDocs(SearchService, SearchKey, pibIndexName, s3Data)
-    else:
-        logging.info('Found existing data')
-        for s in r:
-            s3Data.append(
-                {
-                    'id' : s['id'],
-                    'symbol': s['symbol'],
-                    'cik': s['cik'],
-                    'step': s['step'],
-                    'description': s['description'],
-                    'insertedDate': s['insertedDate'],
-                    'pibData' : s['pibData']
-                })
+    cache = PibStepCache(SearchService, SearchKey, pibIndexName, symbol, cik, step, today)
+
+    # Each release is summarized by the LLM, so the summaries are only redone when the latest releases change
+    pr = pressReleases(apikey=FmpKey, symbol=symbol, limit=25)
+    s3Data = cache.storedWhenMissing(pr, 'Press Releases')
+    if s3Data is not None:
+        return s3Data
+    pr = pr or []
+    inputHash = pibInputHash([(pressRelease['date'], pressRelease['title']) for pressRelease in pr])
+    s3Data = cache.fresh(inputHash, 'Press Releases')
+    if s3Data is None:
+        pressReleasesList = getPressReleases(today, symbol, pr)
+        pressReleasesPib, failed = summarizeLatestPressReleases(llm, pressReleasesList)
+        # A partial or empty summary is stored without its hash, so the next run summarizes the releases again
+        s3Data = cache.save([cache.newRow('Press Releases', None if failed or not pr else inputHash, str(pressReleasesPib))])
     return s3Data
 
 def generateSummaries(llm, docs):
@@ -752,8 +612,7 @@ def processStep4(symbol, cik, filingType, historicalYear, currentYear, embedding
 
     s4Data = []
     ticker = symbol
-    r = findPibData(SearchService, SearchKey, pibIndexName, cik, step, returnFields=['id', 'symbol', 'cik', 'step', 'description', 'insertedDate',
-                                                                   'pibData'])
+    cache = PibStepCache(SearchService, SearchKey, pibIndexName, symbol, cik, step, today)
     secFilingIndexName = 'secdata'
     secFilingsListResp = secFilings(apikey=FmpKey, symbol=ticker, filing_type=filingType)
     if len(secFilingsListResp) > 0:
@@ -781,329 +640,281 @@ def processStep4(symbol, cik, filingType, historicalYear, currentYear, embedding
         logging.info("Latest Filing Date : " + latestFilingDate)
         secFilingList = []
         
+        # The summaries only change when a newer filing is published
+        inputHash = pibInputHash(filingType, latestFilingDate)
+        cached = cache.fresh(inputHash, 'SEC Filings')
+        if cached is not None:
+            return cached
+
+        # Check if we have already processed the latest filing, if yes then skip
+        createSecFilingIndex(SearchService, SearchKey, secFilingIndexName)
+        r = findSecFiling(SearchService, SearchKey, secFilingIndexName, cik, filingType, latestFilingDate, returnFields=['id', 'cik', 'company', 'filingType', 'filingDate',
+                                                                                                                        'periodOfReport', 'sic', 'stateOfInc', 'fiscalYearEnd',
+                                                                                                                        'filingHtmlIndex', 'htmFilingLink', 'completeTextFilingLink',
+                                                                                                                        'item1', 'item1A', 'item1B', 'item2', 'item3', 'item4', 'item5',
+                                                                                                                        'item6', 'item7', 'item7A', 'item8', 'item9', 'item9A', 'item9B',
+                                                                                                                        'item10', 'item11', 'item12', 'item13', 'item14', 'item15',
+                                                                                                                        'sourcefile'])
+        logging.info("Found existing filing index :" + str(r.get_count()))
         if r.get_count() == 0:
-            # Check if we have already processed the latest filing, if yes then skip
-            createSecFilingIndex(SearchService, SearchKey, secFilingIndexName)
-            r = findSecFiling(SearchService, SearchKey, secFilingIndexName, cik, filingType, latestFilingDate, returnFields=['id', 'cik', 'company', 'filingType', 'filingDate',
-                                                                                                                            'periodOfReport', 'sic', 'stateOfInc', 'fiscalYearEnd',
-                                                                                                                            'filingHtmlIndex', 'htmFilingLink', 'completeTextFilingLink',
-                                                                                                                            'item1', 'item1A', 'item1B', 'item2', 'item3', 'item4', 'item5',
-                                                                                                                            'item6', 'item7', 'item7A', 'item8', 'item9', 'item9A', 'item9B',
-                                                                                                                            'item10', 'item11', 'item12', 'item13', 'item14', 'item15',
-                                                                                                                            'sourcefile'])
-            logging.info("Found existing filing index :" + str(r.get_count()))
-            if r.get_count() == 0:
-                emptyBody = {
-                        "values": [
-                            {
-                                "recordId": 0,
-                                "data": {
-                                    "text": ""
-                                }
-                            }
-                        ]
-                }
-
-                secExtractBody = {
+            emptyBody = {
                     "values": [
                         {
                             "recordId": 0,
                             "data": {
-                                "text": {
-                                    "edgar_crawler": {
-                                        "start_year": int(filingYear),
-                                        "end_year": int(filingYear),
-                                        "quarters": [int(filingQuarter)],
-                                        "filing_types": [
-                                            "10-K"
-                                        ],
-                                        "cik_tickers": [cik],
-                                        "user_agent": "Your name (your email)",
-                                        "raw_filings_folder": "RAW_FILINGS",
-                                        "indices_folder": "INDICES",
-                                        "filings_metadata_file": "FILINGS_METADATA.csv",
-                                        "skip_present_indices": skipIndicies
-                                    },
-                                    "extract_items": {
-                                        "raw_filings_folder": "RAW_FILINGS",
-                                        "extracted_filings_folder": "EXTRACTED_FILINGS",
-                                        "filings_metadata_file": "FILINGS_METADATA.csv",
-                                        "items_to_extract": ["1","1A","1B","2","3","4","5","6","7","7A","8","9","9A","9B","10","11","12","13","14","15"],
-                                        "remove_tables": False,
-                                        "skip_extracted_filings": True
-                                    }
-                                }
+                                "text": ""
                             }
                         }
                     ]
-                }
-                # Call Azure Function to perform Web-scraping and store the JSON in our blob
-                secExtract = requests.post(SecExtractionUrl, json = secExtractBody)
-                # Need to validated on how best to manage the processing
-                time.sleep(10)
-                # Once the JSON is created, call the function to process the JSON and store the data in our index
-                docPersistUrl = SecDocPersistUrl + "&indexType=cogsearchvs&indexName=" + secFilingIndexName + "&embeddingModelType=" + embeddingModelType
-                secPersist = requests.post(docPersistUrl, json = emptyBody)
-                r = findSecFiling(SearchService, SearchKey, secFilingIndexName, cik, filingType, latestFilingDate, returnFields=['id', 'cik', 'company', 'filingType', 'filingDate',
-                                                                                                                            'periodOfReport', 'sic', 'stateOfInc', 'fiscalYearEnd',
-                                                                                                                            'filingHtmlIndex', 'htmFilingLink', 'completeTextFilingLink',
-                                                                                                                            'item1', 'item1A', 'item1B', 'item2', 'item3', 'item4', 'item5',
-                                                                                                                            'item6', 'item7', 'item7A', 'item8', 'item9', 'item9A', 'item9B',
-                                                                                                                            'item10', 'item11', 'item12', 'item13', 'item14', 'item15',
-                                                                                                                            'sourcefile'])
-                
-            # Retrieve the latest filing from our index
-            lastSecData = ''
-            for filing in r:
-                lastSecData = filing['item1'] + '\n' + filing['item1A'] + '\n' + filing['item1B'] + '\n' + filing['item2'] + '\n' + filing['item3'] + '\n' + filing['item4'] + '\n' + \
-                    filing['item5'] + '\n' + filing['item6'] + '\n' + filing['item7'] + '\n' + filing['item7A'] + '\n' + filing['item8'] + '\n' + \
-                    filing['item9'] + '\n' + filing['item9A'] + '\n' + filing['item9B'] + '\n' + filing['item10'] + '\n' + filing['item11'] + '\n' + filing['item12'] + '\n' + \
-                    filing['item13'] + '\n' + filing['item14'] + '\n' + filing['item15']
-                secFilingList.append({
-                    "id": filing['id'],
-                    "cik": filing['cik'],
-                    "company": filing['company'],
-                    "filingType": filing['filingType'],
-                    "filingDate": filing['filingDate'],
-                    "periodOfReport": filing['periodOfReport'],
-                    "sic": filing['sic'],
-                    "stateOfInc": filing['stateOfInc'],
-                    "fiscalYearEnd": filing['fiscalYearEnd'],
-                    "filingHtmlIndex": filing['filingHtmlIndex'],
-                    "completeTextFilingLink": filing['completeTextFilingLink'],
-                    "item1": filing['item1'],
-                    "item1A": filing['item1A'],
-                    "item1B": filing['item1B'],
-                    "item2": filing['item2'],
-                    "item3": filing['item3'],
-                    "item4": filing['item4'],
-                    "item5": filing['item5'],
-                    "item6": filing['item6'],
-                    "item7": filing['item7'],
-                    "item7A": filing['item7A'],
-                    "item8": filing['item8'],
-                    "item9": filing['item9'],
-                    "item9A": filing['item9A'],
-                    "item9B": filing['item9B'],
-                    "item10": filing['item10'],
-                    "item11": filing['item11'],
-                    "item12": filing['item12'],
-                    "item13": filing['item13'],
-                    "item14": filing['item14'],
-                    "item15": filing['item15'],
-                    "sourcefile": filing['sourcefile']
-                })
-                logging.info('Process summaries for ' + symbol)
-                secFilingsPib = processStep4Summaries(llm, secFilingList)
-                s4Data.append({
-                            'id' : str(uuid.uuid4()),
-                            'symbol': symbol,
-                            'cik': cik,
-                            'step': step,
-                            'description': 'SEC Filings',
-                            'insertedDate': today.strftime("%Y-%m-%d"),
-                            'pibData' : str(secFilingsPib)
-                    })
-                mergeDocs(SearchService, SearchKey, pibIndexName, s4Data)
-
-                # Check if we have already processed the latest filing, if yes then skip
-                secFilingsVectorIndexName = 'latestsecfilings'
-                createSecFilingsVectorIndex(SearchService, SearchKey, secFilingsVectorIndexName)
-                r = findLatestSecFilings(SearchService, SearchKey, secFilingsVectorIndexName, cik, symbol, latestFilingDate, filingType, returnFields=['id', 'cik', 'symbol', 'latestFilingDate', 'filingType',
-                                                                                                                                'content'])
-                if r.get_count() == 0:
-                    logging.info("Processing latest SEC Filings for CIK : " + str(cik) + " and Symbol : " + str(symbol))
-                    splitter = RecursiveCharacterTextSplitter(chunk_size=8000, chunk_overlap=1000)
-                    rawDocs = splitter.create_documents([lastSecData])
-                    docs = splitter.split_documents(rawDocs)
-                    logging.info("Number of documents chunks generated from Last SEC Filings : " + str(len(docs)))
-
-                    # Store the last index of the earning call transcript in vector Index
-                    indexSecFilingsSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey,
-                                        embeddingModelType, OpenAiEmbedding, secFilingsVectorIndexName, docs, cik,
-                                        symbol, latestFilingDate, filingType)
-        else:
-            logging.info('Found existing data')
-            for s in r:
-                s4Data.append(
+            }
+
+            secExtractBody = {
+                "values": [
                     {
-                        'id' : s['id'],
-                        'symbol': s['symbol'],
-                        'cik': s['cik'],
-                        'step': s['step'],
-                        'description': s['description'],
-                        'insertedDate': s['insertedDate'],
-                        'pibData' : s['pibData']
-                    })
+                        "recordId": 0,
+                        "data": {
+                            "text": {
+                                "edgar_crawler": {
+                                    "start_year": int(filingYear),
+                                    "end_year": int(filingYear),
+                                    "quarters": [int(filingQuarter)],
+                                    "filing_types": [
+                                        "10-K"
+                                    ],
+                                    "cik_tickers": [cik],
+                                    "user_agent": "Your name (your email)",
+                                    "raw_filings_folder": "RAW_FILINGS",
+                                    "indices_folder": "INDICES",
+                                    "filings_metadata_file": "FILINGS_METADATA.csv",
+                                    "skip_present_indices": skipIndicies
+                                },
+                                "extract_items": {
+                                    "raw_filings_folder": "RAW_FILINGS",
+                                    "extracted_filings_folder": "EXTRACTED_FILINGS",
+                                    "filings_metadata_file": "FILINGS_METADATA.csv",
+                                    "items_to_extract": ["1","1A","1B","2","3","4","5","6","7","7A","8","9","9A","9B","10","11","12","13","14","15"],
+                                    "remove_tables": False,
+                                    "skip_extracted_filings": True
+                                }
+                            }
+                        }
+                    }
+                ]
+            }
+            # Call Azure Function to perform Web-scraping and store the JSON in our blob
+            secExtract = requests.post(SecExtractionUrl, json = secExtractBody)
+            # Need to validated on how best to manage the processing
+            time.sleep(10)
+            # Once the JSON is created, call the function to process the JSON and store the data in our index
+            docPersistUrl = SecDocPersistUrl + "&indexType=cogsearchvs&indexName=" + secFilingIndexName + "&embeddingModelType=" + embeddingModelType
+            secPersist = requests.post(docPersistUrl, json = emptyBody)
+            r = findSecFiling(SearchService, SearchKey, secFilingIndexName, cik, filingType, latestFilingDate, returnFields=['id', 'cik', 'company', 'filingType', 'filingDate',
+                                                                                                                        'periodOfReport', 'sic', 'stateOfInc', 'fiscalYearEnd',
+                                                                                                                        'filingHtmlIndex', 'htmFilingLink', 'completeTextFilingLink',
+                                                                                                                        'item1', 'item1A', 'item1B', 'item2', 'item3', 'item4', 'item5',
+                                                                                                                        'item6', 'item7', 'item7A', 'item8', 'item9', 'item9A', 'item9B',
+                                                                                                                        'item10', 'item11', 'item12', 'item13', 'item14', 'item15',
+                                                                                                                        'sourcefile'])
+            
+        # Retrieve the latest filing from our index
+        lastSecData = ''
+        for filing in r:
+            lastSecData = filing['item1'] + '\n' + filing['item1A'] + '\n' + filing['item1B'] + '\n' + filing['item2'] + '\n' + filing['item3'] + '\n' + filing['item4'] + '\n' + \
+                filing['item5'] + '\n' + filing['item6'] + '\n' + filing['item7'] + '\n' + filing['item7A'] + '\n' + filing['item8'] + '\n' + \
+                filing['item9'] + '\n' + filing['item9A'] + '\n' + filing['item9B'] + '\n' + filing['item10'] + '\n' + filing['item11'] + '\n' + filing['item12'] + '\n' + \
+                filing['item13'] + '\n' + filing['item14'] + '\n' + filing['item15']
+            secFilingList.append({
+                "id": filing['id'],
+                "cik": filing['cik'],
+                "company": filing['company'],
+                "filingType": filing['filingType'],
+                "filingDate": filing['filingDate'],
+                "periodOfReport": filing['periodOfReport'],
+                "sic": filing['sic'],
+                "stateOfInc": filing['stateOfInc'],
+                "fiscalYearEnd": filing['fiscalYearEnd'],
+                "filingHtmlIndex": filing['filingHtmlIndex'],
+                "completeTextFilingLink": filing['completeTextFilingLink'],
+                "item1": filing['item1'],
+                "item1A": filing['item1A'],
+                "item1B": filing['item1B'],
+                "item2": filing['item2'],
+                "item3": filing['item3'],
+                "item4": filing['item4'],
+                "item5": filing['item5'],
+                "item6": filing['item6'],
+                "item7": filing['item7'],
+                "item7A": filing['item7A'],
+                "item8": filing['item8'],
+                "item9": filing['item9'],
+                "item9A": filing['item9A'],
+                "item9B": filing['item9B'],
+                "item10": filing['item10'],
+                "item11": filing['item11'],
+                "item12": filing['item12'],
+                "item13": filing['item13'],
+                "item14": filing['item14'],
+                "item15": filing['item15'],
+                "sourcefile": filing['sourcefile']
+            })
+            logging.info('Process summaries for ' + symbol)
+            secFilingsPib = processStep4Summaries(llm, secFilingList)
+            s4Data.append(cache.newRow('SEC Filings', inputHash, str(secFilingsPib)))
+            s4Data = cache.save(s4Data)
+
+            # Check if we have already processed the latest filing, if yes then skip
+            secFilingsVectorIndexName = 'latestsecfilings'
+            createSecFilingsVectorIndex(SearchService, SearchKey, secFilingsVectorIndexName)
+            r = findLatestSecFilings(SearchService, SearchKey, secFilingsVectorIndexName, cik, symbol, latestFilingDate, filingType, returnFields=['id', 'cik', 'symbol', 'latestFilingDate', 'filingType',
+                                                                                                                            'content'])
+            if r.get_count() == 0:
+                logging.info("Processing latest SEC Filings for CIK : " + str(cik) + " and Symbol : " + str(symbol))
+                splitter = RecursiveCharacterTextSplitter(chunk_size=8000, chunk_overlap=1000)
+                rawDocs = splitter.create_documents([lastSecData])
+                docs = splitter.split_documents(rawDocs)
+                logging.info("Number of documents chunks generated from Last SEC Filings : " + str(len(docs)))
+
+                # Store the last index of the earning call transcript in vector Index
+                indexSecFilingsSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey,
+                                    embeddingModelType, OpenAiEmbedding, secFilingsVectorIndexName, docs, cik,
+                                    symbol, latestFilingDate, filingType)
     else:
         logging.info('No Sec Filing data')
-
-        s4Data.append({
-                    'id' : str(uuid.uuid4()),
-                    'symbol': symbol,
-                    'cik': cik,
-                    'step': step,
-                    'description': 'SEC Filings',
-                    'insertedDate': today.strftime("%Y-%m-%d"),
-                    'pibData' : str([{
+        s4Data = [cache.section('SEC Filings', [filingType, None], lambda: str([{
                         "section": "SEC Filings",
                         "summaryType": "SEC Filings",
                         "summary": "No Sec Filing Found"
-                    }])
-            })
-        mergeDocs(SearchService, SearchKey, pibIndexName, s4Data)
+                    }]))]
 
     return s4Data
 
-def processStep5(pibIndexName, cik, step, symbol, today):
-    s5Data = []
-
-    r = findPibData(SearchService, SearchKey, pibIndexName, cik, step, returnFields=['id', 'symbol', 'cik', 'step', 'description', 'insertedDate',
-                                                                    'pibData'])
-
-    if r.get_count() == 0:
-        logging.info('No existing data found')
-        companyRating = rating(apikey=FmpKey, symbol=symbol)
-        fScore = financialScore(apikey=FmpKey, symbol=symbol)
-        esgScores = esgScore(apikey=FmpKey, symbol=symbol)
-        esgRating = esgRatings(apikey=FmpKey, symbol=symbol)
-        ugConsensus = upgradeDowngrades(apikey=FmpKey, symbol=symbol)
-        #priceConsensus = priceTarget(apikey=FmpKey, symbol=symbol)
-        #ratingsDf = pd.DataFrame.from_dict(pd.json_normalize(companyRating))
-        researchReport = []
+def buildResearchReport(companyRating, fScore, esgScores, esgRating, ugConsensus):
+    researchReport = []
 
-        try:
-            researchReport.append({
-                "key": "Overall Recommendation",
-                "value": companyRating[0]['ratingRecommendation']
-            })
-            researchReport.append({
-                "key": "DCF Recommendation",
-                "value": companyRating[0]['ratingDetailsDCFRecommendation']
-            })
-            researchReport.append({
-                "key": "ROE Recommendation",
-                "value": companyRating[0]['ratingDetailsROERecommendation']
-            })
-            researchReport.append({
-                "key": "ROA Recommendation",
-                "value": companyRating[0]['ratingDetailsROARecommendation']
-            })
-            researchReport.append({
-                "key": "PB Recommendation",
-                "value": companyRating[0]['ratingDetailsPBRecommendation']
-            })
-            researchReport.append({
-                "key": "PE Recommendation",
-                "value": companyRating[0]['ratingDetailsPERecommendation']
-            })
-        except:
-            logging.info('No data found for companyRating')
-            pass
+    try:
+        researchReport.append({
+            "key": "Overall Recommendation",
+            "value": companyRating[0]['ratingRecommendation']
+        })
+        researchReport.append({
+            "key": "DCF Recommendation",
+            "value": companyRating[0]['ratingDetailsDCFRecommendation']
+        })
+        researchReport.append({
+            "key": "ROE Recommendation",
+            "value": companyRating[0]['ratingDetailsROERecommendation']
+        })
+        researchReport.append({
+            "key": "ROA Recommendation",
+            "value": companyRating[0]['ratingDetailsROARecommendation']
+        })
+        researchReport.append({
+            "key": "PB Recommendation",
+            "value": companyRating[0]['ratingDetailsPBRecommendation']
+        })
+        researchReport.append({
+            "key": "PE Recommendation",
+            "value": companyRating[0]['ratingDetailsPERecommendation']
+        })
+    except:
+        logging.info('No data found for companyRating')
+        pass
 
-        try:
-            researchReport.append({
-                "key": "Altman ZScore",
-                "value": fScore[0]['altmanZScore']
-            })
-            researchReport.append({
-                "key": "Piotroski Score",
-                "value": fScore[0]['piotroskiScore']
-            })
-        except:
-            logging.info('No data found for fScore')
-            pass
+    try:
+        researchReport.append({
+            "key": "Altman ZScore",
+            "value": fScore[0]['altmanZScore']
+        })
+        researchReport.append({
+            "key": "Piotroski Score",
+            "value": fScore[0]['piotroskiScore']
+        })
+    except:
+        logging.info('No data found for fScore')
+        pass
 
-        try:
-            researchReport.append({
-                "key": "Environmental Score",
-                "value": esgScores[0]['environmentalScore']
-            })
-            researchReport.append({
-                "key": "Social Score",
-                "value": esgScores[0]['socialScore']
-            })
-            researchReport.append({
-                "key": "Governance Score",
-                "value": esgScores[0]['governanceScore']
-            })
-            researchReport.append({
-                "key": "ESG Score",
-                "value": esgScores[0]['ESGScore']
-            })
-        except:
-            logging.info('No data found for esgScores')
-            pass
+    try:
+        researchReport.append({
+            "key": "Environmental Score",
+            "value": esgScores[0]['environmentalScore']
+        })
+        researchReport.append({
+            "key": "Social Score",
+            "value": esgScores[0]['socialScore']
+        })
+        researchReport.append({
+            "key": "Governance Score",
+            "value": esgScores[0]['governanceScore']
+        })
+        researchReport.append({
+            "key": "ESG Score",
+            "value": esgScores[0]['ESGScore']
+        })
+    except:
+        logging.info('No data found for esgScores')
+        pass
 
-        try:
-            researchReport.append({
-                "key": "ESG RIsk Rating",
-                "value": esgRating[0]['ESGRiskRating']
-            })
-        except:
-            logging.info('No data found for esgRating')
-            pass
+    try:
+        researchReport.append({
+            "key": "ESG RIsk Rating",
+            "value": esgRating[0]['ESGRiskRating']
+        })
+    except:
+        logging.info('No data found for esgRating')
+        pass
 
-        try:
-            researchReport.append({
-                "key": "Analyst Consensus Buy",
-                "value": ugConsensus[0]['buy']
-            })
-            researchReport.append({
-                "key": "Analyst Consensus Sell",
-                "value": ugConsensus[0]['sell']
-            })
-            researchReport.append({
-                "key": "Analyst Consensus Strong Buy",
-                "value": ugConsensus[0]['strongBuy']
-            })
-            researchReport.append({
-                "key": "Analyst Consensus Strong Sell",
-                "value": ugConsensus[0]['strongSell']
-            })
-            researchReport.append({
-                "key": "Analyst Consensus Hold",
-                "value": ugConsensus[0]['hold']
-            })
-            researchReport.append({
-                "key": "Analyst Consensus",
-                "value": ugConsensus[0]['consensus']
-            })
-        except:
-            logging.info('No data found for ugConsensus')
-            pass
-
-        # researchReport.append({
-        #     "key": "Price Target Consensus",
-        #     "value": priceConsensus[0]['targetConsensus']
-        # })
-        # researchReport.append({
-        #     "key": "Price Target Median",
-        #     "value": priceConsensus[0]['targetMedian']
-        # })
-        s5Data.append({
-                    'id' : str(uuid.uuid4()),
-                    'symbol': symbol,
-                    'cik': cik,
-                    'step': step,
-                    'description': 'Research Report',
-                    'insertedDate': today.strftime("%Y-%m-%d"),
-                    'pibData' : str(researchReport)
-            })
-        mergeDocs(SearchService, SearchKey, pibIndexName, s5Data)
-    else:
-        logging.info('Found existing data')
-        for s in r:
-            s5Data.append(
-                {
-                    'id' : s['id'],
-                    'symbol': s['symbol'],
-                    'cik': s['cik'],
-                    'step': s['step'],
-                    'description': s['description'],
-                    'insertedDate': s['insertedDate'],
-                    'pibData' : s['pibData']
-                })
+    try:
+        researchReport.append({
+            "key": "Analyst Consensus Buy",
+            "value": ugConsensus[0]['buy']
+        })
+        researchReport.append({
+            "key": "Analyst Consensus Sell",
+            "value": ugConsensus[0]['sell']
+        })
+        researchReport.append({
+            "key": "Analyst Consensus Strong Buy",
+            "value": ugConsensus[0]['strongBuy']
+        })
+        researchReport.append({
+            "key": "Analyst Consensus Strong Sell",
+            "value": ugConsensus[0]['strongSell']
+        })
+        researchReport.append({
+            "key": "Analyst Consensus Hold",
+            "value": ugConsensus[0]['hold']
+        })
+        researchReport.append({
+            "key": "Analyst Consensus",
+            "value": ugConsensus[0]['consensus']
+        })
+    except:
+        logging.info('No data found for ugConsensus')
+        pass
+
+    # researchReport.append({
+    #     "key": "Price Target Consensus",
+    #     "value": priceConsensus[0]['targetConsensus']
+    # })
+    # researchReport.append({
+    #     "key": "Price Target Median",
+    #     "value": priceConsensus[0]['targetMedian']
+    # })
+    return researchReport
+
+def processStep5(pibIndexName, cik, step, symbol, today):
+    cache = PibStepCache(SearchService, SearchKey, pibIndexName, symbol, cik, step, today)
+
+    companyRating = rating(apikey=FmpKey, symbol=symbol)
+    fScore = financialScore(apikey=FmpKey, symbol=symbol)
+    esgScores = esgScore(apikey=FmpKey, symbol=symbol)
+    esgRating = esgRatings(apikey=FmpKey, symbol=symbol)
+    ugConsensus = upgradeDowngrades(apikey=FmpKey, symbol=symbol)
+    #priceConsensus = priceTarget(apikey=FmpKey, symbol=symbol)
+    #ratingsDf = pd.DataFrame.from_dict(pd.json_normalize(companyRating))
+
+    inputs = [companyRating, fScore, esgScores, esgRating, ugConsensus]
+    s5Data = [cache.section('Research Report', inputs, lambda: str(buildResearchReport(*inputs)))]
     return s5Data
 
 def PibSteps(step, symbol, embeddingModelType, overrides):
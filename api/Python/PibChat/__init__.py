@@ -17,13 +17,16 @@ from Utilities.envVars import *
 from langchain.agents import create_csv_agent
 from Utilities.azureBlob import getLocalBlob, getFullPath
 from azure.cosmos import CosmosClient, PartitionKey
+from Utilities.clientRegistry import getCosmosContainer, withClient
 from langchain.callbacks import get_openai_callback
 from langchain.chains.question_answering import load_qa_chain
 from langchain.output_parsers import RegexParser
 from langchain.chains import RetrievalQA
 from Utilities.pibCopilot import performLatestPibDataSearch
 from typing import Any, Sequence
-from Utilities.modelHelper import numTokenFromMessages, getTokenLimit
+from Utilities.modelHelper import getTokenLimit
+from Utilities.messageBuilder import getMessagesFromHistory
+from Utilities.contextPacker import packForChain
 
 def main(req: func.HttpRequest, context: func.Context) -> func.HttpResponse:
     logging.info(f'{context.function_name} HTTP trigger function processed a request.')
@@ -68,33 +71,7 @@ def ComposeResponse(jsonData, symbol, indexName):
             results["values"].append(outputRecord)
     return json.dumps(results, ensure_ascii=False)
 
-def getMessagesFromHistory(systemPrompt: str, modelId: str, history: Sequence[dict[str, str]], 
-                           userConv: str, fewShots = [], maxTokens: int = 4096):
-        #messageBuilder = MessageBuilder(systemPrompt, modelId)
-        messages = []
-        messages.append({'role': 'system', 'content': systemPrompt})
-        tokenLength = numTokenFromMessages(messages[-1], modelId)
-
-        # Add examples to show the chat what responses we want. It will try to mimic any responses and make sure they match the rules laid out in the system message.
-        for shot in fewShots:
-            messages.insert(1, {'role': shot.get('role'), 'content': shot.get('content')})
-
-        userContent = userConv
-        appendIndex = len(fewShots) + 1
-
-        messages.insert(appendIndex, {'role': "user", 'content': userContent})
-
-        for h in reversed(history[:-1]):
-            if h.get("bot"):
-                messages.insert(appendIndex, {'role': "assistant", 'content': h.get('bot')})
-            messages.insert(appendIndex, {'role': "user", 'content': h.get('user')})
-            tokenLength += numTokenFromMessages(messages[appendIndex], modelId)
-            if tokenLength > maxTokens:
-                break
-        
-        return messages
-
-def insertMessage(sessionId, type, role, totalTokens, tokens, response, cosmosContainer):
+def insertMessage(sessionId, type, role, totalTokens, tokens, response):
     aiMessage = {
         "id": str(uuid.uuid4()), 
         "type": type, 
@@ -104,7 +81,8 @@ def insertMessage(sessionId, type, role, totalTokens, tokens, response, cosmosCo
         "timestamp": datetime.datetime.utcnow().isoformat(), 
         "content": response
     }
-    cosmosContainer.create_item(body=aiMessage)
+    # Upserted, as the id is fixed above and a retry after a timeout may find the first write already stored
+    withClient(getCosmosContainer, (CosmosEndpoint, CosmosKey, CosmosDatabase, CosmosContainer), lambda container: container.upsert_item(body=aiMessage))
 
 def GetRrrAnswer(history, approach, overrides, symbol, indexName):
     embeddingModelType = overrides.get('embeddingModelType') or 'azureopenai'
@@ -118,14 +96,6 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
     overrideChain = overrides.get("chainType") or 'stuff'
 
     logging.info("Search for Top " + str(topK))
-    try:
-        cosmosClient = CosmosClient(url=CosmosEndpoint, credential=CosmosKey)
-        cosmosDb = cosmosClient.create_database_if_not_exists(id=CosmosDatabase)
-        cosmosKey = PartitionKey(path="/sessionId")
-        cosmosContainer = cosmosDb.create_container_if_not_exists(id=CosmosContainer, partition_key=cosmosKey, offer_throughput=400)
-    except Exception as e:
-        logging.info("Error connecting to CosmosDB: " + str(e))
-
     lastQuestion = history[-1]["user"]
     totalTokens = 0
 
@@ -134,7 +104,7 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
         if firstSession:
             sessionInfo = overrides.get('session') or ''
             session = json.loads(sessionInfo)
-            cosmosContainer.upsert_item(session)
+            withClient(getCosmosContainer, (CosmosEndpoint, CosmosKey, CosmosDatabase, CosmosContainer), lambda container: container.upsert_item(session))
             logging.info(session)
     except Exception as e:
         logging.info("Error inserting session into CosmosDB: " + str(e))
@@ -159,6 +129,8 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
             gptModel = "gpt-3.5-turbo-16k"
 
     tokenLimit = getTokenLimit(gptModel)
+    # The search query is a few keywords; the history builder counts the prompt itself
+    queryTokens = 32
     # STEP 1: Generate an optimized keyword search query based on the chat history and the last question
     messages = getMessagesFromHistory(
             systemTemplate,
@@ -166,7 +138,7 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
             history,
             'Generate search query for: ' + lastQuestion,
             [],
-            tokenLimit - len('Generate search query for: ' + lastQuestion)
+            tokenLimit - queryTokens
             )
 
     if (embeddingModelType == 'azureopenai'):
@@ -191,7 +163,7 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
                 model=gptModel,
                 messages=messages, 
                 temperature=0.0, 
-                max_tokens=32, 
+                max_tokens=queryTokens, 
                 n=1)
             
         elif deploymentType == "gpt3516k":
@@ -208,7 +180,7 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
                 model=gptModel,
                 messages=messages, 
                 temperature=0.0, 
-                max_tokens=32, 
+                max_tokens=queryTokens, 
                 n=1)
         logging.info("LLM Setup done")
     elif embeddingModelType == "openai":
@@ -224,7 +196,7 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
                 model=gptModel,
                 messages=messages, 
                 temperature=0.0, 
-                max_tokens=32, 
+                max_tokens=queryTokens, 
                 n=1)
     
     try:
@@ -241,7 +213,7 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
         if (q == ''):
             q = history[-1]["user"]
 
-        insertMessage(sessionId, "Message", "User", 0, 0, lastQuestion, cosmosContainer)
+        insertMessage(sessionId, "Message", "User", 0, 0, lastQuestion)
 
     except Exception as e:
         q = history[-1]["user"]
@@ -463,7 +435,8 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
                     Document(page_content=doc['content'], metadata={"id": doc['id'], "source":doc['callDate']})
                     for doc in r
                     ]
-       
+
+        docs = packForChain(docs, overrideChain, qaPrompt, q, gptModel, tokenLength)
         rawDocs = []
         for doc in docs:
             rawDocs.append(doc.page_content)
@@ -493,7 +466,7 @@ def GetRrrAnswer(history, approach, overrides, symbol, indexName):
                 "sources": sources.replace("SOURCES:", '').replace("SOURCES", "").replace("Sources:", '').replace('- ', ''), 
                 "nextQuestions": nextQuestions.replace('Next Questions:', '').replace('- ', '').replace('<', '').replace('>', ''), "error": ""}
             try:
-                insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response, cosmosContainer)
+                insertMessage(sessionId, "Message", "Assistant", totalTokens, cb.total_tokens, response)
             except Exception as e:
                 logging.info("Error inserting message: " + str(e))
 
@@ -2,6 +2,7 @@ import logging
 import azure.functions as func
 import os
 from azure.storage.blob import BlobServiceClient, ContentSettings
+from Utilities.clientRegistry import getBlobServiceClient
 import requests
 import json
 
@@ -20,7 +21,7 @@ def main(req: func.HttpRequest, context: func.Context) -> func.HttpResponse:
       # Upload the File to regular Blob Storage
       url = os.environ['OpenAiDocStorConnString']
       containerName = os.environ['OpenAiDocContainer']
-      blobServiceClient = BlobServiceClient.from_connection_string(url)
+      blobServiceClient = getBlobServiceClient(url)
       containerClient = blobServiceClient.get_container_client(containerName)
       blobClient = containerClient.get_blob_client(blobName)
       logging.info("Set Blob Metadata")
@@ -15,6 +15,11 @@ import numpy as np
 from langchain.docstore.document import Document
 from Utilities.redisIndex import performRedisSearch
 from Utilities.cogSearch import performCogSearch, generateKbEmbeddings, performKbCogVectorSearch, indexDocs
+from Utilities.retrieval import getRetrievalTargets, retrieveDocuments, searchTarget, FusionRetriever
+from Utilities.rerank import rerankDocuments, RerankRetriever, RERANK_CANDIDATES
+from Utilities.contextPacker import packForChain, PackingRetriever
+from Utilities.modelHelper import getChatModel
+from Utilities.answerCache import getAnswerCache, answerCacheKey
 from langchain.prompts import load_prompt
 from Utilities.envVars import *
 from langchain.agents import create_csv_agent
@@ -29,12 +34,19 @@ def QaAnswer(chainType, question, indexType, value, indexNs, approach, overrides
     
     try:
         topK = overrides.get("top") or 5
+        # overrides["rerank"] retrieves rerankCandidates chunks and keeps the topK most relevant, least redundant of them
+        rerank = overrides.get("rerank") or False
+        searchK = (overrides.get("rerankCandidates") or RERANK_CANDIDATES) if rerank else topK
         overrideChain = overrides.get("chainType") or 'stuff'
         temperature = overrides.get("temperature") or 0.3
         tokenLength = overrides.get('tokenLength') or 500
         embeddingModelType = overrides.get('embeddingModelType') or 'azureopenai'
         promptTemplate = overrides.get('promptTemplate') or ''
         deploymentType = overrides.get('deploymentType') or 'gpt35'
+        # The OpenAI path below always answers with gpt-3.5-turbo, so only Azure deployments select the 16k window
+        gptModel = getChatModel(embeddingModelType, deploymentType if embeddingModelType == 'azureopenai' else 'gpt35')
+        # Extra indexes in overrides["indexes"] are searched concurrently and fused with this one
+        targets = getRetrievalTargets(indexType, indexNs, overrides)
 
         logging.info("TopK: " + str(topK))
         logging.info("ChainType: " + str(overrideChain))
@@ -278,10 +290,25 @@ def QaAnswer(chainType, question, indexType, value, indexNs, approach, overrides
                 followupPrompt = PromptTemplate(template=followupTemplate, input_variables=["context"])
                 followupChain = load_qa_chain(llm, chain_type='stuff', prompt=followupPrompt)
 
+            # A question asked before in this process is answered from the local cache, without embedding it again
+            answerCache = getAnswerCache()
+            # The map_rerank setup above reassigns promptTemplate, so the request's own template is read from overrides
+            cacheKey = answerCacheKey(indexType, indexNs, overrideChain, embeddingModelType, deploymentType, temperature,
+                                      overrides.get('promptTemplate'))
+            cachedAnswer = answerCache.lookup(cacheKey, question)
+            if cachedAnswer is not None:
+                return cachedAnswer
+
+            vectorQuestion = None
             try:
                 # Let's verify if the questions is already answered before and check our KB first before asking LLM
                 vectorQuestion = generateKbEmbeddings(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding, embeddingModelType, question)
 
+                # Similar questions are matched locally first; the KB index is the second tier
+                cachedAnswer = answerCache.lookup(cacheKey, question, vectorQuestion)
+                if cachedAnswer is not None:
+                    return cachedAnswer
+
                 # Let's perform the search on the KB first before asking the question to the model
                 kbSearch = performKbCogVectorSearch(vectorQuestion, 'vectorQuestion', SearchService, SearchKey, indexType, indexNs, KbIndexName, 1, ["id", "question", "indexType", "indexName", "answer"])
 
@@ -293,6 +320,7 @@ def QaAnswer(chainType, question, indexType, value, indexNs, approach, overrides
                             logging.info("Found answer from existing KB with search score of " + str(s['@search.score']))
                             #jsonAnswer = ast.literal_eval(json.dumps(s['answer']))
                             jsonAnswer = json.loads(s['answer'])
+                            answerCache.store(cacheKey, question, vectorQuestion, jsonAnswer)
                             return jsonAnswer
             except Exception as e:
                 logging.info("Error in KB Search: " + str(e))
@@ -302,8 +330,15 @@ def QaAnswer(chainType, question, indexType, value, indexNs, approach, overrides
             kbId = str(uuid.uuid4())
 
             if indexType == 'pinecone':
-                vectorDb = Pinecone.from_existing_index(index_name=VsIndexName, embedding=embeddings, namespace=indexNs)
-                docRetriever = vectorDb.as_retriever(search_kwargs={"namespace": indexNs, "k": topK})
+                if len(targets) > 1 or rerank:
+                    docRetriever = FusionRetriever(targets=targets, k=searchK, embeddingModelType=embeddingModelType, embeddings=embeddings,
+                                                   withVectors=rerank)
+                else:
+                    vectorDb = Pinecone.from_existing_index(index_name=VsIndexName, embedding=embeddings, namespace=indexNs)
+                    docRetriever = vectorDb.as_retriever(search_kwargs={"namespace": indexNs, "k": searchK})
+                if rerank:
+                    docRetriever = RerankRetriever(retriever=docRetriever, k=topK, embeddingModelType=embeddingModelType)
+                docRetriever = PackingRetriever(retriever=docRetriever, chainType=overrideChain, prompt=qaPrompt, modelId=gptModel, maxTokens=tokenLength)
                 logging.info("Pinecone Setup done")
                 chain = RetrievalQA(combine_documents_chain=qaChain, retriever=docRetriever, return_source_documents=True)
                 llmAnswer = chain({"query": question}, return_only_outputs=True)
@@ -345,21 +380,31 @@ def QaAnswer(chainType, question, indexType, value, indexNs, approach, overrides
                             "answer": json.dumps(outputFinalAnswer),
                         })
                     
+                    if vectorQuestion is not None:
+                        answerCache.store(cacheKey, question, vectorQuestion, outputFinalAnswer)
                     indexDocs(SearchService, SearchKey, KbIndexName, kbData)
                 except Exception as e:
                     logging.error("Error in KB Indexing: " + str(e))
                     pass
 
                 return outputFinalAnswer            
-            elif indexType == "redis":
+            elif indexType == "redis" or indexType == "local":
                 try:
-                    returnField = ["metadata", "content", "vector_score"]
-                    vectorField = "content_vector"
-                    results = performRedisSearch(question, indexNs, topK, returnField, vectorField, embeddingModelType)
-                    docs = [
-                            Document(page_content=result.content, metadata=json.loads(result.metadata))
-                            for result in results.docs
-                    ]
+                    if len(targets) > 1:
+                        docs = retrieveDocuments(targets, question, searchK, embeddingModelType, embeddings, queryVector=vectorQuestion, withVectors=rerank)
+                    elif indexType == "local" or rerank:
+                        docs = searchTarget(targets[0], question, searchK, embeddingModelType, embeddings, vectorQuestion, rerank)
+                    else:
+                        returnField = ["metadata", "content", "vector_score"]
+                        vectorField = "content_vector"
+                        results = performRedisSearch(question, indexNs, searchK, returnField, vectorField, embeddingModelType)
+                        docs = [
+                                Document(page_content=result.content, metadata=json.loads(result.metadata))
+                                for result in results.docs
+                        ]
+                    if rerank:
+                        docs = rerankDocuments(question, docs, topK, embeddingModelType, queryVector=vectorQuestion)
+                    docs = packForChain(docs, overrideChain, qaPrompt, question, gptModel, tokenLength)
                     rawDocs=[]
                     for doc in docs:
                         rawDocs.append(doc.page_content)
@@ -397,6 +442,8 @@ def QaAnswer(chainType, question, indexType, value, indexNs, approach, overrides
                             "answer": json.dumps(outputFinalAnswer),
                         })
 
+                        if vectorQuestion is not None:
+                            answerCache.store(cacheKey, question, vectorQuestion, outputFinalAnswer)
                         indexDocs(SearchService, SearchKey, KbIndexName, kbData)
                     except Exception as e:
                         logging.info("Error in KB Indexing: " + str(e))
@@ -408,14 +455,22 @@ def QaAnswer(chainType, question, indexType, value, indexNs, approach, overrides
                     return {"data_points": "", "answer": "Working on fixing Redis Implementation - Error : " + str(e), "thoughts": "", "sources": "", "nextQuestions": "", "error":  str(e)}
             elif indexType == "cogsearch" or indexType == "cogsearchvs":
                 try:
-                    r = performCogSearch(indexType, embeddingModelType, question, indexNs, topK)
-                    if r == None:
-                        docs = [Document(page_content="No results found")]
-                    else :
-                        docs = [
-                            Document(page_content=doc['content'], metadata={"id": doc['id'], "source": doc['sourcefile']})
-                            for doc in r
-                            ]
+                    if len(targets) > 1:
+                        docs = retrieveDocuments(targets, question, searchK, embeddingModelType, embeddings, queryVector=vectorQuestion, withVectors=rerank) or [Document(page_content="No results found")]
+                    elif rerank:
+                        docs = searchTarget(targets[0], question, searchK, embeddingModelType, embeddings, vectorQuestion, True) or [Document(page_content="No results found")]
+                    else:
+                        r = performCogSearch(indexType, embeddingModelType, question, indexNs, searchK)
+                        if r == None:
+                            docs = [Document(page_content="No results found")]
+                        else :
+                            docs = [
+                                Document(page_content=doc['content'], metadata={"id": doc['id'], "source": doc['sourcefile']})
+                                for doc in r
+                                ]
+                    if rerank:
+                        docs = rerankDocuments(question, docs, topK, embeddingModelType, queryVector=vectorQuestion)
+                    docs = packForChain(docs, overrideChain, qaPrompt, question, gptModel, tokenLength)
                     rawDocs=[]
                     for doc in docs:
                         rawDocs.append(doc.page_content)
@@ -454,6 +509,8 @@ def QaAnswer(chainType, question, indexType, value, indexNs, approach, overrides
                             "answer": json.dumps(outputFinalAnswer),
                         })
 
+                        if vectorQuestion is not None:
+                            answerCache.store(cacheKey, question, vectorQuestion, outputFinalAnswer)
                         indexDocs(SearchService, SearchKey, KbIndexName, kbData)
                     except Exception as e:
                         logging.info("Error in KB Indexing: " + str(e))
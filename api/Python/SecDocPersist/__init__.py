@@ -27,6 +27,8 @@ from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential 
 from Utilities.envVars import *
 from Utilities.cogSearch import indexSections
+from Utilities.redisIndex import createRedisIndex, secFilingSchema, chunkAndEmbed as redisChunkAndEmbed
+from Utilities.searchUploader import uploadDocuments
 import tiktoken
 from Utilities.embeddings import generateEmbeddings
 from itertools import islice
@@ -289,12 +291,9 @@ def chunkAndEmbed(embeddingModelType, indexType, indexName, secDoc, fullPath):
         #secCommonData['contentVector'] = generateEmbeddings(embeddingModelType, text)
         fullData.append(secCommonData)
         try:
-
-            searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                        index_name=indexName,
-                                        credential=AzureKeyCredential(SearchKey))
-            results = searchClient.upload_documents(fullData)
-            #succeeded = sum([1 for r in results if r.succeeded])
+            succeeded, failed = uploadDocuments(SearchService, SearchKey, indexName, fullData)
+            if failed > 0:
+                raise Exception(f"{failed} documents failed to index")
             logging.info("Completed Indexing of documents")
         except Exception as e:
             logging.error(f"Error indexing documents {e}")
@@ -360,6 +359,19 @@ def PersistSecDocs(embeddingModelType, indexType, indexName,  value):
                 logging.info("Embedding complete")
                 metadata = {'embedded': 'true', 'indexType': indexType, "indexName": indexName}
                 upsertMetadata(OpenAiDocConnStr, SecDocContainer, fileName, metadata)
+            elif indexType == "redis":
+                # Chunks are embedded here and bulk loaded in pipelined batches into an HNSW index with tag fields,
+                # which is what the filtered KNN search in SecSearch queries
+                redisClient = createRedisIndex(secFilingSchema(), indexName)
+                engine = OpenAiEmbedding if embeddingModelType == "azureopenai" else "text-embedding-ada-002"
+                try:
+                    redisChunkAndEmbed(redisClient, indexName, secDoc, engine)
+                except Exception as e:
+                    logging.error(e)
+                    logging.error("Error chunking and embedding")
+                    continue
+                metadata = {'embedded': 'true', 'indexType': indexType, "indexName": indexName}
+                upsertMetadata(OpenAiDocConnStr, SecDocContainer, fileName, metadata)
         return "Success"
     except Exception as e:
       logging.error(e)
@@ -2,11 +2,8 @@ import logging, json, os
 import azure.functions as func
 import openai
 import os
-from redis.commands.search.field import VectorField, TagField, TextField
-from redis.commands.search.indexDefinition import IndexDefinition, IndexType
-import numpy as np
 import pandas as pd
-from Utilities.redisIndex import createRedisIndex, chunkAndEmbed, performRedisSearch
+from Utilities.redisIndex import searchRedis, SEC_TAG_FIELDS
 from langchain.docstore.document import Document
 from langchain.chains.summarize import load_summarize_chain
 from langchain.chains import AnalyzeDocumentChain
@@ -14,9 +11,7 @@ from Utilities.envVars import *
 from Utilities.cogSearch import performCogSearch
 from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
 
-redisUrl = "redis://default:" + RedisPassword + "@" + RedisAddress + ":" + RedisPort
-
-def SecSearch(indexType, indexName,  question, top, embeddingModelType):
+def SecSearch(indexType, indexName,  question, top, embeddingModelType, filters=None):
     logging.info("Embedding text")
     try:
         if (embeddingModelType == 'azureopenai'):
@@ -47,17 +42,15 @@ def SecSearch(indexType, indexName,  question, top, embeddingModelType):
         logging.info("LLM Setup done")
 
         if (indexType == 'redis'):
-            results = performRedisSearch(question, indexName, int(top), [], 'content_vector', embeddingModelType)
+            # Tag filters (cik, filing_type, sic, ...) are applied inside the KNN query, before the vectors are ranked
+            results = searchRedis(question, indexName, int(top), embeddingModelType=embeddingModelType, filters=filters)
             contentPdf = pd.DataFrame(list(map(lambda x: {'cik' : x.cik, 'company': x.company, 'filingType': x.filing_type, 
                                             'filingDate': x.filing_date, 'reportPeriod': x.period_of_report,
                                             'sic': x.sic, 'incState': x.state_of_inc, 'stateLoc': x.state_location,
                                                 'fiscalYearEnd': x.fiscal_year_end, 'filingHtmlIndex': x.filing_html_index,
                                                 'htmLink': x.htm_filing_link, 'completeFilingLink': x.complete_text_filing_link,
                                                 'content': x.content, 'contentSummary': '',
-                                                'filename': x.filename, 'vector_score': x.vector_score}, results.docs)))
-            contentPdf = contentPdf.sort_values(by=['vector_score'], ascending=False)
-            contentPdf = contentPdf.reset_index(drop=True)
-            contentPdf = contentPdf.drop(columns=['vector_score'])
+                                                'filename': x.filename}, results)))
             summaryChain = load_summarize_chain(llm, chain_type="stuff")
             summarizeDocumentChain = AnalyzeDocumentChain(combine_docs_chain=summaryChain)
             logging.info("Calling Summarize")
@@ -118,6 +111,9 @@ def TransformValue(indexType, indexName, question, top, embeddingModelType, reco
         assert ('data' in record), "'data' field is required."
         data = record['data']
         assert ('text' in data), "'text' field is required in 'data' object."
+        # Filter names go into the Redis query, so they must be tag fields of the filing schema
+        unknownFilters = [field for field in (data.get('filters') or {}) if field not in SEC_TAG_FIELDS]
+        assert not unknownFilters, "filters can only use " + ", ".join(SEC_TAG_FIELDS) + ", got " + ", ".join(map(str, unknownFilters))
 
     except KeyError as error:
         return (
@@ -142,7 +138,7 @@ def TransformValue(indexType, indexName, question, top, embeddingModelType, reco
         # Getting the items from the values/data/text
         value = data['text']
 
-        summaryResponse = SecSearch(indexType, indexName, question, top, embeddingModelType)
+        summaryResponse = SecSearch(indexType, indexName, question, top, embeddingModelType, data.get('filters'))
         return ({
             "recordId": recordId,
             "data": {
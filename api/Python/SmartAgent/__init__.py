@@ -22,6 +22,7 @@ from langchain.retrievers import AzureCognitiveSearchRetriever
 from Utilities.cogSearchRetriever import CognitiveSearchRetriever
 from langchain.agents.agent_toolkits import SQLDatabaseToolkit
 from langchain.sql_database import SQLDatabase
+from Utilities.clientRegistry import getSqlDatabase
 from langchain.agents import create_sql_agent
 from langchain.agents import ConversationalChatAgent, AgentExecutor, Tool
 from langchain.memory import ConversationBufferWindowMemory
@@ -88,7 +89,7 @@ def SmartAgent(question, overrides):
                     "Connection Timeout=30;".format(SynapseName, SynapsePool, SynapseUser, SynapsePassword)
     params = urllib.parse.quote_plus(synapseConnectionString)
     sqlConnectionString = 'mssql+pyodbc:///?odbc_connect={}'.format(params)
-    db = SQLDatabase.from_uri(sqlConnectionString)
+    db = getSqlDatabase(sqlConnectionString)
 
     SqlPrefix = """You are an agent designed to interact with a SQL database.
         Given an input question, create a syntactically correct {dialect} query to run, then look at the results of the query and return the answer.
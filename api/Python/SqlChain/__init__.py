@@ -4,6 +4,7 @@ import openai
 from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
 import os
 from langchain.sql_database import SQLDatabase
+from Utilities.clientRegistry import getSqlDatabase
 from langchain.prompts.prompt import PromptTemplate
 from langchain_experimental.sql import SQLDatabaseChain
 from langchain.chains import LLMChain
@@ -56,7 +57,7 @@ def SqlChainAnswer(topK, question, embeddingModelType, value):
                       "Connection Timeout=30;".format(SynapseName, SynapsePool, SynapseUser, SynapsePassword)
         params = urllib.parse.quote_plus(synapseConnectionString)
         sqlConnectionString = 'mssql+pyodbc:///?odbc_connect={}'.format(params)
-        db = SQLDatabase.from_uri(sqlConnectionString)
+        db = getSqlDatabase(sqlConnectionString)
 
         if (embeddingModelType == 'azureopenai'):
             openai.api_type = "azure"
@@ -6,6 +6,7 @@ import os
 from langchain.agents import create_sql_agent
 from langchain.agents.agent_toolkits import SQLDatabaseToolkit
 from langchain.sql_database import SQLDatabase
+from Utilities.clientRegistry import getSqlDatabase
 from langchain.schema import AgentAction
 from Utilities.envVars import *
 from typing import Dict
@@ -56,7 +57,7 @@ def SqlAgentAnswer(topK, question, embeddingModelType, value):
                       "Connection Timeout=30;".format(SynapseName, SynapsePool, SynapseUser, SynapsePassword)
         params = urllib.parse.quote_plus(synapseConnectionString)
         sqlConnectionString = 'mssql+pyodbc:///?odbc_connect={}'.format(params)
-        db = SQLDatabase.from_uri(sqlConnectionString)
+        db = getSqlDatabase(sqlConnectionString)
 
         # SqlPrefix = """You are an agent designed to interact with SQL database systems.
         # Given an input question, create a syntactically correct {dialect} query to run, then look at the results of the query and return the answer.
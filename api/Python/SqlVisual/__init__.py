@@ -12,6 +12,7 @@ from langchain.chat_models import AzureChatOpenAI, ChatOpenAI
 import pandas as pd
 from typing import List
 from sqlalchemy import create_engine  
+from Utilities.clientRegistry import getSqlEngine, withClient
 import time
 import re
 import sys
@@ -22,9 +23,9 @@ def executeSqlQuery(query, limit=10000):
                     "Database={};Uid={};Pwd={};Encrypt=yes;TrustServerCertificate=no;" \
                     "Connection Timeout=30;".format(SynapseName, SynapsePool, SynapseUser, SynapsePassword)
     params = urllib.parse.quote_plus(synapseConnectionString)
-    engine = create_engine("mssql+pyodbc:///?odbc_connect=%s" % params)
+    connectionUrl = "mssql+pyodbc:///?odbc_connect=%s" % params
 
-    result = pd.read_sql_query(query, engine)
+    result = withClient(getSqlEngine, (connectionUrl,), lambda engine: pd.read_sql_query(query, engine))
     result = result.infer_objects()
     for col in result.columns:  
         if 'date' in col.lower():  
@@ -0,0 +1,229 @@
+"""In-process semantic answer cache: recent question embeddings in a NumPy matrix, searched before the remote KB index."""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+_cache = None
+_cacheLock = threading.Lock()
+
+def normalizeQuestion(question: str) -> str:
+    return " ".join(str(question).lower().split())
+
+def answerCacheKey(indexType, indexNs, chainType, embeddingModelType, deploymentType, temperature, promptTemplate):
+    """
+    The partition for a request: everything besides the question that changes its answer. The prompt template is
+    hashed so the key stays short in snapshots; the embedding model keeps vectors of different sizes apart.
+    """
+    templateHash = hashlib.sha1(str(promptTemplate or "").encode("utf-8")).hexdigest()
+    return (indexType, indexNs, chainType, embeddingModelType, deploymentType, float(temperature), templateHash)
+
+class _Partition:
+    """
+      Answers for one (indexType, indexNs, chainType). Rows of vectors are unit-normalized question embeddings,
+      so a single matrix-vector product scores every cached question; the matrix doubles as it fills.
+      """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.vectors = None
+        self.questions = []
+        self.answers = []
+        self.storedAt = np.zeros(0)
+        self.usedAt = np.zeros(0)
+        self.exact = {}
+
+    def _grow(self, dimensions):
+        size = len(self.questions)
+        rows = min(self.capacity, max(16, size * 2))
+        vectors = np.zeros((rows, dimensions), dtype=np.float32)
+        if self.vectors is not None:
+            vectors[:size] = self.vectors[:size]
+        self.vectors = vectors
+
+    def _slot(self, dimensions):
+        # Reuse the least recently used slot once the partition is full
+        size = len(self.questions)
+        if size < self.capacity:
+            if self.vectors is None or size >= self.vectors.shape[0]:
+                self._grow(dimensions)
+            self.questions.append(None)
+            self.answers.append(None)
+            self.storedAt = np.append(self.storedAt, 0.0)
+            self.usedAt = np.append(self.usedAt, 0.0)
+            return size, False
+        slot = int(np.argmin(self.usedAt))
+        self.exact.pop(self.questions[slot], None)
+        return slot, True
+
+    def store(self, question, vector, answer, now):
+        slot, evicted = self.exact.get(question), False
+        if slot is None:
+            slot, evicted = self._slot(len(vector))
+        self.vectors[slot] = vector
+        self.questions[slot] = question
+        self.answers[slot] = answer
+        self.storedAt[slot] = now
+        self.usedAt[slot] = now
+        self.exact[question] = slot
+        return evicted
+
+    def findExact(self, question, now, ttl):
+        slot = self.exact.get(question)
+        if slot is None or now - self.storedAt[slot] > ttl:
+            return None
+        self.usedAt[slot] = now
+        return self.answers[slot]
+
+    def findSimilar(self, vector, now, ttl, threshold):
+        size = len(self.questions)
+        if size == 0 or self.vectors.shape[1] != len(vector):
+            return None, 0.0
+        scores = self.vectors[:size] @ vector
+        scores[now - self.storedAt > ttl] = -1.0
+        slot = int(np.argmax(scores))
+        if scores[slot] < threshold:
+            return None, float(scores[slot])
+        self.usedAt[slot] = now
+        return self.answers[slot], float(scores[slot])
+
+class AnswerCache:
+    """
+      Semantic cache of final answers, partitioned by answerCacheKey.
+      Attributes:
+          maxEntries (int): Answers kept per partition before the least recently used one is replaced.
+          ttl (float): Seconds an answer stays valid.
+          threshold (float): Cosine similarity a cached question needs to count as the same question.
+          snapshotPath (str): Optional file the cache is loaded from and periodically saved to.
+      """
+
+    def __init__(self, maxEntries=1000, ttl=86400, threshold=0.95, maxPartitions=64, snapshotPath=None,
+                 snapshotInterval=60):
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.maxPartitions = maxPartitions
+        self.snapshotPath = snapshotPath
+        self.snapshotInterval = snapshotInterval
+        self.partitions = {}
+        self.partitionUsedAt = {}
+        self.lock = threading.Lock()
+        self.savedAt = time.time()
+        self.exactHits = 0
+        self.semanticHits = 0
+        self.misses = 0
+        self.evictions = 0
+        if snapshotPath and os.path.exists(snapshotPath):
+            try:
+                self.load(snapshotPath)
+            except Exception as e:
+                logging.info("Answer cache snapshot could not be loaded: " + str(e))
+
+    def _partition(self, key, create=False):
+        key = tuple(key)
+        partition = self.partitions.get(key)
+        if partition is None and create:
+            if len(self.partitions) >= self.maxPartitions:
+                oldest = min(self.partitionUsedAt, key=self.partitionUsedAt.get)
+                self.evictions += len(self.partitions.pop(oldest).questions)
+                del self.partitionUsedAt[oldest]
+            partition = self.partitions[key] = _Partition(self.maxEntries)
+        if partition is not None:
+            self.partitionUsedAt[key] = time.time()
+        return partition
+
+    def lookup(self, key, question, vector=None):
+        """
+        Return a cached answer for question, or None. Without a vector only an exact (normalized) match is tried,
+        which needs no embedding call; with one, the closest cached question above the threshold is used.
+        """
+        now = time.time()
+        normalized = normalizeQuestion(question)
+        with self.lock:
+            partition = self._partition(key)
+            answer = partition.findExact(normalized, now, self.ttl) if partition is not None else None
+            if answer is not None:
+                self.exactHits += 1
+                return answer
+            if vector is None:
+                return None
+            answer, score = partition.findSimilar(self._unit(vector), now, self.ttl, self.threshold) if partition is not None else (None, 0.0)
+            if answer is not None:
+                self.semanticHits += 1
+                logging.info(f"Answer cache hit with similarity {score:.4f}")
+                return answer
+            self.misses += 1
+            return None
+
+    def store(self, key, question, vector, answer):
+        with self.lock:
+            partition = self._partition(key, create=True)
+            if partition.store(normalizeQuestion(question), self._unit(vector), answer, time.time()):
+                self.evictions += 1
+            saveNow = self.snapshotPath and time.time() - self.savedAt > self.snapshotInterval
+        if saveNow:
+            self.save(self.snapshotPath)
+
+    def _unit(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def save(self, path):
+        """Write every live answer to an .npz snapshot, replacing the previous one atomically."""
+        with self.lock:
+            now = time.time()
+            arrays = {}
+            meta = []
+            for i, (key, partition) in enumerate(self.partitions.items()):
+                live = [slot for slot in range(len(partition.questions)) if now - partition.storedAt[slot] <= self.ttl]
+                if not live:
+                    continue
+                arrays[f"vectors{i}"] = partition.vectors[live]
+                meta.append({"key": list(key), "vectors": f"vectors{i}",
+                             "questions": [partition.questions[slot] for slot in live],
+                             "answers": [partition.answers[slot] for slot in live],
+                             "storedAt": [float(partition.storedAt[slot]) for slot in live]})
+            self.savedAt = now
+        arrays["meta"] = np.array(json.dumps(meta))
+        tempPath = path + ".tmp"
+        with open(tempPath, "wb") as file:
+            np.savez(file, **arrays)
+        os.replace(tempPath, path)
+
+    def load(self, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            with self.lock:
+                for entry in meta:
+                    partition = self._partition(entry["key"], create=True)
+                    for vector, question, answer, storedAt in zip(data[entry["vectors"]], entry["questions"],
+                                                                  entry["answers"], entry["storedAt"]):
+                        partition.store(question, vector, answer, storedAt)
+        logging.info(f"Loaded answer cache snapshot from {path}")
+
+    def stats(self):
+        return {"exactHits": self.exactHits, "semanticHits": self.semanticHits, "misses": self.misses,
+                "evictions": self.evictions, "partitions": len(self.partitions),
+                "entries": sum(len(p.questions) for p in self.partitions.values())}
+
+def getAnswerCache():
+    """
+    Return the process-wide answer cache, configured from the environment on first use.
+    AnswerCacheEntries bounds each partition, AnswerCacheTtl is in seconds, AnswerCacheThreshold is the cosine
+    similarity for a hit and AnswerCachePath enables the snapshot file.
+    """
+    global _cache
+    with _cacheLock:
+        if _cache is None:
+            _cache = AnswerCache(maxEntries=int(os.environ.get("AnswerCacheEntries", "1000")),
+                                 ttl=float(os.environ.get("AnswerCacheTtl", "86400")),
+                                 threshold=float(os.environ.get("AnswerCacheThreshold", "0.95")),
+                                 snapshotPath=os.environ.get("AnswerCachePath") or None)
+            if _cache.snapshotPath:
+                atexit.register(_cache.save, _cache.snapshotPath)
+    return _cache
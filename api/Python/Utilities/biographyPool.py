@@ -0,0 +1,98 @@
+"""Concurrent per-executive biography generation with a bounded worker pool and an in-process result cache."""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Each biography is a Bing search and two completions, all I/O bound
+BIOGRAPHY_WORKERS = 8
+# A cached biography is reused by every PIB run that falls in the same bucket of this many days
+BIOGRAPHY_BUCKET_DAYS = 7
+
+_cache = None
+_cacheLock = threading.Lock()
+
+def biographyKey(name, company, today, bucketDays=BIOGRAPHY_BUCKET_DAYS):
+    """Key a biography by the normalized executive name, the company and the date bucket it was generated in."""
+    return (" ".join(str(name).lower().split()), str(company).upper(), today.toordinal() // bucketDays)
+
+class BiographyCache:
+    """Least recently used biographies, shared by every request served by this worker process."""
+
+    def __init__(self, maxEntries=1024):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+def getBiographyCache():
+    global _cache
+    if _cache is None:
+        with _cacheLock:
+            if _cache is None:
+                _cache = BiographyCache()
+    return _cache
+
+def generateBiographies(executives, company, today, biography, workers=BIOGRAPHY_WORKERS, cache=None):
+    """
+    Call biography(executive) for every executive not already cached for company in today's bucket, at most
+    workers at a time. Returns the {name, title, biography} entries in the order of executives, and the names
+    whose biography failed; those are left out of the entries and not cached, so the next run retries them.
+    """
+    cache = cache or getBiographyCache()
+    start = time.perf_counter()
+    summaries = {}
+    pending = {}
+    for executive in executives:
+        key = biographyKey(executive['name'], company, today)
+        cached = cache.get(key)
+        if cached is not None:
+            summaries[key] = cached
+        else:
+            # The same person can be listed under several titles; search for them once
+            pending.setdefault(key, executive)
+
+    failed = []
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pending))), thread_name_prefix="biography") as executor:
+            futures = {executor.submit(biography, executive): key for key, executive in pending.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    summaries[key] = future.result()
+                    cache.set(key, summaries[key])
+                except Exception as e:
+                    logging.error(f"Biography of {pending[key]['name']} at {company} failed: {e}")
+                    failed.append(pending[key]['name'])
+
+    biographies = []
+    for executive in executives:
+        key = biographyKey(executive['name'], company, today)
+        if key in summaries:
+            biographies.append({"name": executive['name'], "title": executive['title'], "biography": summaries[key]})
+    logging.info(f"Biographies for {company}: {len(executives) - len(pending)} cached, {len(pending) - len(failed)} generated, "
+                 f"{len(failed)} failed in {time.perf_counter() - start:.2f}s")
+    return biographies, failed
@@ -0,0 +1,133 @@
+"""Process-wide registry of long-lived service clients, reused across warm invocations."""
+import logging
+import threading
+import time
+
+_clients = {}
+_lock = threading.Lock()
+
+class _Entry:
+    def __init__(self, client):
+        self.client = client
+        self.checkedAt = time.monotonic()
+
+def getClient(kind, key, factory, healthCheck=None, checkInterval=300):
+    """
+    Return the shared client for (kind, key), building it with factory() on first use.
+    When healthCheck is given it runs at most once per checkInterval seconds, and a client that fails
+    it is rebuilt. Building happens outside the registry lock so a slow service does not block others.
+    """
+    registryKey = (kind, key)
+    entry = _clients.get(registryKey)
+    if entry is not None and healthCheck is not None and time.monotonic() - entry.checkedAt > checkInterval:
+        try:
+            healthCheck(entry.client)
+            entry.checkedAt = time.monotonic()
+        except Exception as e:
+            logging.info(f"{kind} client failed its health check, reconnecting: {e}")
+            resetClient(kind, key)
+            entry = None
+    if entry is not None:
+        return entry.client
+
+    client = factory()
+    with _lock:
+        # Another thread may have built the same client meanwhile; keep the first one
+        entry = _clients.setdefault(registryKey, _Entry(client))
+    return entry.client
+
+def resetClient(kind, key):
+    """Drop a client so the next lookup builds a new one; call it after a connection-level failure."""
+    with _lock:
+        entry = _clients.pop((kind, key), None)
+    if entry is not None and hasattr(entry.client, "close"):
+        try:
+            entry.client.close()
+        except Exception:
+            pass
+
+# Failures a freshly built client can recover from: dropped or refused connections, timeouts and rejected
+# credentials. Matched by class name, so the registry needs none of the service SDKs to recognize them.
+RECONNECT_ERRORS = {"ConnectionError", "TimeoutError", "ServiceRequestError", "ServiceResponseError",
+                    "ClientAuthenticationError", "AuthenticationError", "OperationalError", "DisconnectionError",
+                    "InterfaceError"}
+
+def isReconnectError(error):
+    return any(cls.__name__ in RECONNECT_ERRORS for cls in type(error).__mro__)
+
+def discardClient(client):
+    """Drop a shared client by identity, for callers that only hold the client and not its registry key."""
+    with _lock:
+        registryKey = next((key for key, entry in _clients.items() if entry.client is client), None)
+    if registryKey is not None:
+        resetClient(*registryKey)
+
+def withClient(getter, args, fn):
+    """
+    Return fn(getter(*args)). When fn fails with a connection or authentication error, the shared client is
+    dropped, a new one is built through getter and fn runs once more; any other error is raised as is.
+    fn should finish its I/O before returning, so lazy results such as search pages are read inside the retry.
+    fn must be safe to repeat, since a write that timed out may have been applied: upsert rather than create.
+    """
+    client = getter(*args)
+    try:
+        return fn(client)
+    except Exception as e:
+        if not isReconnectError(e):
+            raise
+        logging.warning(f"{getter.__name__} client failed ({type(e).__name__}: {e}), rebuilding it and retrying once")
+        discardClient(client)
+        return fn(getter(*args))
+
+def getCosmosContainer(endpoint, key, database, container, partitionKeyPath="/sessionId", throughput=400):
+    """The database and container are created if needed once per process, not on every request."""
+    def factory():
+        from azure.cosmos import CosmosClient, PartitionKey
+        cosmosClient = CosmosClient(url=endpoint, credential=key)
+        cosmosDb = cosmosClient.create_database_if_not_exists(id=database)
+        return cosmosDb.create_container_if_not_exists(id=container, partition_key=PartitionKey(path=partitionKeyPath),
+                                                       offer_throughput=throughput)
+    return getClient("cosmos", (endpoint, key, database, container), factory, healthCheck=lambda c: c.read())
+
+def getBlobServiceClient(connectionString):
+    def factory():
+        from azure.storage.blob import BlobServiceClient
+        return BlobServiceClient.from_connection_string(connectionString)
+    return getClient("blob", connectionString, factory)
+
+def getSearchClient(SearchService, SearchKey, indexName):
+    def factory():
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents import SearchClient
+        return SearchClient(endpoint=f"https://{SearchService}.search.windows.net", index_name=indexName,
+                            credential=AzureKeyCredential(SearchKey))
+    return getClient("search", (SearchService, SearchKey, indexName), factory)
+
+def getSearchIndexClient(SearchService, SearchKey):
+    def factory():
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents.indexes import SearchIndexClient
+        return SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net",
+                                 credential=AzureKeyCredential(SearchKey))
+    return getClient("searchIndex", (SearchService, SearchKey), factory)
+
+def getRedis(host, port, password):
+    def factory():
+        from redis import Redis
+        return Redis(host=host, port=port, password=password, health_check_interval=30)
+    return getClient("redis", (host, str(port), password), factory, healthCheck=lambda r: r.ping(), checkInterval=60)
+
+def getSqlEngine(connectionUrl):
+    # pool_pre_ping replaces connections the server has dropped before they are handed out
+    def factory():
+        from sqlalchemy import create_engine
+        return create_engine(connectionUrl, pool_pre_ping=True)
+    return getClient("sql", connectionUrl, factory)
+
+def getSqlDatabase(connectionUrl):
+    # SQLDatabase reflects the schema when it is built, so sharing it also saves that round trip per request
+    def factory():
+        from langchain.sql_database import SQLDatabase
+        return SQLDatabase(getSqlEngine(connectionUrl))
+    # The chains run their queries through the database directly, so it is probed here instead of per call
+    return getClient("sqlDatabase", connectionUrl, factory, healthCheck=lambda db: db.run("SELECT 1"))
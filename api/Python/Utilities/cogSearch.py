@@ -4,8 +4,11 @@ from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
 import os
 import logging
+from itertools import tee
+from Utilities.searchUploader import uploadDocuments
+from Utilities.clientRegistry import getSearchClient, getSearchIndexClient, withClient
 from azure.search.documents.models import QueryType
-from Utilities.embeddings import generateEmbeddings
+from Utilities.embeddings import generateEmbeddings, generateEmbeddingsStream
 from azure.search.documents.indexes.models import (  
     SearchIndex,  
     SearchField,  
@@ -23,22 +26,23 @@ from azure.search.documents.indexes.models import (
 )
 from azure.search.documents.models import Vector  
 from Utilities.envVars import *
+from Utilities.embeddingEngine import getEmbeddingEngine
 from tenacity import retry, wait_random_exponential, stop_after_attempt  
 import openai
 
 def deleteSearchIndex(indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
-    if indexName in indexClient.list_index_names():
-        logging.info(f"Deleting {indexName} search index")
-        indexClient.delete_index(indexName)
-    else:
-        logging.info(f"Search index {indexName} does not exist")
+    def delete(indexClient):
+        if indexName in indexClient.list_index_names():
+            logging.info(f"Deleting {indexName} search index")
+            indexClient.delete_index(indexName)
+        else:
+            logging.info(f"Search index {indexName} does not exist")
+    withClient(getSearchIndexClient, (SearchService, SearchKey), delete)
         
 def createSearchIndex(indexType, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
-    if indexName not in indexClient.list_index_names():
+    indexNames = withClient(getSearchIndexClient, (SearchService, SearchKey), lambda indexClient: list(indexClient.list_index_names()))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
+    if indexName not in indexNames:
         if indexType == "cogsearchvs":
             index = SearchIndex(
                 name=indexName,
@@ -97,11 +101,14 @@ def createSearchIndex(indexType, indexName):
 def createSections(indexType, embeddingModelType, fileName, docs):
     counter = 1
     if indexType == "cogsearchvs":
-        for i in docs:
+        # docs may be a one-shot stream; tee only buffers the chunks the embedder has read ahead
+        docs, texts = tee(docs)
+        vectors = generateEmbeddingsStream(embeddingModelType, (i.page_content for i in texts))
+        for i, vector in zip(docs, vectors):
             yield {
                 "id": f"{fileName}-{counter}".replace(".", "_").replace(" ", "_").replace(":", "_").replace("/", "_").replace(",", "_").replace("&", "_"),
                 "content": i.page_content,
-                "contentVector": generateEmbeddings(embeddingModelType, i.page_content),
+                "contentVector": vector,
                 "sourcefile": os.path.basename(fileName)
             }
             counter += 1
@@ -116,136 +123,87 @@ def createSections(indexType, embeddingModelType, fileName, docs):
 
 def indexSections(indexType, embeddingModelType, fileName, indexName, docs):
 
-    logging.info("Total docs: " + str(len(docs)))
     sections = createSections(indexType, embeddingModelType, fileName, docs)
     logging.info(f"Indexing sections from '{fileName}' into search index '{indexName}'")
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                    index_name=indexName,
-                                    credential=AzureKeyCredential(SearchKey))
-    
-    # batch = []
-    # for s in sections:
-    #     batch.append(s)
-    # results = searchClient.upload_documents(documents=batch)
-    # succeeded = sum([1 for r in results if r.succeeded])
-    # logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-    i = 0
-    batch = []
-    for s in sections:
-        batch.append(s)
-        i += 1
-        if i % 1000 == 0:
-            results = searchClient.index_documents(batch=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
-            logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-            batch = []
+    succeeded, failed = uploadDocuments(SearchService, SearchKey, indexName, sections)
+    logging.info("Total docs: " + str(succeeded + failed))
 
-    if len(batch) > 0:
-        results = searchClient.upload_documents(documents=batch)
-        succeeded = sum([1 for r in results if r.succeeded])
-        logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-
-def performCogSearch(indexType, embeddingModelType, question, indexName, k, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
-    try:
+def performCogSearch(indexType, embeddingModelType, question, indexName, k, returnFields=["id", "content", "sourcefile"], queryVector=None):
+    # Search results are paged lazily, so they are read inside the search for withClient to see a failed request
+    def search(searchClient):
         if indexType == "cogsearchvs":
-            r = searchClient.search(  
+            return list(searchClient.search(  
                 search_text="",  
-                vector=Vector(value=generateEmbeddings(embeddingModelType, question), k=k, fields="contentVector"),  
+                vector=Vector(value=queryVector, k=k, fields="contentVector"),  
                 select=returnFields,
                 semantic_configuration_name="semanticConfig"
-            )
+            ))
         elif indexType == "cogsearch":
             #r = searchClient.search(question, filter=None, top=k)
             try:
-                r = searchClient.search(question, 
+                return list(searchClient.search(question, 
                                     filter=None,
                                     query_type=QueryType.SEMANTIC, 
                                     query_language="en-us", 
                                     query_speller="lexicon", 
                                     semantic_configuration_name="semanticConfig", 
                                     top=k, 
-                                    query_caption="extractive|highlight-false")
+                                    query_caption="extractive|highlight-false"))
             except Exception as e:
-                 r = searchClient.search(question, 
+                 return list(searchClient.search(question, 
                                 filter=None,
                                 query_type=QueryType.SEMANTIC, 
                                 query_language="en-us", 
                                 query_speller="lexicon", 
                                 semantic_configuration_name="default", 
                                 top=k, 
-                                query_caption="extractive|highlight-false")
-        return r
+                                query_caption="extractive|highlight-false"))
+    try:
+        if indexType == "cogsearchvs" and queryVector is None:
+            queryVector = generateEmbeddings(embeddingModelType, question)
+        return withClient(getSearchClient, (SearchService, SearchKey, indexName), search)
     except Exception as e:
         logging.info(e)
 
     return None
 
 def performSummaryQaCogSearch(indexType, embeddingModelType, question, indexName, k, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
-    try:
+    def search(searchClient):
         if indexType == "cogsearch" or indexType == "cogsearchvs":
             #r = searchClient.search(question, filter=None, top=k)
             try:
-                r = searchClient.search(question, 
+                return list(searchClient.search(question, 
                                     filter=None,
                                     query_type=QueryType.SEMANTIC, 
                                     query_language="en-us", 
                                     query_speller="lexicon", 
                                     semantic_configuration_name="semanticConfig", 
                                     top=k, 
-                                    query_caption="extractive|highlight-false")
+                                    query_caption="extractive|highlight-false"))
             except Exception as e:
-                 r = searchClient.search(question, 
+                 return list(searchClient.search(question, 
                                 filter=None,
                                 query_type=QueryType.SEMANTIC, 
                                 query_language="en-us", 
                                 query_speller="lexicon", 
                                 semantic_configuration_name="default", 
                                 top=k, 
-                                query_caption="extractive|highlight-false")
-        return r
+                                query_caption="extractive|highlight-false"))
+    try:
+        return withClient(getSearchClient, (SearchService, SearchKey, indexName), search)
     except Exception as e:
         logging.info(e)
 
     return None
 
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 # Function to generate embeddings for title and content fields, also used for query embeddings
 def generateKbEmbeddings(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding, embeddingModelType, text):
-    if (embeddingModelType == 'azureopenai'):
-        openai.api_type = "azure"
-        openai.api_key = OpenAiKey
-        openai.api_version = OpenAiVersion
-        openai.api_base = f"{OpenAiEndPoint}"
-
-        response = openai.Embedding.create(
-            input=text, engine=OpenAiEmbedding)
-        embeddings = response['data'][0]['embedding']
-
-    elif embeddingModelType == "openai":
-        try:
-            openai.api_type = "open_ai"
-            openai.api_base = "https://api.openai.com/v1"
-            openai.api_version = '2020-11-07' 
-            openai.api_key = OpenAiApiKey
-
-            response = openai.Embedding.create(
-                input=text, engine="text-embedding-ada-002", api_key = OpenAiApiKey)
-            embeddings = response['data'][0]['embedding']
-        except Exception as e:
-            logging.info(e)
-        
-    return embeddings
+    engine = getEmbeddingEngine(embeddingModelType, OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding)
+    return engine.embed([text])[0]
 
 def createKbSearchIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -289,13 +247,7 @@ def createKbSearchIndex(SearchService, SearchKey, indexName):
         print(f"Search index {indexName} already exists")
 
 def performKbCogVectorSearch(embedValue, embedField, SearchService, SearchKey, indexType, indexName, kbIndexName, k, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=kbIndexName,
-        credential=AzureKeyCredential(SearchKey))
-    
-    try:
-        logging.info("Create Index for KB : " + str(kbIndexName))
-        createKbSearchIndex(SearchService, SearchKey, kbIndexName)
+    def search(searchClient):
         r = searchClient.search(  
             search_text="",
             filter="indexType eq '" + indexType + "' and indexName eq '" + indexName + "'",
@@ -304,7 +256,14 @@ def performKbCogVectorSearch(embedValue, embedField, SearchService, SearchKey, i
             semantic_configuration_name="semanticConfig",
             include_total_count=True
         )
+        # Callers read the count, and asking for it sends the request here rather than on first use
+        r.get_count()
         return r
+    
+    try:
+        logging.info("Create Index for KB : " + str(kbIndexName))
+        createKbSearchIndex(SearchService, SearchKey, kbIndexName)
+        return withClient(getSearchClient, (SearchService, SearchKey, kbIndexName), search)
     except Exception as e:
         logging.info(e)
 
@@ -312,21 +271,4 @@ def performKbCogVectorSearch(embedValue, embedField, SearchService, SearchKey, i
 
 def indexDocs(SearchService, SearchKey, indexName, docs):
     print("Total docs: " + str(len(docs)))
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                    index_name=indexName,
-                                    credential=AzureKeyCredential(SearchKey))
-    i = 0
-    batch = []
-    for s in docs:
-        batch.append(s)
-        i += 1
-        if i % 1000 == 0:
-            results = searchClient.upload_documents(documents=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
-            print(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-            batch = []
-
-    if len(batch) > 0:
-        results = searchClient.upload_documents(documents=batch)
-        succeeded = sum([1 for r in results if r.succeeded])
-        print(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
\ No newline at end of file
+    uploadDocuments(SearchService, SearchKey, indexName, docs)
\ No newline at end of file
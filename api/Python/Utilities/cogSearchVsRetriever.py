@@ -37,6 +37,8 @@ class CognitiveSearchVsRetriever(BaseRetriever, BaseModel):
     chunkSize : str = "2000"
     overlap : str = "100"
     documentId : str = ""
+    configuration : str = ""
+    """When set, search a chunk index that tags each chunk with the configurations that produced it."""
     embeddingModelType : str = "azureopenai"
     openAiEmbedding : str = "text-embedding-ada-002"
     openAiEndPoint : str = ""
@@ -93,6 +95,12 @@ class CognitiveSearchVsRetriever(BaseRetriever, BaseModel):
         )
         return values
 
+    def _filter(self) -> str:
+        if self.configuration:
+            return "documentId eq '" + self.documentId + "' and configurations/any(c: c eq '" + self.configuration + "')"
+        return ("documentId eq '" + self.documentId + "' and splitMethod eq '" + self.splitMethod + "' and model eq '" + self.model + "' and chunkSize eq '" 
+                + self.chunkSize + "' and overlap eq '" + self.overlap + "'")
+
     def _search(self, query: any) -> any:
         searchClient = SearchClient(endpoint=f"https://{self.serviceName}.search.windows.net",
                         index_name=self.indexName,
@@ -101,8 +109,7 @@ class CognitiveSearchVsRetriever(BaseRetriever, BaseModel):
         response = searchClient.search(  
             search_text="",
             vector=Vector(value=self.generateEmbeddings(query), k=self.topK, fields=self.contentKey),
-            filter="documentId eq '" + self.documentId + "' and splitMethod eq '" + self.splitMethod + "' and model eq '" + self.model + "' and chunkSize eq '" 
-                + self.chunkSize + "' and overlap eq '" + self.overlap + "'",
+            filter=self._filter(),
             select=self.returnFields,
             semantic_configuration_name="semanticConfig",
             include_total_count=True
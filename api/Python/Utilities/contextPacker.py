@@ -0,0 +1,106 @@
+"""Fit retrieved chunks into what is left of the model's context window once the prompt and the answer are reserved."""
+import hashlib
+import logging
+import re
+from typing import Any, List
+from langchain.docstore.document import Document
+from langchain.schema import BaseRetriever
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from Utilities.modelHelper import getEncoding, getTokenLimit, numTokenFromText
+
+# How load_qa_with_sources_chain renders each document into {summaries}, and what it puts between them
+SOURCES_DOCUMENT_FORMAT = "Content: {page_content}\nSource: {source}"
+DOCUMENT_SEPARATOR = "\n\n"
+# Tokens the chat API adds around a message, plus slack for merges across the joins of separately counted pieces
+MESSAGE_OVERHEAD = 8
+PACKING_MARGIN = 16
+PACKED_CHAINS = ("stuff", "map_rerank")
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+")
+
+def chunkFingerprint(text):
+    """Hash of the chunk with case, punctuation and whitespace ignored, so re-extracted copies of a page collide."""
+    normalized = " ".join(re.sub(r"[\W_]+", " ", text.lower()).split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+def contextBudget(modelId, promptText, maxTokens):
+    """Tokens left for documents in modelId's window once promptText, the prompt with no documents, and an answer of maxTokens are reserved."""
+    return getTokenLimit(modelId) - numTokenFromText(promptText, modelId) - maxTokens - MESSAGE_OVERHEAD - PACKING_MARGIN
+
+def truncateAtSentence(text, maxTokens, modelId):
+    """The longest prefix of text within maxTokens that ends on a sentence, or on a word when no sentence ends in time."""
+    if maxTokens <= 0:
+        return ""
+    encoding = getEncoding(modelId)
+    tokens = encoding.encode(text)
+    if len(tokens) <= maxTokens:
+        return text
+    head = encoding.decode(tokens[:maxTokens])
+    ends = [match.end() for match in SENTENCE_END.finditer(head)]
+    if ends:
+        return head[:ends[-1]].rstrip()
+    return head.rsplit(None, 1)[0] if " " in head.strip() else ""
+
+def packDocuments(docs, budget, modelId, perDocument=False, documentFormat=SOURCES_DOCUMENT_FORMAT):
+    """
+    docs in their retrieved order, without near duplicates, cut to budget tokens. Chunks are added whole while they
+    fit and the first one that does not is truncated at a sentence boundary to fill what is left. With perDocument,
+    as for map_rerank where every document gets its own call, each chunk is held to the whole budget instead.
+    Every chunk is counted once; the counts are memoized, so chunks retrieved again on later turns cost nothing.
+    """
+    separator = numTokenFromText(DOCUMENT_SEPARATOR, modelId)
+    packed, seen, used, duplicates = [], set(), 0, 0
+    for doc in docs:
+        fingerprint = chunkFingerprint(doc.page_content)
+        if fingerprint in seen:
+            duplicates += 1
+            continue
+        seen.add(fingerprint)
+        overhead = numTokenFromText(documentFormat.format(page_content="", source=doc.metadata.get("source", "")), modelId) + separator
+        remaining = (budget if perDocument else budget - used) - overhead
+        tokens = numTokenFromText(doc.page_content, modelId)
+        full = tokens > remaining
+        if full:
+            text = truncateAtSentence(doc.page_content, remaining, modelId)
+            if not text:
+                if perDocument:
+                    continue
+                break
+            doc = Document(page_content=text, metadata={**doc.metadata, "truncated": True})
+            tokens = numTokenFromText(text, modelId)
+        packed.append(doc)
+        # With perDocument, used is the largest single call rather than the total
+        used = max(used, tokens + overhead) if perDocument else used + tokens + overhead
+        if full and not perDocument:
+            break
+    logging.info(f"Packed {len(packed)} of {len(docs)} chunks into {used} of {budget} tokens, {duplicates} duplicates dropped")
+    return packed
+
+def packForChain(docs, chainType, prompt, question, modelId, maxTokens):
+    """
+    docs packed into the window of a stuff or map_rerank chain whose prompt takes summaries and question, or no
+    docs when the prompt and answer leave no room. map_reduce and refine send one chunk per call and are returned
+    docs unchanged.
+    """
+    if chainType not in PACKED_CHAINS or not docs:
+        return docs
+    budget = contextBudget(modelId, prompt.format(question=question, summaries=""), maxTokens)
+    packed = packDocuments(docs, budget, modelId, perDocument=chainType == "map_rerank")
+    if not packed:
+        # Sending a chunk anyway would overflow the window; the chain answers from the prompt alone instead
+        logging.warning(f"No room for any of {len(docs)} chunks in {budget} tokens, the prompt and answer fill the window")
+    return packed
+
+class PackingRetriever(BaseRetriever):
+    """Packs what another retriever returns, for the chains that take a retriever rather than documents."""
+    retriever: Any
+    chainType: str = "stuff"
+    prompt: Any
+    modelId: str = "gpt-35-turbo"
+    maxTokens: int = 500
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        docs = self.retriever.get_relevant_documents(query)
+        return packForChain(docs, self.chainType, self.prompt, query, self.modelId, self.maxTokens)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        return self._get_relevant_documents(query, run_manager=run_manager)
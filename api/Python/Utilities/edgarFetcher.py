@@ -0,0 +1,207 @@
+"""Concurrent SEC EDGAR fetching over one pooled, rate-limited session, with a resumable crawl state."""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import time
+import aiohttp
+
+# SEC fair-access policy: at most 10 requests per second per client
+SEC_REQUESTS_PER_SECOND = 10
+# Body of the page EDGAR serves instead of the document when it throttles a client
+THROTTLED_MARKER = b'will be managed until action is taken to declare your traffic.'
+RETRY_STATUSES = (403, 429, 500, 502, 503, 504)
+
+class RateLimiter:
+    """
+      Spaces requests evenly so that no more than rate of them start in any second, however many
+      coroutines are waiting. Must be created inside the event loop that uses it.
+      """
+
+    def __init__(self, rate=SEC_REQUESTS_PER_SECOND):
+        self.interval = 1.0 / rate
+        self.nextSlot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.nextSlot - now
+            self.nextSlot = max(now, self.nextSlot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class EdgarClient:
+    """
+      One aiohttp session, and so one connection pool, shared by every request of a crawl.
+      Attributes:
+          userAgent (str): The User-agent that will be declared to SEC EDGAR.
+          rate (float): Requests per second across all concurrent fetches.
+          retries (int): Attempts per URL on network errors, throttling and 5xx responses.
+          backoff (float): Base delay in seconds, doubled on every retry.
+      """
+
+    def __init__(self, userAgent, rate=SEC_REQUESTS_PER_SECOND, connections=10, retries=5, backoff=0.5, timeout=60):
+        self.userAgent = userAgent
+        self.rate = rate
+        self.connections = connections
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.requests = 0
+        self.session = None
+        self.limiter = None
+
+    async def __aenter__(self):
+        self.limiter = RateLimiter(self.rate)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections, ttl_dns_cache=300),
+            headers={'User-agent': self.userAgent, 'Accept-Encoding': 'gzip, deflate'},
+            timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def fetch(self, url):
+        """Return the body of url, or None once every retry failed."""
+        for attempt in range(self.retries):
+            retryAfter = None
+            await self.limiter.wait()
+            self.requests += 1
+            try:
+                async with self.session.get(url) as response:
+                    body = await response.read()
+                    if response.status == 200 and THROTTLED_MARKER not in body:
+                        return body
+                    if response.status not in RETRY_STATUSES and response.status != 200:
+                        logging.debug(f'Request for {url} failed with status {response.status}')
+                        return None
+                    retryAfter = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                logging.debug(f'Request for {url} failed due to network-related error: {err}')
+            delay = self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+            if retryAfter is not None and retryAfter.isdigit():
+                delay = max(delay, int(retryAfter))
+            await asyncio.sleep(delay)
+        logging.debug(f'Retries exceeded, could not download "{url}"')
+        return None
+
+    async def download(self, url, filepath):
+        """Write url to filepath and return the SHA-256 of what was written, or None on failure."""
+        content = await self.fetch(url)
+        if content is None:
+            return None
+        tempPath = filepath + '.part'
+        with open(tempPath, 'wb') as f:
+            f.write(content)
+        os.replace(tempPath, filepath)
+        return hashlib.sha256(content).hexdigest()
+
+def fileChecksum(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _writeJson(path, obj):
+    tempPath = path + '.tmp'
+    with open(tempPath, 'w') as f:
+        json.dump(obj=obj, fp=f, indent=1)
+    os.replace(tempPath, path)
+
+class CompanyIndex:
+    """
+      CIK to company metadata (SIC, state, fiscal year end), loaded once from companies_info.json.
+      Concurrent lookups of the same unknown CIK share a single EDGAR request.
+      """
+
+    def __init__(self, path):
+        self.path = path
+        self.companies = {}
+        self.pending = {}
+        self.dirty = False
+        if os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self.companies = json.load(fp=f)
+            except ValueError as e:
+                logging.info(f'Ignoring unreadable {path}: {e}')
+
+    def __contains__(self, cik):
+        return cik in self.companies
+
+    def get(self, cik):
+        return self.companies.get(cik)
+
+    async def resolve(self, cik, lookup):
+        """Return the metadata for cik, calling the lookup coroutine function only if it is not known yet."""
+        if cik in self.companies:
+            return self.companies[cik]
+        task = self.pending.get(cik)
+        if task is None:
+            task = self.pending[cik] = asyncio.ensure_future(lookup(cik))
+        try:
+            info = await task
+        finally:
+            self.pending.pop(cik, None)
+        if info is not None and cik not in self.companies:
+            self.companies[cik] = info
+            self.dirty = True
+        return info
+
+    def save(self):
+        if self.dirty:
+            _writeJson(self.path, self.companies)
+            self.dirty = False
+
+class CrawlState:
+    """
+      Resumable record of finished filings, keyed by accession number: the downloaded file, its checksum
+      and the crawled metadata. A filing whose file is still on disk with the same checksum is not fetched again.
+      """
+
+    def __init__(self, path, saveInterval=5.0):
+        self.path = path
+        self.saveInterval = saveInterval
+        self.filings = {}
+        self.savedAt = time.monotonic()
+        if os.path.isfile(path):
+            try:
+                with open(path) as f:
+                    self.filings = json.load(fp=f).get('filings', {})
+                logging.info(f'Resuming EDGAR crawl with {len(self.filings)} filings already downloaded')
+            except ValueError as e:
+                logging.info(f'Ignoring unreadable crawl state {path}: {e}')
+
+    def completed(self, accession, folder):
+        """The saved metadata of a filing whose file is intact on disk, or None if it has to be crawled."""
+        entry = self.filings.get(accession)
+        if entry is None:
+            return None
+        filepath = os.path.join(folder, entry['filename'])
+        if not os.path.isfile(filepath) or fileChecksum(filepath) != entry['sha256']:
+            return None
+        return entry['metadata']
+
+    def matches(self, accession, filepath):
+        entry = self.filings.get(accession)
+        return (entry is not None and entry['filename'] == os.path.basename(filepath)
+                and os.path.isfile(filepath) and fileChecksum(filepath) == entry['sha256'])
+
+    def markDone(self, accession, filename, sha256, metadata):
+        self.filings[accession] = {'filename': filename, 'sha256': sha256, 'metadata': metadata}
+        if time.monotonic() - self.savedAt > self.saveInterval:
+            self.save()
+
+    def save(self):
+        _writeJson(self.path, {'filings': self.filings})
+        self.savedAt = time.monotonic()
+
+def toJsonable(metadata):
+    """Replace NaN values, which the index dataframe uses for missing fields, so the state file stays valid JSON."""
+    return {key: (None if isinstance(value, float) and math.isnan(value) else value) for key, value in metadata.items()}
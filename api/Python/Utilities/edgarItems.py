@@ -0,0 +1,588 @@
+"""10-K item extraction: one ITEM scan per filing, precompiled patterns, an lxml parse of HTML filings and a process pool."""
+import logging
+import os
+import re
+from bisect import bisect_left
+from functools import lru_cache, partial
+from html.parser import HTMLParser
+from io import BytesIO
+import cssutils
+from bs4 import BeautifulSoup
+from lxml import etree
+from pathos.pools import ProcessPool
+from tqdm import tqdm
+
+regex_flags = re.IGNORECASE | re.DOTALL | re.MULTILINE
+
+# Characters normalized by clean_text, applied in a single pass
+CHARACTER_TABLE = str.maketrans({
+    '\xa0': ' ', '\u200b': ' ',
+    '\x91': '\u2018', '\x92': '\u2019', '\x93': '\u201c', '\x94': '\u201d', '\x95': '\u2022',
+    '\x96': '-', '\x97': '-', '\x98': '\u02dc', '\x99': '\u2122',
+    '\u2010': '-', '\u2011': '-', '\u2012': '-', '\u2013': '-', '\u2014': '-', '\u2015': '-',
+})
+
+BLOCK_CLOSE_PATTERN = re.compile(r'(<\s*/\s*(div|tr|p|li|)\s*>)')
+LINE_BREAK_PATTERN = re.compile(r'(<br\s*>|<br\s*/>)')
+CELL_CLOSE_PATTERN = re.compile(r'(<\s*/\s*(th|td)\s*>)')
+
+PARAGRAPH_BREAK_PATTERN = re.compile(r'(( )*\n( )*){2,}')
+PARAGRAPH_MARK_PATTERN = re.compile(r'(#NEWLINE)+')
+SPACES_PATTERN = re.compile(r'[ ]{2,}')
+
+BROKEN_PART_PATTERN = re.compile(r'(\n[^\S\r\n]*)(P[^\S\r\n]*A[^\S\r\n]*R[^\S\r\n]*T)([^\S\r\n]+)((\d{1,2}|[IV]{1,2})[AB]?)', re.IGNORECASE)
+BROKEN_ITEM_PATTERN = re.compile(r'(\n[^\S\r\n]*)(I[^\S\r\n]*T[^\S\r\n]*E[^\S\r\n]*M)([^\S\r\n]+)(\d{1,2}[AB]?)', re.IGNORECASE)
+HEADER_BULLET_PATTERN = re.compile(r'(ITEM|PART)(\s+\d{1,2}[AB]?)([\-•])', re.IGNORECASE)
+HORIZONTAL_SPACE_PATTERN = re.compile(r'[^\S\r\n]')
+CONTENTS_HEADER_PATTERN = re.compile(
+    r'\n[^\S\r\n]*'
+    r'(TABLE\s+OF\s+CONTENTS|INDEX\s+TO\s+FINANCIAL\s+STATEMENTS|BACK\s+TO\s+CONTENTS|QUICKLINKS)'
+    r'[^\S\r\n]*\n', regex_flags)
+DASHED_PAGE_NUMBER_PATTERN = re.compile(r'\n[^\S\r\n]*[-‒–—]*\d+[-‒–—]*[^\S\r\n]*\n', regex_flags)
+PAGE_NUMBER_PATTERN = re.compile(r'\n[^\S\r\n]*\d+[^\S\r\n]*\n', regex_flags)
+FINANCIAL_PAGE_PATTERN = re.compile(r'[\n\s]F[-‒–—]*\d+', regex_flags)
+PAGE_HEADER_PATTERN = re.compile(r'\n[^\S\r\n]*Page\s[\d*]+[^\S\r\n]*\n', regex_flags)
+
+PDF_PATTERN = re.compile(r'<PDF>.*?</PDF>', regex_flags)
+DOCUMENT_PATTERN = re.compile('<DOCUMENT>.*?</DOCUMENT>', regex_flags)
+DOCUMENT_TYPE_PATTERN = re.compile(r'\n[^\S\r\n]*<TYPE>(.*?)\n', regex_flags)
+TEXT_TABLE_PATTERN = re.compile(r'<TABLE>.*?</TABLE>', regex_flags)
+
+# Any 'ITEM <number>'; the optional letter and the delimiter after it are read by ItemIndex
+ITEM_NUMBER_PATTERN = re.compile(r'ITEM\s+([0-9]{1,2})', re.IGNORECASE)
+ITEM_DELIMITERS = '.*~-:'
+
+BLOCK_TAGS = ('div', 'tr', 'p', 'li')
+CELL_TAGS = ('th', 'td')
+PLAIN_BACKGROUNDS = ['none', 'transparent', '#ffffff', '#fff', 'white']
+
+def itemRegex(item_index):
+    """The regex for an item number as it appears in a heading, e.g. '1A' also matches '1 A'."""
+    if item_index == '9A':
+        return item_index.replace('A', r'[^\S\r\n]*A(?:\(T\))?')
+    elif 'A' in item_index:
+        return item_index.replace('A', r'[^\S\r\n]*A')
+    elif 'B' in item_index:
+        return item_index.replace('B', r'[^\S\r\n]*B')
+    return item_index
+
+@lru_cache(maxsize=64)
+def itemHeaderPattern(item_index):
+    return re.compile(rf'\n[^\S\r\n]*ITEM\s+{itemRegex(item_index)}[.*~\-:\s]', regex_flags)
+
+def _isDelimiter(character):
+    return character in ITEM_DELIMITERS or character.isspace()
+
+def _isHorizontalSpace(character):
+    return character.isspace() and character not in '\r\n'
+
+class ItemIndex:
+    """
+      Every 'ITEM <number>' of a 10-K text, found in one scan and grouped by item, so that sections can be
+      located with list lookups instead of a regex search per item and candidate next item.
+      Attributes:
+          headers (dict): Item to the (start, end) of each heading, an ITEM that starts a line; start is the newline.
+          mentions (dict): Item to the (spaceStart, itemStart, end) of each ITEM anywhere in the text, where
+              spaceStart is the start of the spaces before it.
+      """
+
+    def __init__(self, text):
+        self.text = text
+        self.headers = {}
+        self.mentions = {}
+        for match in ITEM_NUMBER_PATTERN.finditer(text):
+            itemStart = match.start()
+            spaceStart = itemStart
+            while spaceStart > 0 and _isHorizontalSpace(text[spaceStart - 1]):
+                spaceStart -= 1
+            isHeader = spaceStart > 0 and text[spaceStart - 1] == '\n'
+            for item, end in self._items(match.group(1), match.end()):
+                self.mentions.setdefault(item, []).append((spaceStart, itemStart, end))
+                if isHeader:
+                    self.headers.setdefault(item, []).append((spaceStart - 1, end))
+        self.headerStarts = {item: [start for start, _ in headers] for item, headers in self.headers.items()}
+        self.mentionStarts = {item: [itemStart for _, itemStart, _ in mentions] for item, mentions in self.mentions.items()}
+
+    def _items(self, digits, position):
+        # The items an 'ITEM <digits>' can be read as, with the end of each heading; '9 A' is both Item 9 and Item 9A
+        text = self.text
+        if position < len(text) and _isDelimiter(text[position]):
+            yield digits, position + 1
+        letter = position
+        while letter < len(text) and _isHorizontalSpace(text[letter]):
+            letter += 1
+        if letter + 1 < len(text) and text[letter] in 'aAbB':
+            item = digits + text[letter].upper()
+            if item == '9A' and text[letter + 1:letter + 4].upper() == '(T)' and letter + 4 < len(text) and _isDelimiter(text[letter + 4]):
+                yield item, letter + 5
+            elif _isDelimiter(text[letter + 1]):
+                yield item, letter + 2
+
+    def headings(self, item_index):
+        """Headings of an item that do not overlap, in the order a regex scan of the text would return them."""
+        previousEnd = -1
+        for start, end in self.headers.get(item_index, []):
+            if start >= previousEnd:
+                previousEnd = end
+                yield start, end
+
+    def sections(self, item_index, next_item_index, offset):
+        """
+        The candidate sections from the heading at offset onwards: each heading of the item paired with the first
+        mention of the next item after it, as (start, nextItemStart, end); the next heading is searched after end.
+        """
+        headers = self.headers.get(item_index, [])
+        headerStarts = self.headerStarts.get(item_index, [])
+        mentions = self.mentions.get(next_item_index, [])
+        mentionStarts = self.mentionStarts.get(next_item_index, [])
+        sections = []
+        i = bisect_left(headerStarts, offset)
+        while i < len(headers):
+            start, end = headers[i]
+            j = bisect_left(mentionStarts, end + 1)
+            if j == len(mentions):
+                break
+            spaceStart, _, mentionEnd = mentions[j]
+            sections.append((start, max(end + 1, spaceStart), mentionEnd))
+            i = bisect_left(headerStarts, mentionEnd, i + 1)
+        return sections
+
+class HtmlStripper(HTMLParser):
+    """
+    Strips HTML tags
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.reset()
+        self.strict = False
+        self.convert_charrefs = True
+        self.fed = []
+
+    def handle_data(self, d):
+        self.fed.append(d)
+
+    def get_data(self):
+        return ''.join(self.fed)
+
+    def strip_tags(self, html):
+        self.feed(html)
+        return self.get_data()
+
+def _removeWhitespace(match):
+    return f'{match[1]}{HORIZONTAL_SPACE_PATTERN.sub("", match[2])}{match[3]}{match[4]}'
+
+def _hasBackground(style):
+    return bool(style) and style.lower() not in PLAIN_BACKGROUNDS
+
+class ExtractItems:
+
+    @staticmethod
+    def strip_html(html_content):
+        """
+        Strips the html content to get clean text
+        :param html_content: The HTML content
+        :return: The clean HTML content
+        """
+
+        html_content = BLOCK_CLOSE_PATTERN.sub(r'\1\n\n', html_content)
+        html_content = LINE_BREAK_PATTERN.sub(r'\1\n\n', html_content)
+        html_content = CELL_CLOSE_PATTERN.sub(r' \1 ', html_content)
+        html_content = HtmlStripper().strip_tags(html_content)
+
+        return html_content
+
+    @staticmethod
+    def html_text(root, skipped=()):
+        """
+        The text of a parsed lxml element, laid out as strip_html lays out its markup: a blank line after
+        block elements and line breaks, spaces around table cells, comments dropped
+        :param root: The element
+        :param skipped: Elements left out together with their content
+        :return: The text
+        """
+
+        parts = []
+        stack = [(root, True)]
+        while stack:
+            element, opening = stack.pop()
+            tag = element.tag if isinstance(element.tag, str) else None
+            if not opening:
+                if tag in BLOCK_TAGS:
+                    parts.append('\n\n')
+                elif tag in CELL_TAGS:
+                    parts.append('  ')
+                if element is not root and element.tail:
+                    parts.append(element.tail)
+                continue
+            # The closing entry writes the tail, so skipped elements and comments keep the text after them
+            stack.append((element, False))
+            if tag is None or element in skipped:
+                continue
+            if tag == 'br':
+                parts.append('\n\n')
+            if element.text:
+                parts.append(element.text)
+            for child in reversed(element):
+                stack.append((child, True))
+        return ''.join(parts)
+
+    @staticmethod
+    def parse_html(doc):
+        """
+        Parses an HTML document with lxml, reporting each table as soon as it is complete
+        :param doc: The HTML document
+        :return: The root element and the tables, inner tables first; None if the document could not be parsed
+        """
+
+        try:
+            context = etree.iterparse(BytesIO(doc.encode('utf-8')), events=('end',), tag='table', html=True,
+                                      encoding='utf-8', huge_tree=True)
+            tables = [table for _, table in context]
+            return context.root, tables
+        except (etree.LxmlError, ValueError) as e:
+            logging.info(f'lxml could not parse the document: {e}')
+            return None
+
+    @staticmethod
+    def remove_multiple_lines(text):
+        """
+        Replaces consecutive new lines with a single new line
+        and consecutive whitespace characters with a single whitespace
+        :param text: String containing the financial text
+        :return: String without multiple newlines
+        """
+
+        text = PARAGRAPH_BREAK_PATTERN.sub('#NEWLINE', text)
+        text = text.replace('\n', ' ')
+        text = PARAGRAPH_MARK_PATTERN.sub('\n', text).strip()
+        text = SPACES_PATTERN.sub(' ', text)
+
+        return text
+
+    @staticmethod
+    def clean_text(text):
+        """
+        Clean the text of various unnecessary blocks of text
+        Substitute various special characters
+        :param text: Raw text string
+        :return: String containing normalized, clean text
+        """
+
+        text = text.translate(CHARACTER_TABLE)
+
+        # Fix broken section headers
+        text = BROKEN_PART_PATTERN.sub(_removeWhitespace, text)
+        text = BROKEN_ITEM_PATTERN.sub(_removeWhitespace, text)
+
+        text = HEADER_BULLET_PATTERN.sub(r'\1\2 \3 ', text)
+
+        # Remove unnecessary headers
+        text = CONTENTS_HEADER_PATTERN.sub('\n', text)
+
+        # Remove page numbers and headers
+        text = DASHED_PAGE_NUMBER_PATTERN.sub('\n', text)
+        text = PAGE_NUMBER_PATTERN.sub('\n', text)
+
+        text = FINANCIAL_PAGE_PATTERN.sub('', text)
+        text = PAGE_HEADER_PATTERN.sub('', text)
+
+        return text
+
+    @staticmethod
+    def calculate_table_character_percentages(table_text):
+        """
+        Calculate character type percentages contained in the table text
+        :param table_text: The table text
+        :return non_blank_digits_percentage: Percentage of digit characters
+        :return spaces_percentage: Percentage of space characters
+        """
+        digits = sum(c.isdigit() for c in table_text)
+        # letters   = sum(c.isalpha() for c in table_text)
+        spaces = sum(c.isspace() for c in table_text)
+
+        if len(table_text) - spaces:
+            non_blank_digits_percentage = digits / (len(table_text) - spaces)
+        else:
+            non_blank_digits_percentage = 0
+
+        if len(table_text):
+            spaces_percentage = spaces / len(table_text)
+        else:
+            spaces_percentage = 0
+
+        return non_blank_digits_percentage, spaces_percentage
+
+    @staticmethod
+    def is_numerical_table(items_to_extract, table_text, cells):
+        """
+        Whether a table holds numerical data: it has no item heading and some row or cell is shaded
+        Note that there are many corner-cases in the tables that have text data instead of numerical
+        :param table_text: The clean text of the table
+        :param cells: (style, bgcolor) attribute values of the table's rows and cells
+        """
+
+        for item_index in items_to_extract:
+            if itemHeaderPattern(item_index).search(table_text):
+                return False
+
+        for style, bgcolor in cells:
+            if style is not None:
+                # Parse given cssText which is assumed to be the content of a HTML style attribute
+                style = cssutils.parseStyle(style)
+                if _hasBackground(style['background']) or _hasBackground(style['background-color']):
+                    return True
+            if bgcolor is not None and bgcolor.lower() not in PLAIN_BACKGROUNDS:
+                return True
+
+        return False
+
+    @staticmethod
+    def remove_html_tables(items_to_extract, doc_10k, is_html):
+        """
+        Remove HTML tables that contain numerical data
+        :param doc_10k: The 10-K html
+        :param is_html: Whether the document contains html code or just plain text
+        :return: doc_10k: The 10-K html without numerical tables
+        """
+
+        if is_html:
+            for tbl in doc_10k.find_all('table'):
+                tbl_text = ExtractItems.clean_text(ExtractItems.strip_html(str(tbl)))
+                cells = [(cell.get('style'), cell.get('bgcolor')) for cell in tbl.find_all(['tr', 'td', 'th'])]
+                if ExtractItems.is_numerical_table(items_to_extract, tbl_text, cells):
+                    tbl.decompose()
+
+        else:
+            doc_10k = TEXT_TABLE_PATTERN.sub('', str(doc_10k))
+
+        return doc_10k
+
+    @staticmethod
+    def numerical_tables(items_to_extract, tables):
+        """
+        The lxml counterpart of remove_html_tables
+        :param tables: The tables of the document, inner tables first
+        :return: The tables to leave out of the text
+        """
+
+        skipped = set()
+        for tbl in tables:
+            tbl_text = ExtractItems.clean_text(ExtractItems.html_text(tbl, skipped))
+            cells = [(cell.get('style'), cell.get('bgcolor')) for cell in tbl.iter('tr', 'td', 'th')]
+            if ExtractItems.is_numerical_table(items_to_extract, tbl_text, cells):
+                skipped.add(tbl)
+        return skipped
+
+    @staticmethod
+    def parse_item(items_to_extract, text, item_index, next_item_list, positions, index=None):
+        """
+        Parses Item N for a 10-K text
+        :param text: The 10-K text
+        :param item_index: Number of the requested Item/Section of the 10-K text
+        :param next_item_list: List of possible next 10-K item sections
+        :param positions: List of the end positions of previous item sections
+        :param index: The ItemIndex of the text, built here if not given
+        :return: item_section: The item/section as a text string
+        """
+
+        index = index or ItemIndex(text)
+
+        # Depending on the item_index, search for subsequent sections.
+
+        # There might be many 'candidate' text sections between 2 Items.
+        # For example, the Table of Contents (ToC) still counts as a match when searching text between 'Item 3' and 'Item 4'
+        # But we do NOT want that specific text section; We want the detailed section which is *after* the ToC
+
+        possible_sections_list = []
+        for next_item_index in next_item_list:
+            if possible_sections_list:
+                break
+            for offset, _ in index.headings(item_index):
+                possible = index.sections(item_index, next_item_index, offset)
+                if possible:
+                    possible_sections_list += [(offset, possible)]
+
+        # Extract the wanted section from the text
+        item_section, positions = ExtractItems.get_item_section(possible_sections_list, text, positions)
+
+        # If item is the last one (usual case when dealing with EDGAR's old .txt files), get all the text from its beginning until EOF.
+        # Lettered items never fall back to this, as before
+        if positions:
+            if item_index.isdigit() and item_index in items_to_extract and item_section == '':
+                item_section = ExtractItems.get_last_item_section(item_index, text, positions, index)
+            elif item_index == '15':  # Item 15 is the last one, get all the text from its beginning until EOF
+                item_section = ExtractItems.get_last_item_section(item_index, text, positions, index)
+
+        return item_section.strip(), positions
+
+    @staticmethod
+    def get_item_section(possible_sections_list, text, positions):
+        """
+        Throughout a list of all the possible item sections, it returns the biggest one, which (probably) is the correct one.
+        :param possible_sections_list: List containing all the possible (start, next item start, end) sections between Item X and Item Y
+        :param text: The whole text
+        :param positions: List of the end positions of previous item sections
+        :return: The correct section
+        """
+
+        item_section = ''
+        max_match_length = 0
+        max_match = None
+
+        # Find the match with the largest section
+        for (offset, matches) in possible_sections_list:
+            for match in matches:
+                match_length = match[2] - match[0]
+                if match_length > max_match_length and (not positions or match[0] >= positions[-1]):
+                    max_match = match
+                    max_match_length = match_length
+
+        # Return the text section inside that match
+        if max_match:
+            item_section = text[max_match[0]:max_match[1]]
+            positions.append(max_match[1] - 1)
+
+        return item_section, positions
+
+    @staticmethod
+    def get_last_item_section(item_index, text, positions, index=None):
+        """
+        Returns the text section starting through a given item. This is useful in cases where Item 15 is the last item
+        and there is no Item 16 to indicate its ending. Also, it is useful in cases like EDGAR's old .txt files
+        (mostly before 2005), where there there is no Item 15; thus, ITEM 14 is the last one there.
+        :param item_index: The index of the item/section in the 10-K ('14' or '15')
+        :param text: The whole 10-K text
+        :param positions: List of the end positions of previous item sections
+        :return: All the remaining text until the end, starting from the specified item_index
+        """
+
+        index = index or ItemIndex(text)
+
+        # Headings followed by '.', '-', ':' or a space and at least one more character
+        previous_end = -1
+        for start, end in index.headers.get(item_index, []):
+            if start < previous_end or text[end - 1] in '*~' or end >= len(text):
+                continue
+            previous_end = end + 1
+            if start >= positions[-1]:
+                return text[start:].strip()
+
+        return ''
+
+    @staticmethod
+    def extract_items(filing_metadata, remove_tables, items_to_extract, raw_files_folder, html_parser='lxml'):
+        try:
+            """
+            Extracts all items/sections for a 10-K file and writes it to a CIK_10K_YEAR.json file (eg. 1384400_10K_2017.json)
+            :param filing_metadata: a pandas series containing all filings metadata
+            :param html_parser: 'lxml' to parse HTML filings with lxml directly, 'bs4' to go through BeautifulSoup
+            """
+
+            absolute_10k_filename = os.path.join(raw_files_folder, filing_metadata['filename'])
+            logging.info(f'Extracting items from {absolute_10k_filename}...')
+
+            with open(absolute_10k_filename, 'r', errors='backslashreplace') as file:
+                content = file.read()
+
+            # Remove all embedded pdfs that might be seen in few old 10-K txt annual reports
+            content = PDF_PATTERN.sub('', content)
+
+            documents = DOCUMENT_PATTERN.findall(content)
+
+            doc_10k = None
+            for doc in documents:
+                doc_type = DOCUMENT_TYPE_PATTERN.search(doc)
+                doc_type = doc_type.group(1) if doc_type else None
+                if doc_type.startswith('10'):
+                    doc_10k = doc
+                    break
+
+            if doc_10k is None:
+                if documents:
+                    logging.info(f'\nCould not find document type 10K for {filing_metadata["filename"]}')
+                doc_10k = content
+
+            # if not is_html and not documents:
+            if filing_metadata['filename'].endswith('txt') and not documents:
+                logging.info(f'\nNo <DOCUMENT> tag for {filing_metadata["filename"]}')
+
+            parsed = ExtractItems.parse_html(doc_10k) if html_parser == 'lxml' else None
+            if parsed is not None:
+                root, tables = parsed
+                is_html = root.find('.//td') is not None and root.find('.//tr') is not None
+                if is_html:
+                    skipped = ExtractItems.numerical_tables(items_to_extract, tables) if remove_tables else ()
+                    text = ExtractItems.html_text(root, skipped)
+            else:
+                soup = BeautifulSoup(doc_10k, 'lxml')
+                is_html = (True if soup.find('td') else False) and (True if soup.find('tr') else False)
+                if is_html:
+                    if remove_tables:
+                        soup = ExtractItems.remove_html_tables(items_to_extract, soup, is_html=True)
+                    text = ExtractItems.strip_html(str(soup))
+
+            # For non html clean all table items
+            if not is_html:
+                if remove_tables:
+                    doc_10k = ExtractItems.remove_html_tables(items_to_extract, doc_10k, is_html=False)
+                text = ExtractItems.strip_html(str(doc_10k))
+
+            json_content = {
+                'cik': filing_metadata['CIK'],
+                'company': filing_metadata['Company'],
+                'filing_type': filing_metadata['Type'],
+                'filing_date': filing_metadata['Date'],
+                'period_of_report': filing_metadata['Period of Report'],
+                'sic': filing_metadata['SIC'],
+                'state_of_inc': filing_metadata['State of Inc'],
+                'state_location': filing_metadata['State location'],
+                'fiscal_year_end': filing_metadata['Fiscal Year End'],
+                'filing_html_index': filing_metadata['html_index'],
+                'htm_filing_link': filing_metadata['htm_file_link'],
+                'complete_text_filing_link': filing_metadata['complete_text_file_link'],
+                'filename': filing_metadata['filename']
+            }
+            for item_index in items_to_extract:
+                json_content[f'item_{item_index}'] = ''
+
+            text = ExtractItems.clean_text(text)
+            index = ItemIndex(text)
+
+            positions = []
+            all_items_null = True
+            for i, item_index in enumerate(items_to_extract):
+                next_item_list = items_to_extract[i+1:]
+                item_section, positions = ExtractItems.parse_item(items_to_extract, text, item_index, next_item_list, positions, index)
+                item_section = ExtractItems.remove_multiple_lines(item_section)
+
+                if item_section != '':
+                    all_items_null = False
+                json_content[f'item_{item_index}'] = item_section
+
+            if all_items_null:
+                logging.info(f'\nCould not extract any item for {absolute_10k_filename}')
+                return None
+
+            return json_content
+        except Exception as e:
+            logging.info("Exception in Process Items " + str(e))
+
+def extractFilings(listOfSeries, remove_tables, items_to_extract, raw_files_folder, processes=None, html_parser='lxml'):
+    """
+    Extract the items of many filings in a process pool, since parsing and the regex passes are CPU bound.
+    Returns the extracted items of each filing in order, None where nothing could be extracted.
+    """
+    extract = partial(ExtractItems.extract_items, remove_tables=remove_tables, items_to_extract=items_to_extract,
+                      raw_files_folder=raw_files_folder, html_parser=html_parser)
+    processes = min(processes or os.cpu_count() or 1, len(listOfSeries))
+    if processes <= 1:
+        return [extract(series) for series in listOfSeries]
+
+    pool = ProcessPool(nodes=processes)
+    try:
+        return list(tqdm(pool.imap(extract, listOfSeries), total=len(listOfSeries), ncols=100))
+    finally:
+        pool.close()
+        pool.join()
+        pool.clear()
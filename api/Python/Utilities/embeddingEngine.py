@@ -0,0 +1,158 @@
+"""Batched embedding engine shared by every indexer in Utilities."""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import openai
+import tiktoken
+from tenacity import retry, wait_random_exponential, stop_after_attempt, retry_if_not_exception_type
+from Utilities.embeddingCache import EmbeddingCache, cacheKey, toBytes, fromBytes, getEmbeddingCache
+
+# Azure OpenAI accepts at most 16 inputs per embedding request, OpenAI accepts 2048
+MAX_BATCH_SIZE = {
+    "azureopenai": 16,
+    "openai": 2048
+}
+# text-embedding-ada-002 rejects any single input above this length
+MAX_INPUT_TOKENS = 8191
+
+_engines = {}
+_enginesLock = threading.Lock()
+
+class EmbeddingEngine:
+    """
+      Packs a stream of texts into multi-input embedding requests and keeps several of them in flight.
+      Attributes:
+          embeddingModelType (str): "azureopenai" or "openai".
+          maxBatchSize (int): Maximum number of inputs sent in a single request.
+          maxBatchTokens (int): Maximum number of tokens sent in a single request.
+          maxInFlight (int): Number of requests allowed to run concurrently.
+          cache (EmbeddingCache): Optional cache consulted before any text is sent to the service.
+      Methods:
+          embedStream(self, texts): Yields one vector per text, in input order.
+          embed(self, texts): Returns the list of vectors for texts, in input order.
+      """
+
+    def __init__(self, embeddingModelType: str, apiKey: str, apiBase: str = None, apiVersion: str = None,
+                 deployment: str = None, maxBatchSize: int = None, maxBatchTokens: int = 32768, maxInFlight: int = 4,
+                 cache: EmbeddingCache = None):
+        if embeddingModelType == "azureopenai":
+            self.requestArgs = {"engine": deployment, "api_key": apiKey, "api_base": apiBase,
+                                "api_type": "azure", "api_version": apiVersion}
+        elif embeddingModelType == "openai":
+            self.requestArgs = {"engine": deployment or "text-embedding-ada-002", "api_key": apiKey,
+                                "api_base": apiBase or "https://api.openai.com/v1", "api_type": "open_ai"}
+        else:
+            raise ValueError("Embedding model type " + str(embeddingModelType) + " is not supported")
+        self.embeddingModelType = embeddingModelType
+        self.maxBatchSize = maxBatchSize or MAX_BATCH_SIZE[embeddingModelType]
+        self.maxBatchTokens = max(maxBatchTokens, MAX_INPUT_TOKENS)
+        self.maxInFlight = maxInFlight
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=maxInFlight, thread_name_prefix="embedding")
+
+    def _prepare(self, text):
+        # Empty inputs are rejected by the service and oversized inputs are truncated to the model limit
+        text = text or " "
+        tokens = self.encoding.encode(text)
+        if len(tokens) > MAX_INPUT_TOKENS:
+            tokens = tokens[:MAX_INPUT_TOKENS]
+            text = self.encoding.decode(tokens)
+        return text, len(tokens)
+
+    def _batches(self, prepared):
+        batch = []
+        batchTokens = 0
+        for text, tokenCount in prepared:
+            if batch and (len(batch) >= self.maxBatchSize or batchTokens + tokenCount > self.maxBatchTokens):
+                yield batch
+                batch = []
+                batchTokens = 0
+            batch.append(text)
+            batchTokens += tokenCount
+        if batch:
+            yield batch
+
+    @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3), reraise=True,
+           retry=retry_if_not_exception_type(openai.error.InvalidRequestError))
+    def _createEmbeddings(self, texts):
+        response = openai.Embedding.create(input=texts, **self.requestArgs)
+        data = sorted(response['data'], key=lambda d: d['index'])
+        return [d['embedding'] for d in data]
+
+    def _embedBatch(self, texts):
+        try:
+            return self._createEmbeddings(texts)
+        except Exception as e:
+            if len(texts) == 1:
+                raise
+            # Split the failed batch so a single bad input does not fail its neighbours
+            middle = len(texts) // 2
+            logging.info(f"Embedding batch of {len(texts)} failed, retrying as two halves: {e}")
+            return self._embedBatch(texts[:middle]) + self._embedBatch(texts[middle:])
+
+    def _submitWindow(self, texts):
+        keys = [cacheKey(self.requestArgs["engine"], text) for text in texts]
+        found = self.cache.getMany(keys) if self.cache is not None else {}
+        misses = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in misses:
+                misses[key] = self._prepare(text)
+        futures = []
+        missKeys = list(misses)
+        start = 0
+        for batch in self._batches(misses.values()):
+            futures.append((missKeys[start:start + len(batch)], self.executor.submit(self._embedBatch, batch)))
+            start += len(batch)
+        return keys, found, futures
+
+    def _collectWindow(self, window):
+        keys, found, futures = window
+        vectors = {key: fromBytes(value) for key, value in found.items()}
+        for batchKeys, future in futures:
+            embedded = future.result()
+            vectors.update(zip(batchKeys, embedded))
+            if self.cache is not None:
+                self.cache.setMany({key: toBytes(vector) for key, vector in zip(batchKeys, embedded)})
+        return [vectors[key] for key in keys]
+
+    def embedStream(self, texts):
+        # Texts are read in windows; cached vectors are served from the cache and only the misses are
+        # packed into requests, while the next window is submitted before the previous one is collected
+        windowSize = min(self.maxBatchSize * self.maxInFlight, 1024)
+        pending = deque()
+        window = []
+        for text in texts:
+            window.append(text)
+            if len(window) >= windowSize:
+                pending.append(self._submitWindow(window))
+                window = []
+                if len(pending) > 1:
+                    yield from self._collectWindow(pending.popleft())
+        if window:
+            pending.append(self._submitWindow(window))
+        while pending:
+            yield from self._collectWindow(pending.popleft())
+        if self.cache is not None:
+            logging.info(f"Embedding cache stats: {self.cache.stats()}")
+
+    def embed(self, texts):
+        return list(self.embedStream(texts))
+
+def getEmbeddingEngine(embeddingModelType, OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding):
+    """Return the process-wide engine for the given OpenAI settings, creating it on first use."""
+    if embeddingModelType == "azureopenai":
+        key = (embeddingModelType, OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiEmbedding)
+    else:
+        key = (embeddingModelType, OpenAiApiKey)
+    with _enginesLock:
+        engine = _engines.get(key)
+        if engine is None:
+            if embeddingModelType == "azureopenai":
+                engine = EmbeddingEngine(embeddingModelType, OpenAiKey, apiBase=OpenAiEndPoint,
+                                         apiVersion=OpenAiVersion, deployment=OpenAiEmbedding, cache=getEmbeddingCache())
+            else:
+                engine = EmbeddingEngine(embeddingModelType, OpenAiApiKey, cache=getEmbeddingCache())
+            _engines[key] = engine
+    return engine
@@ -1,31 +1,14 @@
-import openai
-from tenacity import retry, wait_random_exponential, stop_after_attempt  
 from Utilities.envVars import *
+from Utilities.embeddingEngine import getEmbeddingEngine
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 # Function to generate embeddings for title and content fields, also used for query embeddings
 def generateEmbeddings(embeddingModelType, text):
-    if (embeddingModelType == 'azureopenai'):
-        openai.api_type = "azure"
-        openai.api_key = OpenAiKey
-        openai.api_version = OpenAiVersion
-        openai.api_base = f"{OpenAiEndPoint}"
+    return generateEmbeddingsBatch(embeddingModelType, [text])[0]
 
-        response = openai.Embedding.create(
-            input=text, engine=OpenAiEmbedding)
-        embeddings = response['data'][0]['embedding']
+# Function to generate embeddings for many texts at once, returned in input order
+def generateEmbeddingsBatch(embeddingModelType, texts):
+    return list(generateEmbeddingsStream(embeddingModelType, texts))
 
-    elif embeddingModelType == "openai":
-        try:
-            openai.api_type = "open_ai"
-            openai.api_base = "https://api.openai.com/v1"
-            openai.api_version = '2020-11-07' 
-            openai.api_key = OpenAiApiKey
-
-            response = openai.Embedding.create(
-                input=text, engine="text-embedding-ada-002", api_key = OpenAiApiKey)
-            embeddings = response['data'][0]['embedding']
-        except Exception as e:
-            print(e)
-        
-    return embeddings
\ No newline at end of file
+def generateEmbeddingsStream(embeddingModelType, texts):
+    engine = getEmbeddingEngine(embeddingModelType, OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding)
+    return engine.embedStream(texts)
@@ -1,8 +1,12 @@
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import *
 from azure.search.documents import SearchClient
+from Utilities.searchUploader import uploadDocuments
+from Utilities.clientRegistry import getSearchClient, getSearchIndexClient
 from azure.core.credentials import AzureKeyCredential
+import logging
 import os
+import hashlib
 from azure.search.documents.indexes.models import (  
     SearchIndex,  
     SearchField,  
@@ -21,38 +25,19 @@ from azure.search.documents.indexes.models import (
 from azure.search.documents.models import Vector  
 from tenacity import retry, wait_random_exponential, stop_after_attempt  
 import openai
+from Utilities.embeddingEngine import getEmbeddingEngine
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 # Function to generate embeddings for title and content fields, also used for query embeddings
 def generateEmbeddings(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, text):
-    if (embeddingModelType == 'azureopenai'):
-        openai.api_type = "azure"
-        openai.api_key = OpenAiKey
-        openai.api_version = OpenAiVersion
-        openai.api_base = f"{OpenAiEndPoint}"
+    return list(generateEmbeddingsStream(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, [text]))[0]
 
-        response = openai.Embedding.create(
-            input=text, engine=OpenAiEmbedding)
-        embeddings = response['data'][0]['embedding']
-
-    elif embeddingModelType == "openai":
-        try:
-            openai.api_type = "open_ai"
-            openai.api_base = "https://api.openai.com/v1"
-            openai.api_version = '2020-11-07' 
-            openai.api_key = OpenAiApiKey
-
-            response = openai.Embedding.create(
-                input=text, engine="text-embedding-ada-002", api_key = OpenAiApiKey)
-            embeddings = response['data'][0]['embedding']
-        except Exception as e:
-            print(e)
-        
-    return embeddings
+# Function to generate embeddings for many texts, packed into batched requests and yielded in input order
+def generateEmbeddingsStream(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, texts):
+    engine = getEmbeddingEngine(embeddingModelType, OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding)
+    return engine.embedStream(texts)
 
 def deleteSearchIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName in indexClient.list_index_names():
         print(f"Deleting {indexName} search index")
         indexClient.delete_index(indexName)
@@ -61,28 +46,10 @@ def deleteSearchIndex(SearchService, SearchKey, indexName):
 
 def indexDocs(SearchService, SearchKey, indexName, docs):
     print("Total docs: " + str(len(docs)))
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                    index_name=indexName,
-                                    credential=AzureKeyCredential(SearchKey))
-    i = 0
-    batch = []
-    for s in docs:
-        batch.append(s)
-        i += 1
-        if i % 1000 == 0:
-            results = searchClient.upload_documents(documents=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
-            print(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-            batch = []
-
-    if len(batch) > 0:
-        results = searchClient.upload_documents(documents=batch)
-        succeeded = sum([1 for r in results if r.succeeded])
-        print(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
+    uploadDocuments(SearchService, SearchKey, indexName, docs)
 
 def createEvaluatorDocumentSearchIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -108,8 +75,7 @@ def createEvaluatorDocumentSearchIndex(SearchService, SearchKey, indexName):
         print(f"Search index {indexName} already exists")
 
 def createEvaluatorQaSearchIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -136,8 +102,7 @@ def createEvaluatorQaSearchIndex(SearchService, SearchKey, indexName):
         print(f"Search index {indexName} already exists")
 
 def createEvaluatorResultIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -174,8 +139,7 @@ def createEvaluatorResultIndex(SearchService, SearchKey, indexName):
         print(f"Search index {indexName} already exists")
 
 def createEvaluatorRunIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -206,9 +170,7 @@ def createEvaluatorRunIndex(SearchService, SearchKey, indexName):
         print(f"Search index {indexName} already exists")
 
 def searchEvaluatorRunIdIndex(SearchService, SearchKey, indexName, documentId):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -225,9 +187,7 @@ def searchEvaluatorRunIdIndex(SearchService, SearchKey, indexName, documentId):
     return None
 
 def searchEvaluatorRunIndex(SearchService, SearchKey, indexName, documentId, retriever, promptStyle, splitMethod, chunkSize, overlap):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -244,9 +204,7 @@ def searchEvaluatorRunIndex(SearchService, SearchKey, indexName, documentId, ret
     return None
 
 def searchEvaluatorDocumentIndexedData(SearchService, SearchKey, indexName, documentId, splitMethod, chunkSize, overlap):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -262,9 +220,7 @@ def searchEvaluatorDocumentIndexedData(SearchService, SearchKey, indexName, docu
     return None
 
 def searchEvaluatorDocument(SearchService, SearchKey,indexName, documentName):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -281,9 +237,7 @@ def searchEvaluatorDocument(SearchService, SearchKey,indexName, documentName):
     return None
 
 def searchEvaluatorQaData(SearchService, SearchKey,indexName, documentId):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -299,8 +253,7 @@ def searchEvaluatorQaData(SearchService, SearchKey,indexName, documentId):
     return None
 
 def createEvaluatorDataSearchIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -350,8 +303,9 @@ def createEvaluatorDataSearchIndex(SearchService, SearchKey, indexName):
 def createEvaluatorDataSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, fileName, 
                             docs, splitMethod, chunkSize, overlap, model, modelType, documentId):
     counter = 1
-
-    for i in docs:
+    vectors = generateEmbeddingsStream(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding,
+                                       (i.page_content for i in docs))
+    for i, vector in zip(docs, vectors):
         yield {
             "id": f"{fileName}-{counter}-{chunkSize}-{overlap}".replace(".", "_").replace(" ", "_").replace(":", "_").replace("/", "_").replace(",", "_").replace("&", "_"),
             "documentId": documentId,
@@ -361,7 +315,7 @@ def createEvaluatorDataSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAi
             "model": model,
             "modelType": modelType,
             "content": i.page_content,
-            "contentVector": generateEmbeddings(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, i.page_content),
+            "contentVector": vector,
             "sourceFile": os.path.basename(fileName)
         }
         counter += 1
@@ -373,29 +327,116 @@ def indexEvaluatorDataSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiA
     sections = createEvaluatorDataSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding,
                                        fileName, docs, splitMethod, chunkSize, overlap, model, modelType, documentId)
     print(f"Indexing sections from '{fileName}' into search index '{indexName}'")
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                    index_name=indexName,
-                                    credential=AzureKeyCredential(SearchKey))
-    i = 0
-    batch = []
-    for s in sections:
-        batch.append(s)
-        i += 1
-        if i % 1000 == 0:
-            results = searchClient.index_documents(batch=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
-            print(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-            batch = []
-
-    if len(batch) > 0:
-        results = searchClient.upload_documents(documents=batch)
-        succeeded = sum([1 for r in results if r.succeeded])
-        print(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
+    uploadDocuments(SearchService, SearchKey, indexName, sections)
+
+def chunkConfiguration(splitMethod, model, chunkSize, overlap):
+    """The reference a chunk in the evaluator chunk index carries for every split configuration that produced it."""
+    return f"{splitMethod}|{model}|{chunkSize}|{overlap}"
+
+def chunkId(documentId, modelType, content):
+    # The same text split out of the same document shares one entry, whatever configuration produced it
+    return hashlib.sha1(f"{documentId}|{modelType}|{content}".encode("utf-8")).hexdigest()
+
+def createEvaluatorChunkSearchIndex(SearchService, SearchKey, indexName):
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
+    if indexName not in indexClient.list_index_names():
+        index = SearchIndex(
+            name=indexName,
+            fields=[
+                        SimpleField(name="id", type=SearchFieldDataType.String, key=True),
+                        SearchableField(name="documentId", type=SearchFieldDataType.String, searchable=True, filterable=True, retrievable=True, analyzer_name="en.microsoft"),
+                        SimpleField(name="configurations", type=SearchFieldDataType.Collection(SearchFieldDataType.String), filterable=True, retrievable=True),
+                        SearchableField(name="modelType", type=SearchFieldDataType.String, searchable=True, filterable=True, retrievable=True, analyzer_name="en.microsoft"),
+                        SearchableField(name="content", type=SearchFieldDataType.String,
+                                        searchable=True, retrievable=True, analyzer_name="en.microsoft"),
+                        SearchField(name="contentVector", type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                                    searchable=True, dimensions=1536, vector_search_configuration="vectorConfig"),
+                        SimpleField(name="sourceFile", type=SearchFieldDataType.String, filterable=True, facetable=True),
+            ],
+            vector_search = VectorSearch(
+                algorithm_configurations=[
+                    VectorSearchAlgorithmConfiguration(
+                        name="vectorConfig",
+                        kind="hnsw",
+                        hnsw_parameters={
+                            "m": 4,
+                            "efConstruction": 400,
+                            "efSearch": 500,
+                            "metric": "cosine"
+                        }
+                    )
+                ]
+            ),
+            semantic_settings=SemanticSettings(
+                configurations=[SemanticConfiguration(
+                    name='semanticConfig',
+                    prioritized_fields=PrioritizedFields(
+                        title_field=None, prioritized_content_fields=[SemanticField(field_name='content')]))])
+        )
+
+        try:
+            print(f"Creating {indexName} search index")
+            indexClient.create_index(index)
+        except Exception as e:
+            print(e)
+    else:
+        print(f"Search index {indexName} already exists")
+
+def findEvaluatorChunks(SearchService, SearchKey, indexName, ids, batchSize=500):
+    """The configurations already referenced by each of ids that is in the chunk index, without the vectors."""
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
+    found = {}
+    for i in range(0, len(ids), batchSize):
+        batch = ids[i:i + batchSize]
+        r = searchClient.search(
+            search_text="",
+            filter="search.in(id, '" + ",".join(batch) + "', ',')",
+            select=["id", "configurations"],
+            top=len(batch)
+        )
+        for chunk in r:
+            found[chunk["id"]] = set(chunk["configurations"] or [])
+    return found
+
+def indexEvaluatorChunkGrid(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey,
+                           embeddingModelType, OpenAiEmbedding, fileName, indexName, docsByConfiguration, modelType, documentId):
+    """
+    Index the chunks of every split configuration of a document, embedding and uploading each distinct chunk once.
+    docsByConfiguration maps a chunkConfiguration to its split documents. Chunks already in the index only get the
+    references of the configurations they were missing, merged in without their vector.
+    """
+    chunks = {}
+    total = 0
+    for configuration, docs in docsByConfiguration.items():
+        for doc in docs:
+            total += 1
+            id = chunkId(documentId, modelType, doc.page_content)
+            chunks.setdefault(id, [doc.page_content, set()])[1].add(configuration)
+
+    existing = findEvaluatorChunks(SearchService, SearchKey, indexName, list(chunks))
+    newIds = [id for id in chunks if id not in existing]
+    references = [{"id": id, "configurations": sorted(chunks[id][1] | existing[id])}
+                  for id in chunks if id in existing and not chunks[id][1] <= existing[id]]
+    logging.info(f"{total} chunks across {len(docsByConfiguration)} configurations: {len(chunks)} distinct, "
+          f"{len(newIds)} to embed, {len(references)} to reference")
+
+    vectors = generateEmbeddingsStream(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding,
+                                       (chunks[id][0] for id in newIds))
+    uploadDocuments(SearchService, SearchKey, indexName, ({
+            "id": id,
+            "documentId": documentId,
+            "configurations": sorted(chunks[id][1]),
+            "modelType": modelType,
+            "content": chunks[id][0],
+            "contentVector": vector,
+            "sourceFile": os.path.basename(fileName)
+        } for id, vector in zip(newIds, vectors)))
+    if references:
+        uploadDocuments(SearchService, SearchKey, indexName, references, action="merge")
+    return {"chunks": total, "distinct": len(chunks), "embedded": len(newIds), "referenced": len(references)}
 
 def getEvaluatorResult(SearchService, SearchKey, indexName, documentId):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
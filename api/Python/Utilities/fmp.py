@@ -1,6 +1,7 @@
 import requests
 import typing
 import logging
+from Utilities.fmpClient import fmpClient
 
 CONNECT_TIMEOUT = 5
 READ_TIMEOUT = 30
@@ -341,13 +342,9 @@ def __return_json_v3(
     url = f"{BASE_URL_v3}{path}"
     return_var = None
     try:
-        response = requests.get(
-            url, params=query_vars, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
-        )
-        if len(response.content) > 0:
-            return_var = response.json()
+        return_var = fmpClient().getJson(url, query_vars)
 
-        if len(response.content) == 0 or (
+        if return_var is None or (
             isinstance(return_var, dict) and len(return_var.keys()) == 0
         ):
             logging.warning("Response appears to have no data.  Returning empty List.")
@@ -385,13 +382,9 @@ def __return_json_v4(
     url = f"{BASE_URL_v4}{path}"
     return_var = None
     try:
-        response = requests.get(
-            url, params=query_vars, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
-        )
-        if len(response.content) > 0:
-            return_var = response.json()
+        return_var = fmpClient().getJson(url, query_vars)
 
-        if len(response.content) == 0 or (
+        if return_var is None or (
             isinstance(return_var, dict) and len(return_var.keys()) == 0
         ):
             logging.warning("Response appears to have no data.  Returning empty List.")
@@ -646,7 +639,7 @@ def financial_statement(
         "apikey": apikey,
         "datatype": "zip",  # Only ZIP format is supported.
     }
-    response = requests.get(f"{BASE_URL_v3}{path}", params=query_vars)
+    response = fmpClient().request(f"{BASE_URL_v3}{path}", query_vars)
     open(filename, "wb").write(response.content)
     logging.info(f"Saving {symbol} financial statement as {filename}.")
 
@@ -674,7 +667,7 @@ def income_statement(
     query_vars = {"apikey": apikey, "limit": limit, "period": __validate_period(period)}
     if download:
         query_vars["datatype"] = "csv"  # Only CSV is supported.
-        response = requests.get(f"{BASE_URL_v3}{path}", params=query_vars)
+        response = fmpClient().request(f"{BASE_URL_v3}{path}", query_vars)
         open(filename, "wb").write(response.content)
         logging.info(f"Saving {symbol} financial statement as {filename}.")
     else:
@@ -704,7 +697,7 @@ def balance_sheet_statement(
     query_vars = {"apikey": apikey, "limit": limit, "period": __validate_period(period)}
     if download:
         query_vars["datatype"] = "csv"  # Only CSV is supported.
-        response = requests.get(f"{BASE_URL_v3}{path}", params=query_vars)
+        response = fmpClient().request(f"{BASE_URL_v3}{path}", query_vars)
         open(filename, "wb").write(response.content)
         logging.info(f"Saving {symbol} financial statement as {filename}.")
     else:
@@ -734,7 +727,7 @@ def cash_flow_statement(
     query_vars = {"apikey": apikey, "limit": limit, "period": __validate_period(period)}
     if download:
         query_vars["datatype"] = "csv"  # Only CSV is supported.
-        response = requests.get(f"{BASE_URL_v3}{path}", params=query_vars)
+        response = fmpClient().request(f"{BASE_URL_v3}{path}", query_vars)
         open(filename, "wb").write(response.content)
         logging.info(f"Saving {symbol} financial statement as {filename}.")
     else:
@@ -841,7 +834,7 @@ def income_statement_as_reported(
     }
     if download:
         query_vars["datatype"] = "csv"  # Only CSV is supported.
-        response = requests.get(f"{BASE_URL_v3}{path}", params=query_vars)
+        response = fmpClient().request(f"{BASE_URL_v3}{path}", query_vars)
         open(filename, "wb").write(response.content)
         logging.info(f"Saving {symbol} financial statement as {filename}.")
     else:
@@ -875,7 +868,7 @@ def balance_sheet_statement_as_reported(
     }
     if download:
         query_vars["datatype"] = "csv"  # Only CSV is supported.
-        response = requests.get(f"{BASE_URL_v3}{path}", params=query_vars)
+        response = fmpClient().request(f"{BASE_URL_v3}{path}", query_vars)
         open(filename, "wb").write(response.content)
         logging.info(f"Saving {symbol} financial statement as {filename}.")
     else:
@@ -909,7 +902,7 @@ def cash_flow_statement_as_reported(
     }
     if download:
         query_vars["datatype"] = "csv"  # Only CSV is supported.
-        response = requests.get(f"{BASE_URL_v3}{path}", params=query_vars)
+        response = fmpClient().request(f"{BASE_URL_v3}{path}", query_vars)
         open(filename, "wb").write(response.content)
         logging.info(f"Saving {symbol} financial statement as {filename}.")
     else:
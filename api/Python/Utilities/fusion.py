@@ -0,0 +1,101 @@
+"""Concurrent retrieval fan-out with per-search timeouts, and reciprocal-rank fusion of the ranked results."""
+import hashlib
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Seconds a single backend may take before the request goes ahead without it
+SEARCH_TIMEOUT = 5.0
+# Rank damping constant from the original reciprocal-rank fusion paper
+RRF_K = 60
+
+# Searches are I/O bound; a search that times out keeps its worker until it returns, so leave headroom
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="retrieval")
+
+SEARCHABLE_INDEX_TYPES = ("pinecone", "redis", "cogsearch", "cogsearchvs", "local")
+
+def getRetrievalTargets(indexType, indexNs, overrides):
+    """
+    The indexes to search for a request: the request's own index, followed by any extra
+    {"indexType", "indexNs", "timeout"} entries passed in overrides["indexes"], without repeats.
+    """
+    targets = [{"indexType": indexType, "indexNs": indexNs}]
+    for target in overrides.get("indexes") or []:
+        if target.get("indexType") not in SEARCHABLE_INDEX_TYPES:
+            logging.info(f"Skipping retrieval target {target}, only {SEARCHABLE_INDEX_TYPES} can be searched together")
+            continue
+        if any(t["indexType"] == target["indexType"] and t["indexNs"] == target.get("indexNs") for t in targets):
+            continue
+        targets.append({"indexType": target["indexType"], "indexNs": target.get("indexNs"), "timeout": target.get("timeout")})
+    return targets
+
+def contentKey(text):
+    """
+    Hash of the text with whitespace collapsed and leading or trailing punctuation dropped, so the same chunk
+    found by several backends is merged even when one of them decorates or reflows it.
+    """
+    normalized = " ".join(str(text).split())
+    normalized = re.sub(r"^[\W_]+|[\W_]+$", "", normalized)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, round((time.perf_counter() - start) * 1000, 1)
+
+def fanOut(searches, timeout=SEARCH_TIMEOUT):
+    """
+    Run every (name, func, timeout) search concurrently and wait for each one up to its own timeout
+    (or the default). Returns the results of the searches that finished in time, keyed by name, and a
+    report with the status, latency and result count of every search. Slow or failing searches are
+    left out of the results rather than failing the request.
+    """
+    start = time.perf_counter()
+    futures = []
+    for name, func, searchTimeout in searches:
+        futures.append((name, _executor.submit(_timed, func), searchTimeout or timeout))
+
+    results = {}
+    report = {}
+    # Wait on the tightest deadline first so every search is measured against its own budget
+    for name, future, searchTimeout in sorted(futures, key=lambda f: f[2]):
+        remaining = max(0, start + searchTimeout - time.perf_counter())
+        try:
+            results[name], elapsed = future.result(timeout=remaining)
+            report[name] = {"status": "ok", "count": len(results[name]), "ms": elapsed}
+        except FutureTimeout:
+            future.cancel()
+            report[name] = {"status": "timeout", "count": 0, "ms": round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            logging.error(f"Search {name} failed: {e}")
+            report[name] = {"status": "error", "count": 0, "error": str(e)}
+    logging.info(f"Retrieval fan-out: {report}")
+    return results, report
+
+def reciprocalRankFusion(rankings, getText, k=None, rrfK=RRF_K):
+    """
+    Merge ranked lists with reciprocal-rank fusion: an item scores the sum of 1 / (rrfK + rank) over every list
+    it appears in, where items with the same content are treated as one. rankings maps a retriever name to its
+    ranked items. Returns up to k entries of {"item", "score", "retrievers"}, best first; the item kept for
+    duplicated content is the one from the list that ranked it highest.
+    """
+    fused = {}
+    for name, items in rankings.items():
+        for rank, item in enumerate(items, start=1):
+            key = contentKey(getText(item))
+            score = 1.0 / (rrfK + rank)
+            entry = fused.get(key)
+            if entry is None:
+                fused[key] = {"item": item, "score": score, "retrievers": [name], "bestRank": rank}
+                continue
+            entry["score"] += score
+            if name not in entry["retrievers"]:
+                entry["retrievers"].append(name)
+            if rank < entry["bestRank"]:
+                entry["item"] = item
+                entry["bestRank"] = rank
+    ranked = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+    for entry in ranked:
+        del entry["bestRank"]
+    return ranked[:k] if k else ranked
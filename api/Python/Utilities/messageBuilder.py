@@ -1,3 +1,4 @@
+from typing import Sequence
 from Utilities.modelHelper import numTokenFromMessages
 
 class MessageBuilder:
@@ -10,6 +11,7 @@ class MessageBuilder:
       Methods:
           __init__(self, system_content: str, chatgpt_model: str): Initializes the MessageBuilder instance.
           append_message(self, role: str, content: str, index: int = 1): Appends a new message to the conversation.
+          append_history(self, history, userConv, fewShots, maxTokens): Adds the prior turns that fit the token budget.
       """
 
     def __init__(self, system_content: str, chatgpt_model: str):
@@ -21,4 +23,40 @@ class MessageBuilder:
     def append_message(self, role: str, content: str, index: int = 1):
         self.messages.insert(index, {'role': role, 'content': content})
         self.token_length += numTokenFromMessages(
-            self.messages[index], self.model)
\ No newline at end of file
+            self.messages[index], self.model)
+
+    def append_history(self, history: Sequence[dict[str, str]], userConv: str, fewShots = [], maxTokens: int = 4096):
+        """
+        Append the few-shot examples, as many prior turns of history as fit and the current user message.
+        Turns are taken newest first and kept only when both their user and assistant messages fit within
+        maxTokens along with everything else, so the window never exceeds the budget. The last entry of
+        history is the current turn and is represented by userConv.
+        """
+        shots = [{'role': shot.get('role'), 'content': shot.get('content')} for shot in fewShots]
+        current = {'role': "user", 'content': userConv}
+        tokenLength = self.token_length + numTokenFromMessages(current, self.model)
+        for shot in shots:
+            tokenLength += numTokenFromMessages(shot, self.model)
+
+        turns = []
+        for h in reversed(history[:-1]):
+            turn = [{'role': "user", 'content': h.get('user')}]
+            if h.get("bot"):
+                turn.append({'role': "assistant", 'content': h.get('bot')})
+            turnLength = sum(numTokenFromMessages(message, self.model) for message in turn)
+            if tokenLength + turnLength > maxTokens:
+                break
+            tokenLength += turnLength
+            turns.append(turn)
+
+        self.messages.extend(shots)
+        for turn in reversed(turns):
+            self.messages.extend(turn)
+        self.messages.append(current)
+        self.token_length = tokenLength
+        return self.messages
+
+def getMessagesFromHistory(systemPrompt: str, modelId: str, history: Sequence[dict[str, str]],
+                           userConv: str, fewShots = [], maxTokens: int = 4096):
+    messageBuilder = MessageBuilder(systemPrompt, modelId)
+    return messageBuilder.append_history(history, userConv, fewShots, maxTokens)
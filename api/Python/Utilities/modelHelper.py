@@ -1,4 +1,5 @@
 import tiktoken
+from functools import lru_cache
 
 MODELS_2_TOKEN_LIMITS = {
     "gpt-35-turbo": 4000,
@@ -19,6 +20,11 @@ def getTokenLimit(modelId: str) -> int:
         raise ValueError("Expected model gpt-35-turbo and above")
     return MODELS_2_TOKEN_LIMITS.get(modelId)
 
+def getChatModel(embeddingModelType: str, deploymentType: str) -> str:
+    """The chat model a request's deploymentType selects, under the names of the embeddingModelType provider."""
+    if embeddingModelType == "openai":
+        return "gpt-3.5-turbo-16k" if deploymentType == "gpt3516k" else "gpt-3.5-turbo"
+    return "gpt-35-turbo-16k" if deploymentType == "gpt3516k" else "gpt-35-turbo"
 
 def numTokenFromMessages(message: dict[str, str], model: str) -> int:
     """
@@ -34,12 +40,21 @@ def numTokenFromMessages(message: dict[str, str], model: str) -> int:
         numTokenFromMessages(message, model)
         output: 11
     """
-    encoding = tiktoken.encoding_for_model(getOaiChatModel(model))
     num_tokens = 2  # For "role" and "content" keys
     for key, value in message.items():
-        num_tokens += len(encoding.encode(value))
+        num_tokens += numTokenFromText(value, model)
     return num_tokens
 
+@lru_cache(maxsize=None)
+def getEncoding(model: str):
+    # encoding_for_model resolves the model name on every call; the encoder itself never changes
+    return tiktoken.encoding_for_model(getOaiChatModel(model))
+
+@lru_cache(maxsize=4096)
+def numTokenFromText(text: str, model: str) -> int:
+    """Token count of text for the model, memoized because history turns are counted again on every request."""
+    return len(getEncoding(model).encode(text))
+
 
 def getOaiChatModel(aoaimodel: str) -> str:
     message = "Expected Azure OpenAI ChatGPT model name"
@@ -1,8 +1,12 @@
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import *
 from azure.search.documents import SearchClient
+from Utilities.searchUploader import uploadDocuments
+from Utilities.clientRegistry import getSearchClient, getSearchIndexClient
 from azure.core.credentials import AzureKeyCredential
 import os
+import hashlib
+import json
 from azure.search.documents.indexes.models import (  
     SearchIndex,  
     SearchField,  
@@ -21,39 +25,20 @@ from azure.search.documents.indexes.models import (
 from azure.search.documents.models import Vector  
 from tenacity import retry, wait_random_exponential, stop_after_attempt  
 import openai
+from Utilities.embeddingEngine import getEmbeddingEngine
 import logging
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
 # Function to generate embeddings for title and content fields, also used for query embeddings
 def generateEmbeddings(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, text):
-    if (embeddingModelType == 'azureopenai'):
-        openai.api_type = "azure"
-        openai.api_key = OpenAiKey
-        openai.api_version = OpenAiVersion
-        openai.api_base = f"{OpenAiEndPoint}"
+    return list(generateEmbeddingsStream(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, [text]))[0]
 
-        response = openai.Embedding.create(
-            input=text, engine=OpenAiEmbedding)
-        embeddings = response['data'][0]['embedding']
-
-    elif embeddingModelType == "openai":
-        try:
-            openai.api_type = "open_ai"
-            openai.api_base = "https://api.openai.com/v1"
-            openai.api_version = '2020-11-07' 
-            openai.api_key = OpenAiApiKey
-
-            response = openai.Embedding.create(
-                input=text, engine="text-embedding-ada-002", api_key = OpenAiApiKey)
-            embeddings = response['data'][0]['embedding']
-        except Exception as e:
-            logging.info(e)
-        
-    return embeddings
+# Function to generate embeddings for many texts, packed into batched requests and yielded in input order
+def generateEmbeddingsStream(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, texts):
+    engine = getEmbeddingEngine(embeddingModelType, OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding)
+    return engine.embedStream(texts)
 
 def deleteSearchIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName in indexClient.list_index_names():
         logging.info(f"Deleting {indexName} search index")
         indexClient.delete_index(indexName)
@@ -61,8 +46,7 @@ def deleteSearchIndex(SearchService, SearchKey, indexName):
         logging.info(f"Search index {indexName} does not exist")
 
 def createPibIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -79,6 +63,7 @@ def createPibIndex(SearchService, SearchKey, indexName):
                                         searchable=True, retrievable=True, filterable=True, facetable=True, analyzer_name="en.microsoft"),
                         SearchableField(name="pibData", type=SearchFieldDataType.String,
                                         searchable=True, retrievable=True, analyzer_name="en.microsoft"),
+                        SimpleField(name="inputHash", type=SearchFieldDataType.String, retrievable=True),
                         #SimpleField(name="inserteddate", type="Edm.String", searchable=True, retrievable=True,),
             ],
             semantic_settings=SemanticSettings(
@@ -95,11 +80,104 @@ def createPibIndex(SearchService, SearchKey, indexName):
             logging.info(e)
     else:
         logging.info(f"Search index {indexName} already exists")
+        # Indexes created before the step cache lack the input hash; adding a field keeps the existing rows
+        index = indexClient.get_index(indexName)
+        if "inputHash" not in [field.name for field in index.fields]:
+            logging.info(f"Adding inputHash to {indexName} search index")
+            index.fields.append(SimpleField(name="inputHash", type=SearchFieldDataType.String, retrievable=True))
+            indexClient.create_or_update_index(index)
+
+PIB_FIELDS = ['id', 'symbol', 'cik', 'step', 'description', 'insertedDate', 'pibData']
+
+def pibInputHash(*inputs):
+    """Hash of the inputs a PIB row is generated from (FMP payloads, transcript and filing dates)."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class PibStepCache:
+    """
+      The rows one PIB step stored for a company, keyed by description. A row is served from the index while the
+      hash of its inputs is unchanged, so only the sections whose inputs changed are generated again; a regenerated
+      row replaces every older row with the same description.
+      """
+
+    def __init__(self, SearchService, SearchKey, indexName, symbol, cik, step, today):
+        self.SearchService = SearchService
+        self.SearchKey = SearchKey
+        self.indexName = indexName
+        self.symbol = symbol
+        self.cik = cik
+        self.step = step
+        self.today = today
+        self.rows = {}
+        r = findPibData(SearchService, SearchKey, indexName, cik, step, returnFields=PIB_FIELDS + ['inputHash'])
+        for s in r or []:
+            self.rows.setdefault(s['description'], []).append(s)
+
+    def fresh(self, inputHash, *descriptions):
+        """The stored rows for descriptions if all of them were generated from inputHash, otherwise None."""
+        found = []
+        for description in descriptions:
+            current = [s for s in self.rows.get(description, []) if s.get('inputHash') == inputHash]
+            if not current:
+                return None
+            found.append({field: current[0][field] for field in PIB_FIELDS})
+        logging.info(f"Using stored {', '.join(descriptions)} for {self.symbol} step {self.step}")
+        return found
+
+    def storedWhenMissing(self, inputs, *descriptions):
+        """
+        The stored rows for descriptions, whatever their hash, when FMP returned nothing for inputs (the client
+        returns None when a call fails), so a failed call neither fails the step nor overwrites what was stored.
+        None when there are inputs or no stored rows to fall back on.
+        """
+        if inputs:
+            return None
+        found = []
+        for description in descriptions:
+            current = self.rows.get(description)
+            if not current:
+                return None
+            found.append({field: current[0][field] for field in PIB_FIELDS})
+        logging.warning(f"No FMP data for {', '.join(descriptions)} of {self.symbol}, using the stored rows")
+        return found
+
+    def newRow(self, description, inputHash, pibData):
+        return {
+            'id': hashlib.sha1(f"{self.cik}|{self.step}|{description}".encode("utf-8")).hexdigest(),
+            'symbol': self.symbol,
+            'cik': self.cik,
+            'step': self.step,
+            'description': description,
+            'insertedDate': self.today.strftime("%Y-%m-%d"),
+            'pibData': pibData,
+            'inputHash': inputHash
+        }
+
+    def save(self, rows):
+        """Store rows, remove the rows they supersede and return them without the input hash."""
+        mergeDocs(self.SearchService, self.SearchKey, self.indexName, rows)
+        ids = set(row['id'] for row in rows)
+        stale = [{'id': s['id']} for row in rows for s in self.rows.get(row['description'], []) if s['id'] not in ids]
+        if stale:
+            getSearchClient(self.SearchService, self.SearchKey, self.indexName).delete_documents(documents=stale)
+        for row in rows:
+            self.rows[row['description']] = [row]
+        return [{field: row[field] for field in PIB_FIELDS} for row in rows]
+
+    def section(self, description, inputs, generate):
+        """The row for description, calling generate() for its pibData only when inputs changed since it was stored."""
+        rows = self.storedWhenMissing(inputs, description)
+        if rows is not None:
+            return rows[0]
+        inputHash = pibInputHash(inputs)
+        rows = self.fresh(inputHash, description)
+        if rows is None:
+            logging.info(f"Generating {description} for {self.symbol} step {self.step}")
+            rows = self.save([self.newRow(description, inputHash, generate())])
+        return rows[0]
 
 def findPibData(SearchService, SearchKey, indexName, cik, step, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -116,9 +194,7 @@ def findPibData(SearchService, SearchKey, indexName, cik, step, returnFields=["i
     return None
 
 def deletePibData(SearchService, SearchKey, indexName, cik, step, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -138,8 +214,7 @@ def deletePibData(SearchService, SearchKey, indexName, cik, step, returnFields=[
     return None
 
 def createEarningCallIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -172,9 +247,7 @@ def createEarningCallIndex(SearchService, SearchKey, indexName):
         logging.info(f"Search index {indexName} already exists")
 
 def findEarningCalls(SearchService, SearchKey, indexName, symbol, quarter, year, returnFields=["id", "content", "sourcefile"]):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -191,9 +264,7 @@ def findEarningCalls(SearchService, SearchKey, indexName, symbol, quarter, year,
     return None
 
 def findEarningCallsBySymbol(SearchService, SearchKey, indexName, symbol, returnFields=["id", "content", "sourcefile"]):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -209,11 +280,26 @@ def findEarningCallsBySymbol(SearchService, SearchKey, indexName, symbol, return
 
     return None
 
+def findEarningCallQuarters(SearchService, SearchKey, indexName, symbol, fromYear, returnFields=["id", "quarter", "year", "callDate"]):
+    # Every stored earning call of symbol since fromYear in one query; years are four digit strings, so they compare in order
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
+
+    try:
+        r = searchClient.search(
+            search_text="",
+            filter="symbol eq '" + symbol + "' and year ge '" + str(fromYear) + "'",
+            select=returnFields,
+            top=1000
+        )
+        return list(r)
+    except Exception as e:
+        logging.info(e)
+
+    return None
+
 def performEarningCallCogSearch(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey, 
                                 embeddingModelType, OpenAiEmbedding, symbol, quarter, year, question, indexName, k, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     try:
         r = searchClient.search(  
             search_text="",  
@@ -229,8 +315,7 @@ def performEarningCallCogSearch(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAi
     return None
 
 def createEarningCallVectorIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -280,7 +365,9 @@ def createEarningCallVectorIndex(SearchService, SearchKey, indexName):
 def createEarningCallSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, docs,
                               callDate, symbol, year, quarter):
     counter = 1
-    for i in docs:
+    vectors = generateEmbeddingsStream(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding,
+                                       (i.page_content for i in docs))
+    for i, vector in zip(docs, vectors):
         yield {
             "id": f"{symbol}-{year}-{quarter}-{counter}",
             "symbol": symbol,
@@ -288,16 +375,14 @@ def createEarningCallSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiAp
             "year": year,
             "callDate": callDate,
             "content": i.page_content,
-            "contentVector": generateEmbeddings(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, i.page_content)
+            "contentVector": vector
         }
         counter += 1
 
 def indexEarningCallSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey, embeddingModelType, 
                              OpenAiEmbedding, indexName, docs, callDate, symbol, year, quarter):
     logging.info("Total docs: " + str(len(docs)))
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                    index_name=indexName,
-                                    credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
 
     # Validate if we already have created documents for this call transcripts
     r = searchClient.search(  
@@ -314,25 +399,10 @@ def indexEarningCallSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApi
     
     sections = createEarningCallSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, docs,
                                          callDate, symbol, year, quarter)
-    i = 0
-    batch = []
-    for s in sections:
-        batch.append(s)
-        i += 1
-        if i % 1000 == 0:
-            results = searchClient.index_documents(batch=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
-            logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-            batch = []
-
-    if len(batch) > 0:
-        results = searchClient.upload_documents(documents=batch)
-        succeeded = sum([1 for r in results if r.succeeded])
-        logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
+    uploadDocuments(SearchService, SearchKey, indexName, sections)
 
 def createPressReleaseIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -363,8 +433,7 @@ def createPressReleaseIndex(SearchService, SearchKey, indexName):
         logging.info(f"Search index {indexName} already exists")
 
 def createStockNewsIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -400,28 +469,10 @@ def createStockNewsIndex(SearchService, SearchKey, indexName):
 
 def mergeDocs(SearchService, SearchKey, indexName, docs):
     logging.info("Total docs: " + str(len(docs)))
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                    index_name=indexName,
-                                    credential=AzureKeyCredential(SearchKey))
-    i = 0
-    batch = []
-    for s in docs:
-        batch.append(s)
-        i += 1
-        if i % 1000 == 0:
-            results = searchClient.merge_or_upload_documents(documents=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
-            logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-            batch = []
-
-    if len(batch) > 0:
-        results = searchClient.merge_or_upload_documents(documents=batch)
-        succeeded = sum([1 for r in results if r.succeeded])
-        logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
+    uploadDocuments(SearchService, SearchKey, indexName, docs, action="mergeOrUpload")
 
 def createSecFilingIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -480,9 +531,7 @@ def createSecFilingIndex(SearchService, SearchKey, indexName):
             logging.info(e)
 
 def findSecFiling(SearchService, SearchKey, indexName, cik, filingType, filingDate, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -499,8 +548,7 @@ def findSecFiling(SearchService, SearchKey, indexName, cik, filingType, filingDa
     return None
 
 def createSecFilingsVectorIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -551,7 +599,9 @@ def createSecFilingsVectorIndex(SearchService, SearchKey, indexName):
 def createSecFilingsSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, docs,
                               cik, symbol, latestFilingDate, filingType):
     counter = 1
-    for i in docs:
+    vectors = generateEmbeddingsStream(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding,
+                                       (i.page_content for i in docs))
+    for i, vector in zip(docs, vectors):
         yield {
             "id": f"{symbol}-{latestFilingDate}-{filingType}-{counter}",
             "symbol": symbol,
@@ -559,16 +609,14 @@ def createSecFilingsSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApi
             "latestFilingDate": latestFilingDate,
             "filingType": filingType,
             "content": i.page_content,
-            "contentVector": generateEmbeddings(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, i.page_content)
+            "contentVector": vector
         }
         counter += 1
 
 def indexSecFilingsSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey, embeddingModelType, 
                              OpenAiEmbedding, indexName, docs, cik, symbol, latestFilingDate, filingType):
     logging.info("Total docs: " + str(len(docs)))
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                    index_name=indexName,
-                                    credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
 
     # Validate if we already have created documents for this call transcripts
     r = searchClient.search(  
@@ -585,26 +633,10 @@ def indexSecFilingsSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiK
     
     sections = createSecFilingsSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, docs,
                                          cik, symbol, latestFilingDate, filingType)
-    i = 0
-    batch = []
-    for s in sections:
-        batch.append(s)
-        i += 1
-        if i % 1000 == 0:
-            results = searchClient.index_documents(batch=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
-            logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-            batch = []
-
-    if len(batch) > 0:
-        results = searchClient.upload_documents(documents=batch)
-        succeeded = sum([1 for r in results if r.succeeded])
-        logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
+    uploadDocuments(SearchService, SearchKey, indexName, sections)
 
 def findLatestSecFilings(SearchService, SearchKey, indexName, cik, symbol, latestFilingDate, filingType, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -622,30 +654,11 @@ def findLatestSecFilings(SearchService, SearchKey, indexName, cik, symbol, lates
 
 def indexDocs(SearchService, SearchKey, indexName, docs):
     logging.info("Total docs: " + str(len(docs)))
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                    index_name=indexName,
-                                    credential=AzureKeyCredential(SearchKey))
-    i = 0
-    batch = []
-    for s in docs:
-        batch.append(s)
-        i += 1
-        if i % 1000 == 0:
-            results = searchClient.upload_documents(documents=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
-            logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-            batch = []
-
-    if len(batch) > 0:
-        results = searchClient.upload_documents(documents=batch)
-        succeeded = sum([1 for r in results if r.succeeded])
-        logging.info(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
+    uploadDocuments(SearchService, SearchKey, indexName, docs)
 
 def performLatestPibDataSearch(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey, embeddingModelType, 
                                OpenAiEmbedding, filterData, question, indexName, k, returnFields=["id", "content"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     try:
         r = searchClient.search(  
             search_text="",
@@ -661,9 +674,7 @@ def performLatestPibDataSearch(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiA
     return None
 
 def performCogSearch(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, SearchService, SearchKey, embeddingModelType, OpenAiEmbedding, question, indexName, k, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     try:
         r = searchClient.search(  
             search_text="",  
@@ -678,9 +689,7 @@ def performCogSearch(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, Sea
     return None
 
 def performCogVectorSearch(embedValue, embedField, SearchService, SearchKey, indexName, k, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     try:
         r = searchClient.search(  
             search_text="",  
@@ -696,9 +705,7 @@ def performCogVectorSearch(embedValue, embedField, SearchService, SearchKey, ind
     return None
 
 def performKbCogVectorSearch(embedValue, embedField, SearchService, SearchKey, indexType, indexName, kbIndexName, k, returnFields=["id", "content", "sourcefile"] ):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=kbIndexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, kbIndexName)
     
     try:
         r = searchClient.search(  
@@ -716,9 +723,7 @@ def performKbCogVectorSearch(embedValue, embedField, SearchService, SearchKey, i
     return None
 
 def findFileInIndex(SearchService, SearchKey, indexName, fileName, returnFields=["id", "content", "sourcefile"]):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(  
@@ -735,8 +740,7 @@ def findFileInIndex(SearchService, SearchKey, indexName, fileName, returnFields=
     return None
 
 def createSearchIndex(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -779,11 +783,13 @@ def createSearchIndex(SearchService, SearchKey, indexName):
 
 def createSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, fileName, docs):
     counter = 1
-    for i in docs:
+    vectors = generateEmbeddingsStream(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding,
+                                       (i.page_content for i in docs))
+    for i, vector in zip(docs, vectors):
         yield {
             "id": f"{fileName}-{counter}".replace(".", "_").replace(" ", "_").replace(":", "_").replace("/", "_").replace(",", "_").replace("&", "_"),
             "content": i.page_content,
-            "contentVector": generateEmbeddings(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, i.page_content),
+            "contentVector": vector,
             "sourcefile": os.path.basename(fileName)
         }
         counter += 1
@@ -792,28 +798,10 @@ def indexSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, Search
     print("Total docs: " + str(len(docs)))
     sections = createSections(OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, embeddingModelType, OpenAiEmbedding, fileName, docs)
     print(f"Indexing sections from '{fileName}' into search index '{indexName}'")
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net/",
-                                    index_name=indexName,
-                                    credential=AzureKeyCredential(SearchKey))
-    i = 0
-    batch = []
-    for s in sections:
-        batch.append(s)
-        i += 1
-        if i % 1000 == 0:
-            results = searchClient.index_documents(batch=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
-            print(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
-            batch = []
-
-    if len(batch) > 0:
-        results = searchClient.upload_documents(documents=batch)
-        succeeded = sum([1 for r in results if r.succeeded])
-        print(f"\tIndexed {len(results)} sections, {succeeded} succeeded")
+    uploadDocuments(SearchService, SearchKey, indexName, sections)
 
 def createProspectusSummary(SearchService, SearchKey, indexName):
-    indexClient = SearchIndexClient(endpoint=f"https://{SearchService}.search.windows.net/",
-            credential=AzureKeyCredential(SearchKey))
+    indexClient = getSearchIndexClient(SearchService, SearchKey)
     if indexName not in indexClient.list_index_names():
         index = SearchIndex(
             name=indexName,
@@ -843,9 +831,7 @@ def createProspectusSummary(SearchService, SearchKey, indexName):
         print(f"Search index {indexName} already exists")
 
 def findTopicSummaryInIndex(SearchService, SearchKey, indexName, fileName, docType, topic, returnFields=["id", "fileName", "docType", 'topic', "summary"]):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(
@@ -862,9 +848,7 @@ def findTopicSummaryInIndex(SearchService, SearchKey, indexName, fileName, docTy
     return None
 
 def findSummaryInIndex(SearchService, SearchKey, indexName, fileName, docType, returnFields=["id", "fileName", "docType", 'topic', "summary"]):
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=indexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, indexName)
     
     try:
         r = searchClient.search(
@@ -0,0 +1,150 @@
+"""Staged pipeline with bounded queues between stages, used to overlap download, parsing, embedding and upload."""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+_STOP = object()
+_processPool = None
+_processPoolLock = threading.Lock()
+
+def getProcessPool(reset=False):
+    """Return the process pool shared by every CPU-bound stage, recreating it if a worker died."""
+    global _processPool
+    with _processPoolLock:
+        if reset and _processPool is not None:
+            _processPool.shutdown(wait=False, cancel_futures=True)
+            _processPool = None
+        if _processPool is None:
+            _processPool = ProcessPoolExecutor(max_workers=max(1, min(4, os.cpu_count() or 1)))
+        return _processPool
+
+class PipelineStage:
+    """
+      One step of a pipeline.
+      Attributes:
+          name (str): Name used in logs and metrics.
+          func (callable): Function applied to the value produced by the previous stage.
+          workers (int): Number of items this stage processes concurrently.
+          useProcesses (bool): Run func on the shared process pool instead of the stage's threads (func must be picklable).
+          timeout (float): Seconds to wait for a process-pool item before failing it.
+      """
+
+    def __init__(self, name, func, workers=1, useProcesses=False, timeout=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.useProcesses = useProcesses
+        self.timeout = timeout
+
+class PipelineItem:
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        self.error = None
+        self.failedStage = None
+
+class _StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0
+        self.failed = 0
+        self.busySeconds = 0.0
+        self.depthSamples = 0
+        self.depthTotal = 0
+        self.maxQueueDepth = 0
+        self.lock = threading.Lock()
+
+    def sampleDepth(self, depth):
+        with self.lock:
+            self.depthSamples += 1
+            self.depthTotal += depth
+            self.maxQueueDepth = max(self.maxQueueDepth, depth)
+
+    def toDict(self, wallSeconds):
+        return {"stage": self.name, "processed": self.processed, "failed": self.failed,
+                "busySeconds": round(self.busySeconds, 3),
+                "itemsPerSec": round(self.processed / wallSeconds, 3) if wallSeconds > 0 else 0,
+                "maxQueueDepth": self.maxQueueDepth,
+                "avgQueueDepth": round(self.depthTotal / self.depthSamples, 2) if self.depthSamples else 0}
+
+def _runStageItem(stage, value):
+    if not stage.useProcesses:
+        return stage.func(value)
+    try:
+        return getProcessPool().submit(stage.func, value).result(timeout=stage.timeout)
+    except BrokenProcessPool:
+        # A crashed parser takes the pool down with it; rebuild it so the remaining items keep flowing
+        getProcessPool(reset=True)
+        raise
+
+def runPipeline(items, stages, queueSize=4):
+    """
+    Push (key, value) pairs through the stages in order, with a bounded queue in front of every stage.
+    An item that fails in one stage skips the remaining stages but does not hold up the other items.
+    Returns the list of PipelineItem in completion order and a dict of per-stage metrics.
+    """
+    queues = [queue.Queue(maxsize=queueSize) for _ in stages]
+    stats = [_StageStats(stage.name) for stage in stages]
+    results = []
+    resultsLock = threading.Lock()
+
+    def forward(index, item):
+        if index + 1 < len(stages):
+            queues[index + 1].put(item)
+            stats[index + 1].sampleDepth(queues[index + 1].qsize())
+        else:
+            with resultsLock:
+                results.append(item)
+
+    def worker(index):
+        stage = stages[index]
+        stageStats = stats[index]
+        while True:
+            item = queues[index].get()
+            if item is _STOP:
+                break
+            if item.error is None:
+                start = time.perf_counter()
+                try:
+                    item.value = _runStageItem(stage, item.value)
+                except Exception as e:
+                    item.error = e
+                    item.failedStage = stage.name
+                    logging.error(f"Pipeline stage {stage.name} failed for {item.key}: {e}")
+                elapsed = time.perf_counter() - start
+                with stageStats.lock:
+                    stageStats.processed += 1
+                    stageStats.busySeconds += elapsed
+                    if item.error is not None:
+                        stageStats.failed += 1
+            forward(index, item)
+
+    start = time.perf_counter()
+    threads = []
+    for index, stage in enumerate(stages):
+        stageThreads = [threading.Thread(target=worker, args=(index,), name=f"pipeline-{stage.name}-{n}", daemon=True)
+                        for n in range(stage.workers)]
+        for thread in stageThreads:
+            thread.start()
+        threads.append(stageThreads)
+
+    for key, value in items:
+        queues[0].put(PipelineItem(key, value))
+        stats[0].sampleDepth(queues[0].qsize())
+
+    # Drain stage by stage so every item has left a stage before its workers are stopped
+    for index, stage in enumerate(stages):
+        for _ in range(stage.workers):
+            queues[index].put(_STOP)
+        for thread in threads[index]:
+            thread.join()
+
+    wallSeconds = time.perf_counter() - start
+    metrics = {"items": len(results), "failed": sum(1 for item in results if item.error is not None),
+               "wallSeconds": round(wallSeconds, 3), "stages": [s.toDict(wallSeconds) for s in stats]}
+    logging.info(f"Pipeline metrics: {metrics}")
+    return results, metrics
@@ -12,6 +12,8 @@ import numpy as np
 from redis.commands.search.query import Query
 from typing import Mapping
 import json
+from Utilities.embeddingEngine import getEmbeddingEngine
+from Utilities.clientRegistry import getRedis
 
 OpenAiEmbedding = os.environ['OpenAiEmbedding']
 OpenAiKey = os.environ['OpenAiKey']
@@ -25,25 +27,123 @@ openai.api_type = "azure"
 openai.api_base = OpenAiEndPoint
 openai.api_version = OpenAiVersion
 openai.api_key = OpenAiKey
-redisConnection = Redis(host= RedisAddress, port=RedisPort, password=RedisPassword) #api for Docker localhost for local execution
+def getRedisConnection():
+    # Shared through the client registry, which pings it periodically and reconnects when it is gone
+    return getRedis(RedisAddress, RedisPort, RedisPassword)
+
+redisConnection = getRedisConnection()
+
+# Filing attributes that are indexed as tags, so they can prefilter a KNN query
+SEC_TAG_FIELDS = ["cik", "filing_type", "sic", "state_of_inc", "state_location", "fiscal_year_end"]
+SEC_TEXT_FIELDS = ["company", "filing_date", "period_of_report", "filename", "content"]
+SEC_RETURN_FIELDS = SEC_TAG_FIELDS + SEC_TEXT_FIELDS + ["filing_html_index", "htm_filing_link",
+                                                         "complete_text_filing_link", "metadata"]
+# The bulk loader sends a pipeline once it holds this many documents or bytes, whichever comes first
+BULK_LOAD_BATCH = 500
+BULK_LOAD_BYTES = 8 * 1024 * 1024
+TAG_SPECIAL_CHARACTERS = set(",.<>{}[]\"':;!@#$%^&*()-+=~| /")
+
+def vectorField(name="content_vector", dimensions=1536, algorithm="HNSW", distance="COSINE", m=16,
+                efConstruction=200, efRuntime=10, initialCap=None, blockSize=None):
+    """
+    Vector field definition for a Redis search schema.
+    HNSW trades index memory and build time (m, efConstruction) for sub-linear queries whose recall is set by
+    efRuntime; FLAT is an exact brute-force scan that suits small indexes. initialCap pre-sizes the index when
+    the number of documents is known, which avoids rehashing during a bulk load.
+    """
+    attributes = {"TYPE": "FLOAT32", "DIM": dimensions, "DISTANCE_METRIC": distance}
+    algorithm = algorithm.upper()
+    if algorithm == "HNSW":
+        attributes.update({"M": m, "EF_CONSTRUCTION": efConstruction, "EF_RUNTIME": efRuntime})
+    elif algorithm == "FLAT":
+        if blockSize:
+            attributes["BLOCK_SIZE"] = blockSize
+    else:
+        raise ValueError("Vector algorithm " + str(algorithm) + " is not supported")
+    if initialCap:
+        attributes["INITIAL_CAP"] = initialCap
+    return VectorField(name, algorithm, attributes)
+
+def secFilingSchema(dimensions=1536, algorithm="HNSW", **vectorOptions):
+    """Schema for SEC filing chunks: filterable tags, searchable text and the content embedding."""
+    return ([TagField(name) for name in SEC_TAG_FIELDS] +
+            [TextField(name) for name in SEC_TEXT_FIELDS] +
+            [vectorField("content_vector", dimensions, algorithm, **vectorOptions)])
 
 def createRedisIndex(fields, indexName):
+    """Create the index over doc:{indexName} hashes unless it exists; fields defaults to secFilingSchema()."""
+    redisConnection = getRedisConnection()
     try:
         redisConnection.ft(indexName).info()
     except:  # noqa
         # Create Redis Index
         redisConnection.ft(indexName).create_index(
-            fields=fields,
+            fields=fields or secFilingSchema(),
             definition=IndexDefinition(prefix=[f"doc:{indexName}"], index_type=IndexType.HASH),
         )
     return redisConnection
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
+def escapeTag(value):
+    return "".join("\\" + c if c in TAG_SPECIAL_CHARACTERS else c for c in str(value))
+
+def buildTagFilter(filters, tagFields=SEC_TAG_FIELDS):
+    """
+    Turn {"cik": ["320193", "789019"], "filing_type": "10-K"} into a RediSearch prefilter such as
+    (@cik:{320193|789019} @filing_type:{10\\-K}). Returns "*" when there is nothing to filter on.
+    Field names are written into the query as they are, so only the schema's tagFields are accepted.
+    """
+    unknown = [field for field in (filters or {}) if field not in tagFields]
+    if unknown:
+        raise ValueError("Cannot filter on " + ", ".join(map(str, unknown)) + ", only on " + ", ".join(tagFields))
+    clauses = []
+    for field, values in (filters or {}).items():
+        if values is None or values == "" or values == []:
+            continue
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        clauses.append(f"@{field}:{{{'|'.join(escapeTag(value) for value in values)}}}")
+    return "(" + " ".join(clauses) + ")" if clauses else "*"
+
+def buildKnnQuery(k, vectorField, returnFields=None, filters=None, efRuntime=None):
+    knn = f"KNN {int(k)} @{vectorField} $vector" + (" EF_RUNTIME $efRuntime" if efRuntime else "") + " AS vector_score"
+    query = Query(f"{buildTagFilter(filters)}=>[{knn}]").sort_by("vector_score").paging(0, int(k)).dialect(2)
+    if returnFields:
+        query = query.return_fields(*returnFields, "vector_score")
+    return query
+
+def knnParams(vector, efRuntime=None):
+    params = {"vector": np.asarray(vector, dtype=np.float32).tobytes()}
+    if efRuntime:
+        params["efRuntime"] = int(efRuntime)
+    return params
+
+class RedisHit:
+    """
+      One KNN result.
+      Attributes:
+          id (str): Key of the matching hash.
+          score (float): Distance to the query vector; smaller is closer.
+          fields (dict): The returned hash fields.
+      """
+
+    def __init__(self, id, score, fields):
+        self.id = id
+        self.score = score
+        self.fields = fields
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["fields"][name]
+        except KeyError:
+            raise AttributeError(name)
+
 def getEmbedding(text: str, engine=OpenAiEmbedding) -> list[float]:
-    text = text.replace("\n", " ")
-    encoding = tiktoken.get_encoding("cl100k_base")
     logging.info("Perform Embedding")
-    return openai.Embedding.create(input=encoding.encode(text), engine=engine)["data"][0]["embedding"]
+    return getEmbeddings([text], engine)[0]
+
+def getEmbeddings(texts: list[str], engine=OpenAiEmbedding) -> list[list[float]]:
+    embeddingEngine = getEmbeddingEngine("azureopenai", OpenAiEndPoint, OpenAiKey, OpenAiVersion, "", engine)
+    return embeddingEngine.embed([text.replace("\n", " ") for text in texts])
 
 def batched(iterable, n):
     """Batch data into tuples of length n. The last batch may be shorter."""
@@ -67,11 +167,19 @@ def getChunkedText(text, encoding_name="cl100k_base", max_tokens=1500,):
         chunked_text.append(encoding.decode(chunk))
     return chunked_text
 
-def setDocuments(redisClient, indexName, secData):
+def setDocuments(redisClient, indexName, secData, batchSize=BULK_LOAD_BATCH, maxBatchBytes=BULK_LOAD_BYTES):
+    """
+    Write the chunks with non-transactional pipelines of at most batchSize documents or maxBatchBytes,
+    so loading a large filing set holds one bounded batch in memory. Returns the number written.
+    """
     logging.info("Set Document")
-    pipeline = redisClient.pipeline()
+    pipeline = redisClient.pipeline(transaction=False)
+    pending = 0
+    pendingBytes = 0
+    written = 0
     for i, text in enumerate(secData):
         key = f"doc:{indexName}:{text['cik']}_{text['sic']}_{text['filing_date']}_{i}"
+        vector = np.asarray(text['content_vector'], dtype=np.float32).tobytes()
         pipeline.hset(
             key,
              mapping = {
@@ -90,10 +198,21 @@ def setDocuments(redisClient, indexName, secData):
                 "filename": text['filename'],
                 "content": text['content'],
                 "metadata": text['metadata'],
-                "content_vector": np.array(text['content_vector']).astype(dtype=np.float32).tobytes()
+                "content_vector": vector
             },
         )
-    pipeline.execute()
+        pending += 1
+        pendingBytes += len(vector) + len(text['content']) + len(text['metadata'])
+        if pending >= batchSize or pendingBytes >= maxBatchBytes:
+            pipeline.execute()
+            written += pending
+            pending = 0
+            pendingBytes = 0
+    if pending:
+        pipeline.execute()
+        written += pending
+    logging.info(f"Loaded {written} documents into {indexName}")
+    return written
     # redisConnection.hset(
     #     f"embedding:{index}",
     #     mapping={
@@ -136,9 +255,11 @@ def chunkAndEmbed(redisClient, indexName, secDoc, engine="text-embedding-ada-002
                 "content_vector": None,
                 "metadata" : json.dumps({"cik": secDoc['cik'], "source": secDoc['filename'], "filingType": secDoc['filing_type'], "reportDate": secDoc['period_of_report']})
             }
-            secCommonData['content_vector'] = getEmbedding(chunk, engine)
             fullData.append(secCommonData)
             k=k+1
+        vectors = getEmbeddings(chunkedText, engine)
+        for secCommonData, vector in zip(fullData, vectors):
+            secCommonData['content_vector'] = vector
     else:
       logging.info(f"Process full text with text {text}")
       secCommonData = {
@@ -165,36 +286,46 @@ def chunkAndEmbed(redisClient, indexName, secDoc, engine="text-embedding-ada-002
     setDocuments(redisClient, indexName, fullData)
     return None
 
-def performRedisSearch(question, indexName, k, returnField, vectorField, embeddingModelType):
+def getQueryEmbedding(question, embeddingModelType):
     question = question.replace("\n", " ")
     if (embeddingModelType == "azureopenai"):
         engineType = OpenAiEmbedding
     elif (embeddingModelType == "openai"):
         engineType = "text-embedding-ada-002"
+    return getEmbedding(question, engine=engineType)
 
-    embeddingQuery = getEmbedding(question, engine=engineType)
+def performRedisSearch(question, indexName, k, returnField, vectorField, embeddingModelType, filters=None, efRuntime=None,
+                       queryVector=None):
+    """
+    KNN search for question, optionally prefiltered by tag values (see buildTagFilter).
+    queryVector is the question's embedding when the caller already has it.
+    Returns the raw redis-py search result, whose docs are sorted by vector_score.
+    """
+    embeddingQuery = queryVector if queryVector is not None else getQueryEmbedding(question, embeddingModelType)
     logging.info("Got embedding")
-    arrayEmbedding = np.array(embeddingQuery)
-    hybridField = "*"
-    #hybridField = "(@cik:{{4962|2179|7323}})"
-    searchType = 'KNN'
-    baseQuery = (
-        f"{hybridField}=>[{searchType} {k} @{vectorField} $vector AS vector_score]"
-    )
-    redisQuery = (
-        Query(baseQuery)
-        .return_fields(*returnField)
-        .sort_by("vector_score")
-        .paging(0, k)
-        .dialect(2)
-    )
-    paramDict: Mapping[str, str] = {
-            "vector": np.array(arrayEmbedding)  # type: ignore
-            .astype(dtype=np.float32)
-            .tobytes()
-    }
+    redisQuery = buildKnnQuery(k, vectorField, returnField, filters, efRuntime)
 
     # perform vector search
-    results = redisConnection.ft(indexName).search(redisQuery, paramDict)
+    results = getRedisConnection().ft(indexName).search(redisQuery, knnParams(embeddingQuery, efRuntime))
+
+    return results
+
+def fetchRedisVectors(keys, vectorField="content_vector"):
+    """
+    The stored vectors of the hashes at keys, in one round trip; None where a hash has no vector.
+    redis-py decodes every returned search field as text, so vectors are read back as raw bytes instead.
+    """
+    pipeline = getRedisConnection().pipeline(transaction=False)
+    for key in keys:
+        pipeline.hget(key, vectorField)
+    return [None if raw is None else np.frombuffer(raw, dtype=np.float32).tolist() for raw in pipeline.execute()]
 
-    return results
\ No newline at end of file
+def searchRedis(question, indexName, k, returnFields=SEC_RETURN_FIELDS, vectorField="content_vector",
+                embeddingModelType="azureopenai", filters=None, efRuntime=None):
+    """Same search as performRedisSearch, returned as a list of RedisHit, closest first."""
+    results = performRedisSearch(question, indexName, k, returnFields, vectorField, embeddingModelType, filters, efRuntime)
+    hits = []
+    for doc in results.docs:
+        fields = {name: value for name, value in doc.__dict__.items() if name not in ("id", "payload", "vector_score")}
+        hits.append(RedisHit(doc.id, float(doc.vector_score), fields))
+    return hits
@@ -0,0 +1,96 @@
+"""Rerank a wide candidate set by relevance and diversity, so only the best few chunks reach the prompt."""
+import logging
+from typing import Any, List
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.schema import BaseRetriever
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from Utilities.envVars import *
+from Utilities.embeddingEngine import getEmbeddingEngine
+
+RERANK_CANDIDATES = 50
+# Weight of relevance against novelty in maximal marginal relevance; 1.0 ranks by similarity alone
+MMR_LAMBDA = 0.7
+# Metadata keys a retrieved chunk's stored embedding may come back under; the second is the Cognitive Search field
+VECTOR_METADATA = ("vector", "contentVector")
+
+def mmrSelect(queryVector, vectors, keep, lambdaMult=MMR_LAMBDA):
+    """
+    Pick keep rows of vectors by maximal marginal relevance: each pick maximizes
+    lambdaMult * similarity to the query - (1 - lambdaMult) * highest similarity to a row already picked.
+    Both similarities come from one matrix product up front, so each pick is a vector update over the candidates.
+    Returns the picked row indexes in order and the cosine similarity of every row to the query.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(queryVector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    picked = []
+    for _ in range(min(keep, len(vectors))):
+        scores = relevance if not picked else lambdaMult * relevance - (1 - lambdaMult) * redundancy
+        pick = int(np.argmax(np.where(available, scores, -np.inf)))
+        picked.append(pick)
+        available[pick] = False
+        redundancy = np.maximum(redundancy, similarity[pick])
+    return picked, relevance
+
+def storedVector(doc):
+    for key in VECTOR_METADATA:
+        if doc.metadata.get(key) is not None:
+            return doc.metadata[key]
+    return None
+
+def withoutVector(doc, **metadata):
+    """doc without the stored vector, so it does not travel on into the answer."""
+    kept = {key: value for key, value in doc.metadata.items() if key not in VECTOR_METADATA}
+    return Document(page_content=doc.page_content, metadata={**kept, **metadata})
+
+def rerankDocuments(question, docs, keep, embeddingModelType, lambdaMult=MMR_LAMBDA, queryVector=None):
+    """
+    The keep most relevant, least redundant of docs for question, best first, with their similarity to the
+    question in metadata["rerankScore"]. Chunks are compared by the vectors their index returned with them
+    (see retrieval.searchTarget withVectors); only chunks without one, and the question when queryVector is
+    not given, are embedded.
+    """
+    if len(docs) <= 1:
+        return [withoutVector(doc) for doc in docs]
+    vectors = [storedVector(doc) for doc in docs]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    texts = ([] if queryVector is not None else [question]) + [docs[i].page_content for i in missing]
+    if texts:
+        try:
+            engine = getEmbeddingEngine(embeddingModelType, OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding)
+            embedded = engine.embed(texts)
+        except Exception as e:
+            # Reranking only refines the order, so the retrieved order is still a usable answer
+            logging.warning(f"Reranking failed, keeping the first {keep} of {len(docs)} retrieved chunks: {e}")
+            return [withoutVector(doc) for doc in docs[:keep]]
+        if queryVector is None:
+            queryVector, embedded = embedded[0], embedded[1:]
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+    picked, relevance = mmrSelect(queryVector, vectors, keep, lambdaMult)
+    reranked = [withoutVector(docs[i], rerankScore=round(float(relevance[i]), 5)) for i in picked]
+    logging.info(f"Reranked {len(docs)} retrieved chunks down to {len(reranked)}, embedding {len(missing)} without a stored vector")
+    return reranked
+
+class RerankRetriever(BaseRetriever):
+    """
+      Reranks what another retriever returns, for the chains that take a retriever rather than documents.
+      The inner retriever should return stored vectors (FusionRetriever with withVectors, or the contentVector field).
+      """
+    retriever: Any
+    k: int = 5
+    embeddingModelType: str = "azureopenai"
+    lambdaMult: float = MMR_LAMBDA
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        docs = self.retriever.get_relevant_documents(query)
+        return rerankDocuments(query, docs, self.k, self.embeddingModelType, self.lambdaMult)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        return self._get_relevant_documents(query, run_manager=run_manager)
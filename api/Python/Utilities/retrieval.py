@@ -0,0 +1,115 @@
+"""Retrieval across several vector stores and namespaces in one request, merged with reciprocal-rank fusion."""
+import json
+import logging
+from functools import partial
+from typing import Any, List, Optional
+from langchain.docstore.document import Document
+from langchain.schema import BaseRetriever
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+from langchain.vectorstores import Pinecone
+import pinecone
+from Utilities.envVars import *
+from Utilities.fusion import fanOut, reciprocalRankFusion, getRetrievalTargets, SEARCHABLE_INDEX_TYPES, SEARCH_TIMEOUT
+from Utilities.redisIndex import performRedisSearch, fetchRedisVectors
+from Utilities.cogSearch import performCogSearch
+from Utilities.embeddingEngine import getEmbeddingEngine
+from Utilities.localIndex import getLocalIndex
+
+def targetName(target):
+    return f"{target['indexType']}:{target['indexNs']}"
+
+def queryEmbedding(question, embeddingModelType):
+    engine = getEmbeddingEngine(embeddingModelType, OpenAiEndPoint, OpenAiKey, OpenAiVersion, OpenAiApiKey, OpenAiEmbedding)
+    return engine.embed([question])[0]
+
+def searchTarget(target, question, k, embeddingModelType, embeddings=None, queryVector=None, withVectors=False):
+    """
+    Search one index and return its results as Documents, best first. queryVector is the question's embedding
+    when the caller already has it. With withVectors, each Document carries the embedding its index stores for it
+    in metadata["vector"], so the results can be reranked without embedding them again; Cognitive Search indexes
+    without a contentVector field have none.
+    """
+    indexType = target["indexType"]
+    indexNs = target["indexNs"]
+    if queryVector is None and (withVectors or indexType == "local"):
+        queryVector = queryEmbedding(question, embeddingModelType)
+    if indexType == "pinecone":
+        if not withVectors:
+            vectorDb = Pinecone.from_existing_index(index_name=VsIndexName, embedding=embeddings, namespace=indexNs)
+            return vectorDb.similarity_search(question, k=k, namespace=indexNs)
+        response = pinecone.Index(VsIndexName).query(vector=[float(v) for v in queryVector], top_k=k, namespace=indexNs,
+                                                     include_values=True, include_metadata=True)
+        docs = []
+        for match in response["matches"]:
+            # The LangChain Pinecone store keeps the chunk text in the "text" metadata field
+            metadata = dict(match.get("metadata") or {})
+            docs.append(Document(page_content=metadata.pop("text", ""), metadata={**metadata, "vector": match["values"]}))
+        return docs
+    elif indexType == "redis":
+        returnField = ["metadata", "content", "vector_score"]
+        results = performRedisSearch(question, indexNs, k, returnField, "content_vector", embeddingModelType, queryVector=queryVector)
+        docs = [Document(page_content=result.content, metadata=json.loads(result.metadata)) for result in results.docs]
+        if withVectors:
+            for doc, vector in zip(docs, fetchRedisVectors([result.id for result in results.docs], "content_vector")):
+                doc.metadata["vector"] = vector
+        return docs
+    elif indexType == "cogsearch" or indexType == "cogsearchvs":
+        returnFields = ["id", "content", "sourcefile"] + (["contentVector"] if withVectors and indexType == "cogsearchvs" else [])
+        r = performCogSearch(indexType, embeddingModelType, question, indexNs, k, returnFields, queryVector=queryVector)
+        if r is None:
+            return []
+        docs = []
+        for doc in r:
+            metadata = {"id": doc['id'], "source": doc['sourcefile']}
+            if withVectors:
+                metadata["vector"] = doc.get('contentVector')
+            docs.append(Document(page_content=doc['content'], metadata=metadata))
+        return docs
+    elif indexType == "local":
+        docs = []
+        for result in getLocalIndex(indexNs).search(queryVector, k, withVectors=withVectors):
+            record, score = result[0], result[1]
+            metadata = {**record["metadata"], "id": record["id"], "score": round(score, 5)}
+            if withVectors:
+                metadata["vector"] = result[2]
+            docs.append(Document(page_content=record["content"], metadata=metadata))
+        return docs
+    raise ValueError("Index type " + str(indexType) + " cannot be searched")
+
+def retrieveDocuments(targets, question, k, embeddingModelType, embeddings=None, timeout=SEARCH_TIMEOUT, queryVector=None,
+                      withVectors=False):
+    """
+    Search every target concurrently and return the top k Documents after reciprocal-rank fusion.
+    A target that errors or exceeds its timeout is skipped, so a slow backend costs at most the timeout.
+    Each Document's metadata records the fused score and which targets returned it. With withVectors the
+    question is embedded once here and shared by every target, and each result keeps its stored vector.
+    """
+    if queryVector is None and withVectors:
+        queryVector = queryEmbedding(question, embeddingModelType)
+    searches = [(targetName(target), partial(searchTarget, target, question, k, embeddingModelType, embeddings, queryVector, withVectors),
+                 target.get("timeout")) for target in targets]
+    results, report = fanOut(searches, timeout)
+    fused = reciprocalRankFusion(results, lambda doc: doc.page_content, k)
+    docs = []
+    for entry in fused:
+        doc = entry["item"]
+        doc.metadata = {**doc.metadata, "rrfScore": round(entry["score"], 5), "retrievers": entry["retrievers"]}
+        docs.append(doc)
+    logging.info(f"Fused {sum(len(r) for r in results.values())} results from {len(results)} of {len(targets)} indexes into {len(docs)}")
+    return docs
+
+class FusionRetriever(BaseRetriever):
+    """Retriever over several indexes, for the chains that take a retriever rather than documents."""
+    targets: List[dict]
+    k: int = 5
+    embeddingModelType: str = "azureopenai"
+    embeddings: Optional[Any] = None
+    timeout: float = SEARCH_TIMEOUT
+    withVectors: bool = False
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return retrieveDocuments(self.targets, query, self.k, self.embeddingModelType, self.embeddings, self.timeout,
+                                 withVectors=self.withVectors)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        return self._get_relevant_documents(query, run_manager=run_manager)
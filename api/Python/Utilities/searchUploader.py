@@ -0,0 +1,152 @@
+"""Pooled async Cognitive Search clients and concurrent, size-bounded document uploads."""
+import asyncio
+import atexit
+import json
+import logging
+import random
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from azure.search.documents import IndexDocumentsBatch
+from azure.search.documents.aio import SearchClient
+
+# Cognitive Search accepts at most 1000 actions and 16 MB of payload per indexing request
+MAX_BATCH_DOCS = 1000
+MAX_BATCH_BYTES = 12 * 1024 * 1024
+# Per-document status codes the service reports for transient failures
+RETRYABLE_STATUS = {409, 422, 429, 503}
+
+_loop = None
+_loopLock = threading.Lock()
+_clients = {}
+
+def getSearchEndpoint(SearchService):
+    """Accept either a service name or a full endpoint URL."""
+    if SearchService.startswith("http://") or SearchService.startswith("https://"):
+        return SearchService.rstrip("/")
+    return f"https://{SearchService}.search.windows.net"
+
+def _getLoop():
+    # A single background event loop owns every pooled client, so connections outlive one upload call
+    global _loop
+    with _loopLock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="search-upload", daemon=True).start()
+        return _loop
+
+def _getClient(SearchService, SearchKey, indexName):
+    # Only runs on the loop thread, so the pool needs no lock
+    key = (getSearchEndpoint(SearchService), indexName, SearchKey)
+    client = _clients.get(key)
+    if client is None:
+        client = SearchClient(endpoint=key[0], index_name=indexName, credential=AzureKeyCredential(SearchKey))
+        _clients[key] = client
+    return client
+
+async def _closeClients():
+    for client in list(_clients.values()):
+        await client.close()
+    _clients.clear()
+
+def closeClients():
+    """Close every pooled client; registered to run at interpreter exit."""
+    if _loop is not None and _loop.is_running():
+        asyncio.run_coroutine_threadsafe(_closeClients(), _loop).result(timeout=30)
+
+atexit.register(closeClients)
+
+def _addActions(batch, action, documents):
+    if action == "upload":
+        batch.add_upload_actions(documents)
+    elif action == "merge":
+        batch.add_merge_actions(documents)
+    elif action == "mergeOrUpload":
+        batch.add_merge_or_upload_actions(documents)
+    elif action == "delete":
+        batch.add_delete_actions(documents)
+    else:
+        raise ValueError("Search action " + str(action) + " is not supported")
+
+def _batches(documents, maxBatchDocs, maxBatchBytes):
+    batch = []
+    batchBytes = 0
+    for document in documents:
+        documentBytes = len(json.dumps(document, default=str))
+        if batch and (len(batch) >= maxBatchDocs or batchBytes + documentBytes > maxBatchBytes):
+            yield batch
+            batch = []
+            batchBytes = 0
+        batch.append(document)
+        batchBytes += documentBytes
+    if batch:
+        yield batch
+
+async def _sendBatch(SearchService, SearchKey, indexName, documents, action, keyField, retries):
+    client = _getClient(SearchService, SearchKey, indexName)
+    pending = documents
+    succeeded = 0
+    failed = 0
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            await asyncio.sleep(min(30, 2 ** attempt) * random.uniform(0.5, 1))
+        batch = IndexDocumentsBatch()
+        _addActions(batch, action, pending)
+        try:
+            results = await client.index_documents(batch=batch)
+        except (HttpResponseError, ServiceRequestError, ServiceResponseError) as e:
+            status = getattr(e, "status_code", None)
+            if status is not None and status < 500 and status not in RETRYABLE_STATUS:
+                logging.error(f"Search upload of {len(pending)} documents to {indexName} failed: {e}")
+                return succeeded, failed + len(pending)
+            logging.info(f"Search upload of {len(pending)} documents to {indexName} failed, retrying: {e}")
+            continue
+        # Only the documents that failed transiently are sent again
+        retryKeys = set()
+        for result in results:
+            if result.succeeded:
+                succeeded += 1
+            elif result.status_code in RETRYABLE_STATUS:
+                retryKeys.add(result.key)
+            else:
+                failed += 1
+                logging.error(f"Indexing {result.key} into {indexName} failed: {result.error_message}")
+        pending = [document for document in pending if str(document[keyField]) in retryKeys]
+        if not pending:
+            break
+    if pending:
+        logging.error(f"Giving up on {len(pending)} documents for {indexName} after {retries} retries")
+    return succeeded, failed + len(pending)
+
+def uploadDocuments(SearchService, SearchKey, indexName, documents, action="upload", keyField="id",
+                    maxBatchDocs=MAX_BATCH_DOCS, maxBatchBytes=MAX_BATCH_BYTES, concurrency=4, retries=3):
+    """
+    Index documents with up to concurrency batches in flight on the pooled async client for the index.
+    documents may be any iterable and is consumed lazily, so producing documents overlaps the uploads.
+    Batches are bounded by count and by JSON payload size, and documents the service rejects with a
+    transient status are retried individually. Returns the number of documents that succeeded and failed.
+    """
+    loop = _getLoop()
+    inFlight = set()
+    succeeded = 0
+    failed = 0
+
+    def collect(done):
+        nonlocal succeeded, failed
+        for future in done:
+            batchSucceeded, batchFailed = future.result()
+            succeeded += batchSucceeded
+            failed += batchFailed
+
+    for batch in _batches(documents, maxBatchDocs, maxBatchBytes):
+        if len(inFlight) >= concurrency:
+            done, inFlight = wait(inFlight, return_when=FIRST_COMPLETED)
+            collect(done)
+        inFlight.add(asyncio.run_coroutine_threadsafe(
+            _sendBatch(SearchService, SearchKey, indexName, batch, action, keyField, retries), loop))
+    if inFlight:
+        done, _ = wait(inFlight)
+        collect(done)
+    logging.info(f"\tIndexed {succeeded + failed} sections, {succeeded} succeeded")
+    return succeeded, failed
@@ -0,0 +1,152 @@
+"""Generator-based loading and splitting, so large uploads are chunked without holding the whole document in memory."""
+import json
+import logging
+from itertools import islice
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.text_splitter import TokenTextSplitter
+from langchain.text_splitter import NLTKTextSplitter
+from langchain.document_loaders import UnstructuredWordDocumentLoader
+
+# Text is read and split in windows of this many characters
+READ_BLOCK_CHARS = 1024 * 1024
+MARKDOWN_HEADERS = [("#", "Title"), ("##", "SubTitle")]
+# Read as plain text; any other type without a loader of its own is rejected rather than indexed as bytes
+TEXT_EXTENSIONS = (".txt", ".md", ".csv", ".json", ".html", ".htm")
+
+def getTextSplitter(textSplitterType, chunkSize, chunkOverlap):
+    if textSplitterType == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
+    elif textSplitterType == "tiktoken":
+        return TokenTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
+    elif textSplitterType == "nltk":
+        return NLTKTextSplitter(chunk_size=int(chunkSize), chunk_overlap=int(chunkOverlap))
+    raise ValueError("Text splitter " + str(textSplitterType) + " is not supported")
+
+def iterTextBlocks(path, blockChars=READ_BLOCK_CHARS):
+    with open(path, "r", encoding="utf-8", errors="ignore") as file:
+        while True:
+            block = file.read(blockChars)
+            if not block:
+                break
+            yield block
+
+def iterLines(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as file:
+        for line in file:
+            yield line
+
+def iterPdfPages(path):
+    # Same text PDFMinerLoader extracts, one page at a time
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+    for page in extract_pages(path):
+        yield "".join(element.get_text() for element in page if isinstance(element, LTTextContainer))
+
+def splitStream(blocks, textSplitter, windowChars=READ_BLOCK_CHARS):
+    """
+    Split a stream of text blocks into chunks, holding at most one window of text in memory.
+    The last chunk of every window may continue in the next block, so it is carried over and
+    split again together with it; chunk boundaries and overlap match splitting the whole text.
+    """
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        if len(buffer) < windowChars:
+            continue
+        chunks = textSplitter.split_text(buffer)
+        if len(chunks) > 1:
+            yield from chunks[:-1]
+            # Splitters strip chunks, so keep the trailing whitespace that separates it from the next block
+            buffer = chunks[-1] + buffer[len(buffer.rstrip()):]
+    if buffer.strip():
+        yield from textSplitter.split_text(buffer)
+
+def splitMarkdownStream(lines, metadata, maxChars=READ_BLOCK_CHARS):
+    """
+    Streaming equivalent of MarkdownHeaderTextSplitter with the Title/SubTitle headers: yields one
+    Document per header section, and cuts a section that grows past maxChars into several Documents.
+    """
+    levels = {name: len(sep) for sep, name in MARKDOWN_HEADERS}
+    headers = dict(MARKDOWN_HEADERS)
+    current = {}
+    paragraphs = []
+    paragraph = []
+    size = 0
+
+    def section():
+        return Document(page_content="  \n".join(paragraphs + (["\n".join(paragraph)] if paragraph else [])),
+                        metadata={**metadata, **current})
+
+    for line in lines:
+        stripped = line.strip()
+        sep = stripped.split(" ", 1)[0]
+        if sep in headers:
+            if paragraphs or paragraph:
+                yield section()
+                paragraphs, paragraph, size = [], [], 0
+            current = {name: value for name, value in current.items() if levels[name] < len(sep)}
+            current[headers[sep]] = stripped[len(sep):].strip()
+        elif stripped:
+            paragraph.append(stripped)
+            size += len(stripped)
+            if size >= maxChars:
+                yield section()
+                paragraphs, paragraph, size = [], [], 0
+        elif paragraph:
+            paragraphs.append("\n".join(paragraph))
+            paragraph = []
+    if paragraphs or paragraph:
+        yield section()
+
+def streamDocuments(path, fileName, textSplitterType, chunkSize, chunkOverlap, source=None):
+    """Yield the chunks of one downloaded file as Documents, reading the file incrementally."""
+    metadata = {"source": source or path}
+    if textSplitterType == "markdown":
+        yield from splitMarkdownStream(iterLines(path), metadata)
+        return
+    textSplitter = getTextSplitter(textSplitterType, chunkSize, chunkOverlap)
+    if fileName.endswith(".pdf"):
+        blocks = iterPdfPages(path)
+    elif fileName.endswith(".docx") or fileName.endswith(".doc"):
+        # Word documents are parsed as a whole by Unstructured; only the chunking is lazy
+        blocks = (doc.page_content for doc in UnstructuredWordDocumentLoader(path).load())
+    elif fileName.lower().endswith(TEXT_EXTENSIONS):
+        blocks = iterTextBlocks(path)
+    else:
+        raise ValueError("File type of " + fileName + " is not supported")
+    # Keep a window several chunks wide so the splitter still sees enough context to pick boundaries
+    windowChars = max(READ_BLOCK_CHARS, int(chunkSize) * 16)
+    for chunk in splitStream(blocks, textSplitter, windowChars):
+        yield Document(page_content=chunk, metadata=dict(metadata))
+
+def spoolDocuments(docs, path):
+    """Write documents to a JSON-lines file as they are produced and return how many were written."""
+    count = 0
+    with open(path, "w", encoding="utf-8") as file:
+        for doc in docs:
+            file.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}) + "\n")
+            count += 1
+    logging.info(f"Spooled {count} chunks to {path}")
+    return count
+
+def readSpool(path):
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            item = json.loads(line)
+            yield Document(page_content=item["page_content"], metadata=item["metadata"])
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def keepHead(docs, head, count=5):
+    """Pass docs through unchanged while copying the first few into head."""
+    for doc in docs:
+        if len(head) < count:
+            head.append(doc)
+        yield doc
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The function app imports its shared code as the top-level Utilities package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,20 @@
+from Utilities.answerCache import AnswerCache, answerCacheKey
+
+def key(**changes):
+    settings = dict(indexType="local", indexNs="ns", chainType="stuff", embeddingModelType="azureopenai",
+                    deploymentType="gpt35", temperature=0.3, promptTemplate="")
+    settings.update(changes)
+    return answerCacheKey(**settings)
+
+def test_answerCacheKey_separates_answer_settings():
+    assert key() == key(promptTemplate=None)
+    assert key(temperature=0) != key()
+    assert key(deploymentType="gpt3516k") != key()
+    assert key(promptTemplate="Answer in French: {summaries} {question}") != key()
+
+def test_lookup_only_matches_the_same_settings():
+    cache = AnswerCache()
+    cache.store(key(), "What was revenue?", [1.0, 0.0], "42")
+    assert cache.lookup(key(), "what was  revenue?") == "42"
+    assert cache.lookup(key(temperature=0.9), "What was revenue?") is None
+    assert cache.lookup(key(promptTemplate="Be brief. {summaries} {question}"), "What was revenue?", [1.0, 0.0]) is None
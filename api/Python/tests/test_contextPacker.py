@@ -0,0 +1,78 @@
+import pytest
+from langchain.docstore.document import Document
+from langchain.prompts import PromptTemplate
+from Utilities.modelHelper import getEncoding, numTokenFromText
+from Utilities.contextPacker import SOURCES_DOCUMENT_FORMAT, DOCUMENT_SEPARATOR, chunkFingerprint, packDocuments, \
+    packForChain, truncateAtSentence
+
+MODEL = "gpt-35-turbo"
+
+try:
+    getEncoding(MODEL)
+except Exception as e:
+    pytest.skip(f"tiktoken encodings not available: {e}", allow_module_level=True)
+
+def sentences(label, count):
+    return " ".join(f"Sentence {i} of {label} says something about revenue." for i in range(count))
+
+def cost(doc):
+    """Tokens packDocuments charges for doc, the document text plus its formatting and separator."""
+    overhead = numTokenFromText(SOURCES_DOCUMENT_FORMAT.format(page_content="", source=doc.metadata.get("source", "")), MODEL)
+    return numTokenFromText(doc.page_content, MODEL) + overhead + numTokenFromText(DOCUMENT_SEPARATOR, MODEL)
+
+def docsOf(*texts):
+    return [Document(page_content=text, metadata={"source": f"doc{i}.pdf"}) for i, text in enumerate(texts)]
+
+def test_packs_whole_chunks_in_order_while_they_fit():
+    docs = docsOf(sentences("a", 5), sentences("b", 5), sentences("c", 5))
+    budget = cost(docs[0]) + cost(docs[1])
+    packed = packDocuments(docs, budget, MODEL)
+    assert [doc.page_content for doc in packed] == [docs[0].page_content, docs[1].page_content]
+    assert not any(doc.metadata.get("truncated") for doc in packed)
+
+def test_truncates_the_chunk_that_overflows_at_a_sentence():
+    docs = docsOf(sentences("a", 5), sentences("b", 40), sentences("c", 5))
+    budget = cost(docs[0]) + cost(docs[1]) // 2
+    packed = packDocuments(docs, budget, MODEL)
+    assert len(packed) == 2
+    assert packed[1].metadata["truncated"] and packed[1].metadata["source"] == "doc1.pdf"
+    assert packed[1].page_content.endswith("revenue.")
+    assert docs[1].page_content.startswith(packed[1].page_content)
+    assert sum(cost(doc) for doc in packed) <= budget
+
+def test_drops_near_duplicates():
+    docs = docsOf("The quarter closed with record revenue.", "the quarter closed, with RECORD revenue", "Costs fell.")
+    assert chunkFingerprint(docs[0].page_content) == chunkFingerprint(docs[1].page_content)
+    packed = packDocuments(docs, 1000, MODEL)
+    assert [doc.metadata["source"] for doc in packed] == ["doc0.pdf", "doc2.pdf"]
+
+def test_truncateAtSentence_falls_back_to_a_word():
+    text = "one two three four five six seven eight nine ten " * 20
+    truncated = truncateAtSentence(text, 10, MODEL)
+    assert truncated and text.startswith(truncated) and not truncated.endswith(" ")
+    assert numTokenFromText(truncated, MODEL) <= 10
+    assert truncateAtSentence(text, 0, MODEL) == ""
+
+def test_map_rerank_holds_each_document_to_the_whole_budget():
+    docs = docsOf(sentences("a", 30), sentences("b", 30), sentences("c", 30))
+    budget = cost(docs[0]) // 2
+    packed = packDocuments(docs, budget, MODEL, perDocument=True)
+    assert len(packed) == 3
+    assert all(doc.metadata["truncated"] and cost(doc) <= budget for doc in packed)
+
+def test_packForChain_budgets_against_the_prompt():
+    prompt = PromptTemplate(template="Answer {question} from:\n{summaries}", input_variables=["question", "summaries"])
+    docs = docsOf(*(sentences(str(i), 60) for i in range(20)))
+    for chainType in ("stuff", "map_rerank"):
+        packed = packForChain(docs, chainType, prompt, "What was revenue?", MODEL, 500)
+        total = sum(cost(doc) for doc in packed)
+        if chainType == "stuff":
+            assert 0 < len(packed) < len(docs) and total < 4000 - 500
+        else:
+            assert len(packed) == len(docs)
+    assert packForChain(docs, "map_reduce", prompt, "What was revenue?", MODEL, 500) is docs
+
+def test_packForChain_sends_nothing_when_the_prompt_fills_the_window():
+    prompt = PromptTemplate(template="{question} " + "filler " * 3900 + "{summaries}", input_variables=["question", "summaries"])
+    docs = docsOf(sentences("a", 5))
+    assert packForChain(docs, "stuff", prompt, "What was revenue?", MODEL, 500) == []
@@ -0,0 +1,33 @@
+import pytest
+from Utilities.embeddingCache import MmapTier, cacheKey, toBytes, fromBytes
+
+def test_mmapTier_takes_dimensions_from_first_vector(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    writer = MmapTier(path, 64)
+    reader = MmapTier(path, 64)
+    key = cacheKey("ada", "hello")
+    assert writer.getMany([key]) == {}
+    writer.setMany({key: toBytes([0.5, 1.5, 2.5])})
+    assert writer.dimensions == 3
+    # The second handle maps the file once the first write has created it
+    assert fromBytes(reader.getMany([key])[key]) == [0.5, 1.5, 2.5]
+
+def test_mmapTier_shares_vectors_across_handles(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    first, second = MmapTier(path, 64, 4), MmapTier(path, 64, 4)
+    items = {cacheKey("ada", f"text {i}"): toBytes([i, i, i, i]) for i in range(20)}
+    first.setMany(items)
+    assert second.getMany(list(items)) == items
+
+def test_mmapTier_skips_vectors_of_other_dimensions(tmp_path):
+    tier = MmapTier(str(tmp_path / "cache.bin"), 64, 4)
+    key = cacheKey("ada", "hello")
+    tier.setMany({key: toBytes([1.0, 2.0])})
+    assert tier.getMany([key]) == {}
+
+def test_mmapTier_rejects_file_of_other_dimensions(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    MmapTier(path, 64, 4)
+    with pytest.raises(ValueError):
+        MmapTier(path, 64, 8)
+    assert MmapTier(path, 64).dimensions == 4
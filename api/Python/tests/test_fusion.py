@@ -0,0 +1,56 @@
+import time
+from Utilities.fusion import contentKey, fanOut, getRetrievalTargets, reciprocalRankFusion, RRF_K
+
+def texts(fused):
+    return [entry["item"]["text"] for entry in fused]
+
+def test_rrf_orders_by_summed_reciprocal_rank():
+    rankings = {
+        "a": [{"text": "one"}, {"text": "two"}, {"text": "three"}],
+        "b": [{"text": "three"}, {"text": "two"}, {"text": "four"}],
+    }
+    fused = reciprocalRankFusion(rankings, lambda item: item["text"])
+    # Items found by both lists beat one, which only a ranked first
+    assert texts(fused) == ["three", "two", "one", "four"]
+    assert fused[0]["score"] == 1.0 / (RRF_K + 3) + 1.0 / (RRF_K + 1)
+    assert fused[1]["score"] == 2.0 / (RRF_K + 2)
+    assert fused[0]["retrievers"] == ["a", "b"]
+    assert fused[-1]["retrievers"] == ["b"]
+
+def test_rrf_limits_to_k():
+    rankings = {"a": [{"text": str(i)} for i in range(10)]}
+    assert texts(reciprocalRankFusion(rankings, lambda item: item["text"], k=3)) == ["0", "1", "2"]
+
+def test_rrf_merges_decorated_duplicates_and_keeps_best_ranked_copy():
+    rankings = {
+        "redis": [{"text": "other"}, {"text": " : The same\nchunk."}],
+        "local": [{"text": "The same chunk", "source": "local"}],
+    }
+    fused = reciprocalRankFusion(rankings, lambda item: item["text"])
+    assert len(fused) == 2
+    assert fused[0]["item"] == {"text": "The same chunk", "source": "local"}
+    assert fused[0]["retrievers"] == ["redis", "local"]
+
+def test_rrf_counts_a_repeat_within_one_list_once_per_retriever_name():
+    fused = reciprocalRankFusion({"a": [{"text": "x"}, {"text": "x!"}]}, lambda item: item["text"])
+    assert len(fused) == 1 and fused[0]["retrievers"] == ["a"]
+
+def test_contentKey_ignores_whitespace_and_edge_punctuation():
+    assert contentKey("  Hello,\n world ") == contentKey("Hello, world.")
+    assert contentKey("Hello, world") != contentKey("Hello world")
+
+def test_getRetrievalTargets_skips_repeats_and_unsearchable_types():
+    overrides = {"indexes": [{"indexType": "redis", "indexNs": "a"}, {"indexType": "pinecone", "indexNs": "p"},
+                             {"indexType": "milvus", "indexNs": "m"}, {"indexType": "local", "indexNs": "l", "timeout": 2}]}
+    targets = getRetrievalTargets("redis", "a", overrides)
+    assert [(t["indexType"], t["indexNs"]) for t in targets] == [("redis", "a"), ("pinecone", "p"), ("local", "l")]
+    assert targets[2]["timeout"] == 2
+
+def test_fanOut_drops_slow_and_failing_searches():
+    def fail():
+        raise RuntimeError("down")
+    results, report = fanOut([("fast", lambda: [1, 2], None), ("slow", lambda: time.sleep(1) or [3], 0.05),
+                              ("broken", fail, None)], timeout=0.5)
+    assert results == {"fast": [1, 2]}
+    assert report["slow"]["status"] == "timeout"
+    assert report["broken"]["status"] == "error"
@@ -0,0 +1,73 @@
+import numpy as np
+import Utilities.localIndex as localIndex
+from Utilities.localIndex import LocalIndex
+
+def randomVectors(count, dimensions=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+
+def addRows(index, vectors, start=0, source="a.pdf"):
+    ids = [f"id{i}" for i in range(start, start + len(vectors))]
+    index.add(ids, vectors, [{"content": f"chunk {i}", "metadata": {"source": source}} for i in range(start, start + len(vectors))])
+    return ids
+
+def test_search_returns_nearest_first(tmp_path):
+    index = LocalIndex(str(tmp_path / "ns"))
+    vectors = randomVectors(50)
+    addRows(index, vectors)
+    results = index.search(vectors[7], 3)
+    assert results[0][0]["id"] == "id7"
+    assert results[0][1] > 0.999
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+    record, score, stored = index.search(vectors[7], 1, withVectors=True)[0]
+    assert np.allclose(stored, vectors[7] / np.linalg.norm(vectors[7]), atol=1e-6)
+
+def test_add_replaces_existing_id(tmp_path):
+    index = LocalIndex(str(tmp_path / "ns"))
+    vectors = randomVectors(10)
+    addRows(index, vectors)
+    index.add(["id3"], vectors[[5]], [{"content": "replaced", "metadata": {}}])
+    assert index.stats()["rows"] == 10
+    matches = [record["content"] for record, _ in index.search(vectors[5], 2)]
+    assert sorted(matches) == ["chunk 5", "replaced"]
+    assert all(record["content"] != "chunk 3" for record, _ in index.search(vectors[3], 10))
+
+def test_delete_hides_rows_and_compacts(tmp_path):
+    index = LocalIndex(str(tmp_path / "ns"))
+    vectors = randomVectors(20)
+    ids = addRows(index, vectors)
+    assert index.delete(ids[:2]) == 2
+    assert index.delete(ids[:2]) == 0
+    assert index.search(vectors[0], 1)[0][0]["id"] != "id0"
+    # Deleting past COMPACT_RATIO of the rows rewrites the files as a new generation without them
+    index.delete(ids[2:8])
+    stats = index.stats()
+    assert stats["rows"] == 12 and stats["deleted"] == 0 and stats["generation"] == 1
+
+def test_second_handle_sees_writes_and_reopen(tmp_path):
+    path = str(tmp_path / "ns")
+    writer, reader = LocalIndex(path), LocalIndex(path)
+    vectors = randomVectors(30)
+    ids = addRows(writer, vectors[:20])
+    assert reader.search(vectors[4], 1)[0][0]["id"] == "id4"
+    addRows(reader, vectors[20:], start=20, source="b.pdf")
+    writer.delete(ids[:1])
+    assert writer.search(vectors[25], 1)[0][0]["id"] == "id25"
+    assert reader.search(vectors[0], 1)[0][0]["id"] != "id0"
+    reopened = LocalIndex(path)
+    assert reopened.stats()["rows"] == 29
+    assert sorted(reopened.idsWhere("source", "b.pdf")) == sorted(f"id{i}" for i in range(20, 30))
+
+def test_clusters_past_threshold(tmp_path, monkeypatch):
+    monkeypatch.setattr(localIndex, "CLUSTER_THRESHOLD", 256)
+    index = LocalIndex(str(tmp_path / "ns"))
+    vectors = randomVectors(300, dimensions=16)
+    addRows(index, vectors[:200])
+    assert index.stats()["lists"] == 0
+    addRows(index, vectors[200:], start=200)
+    assert index.stats()["lists"] == int(np.sqrt(300))
+    # Probing every cluster is exact; the default probes still find a stored row itself
+    for row in (0, 150, 299):
+        assert index.search(vectors[row], 1, probes=index.stats()["lists"])[0][0]["id"] == f"id{row}"
+        assert index.search(vectors[row], 1)[0][0]["id"] == f"id{row}"
+    reopened = LocalIndex(index.path)
+    assert reopened.search(vectors[42], 1)[0][0]["id"] == "id42"
@@ -0,0 +1,22 @@
+from Utilities.pipeline import PipelineStage, runPipeline
+
+def test_runPipeline_applies_stages_in_order():
+    stages = [PipelineStage("double", lambda v: v * 2, workers=2), PipelineStage("inc", lambda v: v + 1, workers=3)]
+    results, metrics = runPipeline(((i, i) for i in range(20)), stages, queueSize=2)
+    assert sorted((item.key, item.value) for item in results) == [(i, i * 2 + 1) for i in range(20)]
+    assert metrics["items"] == 20 and metrics["failed"] == 0
+    assert [stage["processed"] for stage in metrics["stages"]] == [20, 20]
+
+def test_runPipeline_failed_item_skips_later_stages():
+    def parse(value):
+        if value == 3:
+            raise ValueError("bad file")
+        return value
+    seen = []
+    stages = [PipelineStage("parse", parse), PipelineStage("upload", lambda v: seen.append(v) or v)]
+    results, metrics = runPipeline(((i, i) for i in range(5)), stages)
+    failed = [item for item in results if item.error is not None]
+    assert [(item.key, item.failedStage) for item in failed] == [(3, "parse")]
+    assert sorted(seen) == [0, 1, 2, 4]
+    assert metrics["failed"] == 1
+    assert metrics["stages"][0]["failed"] == 1 and metrics["stages"][1]["processed"] == 4
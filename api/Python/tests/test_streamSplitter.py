@@ -0,0 +1,34 @@
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from Utilities.streamSplitter import splitStream, streamDocuments
+
+def sampleText(paragraphs=200):
+    return "\n\n".join(f"Paragraph {i}. " + " ".join(f"word{i}-{j}" for j in range(i % 17 + 5)) for i in range(paragraphs))
+
+def blocksOf(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+@pytest.mark.parametrize("blockChars", [7, 100, 1000])
+def test_splitStream_matches_whole_text_across_windows(blockChars):
+    text = sampleText()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=120, chunk_overlap=20)
+    streamed = list(splitStream(blocksOf(text, blockChars), splitter, windowChars=600))
+    assert streamed == splitter.split_text(text)
+
+def test_splitStream_short_text_is_one_window():
+    splitter = RecursiveCharacterTextSplitter(chunk_size=120, chunk_overlap=20)
+    assert list(splitStream(["short ", "text"], splitter, windowChars=600)) == ["short text"]
+    assert list(splitStream(["   ", ""], splitter, windowChars=600)) == []
+
+def test_streamDocuments_reads_text_files(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text(sampleText(20), encoding="utf-8")
+    docs = list(streamDocuments(str(path), "notes.txt", "recursive", 200, 0, source="notes"))
+    assert docs and all(doc.metadata == {"source": "notes"} for doc in docs)
+
+@pytest.mark.parametrize("fileName", ["deck.pptx", "sheet.xlsx", "photo.png", "archive"])
+def test_streamDocuments_rejects_unsupported_types(tmp_path, fileName):
+    path = tmp_path / fileName
+    path.write_bytes(b"\x89PNG\x00\x01binary")
+    with pytest.raises(ValueError, match="is not supported"):
+        list(streamDocuments(str(path), fileName, "recursive", 200, 0))
@@ -1,4 +1,5 @@
-from Utilities.modelHelper import numTokenFromMessages, getTokenLimit
+from Utilities.modelHelper import getTokenLimit
+from Utilities.messageBuilder import getMessagesFromHistory
 from typing import Any, Sequence
 import logging, json, os
 import openai
@@ -11,8 +12,13 @@ import numpy as np
 from redis.commands.search.query import Query
 from typing import Mapping
 from redis import Redis
+from Utilities.clientRegistry import getRedis, getSearchClient, withClient
+from Utilities.ndjsonStream import deltaEvent
 import pinecone
-from functools import reduce
+from functools import reduce, partial
+from Utilities.fusion import fanOut, reciprocalRankFusion, getRetrievalTargets
+from Utilities.embeddingCache import getEmbeddingCache, cacheKey, toBytes, fromBytes
+from Utilities.localIndex import getLocalIndex
 
 class ChatGptStream:
 
@@ -33,11 +39,22 @@ class ChatGptStream:
         self.PineconeKey = PineconeKey
         self.PineconeEnv = PineconeEnv
         self.PineconeIndex = PineconeIndex
+        redisConnection = getRedis(RedisAddress, RedisPort, RedisPassword) if RedisAddress else None
+        self.embeddingCache = getEmbeddingCache(redisConnection)
 
+    # Function to generate embeddings for the query, served from the embedding cache when the text was seen before
+    def generateEmbeddings(self, embeddingModelType, text):
+        model = self.OpenAiEmbedding if embeddingModelType == 'azureopenai' else "text-embedding-ada-002"
+        key = cacheKey(model, text)
+        cached = self.embeddingCache.getMany([key])
+        if key in cached:
+            return fromBytes(cached[key])
+        embeddings = self.createEmbeddings(embeddingModelType, text)
+        self.embeddingCache.setMany({key: toBytes(embeddings)})
+        return embeddings
 
     @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
-    # Function to generate embeddings for title and content fields, also used for query embeddings
-    def generateEmbeddings(self, embeddingModelType, text):
+    def createEmbeddings(self, embeddingModelType, text):
         if (embeddingModelType == 'azureopenai'):
             openai.api_type = "azure"
             openai.api_key = self.OpenAiKey
@@ -64,44 +81,44 @@ class ChatGptStream:
         return embeddings
     
     def performCogSearch(self, indexType, embeddingModelType, question, indexName, k, returnFields=["id", "content", "sourcefile"] ):
-        searchClient = SearchClient(endpoint=f"https://{self.SearchService}.search.windows.net",
-            index_name=indexName,
-            credential=AzureKeyCredential(self.SearchKey))
-        try:
+        # Search results are paged lazily, so they are read inside the search for withClient to see a failed request
+        def search(searchClient):
             if indexType == "cogsearchvs":
-                r = searchClient.search(  
+                return list(searchClient.search(  
                     search_text="",  
-                    vector=Vector(value=self.generateEmbeddings(embeddingModelType, question), k=k, fields="contentVector"),  
+                    vector=Vector(value=queryVector, k=k, fields="contentVector"),  
                     select=returnFields,
                     semantic_configuration_name="semanticConfig"
-                )
+                ))
             elif indexType == "cogsearch":
                 #r = searchClient.search(question, filter=None, top=k)
                 try:
-                    r = searchClient.search(question, 
+                    return list(searchClient.search(question, 
                                         filter=None,
                                         query_type=QueryType.SEMANTIC, 
                                         query_language="en-us", 
                                         query_speller="lexicon", 
                                         semantic_configuration_name="semanticConfig", 
                                         top=k, 
-                                        query_caption="extractive|highlight-false")
+                                        query_caption="extractive|highlight-false"))
                 except Exception as e:
-                    r = searchClient.search(question, 
+                    return list(searchClient.search(question, 
                                     filter=None,
                                     query_type=QueryType.SEMANTIC, 
                                     query_language="en-us", 
                                     query_speller="lexicon", 
                                     semantic_configuration_name="default", 
                                     top=k, 
-                                    query_caption="extractive|highlight-false")
-            return r       
+                                    query_caption="extractive|highlight-false"))
+        try:
+            queryVector = self.generateEmbeddings(embeddingModelType, question) if indexType == "cogsearchvs" else None
+            return withClient(getSearchClient, (self.SearchService, self.SearchKey, indexName), search)
         except Exception as e:
             logging.info(e)
             return None
 
     def performRedisSearch(self, question, indexName, k, returnField, vectorField, embeddingModelType):
-        redisConnection = Redis(host= self.RedisAddress, port=self.RedisPort, password=self.RedisPassword) #api for Docker localhost for local execution
+        redisConnection = getRedis(self.RedisAddress, self.RedisPort, self.RedisPassword)
         question = question.replace("\n", " ")
 
         embeddingQuery = self.generateEmbeddings(embeddingModelType, question)
@@ -135,46 +152,7 @@ class ChatGptStream:
     
     def getStreamMessageFromHistory(self, systemPrompt: str, modelId: str, history: Sequence[dict[str, str]], 
                            userConv: str, fewShots = [], maxTokens: int = 4096):
-        messages = []
-        messages.append({'role': 'system', 'content': systemPrompt})
-        tokenLength = numTokenFromMessages(messages[-1], modelId)
-
-        # Add examples to show the chat what responses we want. It will try to mimic any responses and make sure they match the rules laid out in the system message.
-        for shot in fewShots:
-            messages.insert(1, {'role': shot.get('role'), 'content': shot.get('content')})
-
-        userContent = userConv
-        appendIndex = len(fewShots) + 1
-
-        messages.insert(appendIndex, {'role': "user", 'content': userContent})
-
-        for h in reversed(history[:-1]):
-            if h.get("bot"):
-                messages.insert(appendIndex, {'role': "assistant", 'content': h.get('bot')})
-            messages.insert(appendIndex, {'role': "user", 'content': h.get('user')})
-            tokenLength += numTokenFromMessages(messages[appendIndex], modelId)
-            if tokenLength > maxTokens:
-                break
-
-        # messageBuilder = MessageBuilder(systemPrompt, modelId)
-
-        # for shot in fewShots:
-        #     messageBuilder.append_message(shot.get('role'), shot.get('content'))
-
-        # userContent = userConv
-        # appendIndex = len(fewShots) + 1
-
-        # messageBuilder.append_message("user", userContent, index=appendIndex)
-
-        # for h in reversed(history[:-1]):
-        #     if h.get("bot"):
-        #         messageBuilder.append_message("assistant", h.get('bot'), index=appendIndex)
-        #     messageBuilder.append_message("user", h.get('user'), index=appendIndex)
-        #     if messageBuilder.token_length > maxTokens:
-        #         break
-        # messages = messageBuilder.messages
-
-        return messages
+        return getMessagesFromHistory(systemPrompt, modelId, history, userConv, fewShots, maxTokens)
     
     def performPineconeSearch(self, question, indexName, k, embeddingModelType):
         pinecone.init(
@@ -190,6 +168,27 @@ class ChatGptStream:
             )
         return results
 
+    def performLocalSearch(self, question, indexName, k, embeddingModelType):
+        return getLocalIndex(indexName).search(self.generateEmbeddings(embeddingModelType, question), k)
+
+    def searchIndex(self, indexType, indexNs, q, topK, embeddingModelType):
+        """Search one index and return (content, source) pairs, best first."""
+        if indexType == 'redis':
+            returnField = ["metadata", "content", "vector_score"]
+            vectorField = "content_vector"
+            r = self.performRedisSearch(q, indexNs, topK, returnField, vectorField, embeddingModelType)
+            return [(self.noNewLines(result.content), result.metadata.source) for result in r.docs]
+        elif indexType == 'pinecone':
+            r = self.performPineconeSearch(q, indexNs, topK, embeddingModelType)
+            return [(self.noNewLines(result['metadata']['text']), result['metadata']['source']) for result in r['matches']]
+        elif indexType == "cogsearch" or indexType == "cogsearchvs":
+            r = self.performCogSearch(indexType, embeddingModelType, q, indexNs, topK)
+            return [(self.noNewLines(doc["content"]), doc["sourcefile"]) for doc in r]
+        elif indexType == "local":
+            r = self.performLocalSearch(q, indexNs, topK, embeddingModelType)
+            return [(self.noNewLines(record["content"]), record["metadata"].get("source")) for record, score in r]
+        return []
+
     def run(self, indexType, indexNs, postBody):
         body = json.dumps(postBody)
         values = json.loads(body)['values']
@@ -232,6 +231,9 @@ class ChatGptStream:
                 gptModel = "gpt-3.5-turbo-16k"
 
         tokenLimit = getTokenLimit(gptModel)
+        # Completion sizes of the search query and the answer; the history builder counts the prompts themselves
+        queryTokens = 32
+        answerTokens = 1024
         # STEP 1: Generate an optimized keyword search query based on the chat history and the last question
         messages = self.getStreamMessageFromHistory(
                 systemTemplate,
@@ -239,7 +241,7 @@ class ChatGptStream:
                 history,
                 'Generate search query for: ' + lastQuestion,
                 [],
-                tokenLimit - len('Generate search query for: ' + lastQuestion) - tokenLength
+                tokenLimit - queryTokens
                 )
         
         if (embeddingModelType == 'azureopenai'):
@@ -254,7 +256,7 @@ class ChatGptStream:
                     model=gptModel,
                     messages=messages, 
                     temperature=0.0, 
-                    max_tokens=32, 
+                    max_tokens=queryTokens, 
                     n=1)
                 
             elif deploymentType == "gpt3516k":
@@ -263,7 +265,7 @@ class ChatGptStream:
                     model=gptModel,
                     messages=messages, 
                     temperature=0.0, 
-                    max_tokens=32, 
+                    max_tokens=queryTokens, 
                     n=1)
 
             logging.info("LLM Setup done")
@@ -277,7 +279,7 @@ class ChatGptStream:
                     model=gptModel,
                     messages=messages, 
                     temperature=0.0, 
-                    max_tokens=32, 
+                    max_tokens=queryTokens, 
                     n=1)
         try:
             if len(history) > 1:
@@ -297,6 +299,9 @@ class ChatGptStream:
             q = lastQuestion
             print(e)
 
+        # The rewritten query goes out before retrieval starts, so the UI can show progress immediately
+        yield {"query": q}
+
         try:
             if promptTemplate == '':
                 template = """
@@ -317,29 +322,18 @@ class ChatGptStream:
             Only generate questions and do not generate any text before or after the questions, such as 'Next Questions'
             """
 
-            results = []
-
-            uniqueSources = []
-            if indexType == 'redis':
-                returnField = ["metadata", "content", "vector_score"]
-                vectorField = "content_vector"
-                r = self.performRedisSearch(q, indexNs, topK, returnField, vectorField, embeddingModelType)
-                results = [" : " + self.noNewLines(result.content) for result in r.docs]
-                sources = [result.metadata.source for result in r.docs]
-                uniqueSources = list(set(sources))
-            elif indexType == 'pinecone':
-                r = self.performPineconeSearch(q, indexNs, topK, embeddingModelType)
-                #results = [result['metadata']['source'] + " : " + self.noNewLines(result['metadata']['text']) for result in r['matches']]
-                results = [self.noNewLines(result['metadata']['text']) for result in r['matches']]
-                sources = [result['metadata']['source'] for result in r['matches']]
-                uniqueSources = list(set(sources))
-            elif indexType == "cogsearch" or indexType == "cogsearchvs":
-                r = self.performCogSearch(indexType, embeddingModelType, q, indexNs, topK)
-                sr = self.performCogSearch(indexType, embeddingModelType, q, indexNs, topK)
-                sources = [doc["sourcefile"] for doc in sr]
-                #results = [doc["sourcefile"] + " : " + self.noNewLines(doc["content"]) for doc in r]
-                results = [self.noNewLines(doc["content"]) for doc in r]
-                uniqueSources = list(set(sources))
+            # Extra indexes in overrides["indexes"] are searched concurrently and fused with this one
+            targets = getRetrievalTargets(indexType, indexNs, overrides)
+            if len(targets) > 1:
+                searches = [(f"{target['indexType']}:{target.get('indexNs')}",
+                             partial(self.searchIndex, target["indexType"], target.get("indexNs"), q, topK, embeddingModelType),
+                             target.get("timeout")) for target in targets]
+                found, report = fanOut(searches)
+                hits = [entry["item"] for entry in reciprocalRankFusion(found, lambda hit: hit[0], topK)]
+            else:
+                hits = self.searchIndex(indexType, indexNs, q, topK, embeddingModelType)
+            results = [content for content, source in hits]
+            uniqueSources = list(set(source for content, source in hits))
 
             if len(uniqueSources) > 1:
                 finalSources = reduce(lambda x, y: str(x) + "," + str(y), uniqueSources)
@@ -358,7 +352,7 @@ class ChatGptStream:
                 history,
                 lastQuestion,
                 [],
-                tokenLimit
+                tokenLimit - answerTokens
             )
 
             msgToDisplay  = '\n\n'.join([str(message) for message in messages])
@@ -374,21 +368,21 @@ class ChatGptStream:
                 openai.api_base = self.OpenAiEndPoint
 
                 if deploymentType == 'gpt35':
-                    yield from openai.ChatCompletion.create(
+                    completion = openai.ChatCompletion.create(
                         deployment_id=self.OpenAiChat,
                         model=gptModel,
                         messages=messages, 
                         temperature=temperature, 
-                        max_tokens=1024, 
+                        max_tokens=answerTokens, 
                         n=1,
                         stream=True)
                 elif deploymentType == "gpt3516k":
-                    yield from openai.ChatCompletion.create(
+                    completion = openai.ChatCompletion.create(
                         deployment_id=self.OpenAiChat16k,
                         model=gptModel,
                         messages=messages, 
                         temperature=temperature, 
-                        max_tokens=1024, 
+                        max_tokens=answerTokens, 
                         n=1,
                         stream=True)
                 logging.info("LLM Setup done")
@@ -397,14 +391,19 @@ class ChatGptStream:
                 openai.api_base = "https://api.openai.com/v1"
                 openai.api_version = '2020-11-07' 
                 openai.api_key = self.OpenAiApiKey
-                yield from openai.ChatCompletion.create(
+                completion = openai.ChatCompletion.create(
                         deployment_id=self.OpenAiChat,
                         model=gptModel,
                         messages=messages, 
                         temperature=temperature, 
-                        max_tokens=1024, 
+                        max_tokens=answerTokens, 
                         n=1,
                         stream=True)
+            # Only the text of each chunk is forwarded; the writer merges consecutive deltas into one frame
+            for chunk in completion:
+                event = deltaEvent(chunk)
+                if event is not None:
+                    yield event
             # yield from openai.ChatCompletion.create(
             #         deployment_id=self.OpenAiChat,
             #         model=gptModel,
@@ -0,0 +1,291 @@
+"""Content-addressed embedding cache with an in-process LRU tier and an optional shared tier."""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+
+_cache = None
+_cacheLock = threading.Lock()
+
+def cacheKey(model: str, text: str) -> bytes:
+    """Key a vector by the embedding deployment and the whitespace-normalized text."""
+    normalized = " ".join(str(text).split())
+    return hashlib.sha256((model + "\n" + normalized).encode("utf-8")).digest()
+
+def toBytes(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def fromBytes(data: bytes) -> list:
+    return np.frombuffer(data, dtype=np.float32).tolist()
+
+class LruTier:
+    """In-process tier bounded by the total number of vector bytes it holds."""
+
+    def __init__(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.evictions = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def getMany(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                value = self.entries.get(key)
+                if value is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = value
+        return found
+
+    def setMany(self, items):
+        with self.lock:
+            for key, value in items.items():
+                previous = self.entries.pop(key, None)
+                if previous is not None:
+                    self.size -= len(previous)
+                self.entries[key] = value
+                self.size += len(value)
+            while self.size > self.maxBytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+class MmapTier:
+    """
+      Fixed-size, memory-mapped file shared by every worker process on the host.
+      The file is a 4-way set-associative table of (16-byte key, float32 vector) slots, so its size
+      never grows past capacity and a full set evicts one of its slots at random.
+      A header records the vector dimensions and set count; without configured dimensions the file is
+      created on the first write, sized for that vector. Writers hold an exclusive lock on a sibling lock file.
+      """
+    ways = 4
+    keyBytes = 16
+    magic = b"EMBCACHE"
+    headerBytes = 16
+
+    def __init__(self, path: str, capacity: int, dimensions: int = None):
+        self.path = path
+        self.capacity = capacity
+        self.dimensions = None
+        self.map = None
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.lockFile = open(path + ".lock", "a")
+        with self._writeLock():
+            self._open(dimensions)
+
+    @contextmanager
+    def _writeLock(self):
+        # flock does not exclude threads sharing the lock file, so the thread lock is taken first
+        with self.lock:
+            fcntl.flock(self.lockFile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.lockFile, fcntl.LOCK_UN)
+
+    def _open(self, dimensions):
+        """Map the file, creating it for dimensions if it has no header yet. Called with the write lock held."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        try:
+            size = os.fstat(fd).st_size
+            if size >= self.headerBytes:
+                header = os.pread(fd, self.headerBytes, 0)
+                if header[:len(self.magic)] != self.magic:
+                    raise ValueError(self.path + " is not an embedding cache file")
+                fileDimensions, sets = struct.unpack("<II", header[len(self.magic):])
+                if dimensions is not None and fileDimensions != dimensions:
+                    raise ValueError(f"{self.path} holds {fileDimensions}-dimension vectors, expected {dimensions}")
+                dimensions = fileDimensions
+            elif dimensions is None:
+                return
+            else:
+                sets = max(1, self.capacity // self.ways)
+            slotBytes = self.keyBytes + dimensions * 4
+            fileBytes = self.headerBytes + sets * self.ways * slotBytes
+            if size != fileBytes:
+                os.ftruncate(fd, fileBytes)
+            if size < self.headerBytes:
+                os.pwrite(fd, self.magic + struct.pack("<II", dimensions, sets), 0)
+            self.map = mmap.mmap(fd, fileBytes)
+        finally:
+            os.close(fd)
+        self.dimensions = dimensions
+        self.vectorBytes = dimensions * 4
+        self.slotBytes = slotBytes
+        self.sets = sets
+
+    def _ready(self):
+        """Whether the file is mapped, mapping it if another process has created it since."""
+        if self.map is None and os.path.exists(self.path) and os.path.getsize(self.path) >= self.headerBytes:
+            with self._writeLock():
+                if self.map is None:
+                    self._open(None)
+        return self.map is not None
+
+    def _slots(self, key):
+        start = (int.from_bytes(key[:8], "little") % self.sets) * self.ways
+        return [self.headerBytes + (start + way) * self.slotBytes for way in range(self.ways)]
+
+    def getMany(self, keys):
+        found = {}
+        if not self._ready():
+            return found
+        for key in keys:
+            tag = key[:self.keyBytes]
+            for offset in self._slots(key):
+                if self.map[offset:offset + self.keyBytes] == tag:
+                    value = self.map[offset + self.keyBytes:offset + self.slotBytes]
+                    # A concurrent writer clears the tag first, so re-check it after copying the vector
+                    if self.map[offset:offset + self.keyBytes] == tag:
+                        found[key] = value
+                    break
+        return found
+
+    def setMany(self, items):
+        if not items:
+            return
+        empty = bytes(self.keyBytes)
+        with self._writeLock():
+            if self.map is None:
+                self._open(len(next(iter(items.values()))) // 4)
+            for key, value in items.items():
+                if len(value) != self.vectorBytes:
+                    continue
+                tag = key[:self.keyBytes]
+                slots = self._slots(key)
+                target = None
+                for offset in slots:
+                    current = self.map[offset:offset + self.keyBytes]
+                    if current == tag or current == empty:
+                        target = offset
+                        break
+                if target is None:
+                    target = random.choice(slots)
+                    self.evictions += 1
+                self.map[target:target + self.keyBytes] = empty
+                self.map[target + self.keyBytes:target + self.slotBytes] = value
+                self.map[target:target + self.keyBytes] = tag
+
+class RedisTier:
+    """Shared tier on Redis; a sorted set of last-access times bounds it to maxEntries vectors."""
+
+    def __init__(self, redisConnection, maxEntries: int, prefix: str = "embcache"):
+        self.redis = redisConnection
+        self.maxEntries = maxEntries
+        self.prefix = prefix
+        self.lruKey = prefix + ":lru"
+        self.evictions = 0
+
+    def _key(self, key):
+        return self.prefix + ":" + key.hex()
+
+    def getMany(self, keys):
+        if not keys:
+            return {}
+        values = self.redis.mget([self._key(key) for key in keys])
+        found = {key: value for key, value in zip(keys, values) if value is not None}
+        if found:
+            now = time.time()
+            self.redis.zadd(self.lruKey, {self._key(key): now for key in found})
+        return found
+
+    def setMany(self, items):
+        if not items:
+            return
+        now = time.time()
+        pipeline = self.redis.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.set(self._key(key), value)
+        pipeline.zadd(self.lruKey, {self._key(key): now for key in items})
+        pipeline.zcard(self.lruKey)
+        overflow = pipeline.execute()[-1] - self.maxEntries
+        if overflow > 0:
+            evicted = [member for member, _ in self.redis.zpopmin(self.lruKey, overflow)]
+            if evicted:
+                self.redis.delete(*evicted)
+                self.evictions += len(evicted)
+
+class EmbeddingCache:
+    """
+      Looks vectors up in the LRU tier, then the shared tier, and promotes shared hits into the LRU tier.
+      Vectors are kept as float32 bytes so a hit costs no parsing.
+      """
+
+    def __init__(self, lruTier: LruTier, sharedTier=None):
+        self.lruTier = lruTier
+        self.sharedTier = sharedTier
+        self.lruHits = 0
+        self.sharedHits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def getMany(self, keys):
+        found = self.lruTier.getMany(keys)
+        sharedFound = {}
+        if self.sharedTier is not None and len(found) < len(keys):
+            try:
+                sharedFound = self.sharedTier.getMany([key for key in keys if key not in found])
+            except Exception as e:
+                logging.info("Embedding cache shared tier lookup failed: " + str(e))
+            if sharedFound:
+                self.lruTier.setMany(sharedFound)
+                found.update(sharedFound)
+        with self.lock:
+            self.lruHits += len(found) - len(sharedFound)
+            self.sharedHits += len(sharedFound)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def setMany(self, items):
+        self.lruTier.setMany(items)
+        if self.sharedTier is not None:
+            try:
+                self.sharedTier.setMany(items)
+            except Exception as e:
+                logging.info("Embedding cache shared tier write failed: " + str(e))
+
+    def stats(self):
+        return {"lruHits": self.lruHits, "sharedHits": self.sharedHits, "misses": self.misses,
+                "lruBytes": self.lruTier.size, "lruEntries": len(self.lruTier.entries),
+                "lruEvictions": self.lruTier.evictions,
+                "sharedEvictions": self.sharedTier.evictions if self.sharedTier is not None else 0}
+
+def getEmbeddingCache(redisConnection=None):
+    """
+    Return the process-wide embedding cache, configured from the environment on first use.
+    EmbeddingCacheMb bounds the LRU tier, EmbeddingCacheTier selects the shared tier ("mmap" or "redis"),
+    EmbeddingCachePath and EmbeddingCacheEntries size the shared tier, and EmbeddingDimensions, when set, is checked
+    against the dimensions of an existing mmap file.
+    """
+    global _cache
+    with _cacheLock:
+        if _cache is None:
+            maxBytes = int(os.environ.get("EmbeddingCacheMb", "64")) * 1024 * 1024
+            tierType = os.environ.get("EmbeddingCacheTier", "").lower()
+            maxEntries = int(os.environ.get("EmbeddingCacheEntries", "10000"))
+            sharedTier = None
+            try:
+                if tierType == "mmap":
+                    path = os.environ.get("EmbeddingCachePath", os.path.join(tempfile.gettempdir(), "embeddingCache.bin"))
+                    dimensions = os.environ.get("EmbeddingDimensions")
+                    sharedTier = MmapTier(path, maxEntries, int(dimensions) if dimensions else None)
+                elif tierType == "redis":
+                    if redisConnection is None:
+                        from Utilities.redisIndex import getRedisConnection
+                        redisConnection = getRedisConnection()
+                    sharedTier = RedisTier(redisConnection, maxEntries)
+            except Exception as e:
+                logging.info("Embedding cache shared tier not available, using in-process cache only: " + str(e))
+            _cache = EmbeddingCache(LruTier(maxBytes), sharedTier)
+    return _cache
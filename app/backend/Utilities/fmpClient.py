@@ -0,0 +1,198 @@
+"""Shared FMP HTTP client: one pooled session, per-endpoint response TTLs, coalesced in-flight requests and a rate limit."""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import requests
+from requests.adapters import HTTPAdapter
+from Utilities.clientRegistry import getClient
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# FMP starter plans allow 300 calls a minute
+FMP_REQUESTS_PER_MINUTE = 300
+FMP_MAX_CONCURRENT = 8
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+# Seconds a response stays fresh, by the first path segment of the endpoint
+ENDPOINT_TTLS = {
+    "profile": DAY,
+    "key-executives": DAY,
+    "income-statement": 7 * DAY,
+    "balance-sheet-statement": 7 * DAY,
+    "cash-flow-statement": 7 * DAY,
+    "income-statement-growth": 7 * DAY,
+    "balance-sheet-statement-growth": 7 * DAY,
+    "cash-flow-statement-growth": 7 * DAY,
+    "income-statement-as-reported": 7 * DAY,
+    "balance-sheet-statement-as-reported": 7 * DAY,
+    "cash-flow-statement-as-reported": 7 * DAY,
+    "financial-statement-full-as-reported": 7 * DAY,
+    "financial-growth": 7 * DAY,
+    "ratios": 7 * DAY,
+    "key-metrics": 7 * DAY,
+    "enterprise-values": 7 * DAY,
+    "earnings-surprises": DAY,
+    "rating": DAY,
+    "historical-rating": DAY,
+    "score": DAY,
+    "esg-environmental-social-governance-data": DAY,
+    "esg-environmental-social-governance-data-ratings": DAY,
+    "upgrades-downgrades-consensus": DAY,
+    "price-target-consensus": DAY,
+    "sec_filings": HOUR,
+    "earning_call_transcript": HOUR,
+    "batch_earning_call_transcript": DAY,
+    "stock_news": 5 * MINUTE,
+    "press-releases": 15 * MINUTE,
+    "social-sentiment": 15 * MINUTE,
+    "mapper-cik-name": 7 * DAY,
+    "mapper-cik-company": 7 * DAY,
+    "cik_list": 7 * DAY,
+}
+DEFAULT_TTL = 10 * MINUTE
+# A transcript for a given quarter never changes once published
+TRANSCRIPT_TTL = 30 * DAY
+
+def responseTtl(url, params):
+    endpoint = url.split("/api/", 1)[-1].split("/", 2)[1] if "/api/" in url else url
+    if endpoint == "earning_call_transcript" and "quarter" in params:
+        return TRANSCRIPT_TTL
+    return ENDPOINT_TTLS.get(endpoint, DEFAULT_TTL)
+
+class _Entry:
+    def __init__(self, content, expiresAt, etag, lastModified):
+        self.content = content
+        self.expiresAt = expiresAt
+        self.etag = etag
+        self.lastModified = lastModified
+
+class RateLimiter:
+    """Spaces requests evenly so that no more than perMinute of them start in any minute, across threads."""
+
+    def __init__(self, perMinute):
+        self.interval = 60.0 / perMinute if perMinute else 0.0
+        self.nextSlot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.nextSlot - now
+            self.nextSlot = max(now, self.nextSlot) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+class FmpClient:
+    """
+      Thread-safe FMP client shared by the process. Successful responses are cached as raw bytes for the TTL of
+      their endpoint (bounded by maxBytes, least recently used first) and revalidated with If-None-Match or
+      If-Modified-Since when FMP sent validators. Concurrent requests for the same URL share one call.
+      """
+
+    def __init__(self, perMinute=FMP_REQUESTS_PER_MINUTE, maxConcurrent=FMP_MAX_CONCURRENT, maxBytes=64 * 1024 * 1024, retries=2):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=maxConcurrent)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.limiter = RateLimiter(perMinute)
+        self.slots = threading.BoundedSemaphore(maxConcurrent)
+        self.maxBytes = maxBytes
+        self.retries = retries
+        self.size = 0
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "coalesced": 0, "requests": 0}
+
+    def close(self):
+        self.session.close()
+
+    def request(self, url, params, headers=None):
+        """One rate-limited GET over the pooled session, retried when FMP answers 429."""
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            with self.slots:
+                self.stats["requests"] += 1
+                response = self.session.get(url, params=params, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if response.status_code != 429 or attempt == self.retries:
+                return response
+            retryAfter = response.headers.get("Retry-After", "")
+            time.sleep(int(retryAfter) if retryAfter.isdigit() else 2 ** attempt)
+
+    def getJson(self, url, params):
+        """The decoded JSON body of url, or None when it is empty. Raises the requests exceptions of the call."""
+        content = self.getContent(url, params)
+        return json.loads(content) if len(content) > 0 else None
+
+    def getContent(self, url, params):
+        key = url + "?" + "&".join(f"{k}={params[k]}" for k in sorted(params))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expiresAt > time.monotonic():
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.content
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            content = self._fetch(key, url, params, entry)
+            future.set_result(content)
+            return content
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def _fetch(self, key, url, params, stale):
+        headers = {}
+        if stale is not None and stale.etag:
+            headers["If-None-Match"] = stale.etag
+        if stale is not None and stale.lastModified:
+            headers["If-Modified-Since"] = stale.lastModified
+        response = self.request(url, params, headers)
+        ttl = responseTtl(url, params)
+        if response.status_code == 304 and stale is not None:
+            self.stats["revalidated"] += 1
+            self._store(key, _Entry(stale.content, time.monotonic() + ttl, stale.etag, stale.lastModified))
+            return stale.content
+        content = response.content
+        if response.status_code == 200:
+            self._store(key, _Entry(content, time.monotonic() + ttl, response.headers.get("ETag"), response.headers.get("Last-Modified")))
+        else:
+            logging.warning(f"FMP returned {response.status_code} for {url}; not caching the response")
+        return content
+
+    def _store(self, key, entry):
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.content)
+            self.entries[key] = entry
+            self.size += len(entry.content)
+            while self.size > self.maxBytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.content)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+def fmpClient():
+    """The FMP client shared by every request served by this process."""
+    return getClient("fmp", "default", FmpClient)
@@ -0,0 +1,362 @@
+"""In-process vector index on memory-mapped float32 files, for tenants that do not need a search service."""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from Utilities.clientRegistry import getClient, resetClient
+
+INITIAL_CAPACITY = 1024
+# Below this many rows every query scans all vectors; above it rows are grouped into clusters around trained
+# centroids, stored cluster by cluster, and a query only scans the CLUSTER_PROBES clusters nearest to it
+CLUSTER_THRESHOLD = 4096
+CLUSTER_PROBES = 8
+KMEANS_ITERATIONS = 8
+# The files are rewritten once deleted rows, or rows appended since the last rewrite, are this fraction of the index
+COMPACT_RATIO = 0.25
+
+def localIndexRoot():
+    """LocalIndexPath should be a share mounted on every instance when the function app scales out."""
+    return os.environ.get("LocalIndexPath") or os.path.join(tempfile.gettempdir(), "localindex")
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+def trainCentroids(vectors, lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means over a sample of at most 64 rows per list, enough to place the centroids."""
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), lists * 64), replace=False))]
+    centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = np.bincount(assignments, minlength=lists) == 0
+        # A centroid that lost all its rows restarts on a random sample row
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+def assignClusters(vectors, centroids, batch=8192):
+    return np.concatenate([np.argmax(vectors[i:i + batch] @ centroids.T, axis=1).astype(np.int32)
+                           for i in range(0, len(vectors), batch)]) if len(vectors) else np.zeros(0, dtype=np.int32)
+
+class LocalIndex:
+    """
+      One namespace under root/<namespace>, written by storeIndex and searched by the retrieval paths:
+          index.json               dimensions, row count, deleted count and the generation of the files below
+          vectors.<gen>.f32        unit-normalized float32 rows, memory-mapped and grown by doubling
+          deleted.<gen>.u8         one tombstone byte per row
+          rows.<gen>.jsonl         id, content and metadata of each row, appended in row order
+          centroids.<gen>.f32      cluster centroids once the index passes CLUSTER_THRESHOLD rows
+          clusters.<gen>.i32       the cluster of each row
+      Compaction writes the live rows as a new generation, sorted by cluster so that each cluster is one contiguous
+      slice of the vector file; rows added since then form an unsorted tail until the next compaction.
+      index.json is replaced atomically after the other files are written, so a reader in another process only
+      sees rows that are complete. Writers across processes are serialized by a lock file.
+      """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.headerStat = None
+        self.header = {"dimensions": None, "count": 0, "deleted": 0, "generation": 0, "lists": 0, "sorted": 0,
+                       "trainedCount": 0}
+        self.capacity = 0
+        self.vectors = None
+        self.deleted = None
+        self.clusters = None
+        self.centroids = None
+        self.clusterRows = None
+        self.records = []
+        self.rowsOffset = 0
+        self.rowIds = {}
+        self.writeDepth = 0
+        self.lockFile = None
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, name, generation=None):
+        stem, extension = name.split(".")
+        generation = self.header["generation"] if generation is None else generation
+        return os.path.join(self.path, f"{stem}.{generation}.{extension}")
+
+    def _map(self, name, dtype, shape):
+        return np.memmap(self._file(name), dtype=dtype, mode="r+", shape=shape) if shape[0] else None
+
+    def _refresh(self):
+        """Pick up whatever another process or thread committed since the last call; costs one stat when nothing did."""
+        try:
+            stat = os.stat(os.path.join(self.path, "index.json"))
+        except FileNotFoundError:
+            return
+        current = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if current == self.headerStat:
+            return
+        with open(os.path.join(self.path, "index.json")) as f:
+            header = json.load(f)
+        if header["generation"] != self.header["generation"] or header["count"] < len(self.records):
+            self.records, self.rowsOffset, self.rowIds = [], 0, {}
+        self.header = header
+        self.headerStat = current
+        dimensions, count = header["dimensions"], header["count"]
+        self.capacity = os.path.getsize(self._file("vectors.f32")) // (4 * dimensions)
+        self.vectors = self._map("vectors.f32", np.float32, (self.capacity, dimensions))
+        self.deleted = self._map("deleted.u8", np.uint8, (self.capacity,))
+        with open(self._file("rows.jsonl"), "rb") as f:
+            f.seek(self.rowsOffset)
+            while len(self.records) < count:
+                line = f.readline()
+                self.rowsOffset += len(line)
+                record = json.loads(line)
+                if not self.deleted[len(self.records)]:
+                    self.rowIds[record["id"]] = len(self.records)
+                self.records.append(record)
+        if header["lists"]:
+            self.centroids = np.fromfile(self._file("centroids.f32"), dtype=np.float32).reshape(header["lists"], dimensions)
+            self.clusters = self._map("clusters.i32", np.int32, (self.capacity,))
+            self._groupClusters()
+        else:
+            self.centroids = self.clusters = self.clusterRows = None
+
+    def _groupClusters(self):
+        # The start of each cluster in the sorted rows, and the clusters of the unsorted tail
+        sortedRows, count = self.header["sorted"], self.header["count"]
+        starts = np.concatenate([[0], np.cumsum(np.bincount(self.clusters[:sortedRows], minlength=self.header["lists"]))])
+        self.clusterRows = (starts, sortedRows, np.array(self.clusters[sortedRows:count]))
+
+    def _writeHeader(self):
+        headerPath = os.path.join(self.path, "index.json")
+        with open(headerPath + ".tmp", "w") as f:
+            json.dump(self.header, f)
+        os.replace(headerPath + ".tmp", headerPath)
+        stat = os.stat(headerPath)
+        self.headerStat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _writer(self):
+        return _WriteLock(self)
+
+    def _grow(self, needed):
+        dimensions = self.header["dimensions"]
+        capacity = max(INITIAL_CAPACITY, self.capacity)
+        while capacity < needed:
+            capacity *= 2
+        for name, width in (("vectors.f32", 4 * dimensions), ("deleted.u8", 1), ("clusters.i32", 4)):
+            if name == "clusters.i32" and not self.header["lists"]:
+                continue
+            with open(self._file(name), "ab") as f:
+                f.truncate(capacity * width)
+        self.capacity = capacity
+        self.vectors = self._map("vectors.f32", np.float32, (capacity, dimensions))
+        self.deleted = self._map("deleted.u8", np.uint8, (capacity,))
+        if self.header["lists"]:
+            self.clusters = self._map("clusters.i32", np.int32, (capacity,))
+
+    def add(self, ids, vectors, records):
+        """
+        Append rows; records are {"content", "metadata"} dicts. An id already in the index is replaced, its old
+        row tombstoned. Returns the number of rows added.
+        """
+        vectors = normalize(vectors)
+        if len(ids) == 0:
+            return 0
+        with self._writer():
+            if self.header["dimensions"] is None:
+                self.header["dimensions"] = int(vectors.shape[1])
+                open(self._file("rows.jsonl"), "ab").close()
+            elif vectors.shape[1] != self.header["dimensions"]:
+                raise ValueError(f"Index {self.path} holds {self.header['dimensions']}-dimension vectors, got {vectors.shape[1]}")
+            self._tombstone([id for id in ids if id in self.rowIds])
+            start = self.header["count"]
+            end = start + len(ids)
+            if end > self.capacity:
+                self._grow(end)
+            self.vectors[start:end] = vectors
+            self.vectors.flush()
+            if self.header["lists"]:
+                self.clusters[start:end] = assignClusters(vectors, self.centroids)
+                self.clusters.flush()
+            lines = []
+            for row, (id, record) in enumerate(zip(ids, records), start):
+                record = {"id": id, "content": record.get("content", ""), "metadata": record.get("metadata") or {}}
+                self.rowIds[id] = row
+                self.records.append(record)
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+            data = "".join(lines).encode("utf-8")
+            with open(self._file("rows.jsonl"), "ab") as f:
+                f.write(data)
+            self.rowsOffset += len(data)
+            self.header["count"] = end
+            if self.header["lists"]:
+                self._groupClusters()
+            self._writeHeader()
+            # Clusters are retrained as the index doubles, so their size stays near sqrt(rows)
+            live = end - self.header["deleted"]
+            if live >= CLUSTER_THRESHOLD and live >= 2 * self.header["trainedCount"]:
+                self.compact(retrain=True)
+            elif self.header["lists"] and end - self.header["sorted"] > COMPACT_RATIO * self.header["sorted"]:
+                self.compact()
+        return len(ids)
+
+    def _tombstone(self, ids):
+        # Another process may have deleted a row after this one loaded it
+        rows = [row for row in (self.rowIds.pop(id) for id in ids if id in self.rowIds) if not self.deleted[row]]
+        if rows:
+            self.deleted[rows] = 1
+            self.deleted.flush()
+            self.header["deleted"] += len(rows)
+        return len(rows)
+
+    def delete(self, ids):
+        """Tombstone the rows of ids; searches skip them at once and compaction later drops them from the files."""
+        with self._writer():
+            removed = self._tombstone(ids)
+            if removed:
+                self._writeHeader()
+                if self.header["deleted"] > COMPACT_RATIO * self.header["count"]:
+                    self.compact()
+        return removed
+
+    def idsWhere(self, key, value):
+        """Ids of the live rows whose metadata[key] equals value, e.g. every chunk of one file."""
+        with self.lock:
+            self._refresh()
+            return [record["id"] for row, record in enumerate(self.records)
+                    if record["metadata"].get(key) == value and not self.deleted[row]]
+
+    def compact(self, retrain=False, lists=None):
+        """
+        Rewrite the index as the next generation of files, without its tombstoned rows and sorted by cluster.
+        retrain clusters the live rows afresh into lists (about sqrt(rows) by default) centroids.
+        """
+        with self._writer():
+            count = self.header["count"]
+            live = np.flatnonzero(self.deleted[:count] == 0)
+            centroids, assignments = self.centroids, None
+            if retrain:
+                lists = lists or max(1, int(np.sqrt(len(live))))
+                centroids = trainCentroids(np.asarray(self.vectors[live]), lists) if len(live) >= lists else None
+            if centroids is not None:
+                assignments = assignClusters(self.vectors[live], centroids) if retrain else np.asarray(self.clusters[live])
+                order = np.argsort(assignments, kind="stable")
+                live, assignments = live[order], assignments[order]
+            generation = self.header["generation"] + 1
+            capacity = max(INITIAL_CAPACITY, 1 << int(len(live) - 1).bit_length()) if len(live) else INITIAL_CAPACITY
+            vectors = np.zeros((capacity, self.header["dimensions"]), dtype=np.float32)
+            vectors[:len(live)] = self.vectors[live]
+            vectors.tofile(self._file("vectors.f32", generation))
+            np.zeros(capacity, dtype=np.uint8).tofile(self._file("deleted.u8", generation))
+            with open(self._file("rows.jsonl", generation), "wb") as f:
+                for row in live:
+                    f.write((json.dumps(self.records[row], ensure_ascii=False) + "\n").encode("utf-8"))
+            header = dict(self.header, generation=generation, count=int(len(live)), deleted=0, lists=0, sorted=0)
+            if centroids is not None:
+                centroids.tofile(self._file("centroids.f32", generation))
+                clusters = np.zeros(capacity, dtype=np.int32)
+                clusters[:len(live)] = assignments
+                clusters.tofile(self._file("clusters.i32", generation))
+                header.update(lists=len(centroids), sorted=int(len(live)))
+                if retrain:
+                    header["trainedCount"] = int(len(live))
+            self._commit(header)
+            logging.info(f"Compacted {self.path} from {count} to {len(live)} rows in {header['lists']} clusters")
+
+    def _commit(self, header):
+        previous = self.header["generation"]
+        self.header = header
+        self.records, self.rowsOffset, self.rowIds = [], 0, {}
+        self._writeHeader()
+        self.headerStat = None
+        self._refresh()
+        # Readers that still map the previous files keep them until they refresh; unlinking does not disturb them
+        for name in ("vectors.f32", "deleted.u8", "rows.jsonl", "centroids.f32", "clusters.i32"):
+            try:
+                os.remove(self._file(name, previous))
+            except FileNotFoundError:
+                pass
+
+    def search(self, vector, k, probes=CLUSTER_PROBES, withVectors=False):
+        """
+        The k nearest live rows to vector by cosine similarity, best first, as (record, score) pairs, or as
+        (record, score, storedVector) triples with withVectors.
+        """
+        with self.lock:
+            self._refresh()
+            count, deletedCount = self.header["count"], self.header["deleted"]
+            # Plain ndarray views of the maps skip np.memmap's per-slice bookkeeping
+            vectors, deleted, records = np.asarray(self.vectors), np.asarray(self.deleted), self.records
+            centroids, clusterRows = self.centroids, self.clusterRows
+        if count == 0 or k <= 0:
+            return []
+        query = normalize(vector)
+        if centroids is not None and probes < len(centroids):
+            starts, sortedRows, tail = clusterRows
+            nearest = np.argpartition(-(centroids @ query), probes)[:probes]
+            rows = [np.arange(starts[c], starts[c + 1]) for c in nearest]
+            scores = [vectors[starts[c]:starts[c + 1]] @ query for c in nearest]
+            if len(tail):
+                tailRows = sortedRows + np.flatnonzero(np.isin(tail, nearest))
+                rows.append(tailRows)
+                scores.append(vectors[tailRows] @ query)
+            rows, scores = np.concatenate(rows), np.concatenate(scores)
+        else:
+            rows, scores = np.arange(count), vectors[:count] @ query
+        if deletedCount:
+            keep = deleted[rows] == 0
+            rows, scores = rows[keep], scores[keep]
+        if len(rows) == 0:
+            return []
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        if withVectors:
+            return [(records[rows[i]], float(scores[i]), vectors[rows[i]].tolist()) for i in top]
+        return [(records[rows[i]], float(scores[i])) for i in top]
+
+    def stats(self):
+        with self.lock:
+            self._refresh()
+            return {"rows": self.header["count"] - self.header["deleted"], "deleted": self.header["deleted"],
+                    "capacity": self.capacity, "lists": self.header["lists"], "generation": self.header["generation"]}
+
+class _WriteLock:
+    """
+      The index's thread lock plus an exclusive lock on its lock file, with the index refreshed on entry.
+      Re-entrant, so add and delete can train or compact while they hold it.
+      """
+
+    def __init__(self, index):
+        self.index = index
+
+    def __enter__(self):
+        index = self.index
+        index.lock.acquire()
+        if index.writeDepth == 0:
+            index.lockFile = open(os.path.join(index.path, "write.lock"), "a")
+            fcntl.flock(index.lockFile, fcntl.LOCK_EX)
+            index._refresh()
+        index.writeDepth += 1
+        return index
+
+    def __exit__(self, *exc):
+        index = self.index
+        index.writeDepth -= 1
+        if index.writeDepth == 0:
+            fcntl.flock(index.lockFile, fcntl.LOCK_UN)
+            index.lockFile.close()
+            index.lockFile = None
+        index.lock.release()
+
+def getLocalIndex(nameSpace, root=None):
+    """The process-wide handle on a namespace's local index; its files are read lazily on the first search."""
+    path = os.path.join(root or localIndexRoot(), nameSpace)
+    return getClient("localindex", path, lambda: LocalIndex(path))
+
+def deleteLocalIndex(nameSpace, root=None):
+    path = os.path.join(root or localIndexRoot(), nameSpace)
+    resetClient("localindex", path)
+    shutil.rmtree(path, ignore_errors=True)
@@ -1,4 +1,5 @@
 import tiktoken
+from functools import lru_cache
 
 MODELS_2_TOKEN_LIMITS = {
     "gpt-35-turbo": 4000,
@@ -34,12 +35,21 @@ def numTokenFromMessages(message: dict[str, str], model: str) -> int:
         numTokenFromMessages(message, model)
         output: 11
     """
-    encoding = tiktoken.encoding_for_model(getOaiChatModel(model))
     num_tokens = 2  # For "role" and "content" keys
     for key, value in message.items():
-        num_tokens += len(encoding.encode(value))
+        num_tokens += numTokenFromText(value, model)
     return num_tokens
 
+@lru_cache(maxsize=None)
+def getEncoding(model: str):
+    # encoding_for_model resolves the model name on every call; the encoder itself never changes
+    return tiktoken.encoding_for_model(getOaiChatModel(model))
+
+@lru_cache(maxsize=4096)
+def numTokenFromText(text: str, model: str) -> int:
+    """Token count of text for the model, memoized because history turns are counted again on every request."""
+    return len(getEncoding(model).encode(text))
+
 
 def getOaiChatModel(aoaimodel: str) -> str:
     message = "Expected Azure OpenAI ChatGPT model name"
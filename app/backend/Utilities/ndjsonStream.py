@@ -0,0 +1,130 @@
+"""NDJSON response streaming with early flush of status events, coalesced token frames and heartbeats."""
+import json
+import logging
+import queue
+import threading
+import time
+
+_DONE = object()
+
+# Token deltas are held for at most this long, or until this many bytes are waiting, before a frame is written
+FLUSH_SECONDS = 0.05
+MAX_FRAME_BYTES = 4096
+# Sent when nothing else was written for this long, so proxies and load balancers keep the response open
+HEARTBEAT_SECONDS = 10
+
+def isDelta(event):
+    return isinstance(event, dict) and "choices" in event and "delta" in event["choices"][0]
+
+def deltaEvent(chunk):
+    """Reduce an OpenAI streaming chunk to the delta content the UI reads, or None when it carries no text."""
+    try:
+        content = chunk["choices"][0]["delta"].get("content")
+    except (KeyError, IndexError, TypeError):
+        return None
+    if not content:
+        return None
+    return {"choices": [{"delta": {"content": content}}]}
+
+def toLine(event):
+    return json.dumps(event).replace("\n", "\\n") + "\n"
+
+def _produce(events, pending, cancelled):
+    try:
+        for event in events:
+            if cancelled.is_set():
+                break
+            pending.put(event)
+    except Exception as e:
+        pending.put(e)
+    finally:
+        if cancelled.is_set() and hasattr(events, "close"):
+            events.close()
+        pending.put(_DONE)
+
+def streamNdJson(events, startTime=None, flushSeconds=FLUSH_SECONDS, maxFrameBytes=MAX_FRAME_BYTES,
+                 heartbeatSeconds=HEARTBEAT_SECONDS, metrics=None):
+    """
+    Turn a generator of events into NDJSON frames for a streaming Response.
+    The generator runs on a worker thread so heartbeats keep flowing while it waits on retrieval or the model.
+    Status events (anything that is not a token delta) are written as soon as they arrive, after any buffered
+    tokens; consecutive token deltas are merged into one line per frame. Time to first byte and first token,
+    measured from startTime, are logged and sent as a final {"metrics": ...} line, since WSGI cannot send trailers.
+    """
+    startTime = startTime or time.perf_counter()
+    metrics = metrics if metrics is not None else {}
+    pending = queue.Queue()
+    cancelled = threading.Event()
+    threading.Thread(target=_produce, args=(events, pending, cancelled), name="ndjson-stream", daemon=True).start()
+
+    deltas = []
+    deltaBytes = 0
+    deltaSince = None
+    lastWrite = time.perf_counter()
+    frames = 0
+    tokens = 0
+
+    def frame(lines, heartbeat=False):
+        nonlocal lastWrite, frames
+        now = time.perf_counter()
+        # Heartbeats carry nothing the user sees, so they do not count as the first byte
+        if not heartbeat and "ttfbMs" not in metrics:
+            metrics["ttfbMs"] = round((now - startTime) * 1000, 1)
+        lastWrite = now
+        frames += 1
+        return "".join(lines)
+
+    def takeDeltas():
+        nonlocal deltas, deltaBytes, deltaSince
+        line = toLine({"choices": [{"delta": {"content": "".join(deltas)}}]})
+        deltas, deltaBytes, deltaSince = [], 0, None
+        return line
+
+    try:
+        while True:
+            now = time.perf_counter()
+            if deltas:
+                timeout = max(0, deltaSince + flushSeconds - now)
+            else:
+                timeout = max(0, lastWrite + heartbeatSeconds - now)
+            try:
+                event = pending.get(timeout=timeout)
+            except queue.Empty:
+                if deltas:
+                    yield frame([takeDeltas()])
+                else:
+                    yield frame([toLine({"heartbeat": round(time.perf_counter() - startTime, 1)})], heartbeat=True)
+                continue
+
+            if event is _DONE:
+                break
+            if isinstance(event, Exception):
+                raise event
+            if isDelta(event):
+                content = event["choices"][0]["delta"].get("content") or ""
+                if not content:
+                    continue
+                if "ttftMs" not in metrics:
+                    metrics["ttftMs"] = round((time.perf_counter() - startTime) * 1000, 1)
+                tokens += 1
+                deltas.append(content)
+                deltaBytes += len(content)
+                deltaSince = deltaSince or time.perf_counter()
+                if deltaBytes >= maxFrameBytes:
+                    yield frame([takeDeltas()])
+            else:
+                lines = [takeDeltas()] if deltas else []
+                lines.append(toLine(event))
+                yield frame(lines)
+
+        metrics.setdefault("ttfbMs", round((time.perf_counter() - startTime) * 1000, 1))
+        metrics["totalMs"] = round((time.perf_counter() - startTime) * 1000, 1)
+        metrics["frames"] = frames + 1
+        metrics["deltas"] = tokens
+        lines = [takeDeltas()] if deltas else []
+        lines.append(toLine({"metrics": metrics}))
+        yield "".join(lines)
+        logging.info(f"Stream metrics: {metrics}")
+    finally:
+        # Also reached when the client disconnects; stop the producer instead of finishing the completion
+        cancelled.set()
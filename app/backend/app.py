@@ -4,6 +4,7 @@ import json
 from dotenv import load_dotenv
 import os
 import logging
+import time
 from azure.storage.blob import BlobServiceClient, ContentSettings
 import base64
 import mimetypes
@@ -19,9 +20,11 @@ import azure.cognitiveservices.speech as speechsdk
 from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
 from azure.cosmos import CosmosClient, PartitionKey
+from Utilities.clientRegistry import getCosmosContainer, getBlobServiceClient, getSearchClient, withClient
 from Utilities.fmp import *
 from distutils.util import strtobool
 from Utilities.ChatGptStream import *
+from Utilities.ndjsonStream import streamNdJson
 
 load_dotenv()
 app = Flask(__name__)
@@ -204,12 +207,9 @@ def chat():
         logging.exception("Exception in /chat")
         return jsonify({"error": str(e)}), 500
 
-def formatNdJson(r):
-    for data in r:
-        yield json.dumps(data).replace("\n", "\\n") + "\n"
-
 @app.route("/chatStream", methods=["POST"])
 def chatStream():
+    startTime = time.perf_counter()
     indexType=request.json["indexType"]
     indexNs=request.json["indexNs"]
     postBody=request.json["postBody"]
@@ -286,7 +286,9 @@ def chatStream():
                                     SearchService, SearchKey, RedisAddress, RedisPort, RedisPassword,
                                     PineconeKey, PineconeEnv, PineconeIndex)
         r = chatStream.run(indexType=indexType, indexNs=indexNs, postBody=postBody)
-        return Response(formatNdJson(r), mimetype='text/event-stream')
+        # Disable proxy buffering so the early status events and coalesced token frames reach the browser as written
+        return Response(streamNdJson(r, startTime), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
     except Exception as e:
         logging.exception("Exception in /chatStream")
         return jsonify({"error": str(e)}), 500
@@ -349,18 +351,13 @@ def getAllIndexSessions():
         CosmosDb = os.environ.get("COSMOSDATABASE")
         CosmosContainer = os.environ.get("COSMOSCONTAINER")
 
-        cosmosClient = CosmosClient(url=CosmosEndPoint, credential=CosmosKey)
-        cosmosDb = cosmosClient.create_database_if_not_exists(id=CosmosDb)
-        cosmosKey = PartitionKey(path="/sessionId")
-        cosmosContainer = cosmosDb.create_container_if_not_exists(id=CosmosContainer, partition_key=cosmosKey, offer_throughput=400)
-
         cosmosQuery = "SELECT c.sessionId, c.name FROM c WHERE c.type = @type and c.feature = @feature and c.indexType = @indexType and c.indexId = @indexNs"
         params = [dict(name="@type", value=type), 
                   dict(name="@feature", value=feature), 
                   dict(name="@indexType", value=indexType), 
                   dict(name="@indexNs", value=indexNs)]
-        results = cosmosContainer.query_items(query=cosmosQuery, parameters=params, enable_cross_partition_query=True)
-        items = [item for item in results]
+        items = withClient(getCosmosContainer, (CosmosEndPoint, CosmosKey, CosmosDb, CosmosContainer),
+                           lambda container: list(container.query_items(query=cosmosQuery, parameters=params, enable_cross_partition_query=True)))
         #output = json.dumps(items, indent=True)
         return jsonify(items)
     except Exception as e:
@@ -379,20 +376,15 @@ def getIndexSession():
         CosmosDb = os.environ.get("COSMOSDATABASE")
         CosmosContainer = os.environ.get("COSMOSCONTAINER")
 
-        cosmosClient = CosmosClient(url=CosmosEndPoint, credential=CosmosKey)
-        cosmosDb = cosmosClient.create_database_if_not_exists(id=CosmosDb)
-        cosmosKey = PartitionKey(path="/sessionId")
-        cosmosContainer = cosmosDb.create_container_if_not_exists(id=CosmosContainer, partition_key=cosmosKey, offer_throughput=400)
-
         cosmosQuery = "SELECT c.id, c.type, c.sessionId, c.name, c.chainType, \
          c.feature, c.indexId, c.IndexType, c.IndexName, c.llmModel, \
           c.timestamp, c.tokenUsed, c.embeddingModelType FROM c WHERE c.name = @sessionName and c.indexType = @indexType and c.indexId = @indexNs"
         params = [dict(name="@sessionName", value=sessionName), 
                   dict(name="@indexType", value=indexType), 
                   dict(name="@indexNs", value=indexNs)]
-        results = cosmosContainer.query_items(query=cosmosQuery, parameters=params, enable_cross_partition_query=True,
-                                              max_item_count=1)
-        sessions = [item for item in results]
+        sessions = withClient(getCosmosContainer, (CosmosEndPoint, CosmosKey, CosmosDb, CosmosContainer),
+                              lambda container: list(container.query_items(query=cosmosQuery, parameters=params,
+                                                                           enable_cross_partition_query=True, max_item_count=1)))
         return jsonify(sessions)
     except Exception as e:
         logging.exception("Exception in /getIndexSession")
@@ -410,10 +402,7 @@ def deleteIndexSession():
         CosmosDb = os.environ.get("COSMOSDATABASE")
         CosmosContainer = os.environ.get("COSMOSCONTAINER")
 
-        cosmosClient = CosmosClient(url=CosmosEndPoint, credential=CosmosKey)
-        cosmosDb = cosmosClient.create_database_if_not_exists(id=CosmosDb)
-        cosmosKey = PartitionKey(path="/sessionId")
-        cosmosContainer = cosmosDb.create_container_if_not_exists(id=CosmosContainer, partition_key=cosmosKey, offer_throughput=400)
+        cosmosContainer = getCosmosContainer(CosmosEndPoint, CosmosKey, CosmosDb, CosmosContainer)
 
         cosmosQuery = "SELECT c.sessionId FROM c WHERE c.name = @sessionName and c.indexType = @indexType and c.indexId = @indexNs"
         params = [dict(name="@sessionName", value=sessionName), 
@@ -450,10 +439,7 @@ def renameIndexSession():
         CosmosDb = os.environ.get("COSMOSDATABASE")
         CosmosContainer = os.environ.get("COSMOSCONTAINER")
 
-        cosmosClient = CosmosClient(url=CosmosEndPoint, credential=CosmosKey)
-        cosmosDb = cosmosClient.create_database_if_not_exists(id=CosmosDb)
-        cosmosKey = PartitionKey(path="/sessionId")
-        cosmosContainer = cosmosDb.create_container_if_not_exists(id=CosmosContainer, partition_key=cosmosKey, offer_throughput=400)
+        cosmosContainer = getCosmosContainer(CosmosEndPoint, CosmosKey, CosmosDb, CosmosContainer)
 
         cosmosQuery = "SELECT * FROM c WHERE c.name = @sessionName and c.type = 'Session'"
         params = [dict(name="@sessionName", value=oldSessionName)]
@@ -479,15 +465,10 @@ def getIndexSessionDetail():
         CosmosDb = os.environ.get("COSMOSDATABASE")
         CosmosContainer = os.environ.get("COSMOSCONTAINER")
 
-        cosmosClient = CosmosClient(url=CosmosEndPoint, credential=CosmosKey)
-        cosmosDb = cosmosClient.create_database_if_not_exists(id=CosmosDb)
-        cosmosKey = PartitionKey(path="/sessionId")
-        cosmosContainer = cosmosDb.create_container_if_not_exists(id=CosmosContainer, partition_key=cosmosKey, offer_throughput=400)
-
         cosmosQuery = "SELECT c.role, c.content FROM c WHERE c.sessionId = @sessionId and c.type = 'Message' ORDER by c._ts ASC"
         params = [dict(name="@sessionId", value=sessionId)]
-        results = cosmosContainer.query_items(query=cosmosQuery, parameters=params, enable_cross_partition_query=True)
-        items = [item for item in results]
+        items = withClient(getCosmosContainer, (CosmosEndPoint, CosmosKey, CosmosDb, CosmosContainer),
+                           lambda container: list(container.query_items(query=cosmosQuery, parameters=params, enable_cross_partition_query=True)))
         #output = json.dumps(items, indent=True)
         return jsonify(items)
     except Exception as e:
@@ -700,7 +681,7 @@ def refreshIndex():
     try:
         url = os.environ.get("BLOB_CONNECTION_STRING")
         containerName = os.environ.get("BLOB_CONTAINER_NAME")
-        blobClient = BlobServiceClient.from_connection_string(url)
+        blobClient = getBlobServiceClient(url)
         containerClient = blobClient.get_container_client(container=containerName)
         blobList = containerClient.list_blobs(include=['tags', 'metadata'])
         blobJson = []
@@ -755,9 +736,7 @@ def getProspectusList():
     try:
         SearchService = os.environ.get("SEARCHSERVICE")
         SearchKey = os.environ.get("SEARCHKEY")
-        searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name="prospectussummary",
-        credential=AzureKeyCredential(SearchKey))
+        searchClient = getSearchClient(SearchService, SearchKey, "prospectussummary")
         try:
             r = searchClient.search(  
                 search_text="",
@@ -784,9 +763,7 @@ def getDocumentList():
     try:
         SearchService = os.environ.get("SEARCHSERVICE")
         SearchKey = os.environ.get("SEARCHKEY")
-        searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name="evaluatordocument",
-        credential=AzureKeyCredential(SearchKey))
+        searchClient = getSearchClient(SearchService, SearchKey, "evaluatordocument")
         try:
             r = searchClient.search(  
                 search_text="",
@@ -816,9 +793,7 @@ def getAllDocumentRuns():
    
     SearchService = os.environ.get("SEARCHSERVICE")
     SearchKey = os.environ.get("SEARCHKEY")
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name="evaluatorrunresult",
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, "evaluatorrunresult")
     
     documentId=request.json["documentId"]
 
@@ -849,9 +824,7 @@ def getEvaluationQaDataSet():
    
     SearchService = os.environ.get("SEARCHSERVICE")
     SearchKey = os.environ.get("SEARCHKEY")
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name="evaluatorqadata",
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, "evaluatorqadata")
     
     documentId=request.json["documentId"]
 
@@ -883,9 +856,7 @@ def getEvaluationResults():
    
     SearchService = os.environ.get("SEARCHSERVICE")
     SearchKey = os.environ.get("SEARCHKEY")
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name="evaluatorrunresult",
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, "evaluatorrunresult")
     
     documentId=request.json["documentId"]
     runId=request.json["runId"]
@@ -928,9 +899,7 @@ def refreshQuestions():
     kbIndexName = os.environ.get("KBINDEXNAME")
     SearchService = os.environ.get("SEARCHSERVICE")
     SearchKey = os.environ.get("SEARCHKEY")
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=kbIndexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, kbIndexName)
     
     indexType=request.json["indexType"]
     indexName=request.json["indexName"]
@@ -963,9 +932,7 @@ def refreshIndexQuestions():
     kbIndexName = os.environ.get("KBINDEXNAME")
     SearchService = os.environ.get("SEARCHSERVICE")
     SearchKey = os.environ.get("SEARCHKEY")
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=kbIndexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, kbIndexName)
     
     indexType=request.json["indexType"]
 
@@ -1001,9 +968,7 @@ def kbQuestionManagement():
     kbIndexName = os.environ.get("KBINDEXNAME")
     SearchService = os.environ.get("SEARCHSERVICE")
     SearchKey = os.environ.get("SEARCHKEY")
-    searchClient = SearchClient(endpoint=f"https://{SearchService}.search.windows.net",
-        index_name=kbIndexName,
-        credential=AzureKeyCredential(SearchKey))
+    searchClient = getSearchClient(SearchService, SearchKey, kbIndexName)
     
     documentsToDelete=request.json["documentsToDelete"]
 
@@ -1054,7 +1019,7 @@ def uploadFile():
             fileContent = request.json["fileContent"]
         url = os.environ.get("BLOB_CONNECTION_STRING")
         containerName = os.environ.get("BLOB_CONTAINER_NAME")
-        blobClient = BlobServiceClient.from_connection_string(url)
+        blobClient = getBlobServiceClient(url)
         blobContainer = blobClient.get_blob_client(container=containerName, blob=fileName)
         #blob_client.upload_blob(bytes_data,overwrite=True, content_settings=ContentSettings(content_type=content_type))
         blobContainer.upload_blob(fileContent, overwrite=True, content_settings=ContentSettings(content_type=contentType))
@@ -1077,7 +1042,7 @@ def uploadBinaryFile():
 
         url = os.environ.get("BLOB_CONNECTION_STRING")
         containerName = os.environ.get("BLOB_CONTAINER_NAME")
-        blobServiceClient = BlobServiceClient.from_connection_string(url)
+        blobServiceClient = getBlobServiceClient(url)
         containerClient = blobServiceClient.get_container_client(containerName)
         blobClient = containerClient.get_blob_client(blobName)
         #blob_client.upload_blob(bytes_data,overwrite=True, content_settings=ContentSettings(content_type=content_type))
@@ -1107,7 +1072,7 @@ def uploadEvaluatorFile():
 
         url = os.environ.get("BLOB_CONNECTION_STRING")
         containerName = os.environ.get("BLOB_EVALUATOR_CONTAINER_NAME")
-        blobServiceClient = BlobServiceClient.from_connection_string(url)
+        blobServiceClient = getBlobServiceClient(url)
         containerClient = blobServiceClient.get_container_client(containerName)
         blobClient = containerClient.get_blob_client(blobName)
         #blob_client.upload_blob(bytes_data,overwrite=True, content_settings=ContentSettings(content_type=content_type))
@@ -1131,7 +1096,7 @@ def uploadSummaryBinaryFile():
 
         url = os.environ.get("BLOB_CONNECTION_STRING")
         summaryContainerName = os.environ.get("BLOB_SUMMARY_CONTAINER_NAME")
-        blobServiceClient = BlobServiceClient.from_connection_string(url)
+        blobServiceClient = getBlobServiceClient(url)
         containerClient = blobServiceClient.get_container_client(summaryContainerName)
         blobClient = containerClient.get_blob_client(blobName)
         #blob_client.upload_blob(bytes_data,overwrite=True, content_settings=ContentSettings(content_type=content_type))
@@ -1150,7 +1115,7 @@ def uploadSummaryBinaryFile():
 def content_file(path):
     url = os.environ.get("BLOB_CONNECTION_STRING")
     containerName = os.environ.get("BLOB_CONTAINER_NAME")
-    blobClient = BlobServiceClient.from_connection_string(url)
+    blobClient = getBlobServiceClient(url)
     logging.info(f"Getting blob {path.strip()} from container {containerName}")
     blobContainer = blobClient.get_container_client(container=containerName)
     blob = blobContainer.get_blob_client(path.strip()).download_blob()
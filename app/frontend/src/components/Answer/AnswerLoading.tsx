@@ -4,7 +4,11 @@ import { animated, useSpring } from "@react-spring/web";
 import styles from "./Answer.module.css";
 import { AnswerIcon } from "./AnswerIcon";
 
-export const AnswerLoading = () => {
+interface Props {
+    searchQuery?: string;
+}
+
+export const AnswerLoading = ({ searchQuery }: Props) => {
     const animatedStyles = useSpring({
         from: { opacity: 0 },
         to: { opacity: 1 }
@@ -16,7 +20,7 @@ export const AnswerLoading = () => {
                 <AnswerIcon />
                 <Stack.Item grow>
                     <p className={styles.answerText}>
-                        Generating answer
+                        {searchQuery ? `Searching for "${searchQuery}"` : "Generating answer"}
                         <span className={styles.loadingdots} />
                     </p>
                 </Stack.Item>
@@ -56,6 +56,7 @@ const ChatGpt = () => {
     const chatMessageStreamEnd = useRef<HTMLDivElement | null>(null);
 
     const [isLoading, setIsLoading] = useState<boolean>(false);
+    const [streamSearchQuery, setStreamSearchQuery] = useState<string>("");
     const [error, setError] = useState<unknown>();
 
     const [activeCitation, setActiveCitation] = useState<string>();
@@ -381,6 +382,7 @@ const ChatGpt = () => {
         //     setSessionList(sessionLists)
         // }
         lastQuestionRefStream.current = question;
+        setStreamSearchQuery("");
 
         error && setError(undefined);
         setIsLoading(true);
@@ -429,7 +431,14 @@ const ChatGpt = () => {
                             runningText += obj;
                             if (obj != "") {
                                 result = JSON.parse(runningText)
-                                if (result["data_points"]) {
+                                if (result["heartbeat"] !== undefined) {
+                                    // Keep-alive while the backend waits on retrieval or the model
+                                } else if (result["metrics"]) {
+                                    console.debug("Stream metrics", result["metrics"]);
+                                } else if (result["query"] !== undefined) {
+                                    // Sent before retrieval starts, so the loading message can say what is being searched
+                                    setStreamSearchQuery(result["query"]);
+                                } else if (result["data_points"]) {
                                     askResponse = result;
                                 } else if (result["choices"] && result["choices"][0]["delta"]["content"]) {
                                     answer += result["choices"][0]["delta"]["content"];
@@ -1531,7 +1540,7 @@ const ChatGpt = () => {
                                             <>
                                                 <UserChatMessage message={lastQuestionRefStream.current} />
                                                 <div className={styles.chatMessageGptMinWidth}>
-                                                    <AnswerLoading />
+                                                    <AnswerLoading searchQuery={streamSearchQuery} />
                                                 </div>
                                             </>
                                         )}